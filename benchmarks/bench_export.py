@@ -0,0 +1,101 @@
+"""Peak memory and throughput of the streaming NDJSON project export.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_export.py --chapters 10 1000 10000 --batch 200 --cache-mb 4
+
+For each size, fills a fresh database with one project of that many chapters (two
+segments and one text version each), then drains ``export_project`` the way the
+endpoint does, without keeping the chunks, and reports exported bytes, wall time
+and the tracemalloc peak. Version texts go through the shared, byte-bounded
+``text_cache`` (delta chains are resolved from it), so the peak rises until that
+cache is full and stays flat from there; ``--cache-mb`` sets its bound.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+from app.blobs import text_cache
+from app.db import get_connection, init_db
+from app.export import EXPORT_SECTIONS, export_project
+from app.versions import insert_text_version
+
+NOW = "2026-01-01T00:00:00.000000Z"
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    return "".join(chr(0x4E00 + rng.randrange(3000)) for _ in range(chars))
+
+
+def _fill(chapters: int, seed: int) -> None:
+    rng = random.Random(seed)
+    conn = get_connection()
+    conn.execute("INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_b', 'B', ?, ?)", (NOW, NOW))
+    for no in range(1, chapters + 1):
+        chapter_id = f"ch_{no:06d}"
+        conn.execute(
+            "INSERT INTO chapters (id, project_id, chapter_no, title, plan_json, created_at, updated_at) "
+            "VALUES (?, 'proj_b', ?, ?, ?, ?, ?)",
+            (chapter_id, no, _text(rng, 8), '{"beats": ["a", "b"]}', NOW, NOW),
+        )
+        for segment_no in (1, 2):
+            text = _text(rng, 400)
+            conn.execute(
+                "INSERT INTO chapter_segments (id, chapter_id, segment_no, content_text, char_count, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (f"chseg_{no:06d}_{segment_no}", chapter_id, segment_no, text, len(text), NOW, NOW),
+            )
+        insert_text_version(conn, chapter_id, "final", _text(rng, 3000), None, None, NOW)
+    conn.commit()
+    conn.close()
+
+
+def _drain(batch: int, compress: bool) -> tuple[int, float, int]:
+    text_cache.clear()
+    conn = get_connection()
+    tracemalloc.start()
+    started = time.perf_counter()
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    total = 0
+    for chunk in export_project(conn, "proj_b", EXPORT_SECTIONS, batch):
+        total += len(compressor.compress(chunk) if compressor is not None else chunk)
+    if compressor is not None:
+        total += len(compressor.flush())
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    conn.close()
+    return total, elapsed_ms, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--cache-mb", type=int, default=text_cache.max_bytes // (1024 * 1024))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    text_cache.max_bytes = args.cache_mb * 1024 * 1024
+
+    print(f"batch size {args.batch}, text cache {args.cache_mb} MiB, zlib {zlib.ZLIB_VERSION}")
+    print(f"{'chapters':>9}{'gzip':>6}{'bytes':>14}{'ms':>10}{'peak_kib':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for chapters in args.chapters:
+            os.environ["WRITER_DB_PATH"] = str(Path(tmp) / f"export_{chapters}.db")
+            init_db()
+            _fill(chapters, args.seed)
+            for compress in (False, True):
+                total, elapsed_ms, peak = _drain(args.batch, compress)
+                flag = "yes" if compress else "no"
+                print(f"{chapters:>9}{flag:>6}{total:>14}{elapsed_ms:>10.1f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
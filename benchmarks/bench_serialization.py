@@ -0,0 +1,324 @@
+"""Serialization cost of one list page per endpoint: pydantic models vs raw row encoding.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_serialization.py --items 100 --repeat 200
+
+For every list endpoint, builds a page of synthetic rows shaped like its SELECT and
+times the two ways of turning it into a response body: the old path (``json.loads``
+on each JSON column, a model per row, then FastAPI's ``response_model`` validation
+and ``dump_json``) and ``RowEncoder`` + ``encode_page``. Both bodies are checked to
+decode to the same document before timing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Any, Callable
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.schemas import (
+    ChapterListResponse,
+    ChapterOut,
+    ChapterReviewListResponse,
+    ChapterReviewOut,
+    ChapterSegmentListResponse,
+    ChapterSegmentOut,
+    ChapterTextVersionListResponse,
+    ChapterTextVersionOut,
+    LlmModelListResponse,
+    LlmModelOut,
+    LlmProviderListResponse,
+    LlmProviderOut,
+    ProjectListResponse,
+    ProjectOut,
+    RunEventListResponse,
+    RunEventOut,
+    RunListResponse,
+    RunOut,
+    RunStepListResponse,
+    RunStepOut,
+)
+from app.serialization import RowEncoder, encode_page
+
+NOW = "2026-01-01T00:00:00.000000Z"
+Row = dict[str, Any]
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    return "".join(chr(0x4E00 + rng.randrange(3000)) for _ in range(chars))
+
+
+def _stored(value: object) -> str:
+    return json.dumps(value, ensure_ascii=True, sort_keys=True)
+
+
+def _plan(rng: random.Random) -> str:
+    return _stored({"schema_version": "1.2", "beats": [_text(rng, 40) for _ in range(6)], "pov": "node_1"})
+
+
+def _report(rng: random.Random) -> str:
+    return _stored(
+        {
+            "issues": [{"kind": "pacing", "note": _text(rng, 60)} for _ in range(4)],
+            "scores": {"consistency": 7, "style": 8, "progress": 6},
+            "summary": _text(rng, 120),
+        }
+    )
+
+
+def _budget() -> str:
+    return _stored({"max_tokens": 200000, "max_cost": 12.5})
+
+
+# endpoint: (list model, item model, JSON columns, renamed columns, row factory)
+ENDPOINTS: dict[str, tuple[type[BaseModel], type[BaseModel], tuple[str, ...], dict[str, str], Callable[..., Row]]] = {
+    "GET /projects": (
+        ProjectListResponse,
+        ProjectOut,
+        (),
+        {},
+        lambda rng, n: {
+            "id": f"proj_{n:06d}",
+            "name": _text(rng, 8),
+            "genre": "fantasy",
+            "premise": _text(rng, 200),
+            "created_at": NOW,
+            "updated_at": NOW,
+        },
+    ),
+    "GET /chapters": (
+        ChapterListResponse,
+        ChapterOut,
+        ("plan_json",),
+        {},
+        lambda rng, n: {
+            "id": f"ch_{n:06d}",
+            "project_id": "proj_1",
+            "volume_no": 1,
+            "chapter_no": n + 1,
+            "title": _text(rng, 10),
+            "status": "draft",
+            "needs_review": n % 2,
+            "review_reason": None,
+            "plan_json": _plan(rng),
+            "traversal_profile_id": None,
+            "style_guide_id": None,
+            "lock_version": 3,
+            "created_at": NOW,
+            "updated_at": NOW,
+        },
+    ),
+    "GET /chapters/{id}/segments": (
+        ChapterSegmentListResponse,
+        ChapterSegmentOut,
+        ("attrs_json",),
+        {},
+        lambda rng, n: {
+            "id": f"chseg_{n:06d}",
+            "chapter_id": "ch_1",
+            "segment_no": n + 1,
+            "title": _text(rng, 6),
+            "pov_node_id": "node_1",
+            "segment_type": "scene",
+            "content_text": _text(rng, 800),
+            "char_count": 800,
+            "content_hash": "0" * 64,
+            "attrs_json": _stored({"mood": _text(rng, 4), "tags": ["a", "b"]}),
+            "created_at": NOW,
+            "updated_at": NOW,
+        },
+    ),
+    "GET /chapters/{id}/reviews": (
+        ChapterReviewListResponse,
+        ChapterReviewOut,
+        ("report_json",),
+        {},
+        lambda rng, n: {
+            "id": f"chrev_{n:06d}",
+            "chapter_id": "ch_1",
+            "version_id": "chv_1",
+            "review_type": "consistency",
+            "report_json": _report(rng),
+            "source_run_id": "run_1",
+            "source_step_id": f"step_{n:06d}",
+            "created_at": NOW,
+        },
+    ),
+    "GET /chapters/{id}/text-versions": (
+        ChapterTextVersionListResponse,
+        ChapterTextVersionOut,
+        (),
+        {},
+        lambda rng, n: {
+            "id": f"chv_{n:06d}",
+            "chapter_id": "ch_1",
+            "version_no": n + 1,
+            "stage": "final",
+            "content_text": _text(rng, 3000),
+            "char_count": 3000,
+            "content_hash": "0" * 64,
+            "source_run_id": "run_1",
+            "source_step_id": None,
+            "created_at": NOW,
+        },
+    ),
+    "GET /projects/{id}/runs": (
+        RunListResponse,
+        RunOut,
+        ("input_json", "output_json", "budget_json"),
+        {},
+        lambda rng, n: {
+            "id": f"run_{n:06d}",
+            "project_id": "proj_1",
+            "swarm_profile_id": None,
+            "run_type": "chapter_write",
+            "target_chapter_id": "ch_1",
+            "status": "completed",
+            "input_json": _stored({"prompt": _text(rng, 200), "provider_id": "mock"}),
+            "output_json": _stored({"chapter_version_id": "chv_1", "select": {"selected_step_id": "step_1"}}),
+            "budget_json": _budget(),
+            "budget_remaining_tokens": 150000,
+            "budget_remaining_cost": 9.25,
+            "llm_cache": 1,
+            "batch_id": None,
+            "priority": "interactive",
+            "queue_position": None,
+            "estimated_start_at": None,
+            "started_at": NOW,
+            "finished_at": NOW,
+        },
+    ),
+    "GET /runs/{id}/steps": (
+        RunStepListResponse,
+        RunStepOut,
+        ("override_payload_json", "input_json", "output_json", "budget_json", "depends_on_json"),
+        {"depends_on": "depends_on_json"},
+        lambda rng, n: {
+            "id": f"step_{n:06d}",
+            "run_id": "run_1",
+            "step_no": n + 1,
+            "step_type": "review",
+            "role": "reviewer",
+            "status": "completed",
+            "depends_on_json": _stored([f"step_{n - 1:06d}"]) if n else None,
+            "requires_approval": 0,
+            "approval_status": "not_required",
+            "override_payload_json": None,
+            "input_json": _stored({"draft_no": 1, "review_of": "step_1"}),
+            "output_json": _report(rng),
+            "budget_json": _budget(),
+            "budget_remaining_tokens": 150000,
+            "budget_remaining_cost": 9.25,
+            "started_at": NOW,
+            "finished_at": NOW,
+            "error_text": None,
+        },
+    ),
+    "GET /runs/{id}/events": (
+        RunEventListResponse,
+        RunEventOut,
+        # Events reach the handler already parsed (they are shared with the live bus).
+        (),
+        {"payload_json": "payload"},
+        lambda rng, n: {
+            "id": f"rev_{n:06d}",
+            "run_id": "run_1",
+            "step_id": "step_1",
+            "event_type": "step.output.delta",
+            "status": "running",
+            "payload": {"delta": _text(rng, 40), "offset": n * 40},
+            "created_at": NOW,
+        },
+    ),
+    "GET /llm/providers": (
+        LlmProviderListResponse,
+        LlmProviderOut,
+        ("config_json",),
+        {},
+        lambda rng, n: {
+            "id": f"p{n}",
+            "name": f"Provider {n}",
+            "base_url": "http://127.0.0.1:8000",
+            "config_json": _stored({"timeout_seconds": 30, "max_connections": 10, "http2": True}),
+            "created_at": NOW,
+            "updated_at": NOW,
+        },
+    ),
+    "GET /llm/providers/{id}/models": (
+        LlmModelListResponse,
+        LlmModelOut,
+        ("capabilities_json",),
+        {},
+        lambda rng, n: {
+            "id": f"llmm_{n:06d}",
+            "provider_id": "p1",
+            "model_name": f"model-{n}",
+            "capabilities_json": _stored({"context": 128000, "streaming": True}),
+            "created_at": NOW,
+            "updated_at": NOW,
+        },
+    ),
+}
+
+
+def _model_body(list_model: type[BaseModel], item_model: type[BaseModel], json_columns, renamed, rows, **page) -> bytes:
+    columns = {name: renamed.get(name, name) for name in item_model.model_fields}
+    items = [
+        item_model(
+            **{
+                # A NULL JSON column falls back to the field default, as the handlers did.
+                name: json.loads(row[column]) if column in json_columns else row[column]
+                for name, column in columns.items()
+                if not (column in json_columns and row[column] is None)
+            }
+        )
+        for row in rows
+    ]
+    # What FastAPI does with the returned model through ``response_model``.
+    adapter = TypeAdapter(list_model)
+    return adapter.dump_json(adapter.validate_python(list_model(items=items, **page)))
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.items} items per page, median of {args.repeat} runs")
+    print(f"{'endpoint':<34}{'model_ms':>10}{'raw_ms':>10}{'speedup':>9}")
+    for endpoint, (list_model, item_model, json_columns, renamed, make_row) in ENDPOINTS.items():
+        rows = [make_row(rng, n) for n in range(args.items)]
+        encoder = RowEncoder(item_model, columns=renamed)
+        page = {name: None for name in list_model.model_fields if name != "items"}
+
+        def raw() -> bytes:
+            return encode_page(encoder, rows, **page)
+
+        def model() -> bytes:
+            return _model_body(list_model, item_model, json_columns, renamed, rows, **page)
+
+        assert json.loads(raw()) == json.loads(model()), endpoint
+        model_ms = _median_ms(model, args.repeat)
+        raw_ms = _median_ms(raw, args.repeat)
+        print(f"{endpoint:<34}{model_ms:>10.3f}{raw_ms:>10.3f}{model_ms / raw_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Cold-start benchmark for schema migrations against a large database.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_startup.py --size-mb 1024 --path /tmp/writer-bench.db
+
+Compares the legacy boot path (re-running every CREATE ... IF NOT EXISTS on each
+start) with the versioned fast path, and times the first migration of an
+unversioned database whose indexes still have to be built.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+from app.db import PoolSettings, _open_connection
+from app.migrations import MIGRATIONS, migrate
+
+ROW_TEXT_BYTES = 64 * 1024
+
+
+def _populate(path: Path, size_mb: int) -> None:
+    conn = _open_connection(path, PoolSettings.from_env())
+    conn.isolation_level = None
+    for migration in MIGRATIONS:
+        for statement in migration.statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(statement)
+
+    now = "2026-01-01T00:00:00.000000Z"
+    conn.execute(
+        "INSERT INTO projects (id, name, genre, premise, created_at, updated_at) "
+        "VALUES ('proj_bench', 'Bench', NULL, NULL, ?, ?)",
+        (now, now),
+    )
+    target_bytes = size_mb * 1024 * 1024
+    chapter_no = 0
+    while path.stat().st_size < target_bytes:
+        conn.execute("BEGIN")
+        chapters = []
+        versions = []
+        for _ in range(200):
+            chapter_no += 1
+            chapter_id = f"ch_{chapter_no:012d}"
+            chapters.append((chapter_id, chapter_no, now, now))
+            body = (f"chapter {chapter_no} " + os.urandom(ROW_TEXT_BYTES // 4).hex())[:ROW_TEXT_BYTES]
+            versions.append((f"chv_{chapter_no:012d}", chapter_id, body, now))
+        conn.executemany(
+            "INSERT INTO chapters (id, project_id, chapter_no, created_at, updated_at) "
+            "VALUES (?, 'proj_bench', ?, ?, ?)",
+            chapters,
+        )
+        conn.executemany(
+            "INSERT INTO chapter_text_versions (id, chapter_id, version_no, stage, content_text, created_at) "
+            "VALUES (?, ?, 1, 'final', ?, ?)",
+            versions,
+        )
+        conn.execute("COMMIT")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def _legacy_boot(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    for migration in MIGRATIONS:
+        for statement in migration.statements:
+            if not callable(statement):
+                conn.execute(statement)
+        for index_sql in migration.indexes:
+            conn.execute(index_sql)
+    conn.commit()
+    conn.close()
+
+
+def _versioned_boot(path: Path) -> None:
+    conn = _open_connection(path, PoolSettings.from_env())
+    migrate(conn)
+    conn.close()
+
+
+def _median_ms(fn, path: Path, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(path)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--path", type=Path, default=Path("data/bench-startup.db"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    args.path.parent.mkdir(parents=True, exist_ok=True)
+    if not args.path.exists():
+        print(f"populating {args.path} to {args.size_mb} MB ...")
+        _populate(args.path, args.size_mb)
+    size_mb = args.path.stat().st_size / (1024 * 1024)
+
+    conn = sqlite3.connect(args.path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+    started = time.perf_counter()
+    _versioned_boot(args.path)
+    first_migration_ms = (time.perf_counter() - started) * 1000
+
+    legacy_ms = _median_ms(_legacy_boot, args.path, args.repeat)
+    fast_ms = _median_ms(_versioned_boot, args.path, args.repeat)
+
+    print(f"database size:            {size_mb:10.1f} MB")
+    print(f"first migration (v0->v{MIGRATIONS[-1].version}): {first_migration_ms:10.2f} ms")
+    print(f"legacy executescript boot: {legacy_ms:10.3f} ms (median of {args.repeat})")
+    print(f"versioned fast-path boot:  {fast_ms:10.3f} ms (median of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Storage size and read latency of full-copy vs delta version history.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_versions.py --versions 200 --paragraphs 120
+
+Writes the same revision history of one chapter into two fresh databases, one per
+WRITER_VERSION_STORAGE mode, then reports blob bytes, file size and cold/warm read
+latency of the latest version and of the full history.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.blobs import text_cache
+from app.db import get_connection, init_db
+from app.versions import VERSION_COLUMNS, insert_text_version, load_version_texts
+
+NOW = "2026-01-01T00:00:00.000000Z"
+
+
+def _history(versions: int, paragraphs: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+
+    def paragraph(label: str) -> str:
+        return label + "".join(chr(0x4E00 + rng.randrange(3000)) for _ in range(120)) + "\n"
+
+    body = [paragraph(f"第{idx}段。") for idx in range(paragraphs)]
+    history = []
+    for _ in range(versions):
+        for _ in range(rng.randint(1, 3)):
+            idx = rng.randrange(len(body))
+            body[idx] = paragraph(f"修订{idx}。")
+        history.append("".join(body))
+    return history
+
+
+def _run(mode: str, history: list[str], workdir: Path, interval: int, repeat: int) -> dict[str, float]:
+    os.environ["WRITER_DB_PATH"] = str(workdir / f"{mode}.db")
+    os.environ["WRITER_VERSION_STORAGE"] = mode
+    os.environ["WRITER_VERSION_KEYFRAME_INTERVAL"] = str(interval)
+    init_db()
+    conn = get_connection()
+    conn.execute("INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_b', 'B', ?, ?)", (NOW, NOW))
+    conn.execute(
+        "INSERT INTO chapters (id, project_id, chapter_no, created_at, updated_at) VALUES ('ch_b', 'proj_b', 1, ?, ?)",
+        (NOW, NOW),
+    )
+    started = time.perf_counter()
+    for text in history:
+        insert_text_version(conn, "ch_b", "final", text, None, None, NOW)
+        conn.commit()
+    write_ms = (time.perf_counter() - started) * 1000
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+
+    blob_bytes = conn.execute("SELECT COALESCE(SUM(length(data)), 0) FROM text_blobs").fetchone()[0]
+    rows = conn.execute(
+        f"SELECT {VERSION_COLUMNS} FROM chapter_text_versions WHERE chapter_id = 'ch_b' ORDER BY version_no"
+    ).fetchall()
+
+    def timed(fn) -> float:
+        samples = []
+        for _ in range(repeat):
+            text_cache.clear()
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    latest_cold = timed(lambda: load_version_texts(conn, [rows[-1]]))
+    history_cold = timed(lambda: load_version_texts(conn, rows))
+    load_version_texts(conn, rows)
+    started = time.perf_counter()
+    load_version_texts(conn, [rows[-1]])
+    latest_warm = (time.perf_counter() - started) * 1000
+    file_bytes = Path(os.environ["WRITER_DB_PATH"]).stat().st_size
+    conn.close()
+    return {
+        "blob_kb": blob_bytes / 1024,
+        "file_kb": file_bytes / 1024,
+        "write_ms": write_ms,
+        "latest_cold_ms": latest_cold,
+        "latest_warm_ms": latest_warm,
+        "history_cold_ms": history_cold,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=120)
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    history = _history(args.versions, args.paragraphs, args.seed)
+    raw_kb = sum(len(text.encode("utf-8")) for text in history) / 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            mode: _run(mode, history, Path(tmp), args.keyframe_interval, args.repeat)
+            for mode in ("full", "delta")
+        }
+
+    print(f"{args.versions} versions, {raw_kb:.0f} KB of raw text, keyframe every {args.keyframe_interval}")
+    print(f"{'metric':<18}{'full':>12}{'delta':>12}")
+    for metric in ("blob_kb", "file_kb", "write_ms", "latest_cold_ms", "latest_warm_ms", "history_cold_ms"):
+        print(f"{metric:<18}{results['full'][metric]:>12.2f}{results['delta'][metric]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
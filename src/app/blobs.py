@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import hashlib
+import lzma
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterable
+
+from app.db import env_int
+from app.timestamps import utc_now_iso
+
+CODECS = ("zlib", "lzma")
+_IN_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _configured_codec() -> str:
+    codec = os.getenv("WRITER_BLOB_CODEC", "zlib").strip().lower()
+    if codec not in CODECS:
+        raise ValueError(f"WRITER_BLOB_CODEC must be one of {', '.join(CODECS)}.")
+    return codec
+
+
+def compress(raw: bytes, codec: str) -> tuple[str, bytes]:
+    if codec == "lzma":
+        packed = lzma.compress(raw, preset=6)
+    else:
+        packed = zlib.compress(raw, 6)
+    if len(packed) >= len(raw):
+        return "none", raw
+    return codec, packed
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "lzma":
+        return lzma.decompress(data)
+    if codec == "none":
+        return bytes(data)
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+
+class TextCache:
+    """Byte-bounded LRU of decompressed text bodies keyed by content hash.
+
+    Entries are immutable (the key is the SHA-256 of the value), so one cache can be
+    shared across connections and database files without invalidation. An entry is
+    measured by its UTF-8 size, not its length: CJK text takes 2 bytes a character
+    in memory and 3 encoded, so counting characters would let the cache outgrow its bound.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        # Per digest: the text and its size in bytes, so eviction does not re-encode it.
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[digest] = (text, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+text_cache = TextCache(max_bytes=env_int("WRITER_BLOB_CACHE_MB", 64) * 1024 * 1024)
+
+
+def put_text(conn: sqlite3.Connection, text: str) -> str:
+    """Store ``text`` once under its SHA-256 and return the hash."""
+    digest = text_hash(text)
+    exists = conn.execute("SELECT 1 FROM text_blobs WHERE hash = ?", (digest,)).fetchone()
+    if exists is None:
+        raw = text.encode("utf-8")
+        codec, data = compress(raw, _configured_codec())
+        conn.execute(
+            "INSERT OR IGNORE INTO text_blobs (hash, codec, raw_size, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                digest,
+                codec,
+                len(raw),
+                data,
+                utc_now_iso(),
+            ),
+        )
+    text_cache.put(digest, text)
+    return digest
+
+
+def get_texts(conn: sqlite3.Connection, digests: Iterable[str]) -> dict[str, str]:
+    found: dict[str, str] = {}
+    missing: list[str] = []
+    for digest in dict.fromkeys(digests):
+        cached = text_cache.get(digest)
+        if cached is None:
+            missing.append(digest)
+        else:
+            found[digest] = cached
+
+    for start in range(0, len(missing), _IN_CHUNK):
+        chunk = missing[start : start + _IN_CHUNK]
+        placeholders = ", ".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT hash, codec, data FROM text_blobs WHERE hash IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        for row in rows:
+            text = decompress(row["codec"], row["data"]).decode("utf-8")
+            text_cache.put(row["hash"], text)
+            found[row["hash"]] = text
+    return found
+
+
+def get_text(conn: sqlite3.Connection, digest: str) -> str:
+    texts = get_texts(conn, [digest])
+    if digest not in texts:
+        raise KeyError(f"Text blob {digest} not found.")
+    return texts[digest]
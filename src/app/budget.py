@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import sqlite3
+from dataclasses import dataclass, replace
+
+from app.llm import LlmOutcome, LlmRequest, usage_tokens
+
+# Character-based prompt estimates can undercount (CJK text especially), so the
+# pre-call check pads them before comparing against what is left.
+ESTIMATE_MARGIN = 0.15
+
+
+def _number(raw: dict[str, object], key: str) -> float | None:
+    value = raw.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+@dataclass(frozen=True)
+class BudgetLimits:
+    """Limits read from a run's ``budget_json``; a missing or non-numeric key means unlimited."""
+
+    max_tokens_total: int | None = None
+    max_tokens_step: int | None = None
+    max_cost_total: float | None = None
+    max_cost_step: float | None = None
+    # Completion tokens the estimate sets aside on top of the prompt.
+    completion_reserve_tokens: int = 0
+    # None falls back to WRITER_STEP_TIMEOUT_SECONDS (see ``step_timeout``).
+    step_timeout_seconds: float | None = None
+    # Extra attempts a step gets after its LLM call times out.
+    retry_budget: int = 0
+
+    @classmethod
+    def from_json(cls, raw: object) -> "BudgetLimits":
+        if not isinstance(raw, dict):
+            return cls()
+        max_tokens_total = _number(raw, "max_tokens_total")
+        max_tokens_step = _number(raw, "max_tokens_step")
+        reserve = _number(raw, "completion_reserve_tokens")
+        step_timeout = _number(raw, "step_timeout_seconds")
+        retry_budget = _number(raw, "retry_budget")
+        return cls(
+            max_tokens_total=int(max_tokens_total) if max_tokens_total is not None else None,
+            max_tokens_step=int(max_tokens_step) if max_tokens_step is not None else None,
+            max_cost_total=_number(raw, "max_cost_total"),
+            max_cost_step=_number(raw, "max_cost_step"),
+            completion_reserve_tokens=max(0, int(reserve)) if reserve is not None else 0,
+            step_timeout_seconds=step_timeout if step_timeout is not None and step_timeout > 0 else None,
+            retry_budget=max(0, int(retry_budget)) if retry_budget is not None else 0,
+        )
+
+    @property
+    def step_timeout(self) -> float:
+        if self.step_timeout_seconds is not None:
+            return self.step_timeout_seconds
+        raw = os.getenv("WRITER_STEP_TIMEOUT_SECONDS", "").strip()
+        return float(raw) if raw else 300.0
+
+
+def _configured_pricing() -> dict[str, dict[str, float]]:
+    raw = os.getenv("WRITER_LLM_PRICING", "").strip()
+    if not raw:
+        return {}
+    parsed = json.loads(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("WRITER_LLM_PRICING must be a JSON object.")
+    return parsed
+
+
+def call_cost(model_id: str, usage: dict[str, object]) -> float:
+    """Cost of one call: ``usage["cost"]`` when the provider reports it, else priced.
+
+    Prices come from ``WRITER_LLM_PRICING``, a JSON object mapping model ids (or
+    ``"*"``) to ``{"prompt_per_1k", "completion_per_1k"}``; unpriced models cost 0.
+    """
+    reported = _number(usage, "cost")
+    if reported is not None:
+        return reported
+    pricing = _configured_pricing()
+    prices = pricing.get(model_id) or pricing.get("*")
+    if not isinstance(prices, dict):
+        return 0.0
+    prompt_tokens = usage.get("prompt_tokens") if isinstance(usage.get("prompt_tokens"), int) else 0
+    completion_tokens = usage.get("completion_tokens") if isinstance(usage.get("completion_tokens"), int) else 0
+    return (
+        prompt_tokens * float(prices.get("prompt_per_1k", 0.0))
+        + completion_tokens * float(prices.get("completion_per_1k", 0.0))
+    ) / 1000.0
+
+
+def estimate_call_tokens(request: LlmRequest, limits: BudgetLimits) -> int:
+    return math.ceil(request.estimated_prompt_tokens * (1.0 + ESTIMATE_MARGIN)) + limits.completion_reserve_tokens
+
+
+def initial_run_remaining(limits: BudgetLimits) -> tuple[int | None, float | None]:
+    return limits.max_tokens_total, limits.max_cost_total
+
+
+def initial_step_remaining(limits: BudgetLimits) -> tuple[int | None, float | None]:
+    return limits.max_tokens_step, limits.max_cost_step
+
+
+def _estimate(request: LlmRequest, limits: BudgetLimits) -> tuple[int, float]:
+    tokens = estimate_call_tokens(request, limits)
+    return tokens, call_cost(request.model_id, {"prompt_tokens": tokens})
+
+
+def _subtract(conn: sqlite3.Connection, request: LlmRequest, tokens: int, cost: float) -> None:
+    # NULL (unlimited) stays NULL under subtraction.
+    conn.execute(
+        "UPDATE runs SET budget_remaining_tokens = budget_remaining_tokens - ?, "
+        "budget_remaining_cost = budget_remaining_cost - ? WHERE id = ?",
+        (tokens, cost, request.run_id),
+    )
+    conn.execute(
+        "UPDATE run_steps SET budget_remaining_tokens = budget_remaining_tokens - ?, "
+        "budget_remaining_cost = budget_remaining_cost - ? WHERE id = ?",
+        (tokens, cost, request.step_id),
+    )
+
+
+def check_before_call(conn: sqlite3.Connection, request: LlmRequest, budget: object) -> str | None:
+    """Return why ``request`` must not be sent, or None if the budget allows it.
+
+    Compares the estimate against the projected ``budget_remaining_*`` columns of
+    the run and the step; NULL columns are unlimited.
+    """
+    limits = BudgetLimits.from_json(budget)
+    run = conn.execute(
+        "SELECT budget_remaining_tokens, budget_remaining_cost FROM runs WHERE id = ?",
+        (request.run_id,),
+    ).fetchone()
+    step = conn.execute(
+        "SELECT budget_remaining_tokens, budget_remaining_cost FROM run_steps WHERE id = ?",
+        (request.step_id,),
+    ).fetchone()
+    tokens, cost = _estimate(request, limits)
+    for scope, row, token_key, cost_key in (
+        ("step", step, "max_tokens_step", "max_cost_step"),
+        ("run", run, "max_tokens_total", "max_cost_total"),
+    ):
+        if row is None:
+            continue
+        remaining_tokens, remaining_cost = row[0], row[1]
+        if remaining_tokens is not None and tokens > remaining_tokens:
+            return (
+                f"Token budget exceeded: the call needs an estimated {tokens} tokens but the {scope} "
+                f"has {max(0, remaining_tokens)} left ({token_key})."
+            )
+        if remaining_cost is not None and (remaining_cost <= 0 or cost > remaining_cost):
+            return (
+                f"Cost budget exceeded: the call needs an estimated {cost:g} but the {scope} "
+                f"has {max(0.0, remaining_cost):g} left ({cost_key})."
+            )
+    return None
+
+
+def reserve_call(conn: sqlite3.Connection, request: LlmRequest, budget: object) -> LlmRequest:
+    """Set an admitted call's estimate aside in the run and step projections.
+
+    Do it in the same write as ``check_before_call``, so calls admitted together
+    each see what the ones before them will spend. The returned request carries the
+    reservation for ``charge_usage`` to settle.
+    """
+    tokens, cost = _estimate(request, BudgetLimits.from_json(budget))
+    _subtract(conn, request, tokens, cost)
+    return replace(request, reserved_tokens=tokens, reserved_cost=cost)
+
+
+def release_reservation(conn: sqlite3.Connection, request: LlmRequest) -> None:
+    """Give back the reservation of a call that will not be made."""
+    _subtract(conn, request, -request.reserved_tokens, -request.reserved_cost)
+
+
+def charge_usage(conn: sqlite3.Connection, request: LlmRequest, outcome: LlmOutcome) -> None:
+    """Settle ``request``'s reservation against what its call actually used.
+
+    The billable attempts (the outcome and any hedge attempts riding along) are
+    charged, and the reservations of the request and of a hedge's duplicate are
+    given back, in one update per projection.
+    """
+    tokens = -request.reserved_tokens
+    cost = -request.reserved_cost
+    for attempt in (outcome, *outcome.hedge_attempts):
+        tokens -= attempt.reserved_tokens
+        cost -= attempt.reserved_cost
+        if attempt.billable:
+            tokens += usage_tokens(attempt.usage)
+            cost += call_cost(attempt.model_id, attempt.usage)
+    if tokens or cost:
+        _subtract(conn, request, tokens, cost)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class CallCancelled(Exception):
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"LLM call cancelled: {reason}.")
+        self.reason = reason
+
+
+class CancellationToken:
+    """One-shot flag shared between a driver and the LLM call it is waiting on.
+
+    The first ``cancel`` wins and its reason sticks (``"timeout"``, ``"paused"``,
+    ``"cancelled"``); callbacks registered before or after it fire exactly once.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise CallCancelled(self.reason)
+
+    def child(self) -> "CancellationToken":
+        """A token cancelled along with this one (with the same reason) that can also be cancelled alone."""
+        child = CancellationToken()
+        self.add_callback(lambda: child.cancel(self.reason or "cancelled"))
+        return child
+
+
+_current_token: ContextVar[CancellationToken | None] = ContextVar("llm_cancellation_token", default=None)
+
+
+def current_token() -> CancellationToken | None:
+    """The token of the call running on this thread, for cooperative checks inside it."""
+    return _current_token.get()
+
+
+def start_call(fn: Callable[[], T], token: CancellationToken) -> Future[T]:
+    """Run ``fn`` on its own daemon thread with ``token`` as its :func:`current_token`."""
+    future: Future[T] = Future()
+
+    def target() -> None:
+        _current_token.set(token)
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=target, name="llm-call", daemon=True).start()
+    return future
+
+
+def call_with_deadline(fn: Callable[[], T], token: CancellationToken, timeout: float | None) -> T:
+    """Run ``fn`` on its own thread; return its result unless ``token`` fires first.
+
+    Passing ``timeout`` seconds cancels ``token`` with reason ``"timeout"``. Once the
+    token is cancelled the caller gets :class:`CallCancelled` straight away, so its
+    worker slot is free again; the abandoned thread stops at its next
+    :func:`current_token` check (between stream chunks) and its result is dropped.
+    """
+    done = threading.Event()
+    token.add_callback(done.set)
+    future = start_call(fn, token)
+    future.add_done_callback(lambda _: done.set())
+    if not done.wait(timeout):
+        token.cancel("timeout")
+    if future.done():
+        return future.result()
+    raise CallCancelled(token.reason or "timeout")
+
+
+class CancellationRegistry:
+    """Tokens of the LLM calls this process has in flight, by run id."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tokens: dict[str, CancellationToken] = {}
+
+    def open(self, run_id: str) -> CancellationToken:
+        token = CancellationToken()
+        with self._lock:
+            self._tokens[run_id] = token
+        return token
+
+    def close(self, run_id: str, token: CancellationToken) -> None:
+        with self._lock:
+            if self._tokens.get(run_id) is token:
+                del self._tokens[run_id]
+
+    def cancel(self, run_id: str, reason: str) -> bool:
+        """Cancel ``run_id``'s in-flight call, if this process has one; thread-safe."""
+        with self._lock:
+            token = self._tokens.get(run_id)
+        return token is not None and token.cancel(reason)
+
+
+_registry = CancellationRegistry()
+
+
+def get_cancellations() -> CancellationRegistry:
+    return _registry
@@ -1,157 +1,22 @@
 from __future__ import annotations
 
+import logging
 import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Callable, Iterator, TypeVar
 
-SCHEMA_SQL = """
-PRAGMA foreign_keys = ON;
-
-CREATE TABLE IF NOT EXISTS projects (
-  id TEXT PRIMARY KEY,
-  name TEXT NOT NULL,
-  genre TEXT,
-  premise TEXT,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS project_settings (
-  id TEXT PRIMARY KEY,
-  project_id TEXT NOT NULL,
-  settings_json TEXT NOT NULL,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL,
-  FOREIGN KEY(project_id) REFERENCES projects(id)
-);
-
-CREATE UNIQUE INDEX IF NOT EXISTS idx_project_settings_project_id
-ON project_settings(project_id);
-
-CREATE TABLE IF NOT EXISTS chapters (
-  id TEXT PRIMARY KEY,
-  project_id TEXT NOT NULL,
-  volume_no INTEGER NOT NULL DEFAULT 1,
-  chapter_no INTEGER NOT NULL,
-  title TEXT,
-  status TEXT NOT NULL DEFAULT 'planned',
-  needs_review INTEGER NOT NULL DEFAULT 0,
-  review_reason TEXT,
-  plan_json TEXT,
-  traversal_profile_id TEXT,
-  style_guide_id TEXT,
-  lock_version INTEGER NOT NULL DEFAULT 0,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL,
-  UNIQUE(project_id, volume_no, chapter_no),
-  FOREIGN KEY(project_id) REFERENCES projects(id)
-);
-
-CREATE TABLE IF NOT EXISTS chapter_text_versions (
-  id TEXT PRIMARY KEY,
-  chapter_id TEXT NOT NULL,
-  version_no INTEGER NOT NULL,
-  stage TEXT NOT NULL,
-  content_text TEXT NOT NULL,
-  source_run_id TEXT,
-  source_step_id TEXT,
-  created_at TEXT NOT NULL,
-  UNIQUE(chapter_id, version_no),
-  FOREIGN KEY(chapter_id) REFERENCES chapters(id)
-);
-
-CREATE TABLE IF NOT EXISTS chapter_segments (
-  id TEXT PRIMARY KEY,
-  chapter_id TEXT NOT NULL,
-  segment_no INTEGER NOT NULL,
-  title TEXT,
-  pov_node_id TEXT,
-  segment_type TEXT,
-  content_text TEXT,
-  attrs_json TEXT,
-  is_deleted INTEGER NOT NULL DEFAULT 0,
-  deleted_at TEXT,
-  deleted_reason TEXT,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL,
-  UNIQUE(chapter_id, segment_no),
-  FOREIGN KEY(chapter_id) REFERENCES chapters(id)
-);
-
-CREATE TABLE IF NOT EXISTS chapter_reviews (
-  id TEXT PRIMARY KEY,
-  chapter_id TEXT NOT NULL,
-  version_id TEXT NOT NULL,
-  review_type TEXT NOT NULL DEFAULT 'logic',
-  report_json TEXT NOT NULL,
-  source_run_id TEXT,
-  source_step_id TEXT,
-  created_at TEXT NOT NULL,
-  FOREIGN KEY(chapter_id) REFERENCES chapters(id),
-  FOREIGN KEY(version_id) REFERENCES chapter_text_versions(id)
-);
-
-CREATE TABLE IF NOT EXISTS runs (
-  id TEXT PRIMARY KEY,
-  project_id TEXT NOT NULL,
-  swarm_profile_id TEXT,
-  run_type TEXT NOT NULL,
-  target_chapter_id TEXT,
-  status TEXT NOT NULL,
-  input_json TEXT,
-  output_json TEXT,
-  budget_json TEXT,
-  started_at TEXT NOT NULL,
-  finished_at TEXT,
-  FOREIGN KEY(project_id) REFERENCES projects(id),
-  FOREIGN KEY(target_chapter_id) REFERENCES chapters(id)
-);
-
-CREATE TABLE IF NOT EXISTS run_steps (
-  id TEXT PRIMARY KEY,
-  run_id TEXT NOT NULL,
-  step_no INTEGER NOT NULL,
-  step_type TEXT NOT NULL,
-  role TEXT,
-  status TEXT NOT NULL,
-  requires_approval INTEGER NOT NULL DEFAULT 0,
-  approval_status TEXT NOT NULL DEFAULT 'n/a',
-  override_payload_json TEXT,
-  input_json TEXT,
-  output_json TEXT,
-  budget_json TEXT,
-  started_at TEXT NOT NULL,
-  finished_at TEXT,
-  error_text TEXT,
-  UNIQUE(run_id, step_no),
-  FOREIGN KEY(run_id) REFERENCES runs(id)
-);
-
-CREATE TABLE IF NOT EXISTS llm_calls (
-  id TEXT PRIMARY KEY,
-  run_id TEXT,
-  step_id TEXT,
-  provider_id TEXT,
-  model_id TEXT,
-  purpose TEXT,
-  request_hash TEXT NOT NULL,
-  response_hash TEXT,
-  usage_json TEXT,
-  status TEXT NOT NULL,
-  error_text TEXT,
-  created_at TEXT NOT NULL,
-  FOREIGN KEY(run_id) REFERENCES runs(id),
-  FOREIGN KEY(step_id) REFERENCES run_steps(id)
-);
-
-CREATE INDEX IF NOT EXISTS idx_chapters_project_id ON chapters(project_id, id);
-CREATE INDEX IF NOT EXISTS idx_chapter_segments_chapter_id ON chapter_segments(chapter_id, segment_no);
-CREATE INDEX IF NOT EXISTS idx_chapter_text_versions_chapter_id ON chapter_text_versions(chapter_id, id);
-CREATE INDEX IF NOT EXISTS idx_chapter_reviews_chapter_id ON chapter_reviews(chapter_id, id);
-CREATE INDEX IF NOT EXISTS idx_runs_project_id ON runs(project_id, id);
-CREATE INDEX IF NOT EXISTS idx_run_steps_run_id ON run_steps(run_id, step_no);
-CREATE INDEX IF NOT EXISTS idx_llm_calls_run_id ON llm_calls(run_id, created_at);
-"""
+from app.migrations import migrate
+
+T = TypeVar("T")
+
+logger = logging.getLogger("app.db")
 
 
 def _db_path() -> Path:
@@ -159,16 +24,484 @@ def _db_path() -> Path:
     return Path(raw_path)
 
 
-def get_connection() -> sqlite3.Connection:
-    db_path = _db_path()
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path)
+def env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return int(raw)
+
+
+def env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return float(raw)
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    pool_size: int = 8
+    # Connections open at once (idle plus checked out); ``acquire`` waits for one to free up.
+    max_open: int = 32
+    acquire_timeout_seconds: float = 5.0
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size: int = -32000
+    mmap_size: int = 268435456
+    busy_timeout_ms: int = 5000
+    temp_store: str = "MEMORY"
+    statement_cache_size: int = 512
+    max_lifetime_seconds: float = 600.0
+    health_check_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            pool_size=env_int("WRITER_DB_POOL_SIZE", cls.pool_size),
+            max_open=env_int("WRITER_DB_POOL_MAX_OPEN", cls.max_open),
+            acquire_timeout_seconds=env_float("WRITER_DB_POOL_ACQUIRE_TIMEOUT_SECONDS", cls.acquire_timeout_seconds),
+            journal_mode=os.getenv("WRITER_DB_JOURNAL_MODE", cls.journal_mode),
+            synchronous=os.getenv("WRITER_DB_SYNCHRONOUS", cls.synchronous),
+            cache_size=env_int("WRITER_DB_CACHE_SIZE", cls.cache_size),
+            mmap_size=env_int("WRITER_DB_MMAP_SIZE", cls.mmap_size),
+            busy_timeout_ms=env_int("WRITER_DB_BUSY_TIMEOUT_MS", cls.busy_timeout_ms),
+            temp_store=os.getenv("WRITER_DB_TEMP_STORE", cls.temp_store),
+            statement_cache_size=env_int("WRITER_DB_STATEMENT_CACHE", cls.statement_cache_size),
+            max_lifetime_seconds=env_float("WRITER_DB_MAX_LIFETIME_SECONDS", cls.max_lifetime_seconds),
+            health_check_seconds=env_float("WRITER_DB_HEALTH_CHECK_SECONDS", cls.health_check_seconds),
+        )
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection carrying the bookkeeping the pool needs for recycling."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.opened_at = time.monotonic()
+        self.last_used_at = self.opened_at
+        self.last_thread_id: int | None = None
+        # Set by the writer while a write closure runs; see ``on_commit``.
+        self.commit_hooks: list[Callable[[], None]] | None = None
+
+
+def on_commit(conn: sqlite3.Connection, callback: Callable[[], None]) -> None:
+    """Run ``callback`` after the write that is in progress on ``conn`` commits.
+
+    On the writer connection the callback is dropped if the write rolls back. Other
+    connections do not track transactions, so the callback runs immediately.
+    """
+    hooks = getattr(conn, "commit_hooks", None)
+    if hooks is None:
+        callback()
+    else:
+        hooks.append(callback)
+
+
+def _open_connection(
+    db_path: Path, settings: PoolSettings, read_only: bool = False
+) -> PooledConnection:
+    conn = sqlite3.connect(
+        db_path,
+        factory=PooledConnection,
+        cached_statements=settings.statement_cache_size,
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.busy_timeout_ms)};")
+    conn.execute(f"PRAGMA journal_mode = {settings.journal_mode};")
+    conn.execute(f"PRAGMA synchronous = {settings.synchronous};")
+    conn.execute(f"PRAGMA cache_size = {int(settings.cache_size)};")
+    conn.execute(f"PRAGMA mmap_size = {int(settings.mmap_size)};")
+    conn.execute(f"PRAGMA temp_store = {settings.temp_store};")
     conn.execute("PRAGMA foreign_keys = ON;")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON;")
     return conn
 
 
-def init_db() -> None:
-    with get_connection() as conn:
-        conn.executescript(SCHEMA_SQL)
-        conn.commit()
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+class ConnectionPool:
+    """Keeps up to ``pool_size`` warm, pre-configured connections for one database file.
+
+    A connection is checked out by exactly one caller at a time. FastAPI may run a
+    dependency's setup and teardown on different worker threads, so connections are
+    not pinned to thread-locals; instead ``acquire`` prefers the idle connection the
+    calling thread released last, which keeps that connection's page cache hot.
+    At most ``max_open`` connections exist at once, whoever holds them; ``acquire``
+    waits up to ``acquire_timeout_seconds`` for one and then raises ``PoolExhausted``.
+    """
+
+    def __init__(self, db_path: Path, settings: PoolSettings, read_only: bool = False) -> None:
+        self.db_path = db_path
+        self.settings = settings
+        self.read_only = read_only
+        self._idle: list[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        # Idle plus checked-out connections, including ones being opened.
+        self._open = 0
+        self.opened = 0
+        self.recycled = 0
+        self.timeouts = 0
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _checkout(self, deadline: float) -> PooledConnection | None:
+        """An idle connection, or None after reserving a slot for a new one."""
+        thread_id = threading.get_ident()
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed.")
+                if self._idle:
+                    for idx in range(len(self._idle) - 1, -1, -1):
+                        if self._idle[idx].last_thread_id == thread_id:
+                            return self._idle.pop(idx)
+                    return self._idle.pop()
+                if self._open < self.settings.max_open:
+                    self._open += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhausted(f"All {self.settings.max_open} database connections are in use.")
+                self._available.wait(remaining)
+
+    def _discard(self, conn: PooledConnection) -> None:
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+        _close_quietly(conn)
+
+    def _is_healthy(self, conn: PooledConnection, now: float) -> bool:
+        if now - conn.opened_at > self.settings.max_lifetime_seconds:
+            return False
+        if now - conn.last_used_at > self.settings.health_check_seconds:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                return False
+        return True
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.settings.acquire_timeout_seconds
+        while True:
+            conn = self._checkout(deadline)
+            if conn is None:
+                try:
+                    conn = _open_connection(self.db_path, self.settings, self.read_only)
+                except BaseException:
+                    with self._available:
+                        self._open -= 1
+                        self._available.notify()
+                    raise
+                with self._lock:
+                    self.opened += 1
+                return conn
+            if self._is_healthy(conn, time.monotonic()):
+                return conn
+            with self._lock:
+                self.recycled += 1
+            self._discard(conn)
+
+    def release(self, conn: PooledConnection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        now = time.monotonic()
+        conn.last_used_at = now
+        conn.last_thread_id = threading.get_ident()
+        with self._lock:
+            keep = (
+                not self._closed
+                and len(self._idle) < self.settings.pool_size
+                and now - conn.opened_at <= self.settings.max_lifetime_seconds
+            )
+            if keep:
+                self._idle.append(conn)
+                self._available.notify()
+                return
+            if not self._closed:
+                self.recycled += 1
+        self._discard(conn)
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    def close(self) -> None:
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            _close_quietly(conn)
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    db_path = _db_path()
+    key = str(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, PoolSettings.from_env(), read_only=True)
+            _pools[key] = pool
+        return pool
+
+
+@contextmanager
+def pooled_connection() -> Iterator[sqlite3.Connection]:
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@dataclass(frozen=True)
+class WriterSettings:
+    max_batch: int = 64
+    batch_window_ms: float = 0.0
+    max_pending: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "WriterSettings":
+        return cls(
+            max_batch=env_int("WRITER_DB_WRITE_BATCH_SIZE", cls.max_batch),
+            batch_window_ms=env_float("WRITER_DB_WRITE_BATCH_WINDOW_MS", cls.batch_window_ms),
+            max_pending=env_int("WRITER_DB_WRITE_QUEUE_SIZE", cls.max_pending),
+        )
+
+
+@dataclass
+class _WriteRequest:
+    fn: Callable[[sqlite3.Connection], Any]
+    future: Future
+    enqueued_at: float
+
+
+class WriteQueue:
+    """Serializes all writes for one database file through a single writer thread.
+
+    Callers hand in closures that receive the writer connection. The writer drains
+    whatever is queued (up to ``max_batch``) into one ``BEGIN IMMEDIATE`` transaction,
+    runs each closure under its own savepoint so a failing closure only rolls back its
+    own changes, commits once, and only then resolves every caller's future.
+    """
+
+    def __init__(self, db_path: Path, settings: PoolSettings, writer_settings: WriterSettings) -> None:
+        self.db_path = db_path
+        self.settings = settings
+        self.writer_settings = writer_settings
+        self._queue: queue.Queue[_WriteRequest | None] = queue.Queue(maxsize=writer_settings.max_pending)
+        self._thread = threading.Thread(target=self._run, name="writer-db", daemon=True)
+        self._conn: sqlite3.Connection | None = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.rejected = 0
+        self.active = 0
+        self.peak_pending = 0
+        self.total_wait_seconds = 0.0
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _ensure_started(self) -> None:
+        if self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("Write queue is closed.")
+            if not self._thread.is_alive():
+                self._thread.start()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], T], block: bool = True) -> "Future[T]":
+        """Queue ``fn`` for the writer; with ``block=False`` a full queue raises ``queue.Full``."""
+        self._ensure_started()
+        future: Future[T] = Future()
+        request = _WriteRequest(fn=fn, future=future, enqueued_at=time.monotonic())
+        try:
+            self._queue.put(request, block=block)
+        except queue.Full:
+            self.rejected += 1
+            raise
+        self.peak_pending = max(self.peak_pending, self._queue.qsize())
+        return future
+
+    def execute(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        if threading.current_thread() is self._thread and self._conn is not None:
+            return fn(self._conn)
+        return self.submit(fn).result()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _collect_batch(self, first: _WriteRequest) -> tuple[list[_WriteRequest], bool]:
+        batch = [first]
+        window = self.writer_settings.batch_window_ms / 1000.0
+        deadline = time.monotonic() + window
+        while len(batch) < self.writer_settings.max_batch:
+            try:
+                if window > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        conn = _open_connection(self.db_path, self.settings)
+        conn.isolation_level = None
+        self._conn = conn
+        try:
+            stop = False
+            while not stop:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stop = self._collect_batch(first)
+                self._commit_batch(conn, batch)
+        finally:
+            self._conn = None
+            _close_quietly(conn)
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list[_WriteRequest]) -> None:
+        live = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        started = time.monotonic()
+        self.total_wait_seconds += sum(started - request.enqueued_at for request in live)
+        self.active = len(live)
+        try:
+            self._apply_batch(conn, live)
+        finally:
+            self.active = 0
+
+    def _apply_batch(self, conn: sqlite3.Connection, live: list[_WriteRequest]) -> None:
+        outcomes: list[tuple[bool, Any]] = []
+        committed_hooks: list[Callable[[], None]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for request in live:
+                conn.execute("SAVEPOINT write_item")
+                conn.commit_hooks = []
+                try:
+                    result = request.fn(conn)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    outcomes.append((False, exc))
+                else:
+                    conn.execute("RELEASE write_item")
+                    outcomes.append((True, result))
+                    committed_hooks.extend(conn.commit_hooks)
+                finally:
+                    conn.commit_hooks = None
+            conn.execute("COMMIT")
+        except Exception as exc:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            for request in live:
+                request.future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.writes += len(live)
+        for hook in committed_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("Commit hook failed.")
+        for request, (ok, value) in zip(live, outcomes):
+            if ok:
+                request.future.set_result(value)
+            else:
+                request.future.set_exception(value)
+
+    def close(self) -> None:
+        with self._start_lock:
+            self._closed = True
+            started = self._thread.is_alive()
+        if started:
+            self._queue.put(None)
+            self._thread.join()
+
+
+_writers: dict[str, WriteQueue] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer() -> WriteQueue:
+    db_path = _db_path()
+    key = str(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = WriteQueue(db_path, PoolSettings.from_env(), WriterSettings.from_env())
+            _writers[key] = writer
+        return writer
+
+
+def run_write(fn: Callable[[sqlite3.Connection], T]) -> T:
+    return get_writer().execute(fn)
+
+
+def close_writers() -> None:
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def get_connection() -> sqlite3.Connection:
+    db_path = _db_path()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    return _open_connection(db_path, PoolSettings.from_env())
+
+
+def init_db() -> list[int]:
+    conn = get_connection()
+    try:
+        return migrate(conn)
+    finally:
+        conn.close()
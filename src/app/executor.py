@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from app.db import env_int, get_writer, pooled_connection
+
+T = TypeVar("T")
+
+
+class ExecutorSaturated(RuntimeError):
+    pass
+
+
+class ReadExecutor:
+    """Size-bounded thread pool that runs read closures on pooled read-only connections.
+
+    At most ``max_workers`` closures run at once and at most ``max_queue`` wait behind
+    them; beyond that ``submit`` raises ``ExecutorSaturated`` instead of queueing
+    without bound, so a burst of slow list queries cannot starve the event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-read")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queued = 0
+        self.total_wait_seconds = 0.0
+
+    def _run(self, fn: Callable[[sqlite3.Connection], T], enqueued_at: float) -> T:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait_seconds += time.monotonic() - enqueued_at
+        try:
+            with pooled_connection() as conn:
+                return fn(conn)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def submit(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        with self._lock:
+            if self.queued + self.active >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated("Database read executor is saturated.")
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        future = self._executor.submit(self._run, fn, time.monotonic())
+        return await asyncio.wrap_future(future)
+
+    def metrics(self) -> dict[str, float | int]:
+        with self._lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "peak_queued": self.peak_queued,
+                "avg_wait_ms": (self.total_wait_seconds / started * 1000.0) if started else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+_read_executor: ReadExecutor | None = None
+_read_executor_lock = threading.Lock()
+
+
+def get_read_executor() -> ReadExecutor:
+    global _read_executor
+    with _read_executor_lock:
+        if _read_executor is None:
+            _read_executor = ReadExecutor(
+                max_workers=env_int("WRITER_DB_READ_WORKERS", 8),
+                max_queue=env_int("WRITER_DB_READ_QUEUE_SIZE", 256),
+            )
+        return _read_executor
+
+
+async def db_read(fn: Callable[[sqlite3.Connection], T]) -> T:
+    return await get_read_executor().submit(fn)
+
+
+def read_metrics() -> dict[str, float | int]:
+    return get_read_executor().metrics()
+
+
+async def db_write(fn: Callable[[sqlite3.Connection], T]) -> T:
+    try:
+        future = get_writer().submit(fn, block=False)
+    except queue.Full as exc:
+        raise ExecutorSaturated("Database write queue is saturated.") from exc
+    return await asyncio.wrap_future(future)
+
+
+def write_metrics() -> dict[str, float | int]:
+    writer = get_writer()
+    started = writer.writes + writer.active
+    return {
+        "max_workers": 1,
+        "max_queue": writer.writer_settings.max_pending,
+        "queued": writer.pending(),
+        "active": writer.active,
+        "completed": writer.writes,
+        "rejected": writer.rejected,
+        "peak_queued": writer.peak_pending,
+        "avg_wait_ms": (writer.total_wait_seconds / started * 1000.0) if started else 0.0,
+    }
+
+
+def shutdown_executors() -> None:
+    global _read_executor
+    with _read_executor_lock:
+        executor, _read_executor = _read_executor, None
+    if executor is not None:
+        executor.shutdown()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, Iterator, TypeVar
+
+from app.db import env_int
+from app.executor import ExecutorSaturated, db_read
+from app.schemas import ChapterOut, ChapterSegmentOut, ChapterTextVersionOut, ProjectOut
+from app.serialization import RowEncoder
+from app.versions import VERSION_COLUMNS, load_version_texts
+
+T = TypeVar("T")
+
+EXPORT_SECTIONS = ("chapters", "segments", "versions")
+
+# A batch that finds the read lane saturated waits and retries this many times
+# before the stream gives up; mid-response there is no 503 left to send.
+_SATURATED_RETRIES = 100
+_SATURATED_RETRY_SECONDS = 0.05
+
+_PROJECT_ENCODER = RowEncoder(ProjectOut)
+_CHAPTER_ENCODER = RowEncoder(ChapterOut)
+_SEGMENT_ENCODER = RowEncoder(ChapterSegmentOut)
+_VERSION_ENCODER = RowEncoder(ChapterTextVersionOut)
+_PROJECT_CHAPTERS = "SELECT id FROM chapters WHERE project_id = ?"
+
+
+def batch_size() -> int:
+    return max(1, env_int("WRITER_EXPORT_BATCH_SIZE", 200))
+
+
+def parse_include(include: str) -> tuple[str, ...]:
+    """The requested sections in export order; raises ``ValueError`` on unknown names."""
+    requested = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = sorted(requested - set(EXPORT_SECTIONS))
+    if unknown:
+        raise ValueError(f"Unknown export sections: {', '.join(unknown)}.")
+    return tuple(name for name in EXPORT_SECTIONS if name in requested)
+
+
+def _line(record_type: bytes, body: bytes) -> bytes:
+    return b'{"type":' + record_type + b',"data":' + body + b"}\n"
+
+
+@dataclass(frozen=True)
+class _Section:
+    name: str
+    record_type: bytes
+    table: str
+    columns: str
+    # Filter on the project id; ``key`` is a unique ordering the section is paged by.
+    # Sections keyed by chapter read ``{chapters}``, the project's chapter ids, which a
+    # later page narrows to the key's chapter onwards so it does not re-walk earlier chapters.
+    where: str
+    key: tuple[str, ...]
+    encoder: RowEncoder
+
+    def page(self, conn: sqlite3.Connection, project_id: str, after: tuple | None, size: int) -> list[sqlite3.Row]:
+        values: tuple = (project_id,)
+        if after is None:
+            where = self.where.format(chapters=_PROJECT_CHAPTERS)
+        else:
+            where = self.where.format(chapters=f"{_PROJECT_CHAPTERS} AND id >= ?")
+            if "{chapters}" in self.where:
+                values += (after[0],)
+            where += f" AND ({', '.join(self.key)}) > ({', '.join('?' for _ in self.key)})"
+            values += after
+        return conn.execute(
+            f"SELECT {self.columns} FROM {self.table} WHERE {where} ORDER BY {', '.join(self.key)} LIMIT ?",
+            (*values, size),
+        ).fetchall()
+
+    def encode(self, conn: sqlite3.Connection, rows: list[sqlite3.Row]) -> bytes:
+        if self.name == "versions":
+            texts = load_version_texts(conn, rows)
+            return b"".join(
+                _line(self.record_type, self.encoder.encode(row, content_text=text)) for row, text in zip(rows, texts)
+            )
+        return b"".join(_line(self.record_type, self.encoder.encode(row)) for row in rows)
+
+
+_SECTIONS = (
+    _Section(
+        "chapters",
+        b'"chapter"',
+        "chapters",
+        _CHAPTER_ENCODER.select_list,
+        "project_id = ?",
+        ("volume_no", "chapter_no"),
+        _CHAPTER_ENCODER,
+    ),
+    _Section(
+        "segments",
+        b'"segment"',
+        "chapter_segments",
+        _SEGMENT_ENCODER.select_list,
+        "chapter_id IN ({chapters}) AND is_deleted = 0",
+        ("chapter_id", "segment_no"),
+        _SEGMENT_ENCODER,
+    ),
+    # Oldest first per chapter, so delta bases are resolved (and cached) before their successors.
+    _Section(
+        "versions",
+        b'"version"',
+        "chapter_text_versions",
+        VERSION_COLUMNS,
+        "chapter_id IN ({chapters})",
+        ("chapter_id", "version_no"),
+        _VERSION_ENCODER,
+    ),
+)
+
+
+class ProjectExport:
+    """One project's NDJSON export, read one keyset batch per call.
+
+    The first line is the project; then, in ``EXPORT_SECTIONS`` order, every chapter
+    (in reading order), live segment and text version, each as
+    ``{"type": ..., "data": <list item>}``. Each call reads one batch of ``size``
+    rows after the last key it returned, on whatever connection it is given, so no
+    connection or read snapshot is held between batches and memory stays flat
+    however large the project is. The flip side: each batch is its own snapshot,
+    so rows written while an export streams appear if their batch is read later.
+    """
+
+    def __init__(self, project_id: str, sections: Iterable[str], size: int) -> None:
+        self.project_id = project_id
+        self.size = size
+        self._pending = [section for section in _SECTIONS if section.name in set(sections)]
+        self._after: tuple | None = None
+
+    def project_line(self, conn: sqlite3.Connection) -> bytes | None:
+        """The project line, or None when the project does not exist."""
+        row = conn.execute(
+            "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
+            (self.project_id,),
+        ).fetchone()
+        return None if row is None else _line(b'"project"', _PROJECT_ENCODER.encode(row))
+
+    def next_chunk(self, conn: sqlite3.Connection) -> bytes | None:
+        """The lines of the next batch, or None once every section is done."""
+        while self._pending:
+            section = self._pending[0]
+            rows = section.page(conn, self.project_id, self._after, self.size)
+            if len(rows) < self.size:
+                self._pending.pop(0)
+                self._after = None
+            else:
+                self._after = tuple(rows[-1][column] for column in section.key)
+            if rows:
+                return section.encode(conn, rows)
+        return None
+
+
+def export_project(conn: sqlite3.Connection, project_id: str, sections: Iterable[str], size: int) -> Iterator[bytes]:
+    """The whole export on one connection, one chunk per batch."""
+    export = ProjectExport(project_id, sections, size)
+    yield export.project_line(conn) or b""
+    while (chunk := export.next_chunk(conn)) is not None:
+        yield chunk
+
+
+async def _read(fn: Callable[[sqlite3.Connection], T]) -> T:
+    for _ in range(_SATURATED_RETRIES):
+        try:
+            return await db_read(fn)
+        except ExecutorSaturated:
+            await asyncio.sleep(_SATURATED_RETRY_SECONDS)
+    return await db_read(fn)
+
+
+async def stream_project_export(export: ProjectExport, first: bytes, compress: bool) -> AsyncIterator[bytes]:
+    """The export's chunks, each batch read (and, with ``compress``, gzipped) on the bounded read lane.
+
+    ``first`` is the project line the caller already read.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def pack(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor is not None else chunk
+
+    def read(conn: sqlite3.Connection) -> bytes | None:
+        chunk = export.next_chunk(conn)
+        return None if chunk is None else pack(chunk)
+
+    if data := pack(first):
+        yield data
+    while (chunk := await _read(read)) is not None:
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
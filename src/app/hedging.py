@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Callable
+
+from app.cancellation import CallCancelled, CancellationToken, current_token, start_call
+from app.db import env_float, pooled_connection
+from app.llm import ChunkCallback, LlmOutcome, LlmRequest, estimated_usage
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    # A call still running past this percentile of recent latencies gets a duplicate.
+    percentile: float = 0.95
+    # Too little history gives a meaningless percentile; do not hedge until there is enough.
+    min_samples: int = 20
+    # How many of the newest successful calls the percentile is taken over.
+    window: int = 200
+    # Never hedge sooner than this, however fast the history is.
+    min_delay_seconds: float = 0.0
+    # Send the duplicate here instead of to the same provider/model.
+    fallback_provider_id: str | None = None
+    fallback_model_id: str | None = None
+
+    @classmethod
+    def from_json(cls, raw: dict[str, object]) -> "HedgePolicy":
+        percentile = float(raw.get("percentile", cls.percentile))
+        if not 0.0 < percentile < 1.0:
+            raise ValueError("Hedge percentile must be between 0 and 1.")
+        return cls(
+            percentile=percentile,
+            min_samples=max(1, int(raw.get("min_samples", cls.min_samples))),
+            window=max(1, int(raw.get("window", cls.window))),
+            min_delay_seconds=float(raw.get("min_delay_seconds", cls.min_delay_seconds)),
+            fallback_provider_id=raw.get("fallback_provider_id"),
+            fallback_model_id=raw.get("fallback_model_id"),
+        )
+
+
+@dataclass(frozen=True)
+class HedgePlan:
+    request: LlmRequest
+    delay_seconds: float
+
+
+def latency_percentile(
+    conn: sqlite3.Connection,
+    provider_id: str,
+    model_id: str,
+    percentile: float,
+    window: int,
+    min_samples: int,
+) -> float | None:
+    """Nearest-rank ``percentile`` of the newest ``window`` successful call latencies, in ms."""
+    rows = conn.execute(
+        "SELECT latency_ms FROM llm_calls WHERE provider_id = ? AND model_id = ? "
+        "AND status = 'succeeded' AND latency_ms IS NOT NULL ORDER BY created_at DESC LIMIT ?",
+        (provider_id, model_id, window),
+    ).fetchall()
+    if len(rows) < min_samples:
+        return None
+    latencies = sorted(row[0] for row in rows)
+    return latencies[max(0, math.ceil(percentile * len(latencies)) - 1)]
+
+
+class HedgeRegistry:
+    """Hedging policies keyed on ``provider_id:model_id``, with cached latency thresholds.
+
+    Policies come from ``WRITER_LLM_HEDGE``, a JSON object mapping those keys (or
+    ``"*"``) to ``{"percentile", "min_samples", "window", "min_delay_seconds",
+    "fallback_provider_id", "fallback_model_id"}``. Calls with no policy are never
+    hedged. Thresholds are re-read from ``llm_calls`` every ``refresh_seconds``.
+    """
+
+    def __init__(self, config: dict[str, HedgePolicy], refresh_seconds: float) -> None:
+        self.config = config
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._thresholds: dict[str, tuple[float, float | None]] = {}
+
+    def policy_for(self, request: LlmRequest) -> HedgePolicy | None:
+        return self.config.get(f"{request.provider_id}:{request.model_id}") or self.config.get("*")
+
+    def threshold_ms(self, request: LlmRequest, policy: HedgePolicy) -> float | None:
+        key = f"{request.provider_id}:{request.model_id}"
+        with self._lock:
+            cached = self._thresholds.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.refresh_seconds:
+            return cached[1]
+        with pooled_connection() as conn:
+            threshold = latency_percentile(
+                conn, request.provider_id, request.model_id, policy.percentile, policy.window, policy.min_samples
+            )
+        with self._lock:
+            self._thresholds[key] = (time.monotonic(), threshold)
+        return threshold
+
+    def plan(self, request: LlmRequest) -> HedgePlan | None:
+        policy = self.policy_for(request)
+        if policy is None:
+            return None
+        threshold = self.threshold_ms(request, policy)
+        if threshold is None:
+            return None
+        # The duplicate reserves its own budget when it fires, if at all.
+        hedge_request = replace(
+            request,
+            provider_id=policy.fallback_provider_id or request.provider_id,
+            model_id=policy.fallback_model_id or request.model_id,
+            reserved_tokens=0,
+            reserved_cost=0.0,
+        )
+        return HedgePlan(request=hedge_request, delay_seconds=max(policy.min_delay_seconds, threshold / 1000.0))
+
+
+class _CountingChunks:
+    """Forwards stream chunks (if anyone is listening) and counts the text seen so far."""
+
+    def __init__(self, on_chunk: ChunkCallback | None) -> None:
+        self.on_chunk = on_chunk
+        self.chars = 0
+
+    def __call__(self, text: str) -> None:
+        self.chars += len(text)
+        if self.on_chunk is not None:
+            self.on_chunk(text)
+
+
+@dataclass
+class _Attempt:
+    request: LlmRequest
+    token: CancellationToken
+    future: Future[LlmOutcome]
+    chunks: _CountingChunks
+    started: float
+
+    def outcome(self) -> LlmOutcome:
+        try:
+            return self.future.result()
+        except CallCancelled as exc:
+            return self._cut_off(str(exc), exc.reason)
+        except Exception as exc:
+            return LlmOutcome(provider_id=self.request.provider_id, model_id=self.request.model_id, error=str(exc))
+
+    def _cut_off(self, error: str, reason: str) -> LlmOutcome:
+        return LlmOutcome(
+            provider_id=self.request.provider_id,
+            model_id=self.request.model_id,
+            usage=estimated_usage(self.request, self.chunks.chars),
+            error=error,
+            cancel_reason=reason,
+            latency_ms=round((time.monotonic() - self.started) * 1000.0, 3),
+        )
+
+    def lose(self) -> LlmOutcome:
+        """Cancel this attempt and return what it cost, to be logged next to the winner."""
+        self.token.cancel("hedged")
+        outcome = self.outcome() if self.future.done() else self._cut_off("LLM call cancelled: hedged.", "hedged")
+        outcome.hedge_lost = True
+        return outcome
+
+
+def hedged_call(
+    call: Callable[[LlmRequest, ChunkCallback | None], LlmOutcome],
+    request: LlmRequest,
+    plan: HedgePlan,
+    on_chunk: ChunkCallback | None = None,
+    admit: Callable[[LlmRequest], LlmRequest | None] | None = None,
+) -> LlmOutcome:
+    """Run ``request``; if it outlives ``plan.delay_seconds``, race ``plan.request`` against it.
+
+    The first successful attempt wins and the other is cancelled; its outcome rides
+    along in ``hedge_attempts`` so both are logged with their usage. Only the
+    primary streams to ``on_chunk`` (the hedge buffers), so a hedge win replaces
+    the streamed text when the step completes. Cancelling the caller's token
+    cancels both attempts. ``admit`` is asked when the hedge is due and returns the
+    request to send (carrying any budget it reserved), or None to send nothing and
+    simply await the primary; the hedge outcome carries that reservation back.
+    """
+    parent = current_token()
+    finished: queue.Queue[int] = queue.Queue()
+    attempts: list[_Attempt] = []
+
+    def launch(attempt_request: LlmRequest, chunk_callback: ChunkCallback | None) -> None:
+        token = parent.child() if parent is not None else CancellationToken()
+        chunks = _CountingChunks(chunk_callback)
+        future = start_call(lambda: call(attempt_request, chunks), token)
+        index = len(attempts)
+        attempts.append(_Attempt(attempt_request, token, future, chunks, time.monotonic()))
+        future.add_done_callback(lambda _: finished.put(index))
+
+    if parent is not None:
+        parent.add_callback(lambda: finished.put(-1))
+    launch(request, on_chunk)
+    try:
+        index = finished.get(timeout=plan.delay_seconds)
+    except queue.Empty:
+        hedge_request = admit(plan.request) if admit is not None else plan.request
+        if hedge_request is not None:
+            launch(hedge_request, None)
+        index = finished.get()
+    else:
+        if index >= 0:
+            return attempts[0].outcome()
+
+    pending = set(range(len(attempts)))
+    while True:
+        if index < 0:
+            parent.raise_if_cancelled()
+        pending.discard(index)
+        winner = attempts[index].outcome()
+        if winner.succeeded or not pending:
+            break
+        index = finished.get()
+    if len(attempts) == 1:
+        return winner
+    winner.hedge_attempts = [attempts[1 - index].lose()]
+    hedge = winner if index == 1 else winner.hedge_attempts[0]
+    hedge.reserved_tokens = attempts[1].request.reserved_tokens
+    hedge.reserved_cost = attempts[1].request.reserved_cost
+    if index == 1:
+        winner.hedge_model_id = plan.request.model_id
+    return winner
+
+
+def _configured_policies() -> dict[str, HedgePolicy]:
+    raw = os.getenv("WRITER_LLM_HEDGE", "").strip()
+    if not raw:
+        return {}
+    parsed = json.loads(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("WRITER_LLM_HEDGE must be a JSON object.")
+    return {key: HedgePolicy.from_json(policy) for key, policy in parsed.items()}
+
+
+_registry: HedgeRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_hedging() -> HedgeRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = HedgeRegistry(_configured_policies(), env_float("WRITER_LLM_HEDGE_REFRESH_SECONDS", 30.0))
+        return _registry
+
+
+def reset_hedging() -> None:
+    global _registry
+    with _registry_lock:
+        _registry = None
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Awaitable, Callable
+
+from app.db import env_float, env_int
+from app.executor import ExecutorSaturated, db_write
+from app.timestamps import iso, parse_iso, utc_now
+from app.ulid import new_ulid
+
+logger = logging.getLogger(__name__)
+
+Scope = dict[str, object]
+Message = dict[str, object]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+AsgiApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+_MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+
+def ttl_seconds() -> float:
+    return env_float("WRITER_IDEMPOTENCY_TTL_SECONDS", 86400.0)
+
+
+def lease_seconds() -> float:
+    return env_float("WRITER_IDEMPOTENCY_LEASE_SECONDS", 60.0)
+
+
+@dataclass(frozen=True)
+class Claim:
+    # "execute" (this request owns the key), "replay", "processing" or "conflict".
+    action: str
+    key_id: str | None = None
+    http_status: int | None = None
+    response_json: str | None = None
+    retry_after_seconds: int | None = None
+
+
+def request_hash(query: bytes, body: bytes) -> str:
+    """Hash of what makes two requests to one endpoint the same: query string and body.
+
+    JSON bodies are canonicalized first, so key order and whitespace do not count.
+    """
+    try:
+        canonical = json.dumps(json.loads(body), ensure_ascii=True, sort_keys=True).encode("ascii") if body else b""
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(query + b"\n" + canonical).hexdigest()
+
+
+def project_scope(path: str, body: bytes) -> str:
+    """The project a request writes to, from its body or ``/projects/{id}`` path; "" when it has none."""
+    try:
+        parsed = json.loads(body) if body else None
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict) and isinstance(parsed.get("project_id"), str):
+        return parsed["project_id"]
+    parts = path.strip("/").split("/")
+    if len(parts) >= 2 and parts[0] == "projects":
+        return parts[1]
+    return ""
+
+
+def claim_key(
+    conn: sqlite3.Connection,
+    project_id: str,
+    endpoint: str,
+    key: str,
+    hashed: str,
+    owner: str,
+    lease: float,
+    ttl: float,
+) -> Claim:
+    """Decide what a request carrying ``key`` does: run (under a lease), replay, wait or conflict.
+
+    Keys older than ``ttl`` count as unused. A key whose owner failed (5xx) or let its
+    lease lapse mid-request is taken over; the compare-and-set on ``updated_at``
+    stops two retries from both taking it.
+    """
+    now = utc_now()
+    now_iso = iso(now)
+    lease_until = iso(now + timedelta(seconds=lease))
+    inserted = conn.execute(
+        "INSERT INTO idempotency_keys ("
+        "id, project_id, endpoint, idempotency_key, request_hash, status, lease_owner, lease_until, "
+        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'processing', ?, ?, ?, ?) "
+        "ON CONFLICT(project_id, endpoint, idempotency_key) DO NOTHING RETURNING id",
+        (new_ulid("idem"), project_id, endpoint, key, hashed, owner, lease_until, now_iso, now_iso),
+    ).fetchone()
+    if inserted is not None:
+        return Claim("execute", inserted["id"])
+
+    row = conn.execute(
+        "SELECT id, request_hash, status, lease_until, http_status, response_json, created_at, updated_at "
+        "FROM idempotency_keys WHERE project_id = ? AND endpoint = ? AND idempotency_key = ?",
+        (project_id, endpoint, key),
+    ).fetchone()
+    expired = row["created_at"] < iso(now - timedelta(seconds=ttl))
+    if not expired:
+        if row["request_hash"] != hashed:
+            return Claim("conflict", row["id"])
+        if row["status"] == "succeeded":
+            return Claim("replay", row["id"], row["http_status"], row["response_json"])
+        if row["status"] == "processing" and row["lease_until"] > now_iso:
+            wait = (parse_iso(row["lease_until"]) - now).total_seconds()
+            return Claim("processing", row["id"], retry_after_seconds=max(1, math.ceil(wait)))
+
+    taken = conn.execute(
+        "UPDATE idempotency_keys SET request_hash = ?, status = 'processing', lease_owner = ?, lease_until = ?, "
+        "http_status = NULL, response_json = NULL, response_hash = NULL, error_text = NULL, "
+        "created_at = ?, updated_at = ? WHERE id = ? AND updated_at = ? RETURNING id",
+        (
+            hashed,
+            owner,
+            lease_until,
+            now_iso if expired else row["created_at"],
+            now_iso,
+            row["id"],
+            row["updated_at"],
+        ),
+    ).fetchone()
+    if taken is None:
+        return Claim("processing", row["id"], retry_after_seconds=1)
+    return Claim("execute", row["id"])
+
+
+def finish_key(
+    conn: sqlite3.Connection,
+    key_id: str,
+    owner: str,
+    http_status: int | None,
+    body: bytes | None,
+    error: str | None = None,
+) -> bool:
+    """Store the response of the request holding ``key_id``; 5xx and exceptions leave it retryable."""
+    succeeded = error is None and http_status is not None and http_status < 500
+    response_json = body.decode("utf-8") if succeeded and body is not None else None
+    row = conn.execute(
+        "UPDATE idempotency_keys SET status = ?, lease_owner = NULL, lease_until = NULL, http_status = ?, "
+        "response_json = ?, response_hash = ?, error_text = ?, updated_at = ? "
+        "WHERE id = ? AND lease_owner = ? RETURNING id",
+        (
+            "succeeded" if succeeded else "failed",
+            http_status,
+            response_json,
+            hashlib.sha256(body).hexdigest() if response_json is not None else None,
+            None if succeeded else error or f"HTTP {http_status}",
+            iso(utc_now()),
+            key_id,
+            owner,
+        ),
+    ).fetchone()
+    return row is not None
+
+
+def purge_expired_keys(conn: sqlite3.Connection, ttl: float, batch_size: int) -> int:
+    """Delete up to ``batch_size`` keys older than ``ttl`` (skipping live leases); returns the count."""
+    now = utc_now()
+    return conn.execute(
+        "DELETE FROM idempotency_keys WHERE id IN ("
+        "SELECT id FROM idempotency_keys WHERE created_at < ? "
+        "AND (status != 'processing' OR lease_until < ?) LIMIT ?)",
+        (iso(now - timedelta(seconds=ttl)), iso(now), batch_size),
+    ).rowcount
+
+
+async def _send_json(send: Send, status: int, body: dict[str, object], headers: list[tuple[bytes, bytes]]) -> None:
+    await _send_raw(send, status, json.dumps(body).encode("utf-8"), headers)
+
+
+async def _send_raw(send: Send, status: int, data: bytes, headers: list[tuple[bytes, bytes]]) -> None:
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode("ascii")), *headers]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+class IdempotencyMiddleware:
+    """Make mutating requests that carry an ``Idempotency-Key`` header safe to retry.
+
+    The first request with a key runs under a lease on its ``idempotency_keys`` row
+    and its response is stored. A retry with the same key and request replays that
+    response (marked ``Idempotent-Replayed: true``) without running the handler again;
+    while the first is still running it gets 202 ``E104_PROCESSING``, and the same
+    key with a different request gets 409 ``E101_IDEMPOTENCY_CONFLICT``. Keys are
+    scoped to the request's project and ``METHOD path``. Expired keys are purged in
+    batches of ``WRITER_IDEMPOTENCY_PURGE_BATCH`` after a response, at most once per
+    ``WRITER_IDEMPOTENCY_PURGE_SECONDS``.
+    """
+
+    def __init__(self, app: AsgiApp) -> None:
+        self.app = app
+        self._last_purge = 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in _MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+        raw_key = next((value for name, value in scope["headers"] if name == IDEMPOTENCY_HEADER), None)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        key = raw_key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            detail = f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters."
+            await _send_json(send, 422, {"detail": detail}, [])
+            return
+
+        body = await self._read_body(receive)
+        path = scope["path"]
+        endpoint = f"{scope['method']} {path}"
+        owner = new_ulid("req")
+        ttl = ttl_seconds()
+        try:
+            claim = await db_write(
+                lambda conn: claim_key(
+                    conn,
+                    project_scope(path, body),
+                    endpoint,
+                    key,
+                    request_hash(scope.get("query_string", b""), body),
+                    owner,
+                    lease_seconds(),
+                    ttl,
+                )
+            )
+        except ExecutorSaturated as exc:
+            await _send_json(send, 503, {"detail": str(exc)}, [(b"retry-after", b"1")])
+            return
+
+        if claim.action == "conflict":
+            detail = "Idempotency-Key was already used with a different request."
+            await _send_json(send, 409, {"detail": detail, "error_code": "E101_IDEMPOTENCY_CONFLICT"}, [])
+            return
+        if claim.action == "processing":
+            retry_after = claim.retry_after_seconds or 1
+            await _send_json(
+                send,
+                202,
+                {
+                    "detail": "A request with this Idempotency-Key is still processing.",
+                    "error_code": "E104_PROCESSING",
+                    "retry_after_seconds": retry_after,
+                },
+                [(b"retry-after", str(retry_after).encode("ascii"))],
+            )
+            return
+        if claim.action == "replay":
+            data = (claim.response_json or "").encode("utf-8")
+            await _send_raw(send, claim.http_status or 200, data, [(b"idempotent-replayed", b"true")])
+            return
+
+        status: int | None = None
+        chunks: list[bytes] = []
+        delivered = False
+
+        async def replay_body() -> Message:
+            nonlocal delivered
+            if delivered:
+                return await receive()
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except Exception as exc:
+            await self._finish(claim.key_id, owner, status, None, str(exc) or type(exc).__name__)
+            raise
+        await self._finish(claim.key_id, owner, status, b"".join(chunks))
+        await self._maybe_purge(ttl)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks: list[bytes] = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _finish(
+        key_id: str, owner: str, status: int | None, body: bytes | None, error: str | None = None
+    ) -> None:
+        try:
+            await db_write(lambda conn: finish_key(conn, key_id, owner, status, body, error))
+        except Exception:
+            # The lease lapses and a retry takes the key over.
+            logger.exception("Could not store the response for idempotency key %s.", key_id)
+
+    async def _maybe_purge(self, ttl: float) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < env_float("WRITER_IDEMPOTENCY_PURGE_SECONDS", 60.0):
+            return
+        self._last_purge = now
+        batch_size = env_int("WRITER_IDEMPOTENCY_PURGE_BATCH", 500)
+        # One short write per batch, so a large backlog never holds the writer for long.
+        try:
+            while await db_write(lambda conn: purge_expired_keys(conn, ttl, batch_size)) >= batch_size:
+                pass
+        except ExecutorSaturated:
+            self._last_purge = 0.0
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+from datetime import timedelta
+from typing import Iterable
+
+from app.cancellation import get_cancellations
+from app.db import env_float, run_write
+from app.timestamps import iso, utc_now
+from app.ulid import new_ulid
+
+logger = logging.getLogger(__name__)
+
+# One owner id per process; every run this process drives is leased under it.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{new_ulid()[-8:]}"
+
+
+def lease_seconds() -> float:
+    return env_float("WRITER_RUN_LEASE_SECONDS", 60.0)
+
+
+def claim_run(conn: sqlite3.Connection, run_id: str, owner: str, seconds: float) -> bool:
+    """Take (or extend) the lease on ``run_id`` unless another owner holds a live one."""
+    now = utc_now()
+    row = conn.execute(
+        "UPDATE runs SET lease_owner = ?, lease_expires_at = ? "
+        "WHERE id = ? AND status = 'running' "
+        "AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires_at < ?) "
+        "RETURNING id",
+        (owner, iso(now + timedelta(seconds=seconds)), run_id, owner, iso(now)),
+    ).fetchone()
+    return row is not None
+
+
+def claim_next_runs(conn: sqlite3.Connection, owner: str, limit: int, seconds: float) -> list[str]:
+    """Atomically lease up to ``limit`` running runs that nobody holds a live lease on."""
+    now = utc_now()
+    rows = conn.execute(
+        "UPDATE runs SET lease_owner = ?, lease_expires_at = ? "
+        "WHERE id IN ("
+        "SELECT id FROM runs WHERE status = 'running' "
+        "AND (lease_owner IS NULL OR lease_expires_at < ?) "
+        "ORDER BY id LIMIT ?"
+        ") RETURNING id",
+        (owner, iso(now + timedelta(seconds=seconds)), iso(now), limit),
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def holds_lease(conn: sqlite3.Connection, run_id: str, owner: str) -> bool:
+    row = conn.execute("SELECT lease_owner FROM runs WHERE id = ?", (run_id,)).fetchone()
+    return row is not None and row[0] == owner
+
+
+def renew_leases(conn: sqlite3.Connection, owner: str, run_ids: Iterable[str], seconds: float) -> int:
+    expires_at = iso(utc_now() + timedelta(seconds=seconds))
+    renewed = 0
+    for run_id in run_ids:
+        renewed += conn.execute(
+            "UPDATE runs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ?",
+            (expires_at, run_id, owner),
+        ).rowcount
+    return renewed
+
+
+def stopped_runs(conn: sqlite3.Connection, run_ids: list[str]) -> dict[str, str]:
+    """Status of each of ``run_ids`` that is no longer running (paused or cancelled elsewhere)."""
+    placeholders = ", ".join("?" for _ in run_ids)
+    rows = conn.execute(
+        f"SELECT id, status FROM runs WHERE id IN ({placeholders}) AND status != 'running'",
+        run_ids,
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def release_run(conn: sqlite3.Connection, run_id: str, owner: str) -> None:
+    conn.execute(
+        "UPDATE runs SET lease_owner = NULL, lease_expires_at = NULL WHERE id = ? AND lease_owner = ?",
+        (run_id, owner),
+    )
+
+
+def reclaim_expired_leases(conn: sqlite3.Connection) -> list[str]:
+    """Clear leases whose owner stopped heartbeating and return the affected run ids."""
+    rows = conn.execute(
+        "UPDATE runs SET lease_owner = NULL, lease_expires_at = NULL "
+        "WHERE status = 'running' AND lease_owner IS NOT NULL AND lease_expires_at < ? "
+        "RETURNING id",
+        (iso(utc_now()),),
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+class LeaseHeartbeat:
+    """Daemon thread that keeps this process's leases alive while runs are driven.
+
+    Renews every third of the lease period, so a lease only lapses after the owning
+    process has missed several heartbeats (crashed, killed, or wedged). Each beat
+    also cancels in-flight calls of runs another process paused or cancelled.
+    """
+
+    def __init__(self, owner: str, seconds: float) -> None:
+        self.owner = owner
+        self.seconds = seconds
+        self._held: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.beats = 0
+
+    def track(self, run_id: str) -> None:
+        with self._lock:
+            self._held.add(run_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="lease-heartbeat", daemon=True)
+                self._thread.start()
+
+    def untrack(self, run_id: str) -> None:
+        with self._lock:
+            self._held.discard(run_id)
+
+    def beat(self) -> int:
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return 0
+
+        def renew(conn: sqlite3.Connection) -> tuple[int, dict[str, str]]:
+            return renew_leases(conn, self.owner, held, self.seconds), stopped_runs(conn, held)
+
+        renewed, stopped = run_write(renew)
+        for run_id, status in stopped.items():
+            get_cancellations().cancel(run_id, status)
+        self.beats += 1
+        return renewed
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.seconds / 3.0):
+            try:
+                self.beat()
+            except Exception:
+                logger.exception("Lease heartbeat failed.")
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+
+_heartbeat: LeaseHeartbeat | None = None
+_heartbeat_lock = threading.Lock()
+
+
+def get_heartbeat() -> LeaseHeartbeat:
+    global _heartbeat
+    with _heartbeat_lock:
+        if _heartbeat is None:
+            _heartbeat = LeaseHeartbeat(WORKER_ID, lease_seconds())
+        return _heartbeat
+
+
+def stop_heartbeat() -> None:
+    global _heartbeat
+    with _heartbeat_lock:
+        heartbeat, _heartbeat = _heartbeat, None
+    if heartbeat is not None:
+        heartbeat.stop()
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field, replace
+from typing import Callable
+
+from app.cancellation import CallCancelled, current_token
+from app.ulid import new_ulid
+
+LlmGenerate = Callable[[dict[str, object]], object]
+# Receives each streamed text delta as it arrives.
+ChunkCallback = Callable[[str], None]
+
+DEFAULT_PROVIDER_ID = "mock"
+DEFAULT_MODEL_ID = "mock-writer-v1"
+# Identify the caller rather than the prompt, so they stay out of request_hash and
+# identical prompts from different runs share one hash (and one cache entry).
+_UNHASHED_KEYS = ("run_id", "step_id")
+
+
+def default_llm_generate(request_payload: dict[str, object]) -> dict[str, object]:
+    chapter_title = request_payload.get("chapter_title")
+    if not isinstance(chapter_title, str) or not chapter_title.strip():
+        chapter_title = f"Chapter {request_payload.get('chapter_no', 'X')}"
+
+    input_json = request_payload.get("input_json")
+    prompt_text = ""
+    if isinstance(input_json, dict):
+        raw_prompt = input_json.get("prompt")
+        if isinstance(raw_prompt, str):
+            prompt_text = raw_prompt.strip()
+
+    if isinstance(request_payload.get("review_of"), dict):
+        # Review steps answer with a report; the mock finds nothing wrong.
+        report = {"issues": [], "summary": f"No issues found in {chapter_title}."}
+        return {
+            "content_text": json.dumps(report, ensure_ascii=True, sort_keys=True),
+            "provider_id": DEFAULT_PROVIDER_ID,
+            "model_id": DEFAULT_MODEL_ID,
+        }
+
+    base_text = prompt_text or "M0a draft generated by the built-in mock runner."
+    content_text = f"{chapter_title}\n\n{base_text}"
+    return {
+        "content_text": content_text,
+        "provider_id": DEFAULT_PROVIDER_ID,
+        "model_id": DEFAULT_MODEL_ID,
+    }
+
+
+@dataclass(frozen=True)
+class LlmRequest:
+    run_id: str
+    step_id: str
+    purpose: str
+    payload: dict[str, object]
+    request_text: str
+    request_hash: str
+    model_id: str = DEFAULT_MODEL_ID
+    use_cache: bool = True
+    provider_id: str = DEFAULT_PROVIDER_ID
+    rate_limit_bucket: str | None = None
+    # Deadline for the whole call, rate-limit wait included; None waits forever.
+    timeout_seconds: float | None = None
+    # Budget set aside when the call was admitted (see ``budget.reserve_call``).
+    reserved_tokens: int = 0
+    reserved_cost: float = 0.0
+
+    @property
+    def bucket(self) -> str:
+        return self.rate_limit_bucket or f"{self.provider_id}:{self.model_id}"
+
+    @property
+    def estimated_prompt_tokens(self) -> int:
+        return max(1, len(self.request_text) // 4)
+
+
+@dataclass
+class LlmOutcome:
+    provider_id: str = DEFAULT_PROVIDER_ID
+    model_id: str = DEFAULT_MODEL_ID
+    content_text: str | None = None
+    usage: dict[str, object] = field(default_factory=dict)
+    response_hash: str | None = None
+    error: str | None = None
+    cache_hit: bool = False
+    call_id: str = field(default_factory=lambda: new_ulid("llm"))
+    # Set on outcomes shared from another run's in-flight call (single-flight followers).
+    leader_call_id: str | None = None
+    # {"bucket", "wait_ms"} when the call went through a rate limiter.
+    rate_limit: dict[str, object] | None = None
+    # Why the driver stopped waiting ("timeout", "paused", "cancelled", "hedged"), if it did.
+    cancel_reason: str | None = None
+    # Wall time of a fresh provider call; None for cache hits and coalesced followers.
+    latency_ms: float | None = None
+    # Set on the losing attempt of a hedged call; it is logged next to the winner.
+    hedge_lost: bool = False
+    # Set when a hedge's duplicate won: the model it was sent to, which the response is cached under.
+    hedge_model_id: str | None = None
+    # Budget a hedge's duplicate reserved when it fired; the primary's rides on its request.
+    reserved_tokens: int = 0
+    reserved_cost: float = 0.0
+    hedge_attempts: list["LlmOutcome"] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def coalesced(self) -> bool:
+        return self.leader_call_id is not None
+
+    @property
+    def billable(self) -> bool:
+        """True for a fresh provider call; cache hits and coalesced followers cost nothing.
+
+        Calls cut off by a timeout, a pause or cancel, or a winning hedge are billed too:
+        their tokens were spent even though no output was kept.
+        """
+        return (
+            (self.succeeded or self.hedge_lost or self.cancel_reason is not None)
+            and not self.cache_hit
+            and not self.coalesced
+        )
+
+    def for_follower(self) -> "LlmOutcome":
+        return replace(
+            self,
+            usage=dict(self.usage),
+            call_id=new_ulid("llm"),
+            leader_call_id=self.call_id,
+            latency_ms=None,
+            reserved_tokens=0,
+            reserved_cost=0.0,
+            hedge_attempts=[],
+        )
+
+
+def build_request(
+    run_id: str,
+    step_id: str,
+    purpose: str,
+    payload: dict[str, object],
+    model_id: str = DEFAULT_MODEL_ID,
+    use_cache: bool = True,
+    provider_id: str = DEFAULT_PROVIDER_ID,
+    rate_limit_bucket: str | None = None,
+    timeout_seconds: float | None = None,
+) -> LlmRequest:
+    hashed = {key: value for key, value in payload.items() if key not in _UNHASHED_KEYS}
+    request_text = json.dumps(hashed, ensure_ascii=True, sort_keys=True)
+    return LlmRequest(
+        run_id=run_id,
+        step_id=step_id,
+        purpose=purpose,
+        payload=payload,
+        request_text=request_text,
+        request_hash=hashlib.sha256(f"{purpose}\n{request_text}".encode("utf-8")).hexdigest(),
+        model_id=model_id,
+        use_cache=use_cache,
+        provider_id=provider_id,
+        rate_limit_bucket=rate_limit_bucket,
+        timeout_seconds=timeout_seconds,
+    )
+
+
+def _consume_stream(stream: Iterator[object], on_chunk: ChunkCallback | None) -> dict[str, object]:
+    """Collect a streaming generator into the dict shape a non-streaming one returns.
+
+    A stream yields text deltas, either as strings or as ``{"delta": str}``; any
+    chunk may also carry ``usage_json``, ``provider_id`` or ``model_id`` (typically
+    the last one), and later values win. A cancelled call stops reading (and closes
+    the stream) at the next chunk.
+    """
+    parts: list[str] = []
+    final: dict[str, object] = {}
+    token = current_token()
+    for chunk in stream:
+        if token is not None and token.cancelled:
+            close = getattr(stream, "close", None)
+            if callable(close):
+                close()
+            token.raise_if_cancelled()
+        if isinstance(chunk, str):
+            delta = chunk
+        elif isinstance(chunk, dict):
+            delta = chunk.get("delta", "")
+            if not isinstance(delta, str):
+                raise ValueError("LLM stream chunk delta must be a string.")
+            final.update({key: chunk[key] for key in ("usage_json", "provider_id", "model_id") if key in chunk})
+        else:
+            raise ValueError("LLM stream chunks must be strings or dicts.")
+        if delta:
+            parts.append(delta)
+            if on_chunk is not None:
+                on_chunk(delta)
+    final["content_text"] = "".join(parts)
+    return final
+
+
+def call_llm(generator: LlmGenerate, request: LlmRequest, on_chunk: ChunkCallback | None = None) -> LlmOutcome:
+    """Run ``generator`` and normalise its result; never touches the database.
+
+    ``generator`` returns either the whole response (a string or a dict with
+    ``content_text``) or an iterator of chunks, which is consumed here with each
+    delta passed to ``on_chunk``. Raises :class:`CallCancelled` instead of calling
+    out once the caller's cancellation token has fired.
+    """
+    outcome = LlmOutcome(provider_id=request.provider_id, model_id=request.model_id)
+    token = current_token()
+    started = time.monotonic()
+    try:
+        if token is not None:
+            token.raise_if_cancelled()
+        generated = generator(request.payload)
+        if isinstance(generated, Iterator):
+            generated = _consume_stream(generated, on_chunk)
+        if isinstance(generated, str):
+            content_text = generated
+        elif isinstance(generated, dict):
+            raw_content = generated.get("content_text")
+            if not isinstance(raw_content, str):
+                raise ValueError("LLM mock must return content_text as string.")
+            content_text = raw_content
+            if isinstance(generated.get("provider_id"), str):
+                outcome.provider_id = generated["provider_id"]
+            if isinstance(generated.get("model_id"), str):
+                outcome.model_id = generated["model_id"]
+            raw_usage = generated.get("usage_json")
+            if isinstance(raw_usage, dict):
+                outcome.usage = raw_usage
+        else:
+            raise ValueError("LLM mock must return either a string or a dict.")
+
+        if not content_text.strip():
+            raise ValueError("LLM mock returned empty content.")
+    except CallCancelled:
+        raise
+    except Exception as exc:
+        outcome.error = str(exc)
+        outcome.latency_ms = round((time.monotonic() - started) * 1000.0, 3)
+        return outcome
+
+    if not outcome.usage:
+        outcome.usage = {
+            "prompt_tokens": request.estimated_prompt_tokens,
+            "completion_tokens": max(1, len(content_text) // 4),
+        }
+    response_text = json.dumps({"content_text": content_text}, ensure_ascii=True, sort_keys=True)
+    outcome.content_text = content_text
+    outcome.latency_ms = round((time.monotonic() - started) * 1000.0, 3)
+    outcome.response_hash = hashlib.sha256(response_text.encode("utf-8")).hexdigest()
+    return outcome
+
+
+def usage_tokens(usage: dict[str, object]) -> int:
+    return sum(
+        value for key in ("prompt_tokens", "completion_tokens") if isinstance(value := usage.get(key), int)
+    )
+
+
+def estimated_usage(request: LlmRequest, streamed_chars: int) -> dict[str, object]:
+    """Usage of a call we stopped reading: the provider never reported it, so estimate it."""
+    return {
+        "prompt_tokens": request.estimated_prompt_tokens,
+        "completion_tokens": streamed_chars // 4,
+        "estimated": True,
+    }
+
+
+def _call_status(outcome: LlmOutcome) -> str:
+    if outcome.hedge_lost:
+        return "hedge_lost"
+    if outcome.cancel_reason is not None:
+        return "cancelled"
+    if not outcome.succeeded:
+        return "failed"
+    # Cache hits and coalesced followers keep the original usage for reference but
+    # cost nothing; what is billed is decided by ``LlmOutcome.billable``, which also
+    # counts "cancelled" and "hedge_lost" calls.
+    if outcome.coalesced:
+        return "coalesced"
+    return "cache_hit" if outcome.cache_hit else "succeeded"
+
+
+def record_llm_call(
+    conn: sqlite3.Connection,
+    request: LlmRequest,
+    outcome: LlmOutcome,
+    created_at: str,
+) -> str:
+    conn.execute(
+        "INSERT INTO llm_calls ("
+        "id, run_id, step_id, provider_id, model_id, purpose, request_hash, response_hash, usage_json, "
+        "status, error_text, leader_call_id, latency_ms, created_at"
+        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            outcome.call_id,
+            request.run_id,
+            request.step_id,
+            outcome.provider_id,
+            outcome.model_id,
+            request.purpose,
+            request.request_hash,
+            outcome.response_hash,
+            json.dumps(outcome.usage, ensure_ascii=True, sort_keys=True) if outcome.usage else None,
+            _call_status(outcome),
+            outcome.error,
+            outcome.leader_call_id,
+            outcome.latency_ms,
+            created_at,
+        ),
+    )
+    return outcome.call_id
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Protocol
+
+from app.blobs import get_texts, put_text
+from app.db import env_float, env_int, pooled_connection
+from app.llm import LlmOutcome, LlmRequest
+
+TIERS = ("memory", "sqlite")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    provider_id: str
+    model_id: str
+    content_text: str
+    usage: dict[str, object]
+    response_hash: str
+    stored_at: float
+
+    def to_outcome(self) -> LlmOutcome:
+        return LlmOutcome(
+            provider_id=self.provider_id,
+            model_id=self.model_id,
+            content_text=self.content_text,
+            usage=dict(self.usage),
+            response_hash=self.response_hash,
+            cache_hit=True,
+        )
+
+
+def cache_key(request_hash: str, model_id: str) -> str:
+    return f"{model_id}:{request_hash}"
+
+
+class CacheTier(Protocol):
+    name: str
+    needs_connection: bool
+
+    def get(self, conn: sqlite3.Connection | None, key: str, now: float) -> CachedResponse | None: ...
+
+    def put(self, conn: sqlite3.Connection | None, key: str, entry: CachedResponse) -> None: ...
+
+    def touch(self, conn: sqlite3.Connection | None, key: str, now: float) -> None: ...
+
+
+class MemoryCacheTier:
+    """Process-local LRU bounded by entry count and total text size, with a TTL."""
+
+    name = "memory"
+    needs_connection = False
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, conn: sqlite3.Connection | None, key: str, now: float) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now - entry.stored_at > self.ttl_seconds:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, conn: sqlite3.Connection | None, key: str, entry: CachedResponse) -> None:
+        size = len(entry.content_text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def touch(self, conn: sqlite3.Connection | None, key: str, now: float) -> None:
+        pass
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.content_text)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SqliteCacheTier:
+    """Shared across processes via ``llm_response_cache``; bodies live in ``text_blobs``.
+
+    Recency is tracked in ``last_used_epoch`` and only written from the write path, so a
+    lookup stays a pure read; the oldest rows are pruned past ``max_entries``.
+    """
+
+    name = "sqlite"
+    needs_connection = True
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, conn: sqlite3.Connection | None, key: str, now: float) -> CachedResponse | None:
+        row = conn.execute(
+            "SELECT provider_id, response_model_id, content_hash, usage_json, response_hash, created_epoch "
+            "FROM llm_response_cache WHERE cache_key = ? AND created_epoch >= ?",
+            (key, now - self.ttl_seconds),
+        ).fetchone()
+        if row is None:
+            return None
+        texts = get_texts(conn, [row["content_hash"]])
+        if row["content_hash"] not in texts:
+            return None
+        return CachedResponse(
+            provider_id=row["provider_id"],
+            model_id=row["response_model_id"],
+            content_text=texts[row["content_hash"]],
+            usage=json.loads(row["usage_json"]),
+            response_hash=row["response_hash"],
+            stored_at=row["created_epoch"],
+        )
+
+    def put(self, conn: sqlite3.Connection | None, key: str, entry: CachedResponse) -> None:
+        content_hash = put_text(conn, entry.content_text)
+        conn.execute(
+            "INSERT INTO llm_response_cache ("
+            "cache_key, provider_id, response_model_id, content_hash, usage_json, response_hash, "
+            "created_epoch, last_used_epoch, hits"
+            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0) "
+            "ON CONFLICT(cache_key) DO UPDATE SET "
+            "provider_id = excluded.provider_id, "
+            "response_model_id = excluded.response_model_id, "
+            "content_hash = excluded.content_hash, "
+            "usage_json = excluded.usage_json, "
+            "response_hash = excluded.response_hash, "
+            "created_epoch = excluded.created_epoch, "
+            "last_used_epoch = excluded.last_used_epoch",
+            (
+                key,
+                entry.provider_id,
+                entry.model_id,
+                content_hash,
+                json.dumps(entry.usage, ensure_ascii=True, sort_keys=True),
+                entry.response_hash,
+                entry.stored_at,
+                entry.stored_at,
+            ),
+        )
+        self._prune(conn, entry.stored_at)
+
+    def touch(self, conn: sqlite3.Connection | None, key: str, now: float) -> None:
+        conn.execute(
+            "UPDATE llm_response_cache SET last_used_epoch = ?, hits = hits + 1 WHERE cache_key = ?",
+            (now, key),
+        )
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM llm_response_cache WHERE created_epoch < ?", (now - self.ttl_seconds,))
+        excess = conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM llm_response_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_response_cache ORDER BY last_used_epoch LIMIT ?)",
+                (excess,),
+            )
+
+
+class LlmResponseCache:
+    """Read-through cache of successful LLM responses keyed on ``(model_id, request_hash)``.
+
+    ``lookup`` runs before the model call and only reads; ``remember`` runs inside
+    the write that records the ``llm_calls`` row, so a response is cached in the
+    same transaction that accounts for it.
+    """
+
+    def __init__(self, tiers: list[CacheTier]) -> None:
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, request: LlmRequest) -> LlmOutcome | None:
+        if not request.use_cache or not self.tiers:
+            return None
+        key = cache_key(request.request_hash, request.model_id)
+        now = time.time()
+        for index, tier in enumerate(self.tiers):
+            if tier.needs_connection:
+                with pooled_connection() as conn:
+                    entry = tier.get(conn, key, now)
+            else:
+                entry = tier.get(None, key, now)
+            if entry is not None:
+                # Promote into the faster tiers that missed.
+                for faster in self.tiers[:index]:
+                    if not faster.needs_connection:
+                        faster.put(None, key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry.to_outcome()
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def remember(self, conn: sqlite3.Connection, request: LlmRequest, outcome: LlmOutcome) -> None:
+        if not request.use_cache or not self.tiers or not outcome.succeeded or outcome.coalesced:
+            return
+        # A hedge win answered for the fallback model, not the one the request asked for.
+        key = cache_key(request.request_hash, outcome.hedge_model_id or request.model_id)
+        now = time.time()
+        if outcome.cache_hit:
+            for tier in self.tiers:
+                tier.touch(conn, key, now)
+            return
+        entry = CachedResponse(
+            provider_id=outcome.provider_id,
+            model_id=outcome.model_id,
+            content_text=outcome.content_text,
+            usage=dict(outcome.usage),
+            response_hash=outcome.response_hash,
+            stored_at=now,
+        )
+        for tier in self.tiers:
+            tier.put(conn, key, entry)
+
+
+def _configured_tiers() -> list[CacheTier]:
+    raw = os.getenv("WRITER_LLM_CACHE_TIERS", "memory,sqlite").strip().lower()
+    if raw in {"", "off", "none"}:
+        return []
+    ttl_seconds = env_float("WRITER_LLM_CACHE_TTL_SECONDS", 86400.0)
+    tiers: list[CacheTier] = []
+    for name in (part.strip() for part in raw.split(",")):
+        if name == "memory":
+            tiers.append(
+                MemoryCacheTier(
+                    max_entries=env_int("WRITER_LLM_CACHE_MEMORY_ENTRIES", 1024),
+                    max_bytes=env_int("WRITER_LLM_CACHE_MEMORY_MB", 32) * 1024 * 1024,
+                    ttl_seconds=ttl_seconds,
+                )
+            )
+        elif name == "sqlite":
+            tiers.append(
+                SqliteCacheTier(
+                    max_entries=env_int("WRITER_LLM_CACHE_SQLITE_ENTRIES", 100000),
+                    ttl_seconds=ttl_seconds,
+                )
+            )
+        else:
+            raise ValueError(f"WRITER_LLM_CACHE_TIERS entries must be among {', '.join(TIERS)}.")
+    return tiers
+
+
+_response_cache: LlmResponseCache | None = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LlmResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LlmResponseCache(_configured_tiers())
+        return _response_cache
+
+
+def reset_response_cache() -> None:
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = None
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.ulid import new_ulid
+
+logger = logging.getLogger("app.llm_stub")
+
+
+@dataclass
+class StubConfig:
+    # Delay before the first byte of every response.
+    latency_ms: float = 0.0
+    # Delay between streamed chunks.
+    chunk_delay_ms: float = 0.0
+    # Words in each reply; 0 echoes the last user message instead.
+    reply_words: int = 0
+    # Answer this many chat requests with 503 before serving normally (retry testing).
+    fail_first: int = 0
+
+
+@dataclass
+class StubStats:
+    connections: int = 0
+    requests: int = 0
+    failures: int = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubHTTPServer"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats.connections += 1
+
+    def log_message(self, format: str, *args: object) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, body: dict[str, object], headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}."}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.path not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}."}})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Request body is not JSON."}})
+            return
+
+        config = self.server.config
+        with self.server.stats_lock:
+            self.server.stats.requests += 1
+            failing = self.server.stats.failures < config.fail_first
+            if failing:
+                self.server.stats.failures += 1
+        if config.latency_ms:
+            time.sleep(config.latency_ms / 1000.0)
+        if failing:
+            self._send_json(503, {"error": {"message": "Stub is failing on purpose."}}, {"Retry-After": "0"})
+            return
+
+        model = body.get("model") or "stub-model"
+        prompt = "".join(
+            message.get("content") or ""
+            for message in body.get("messages") or []
+            if isinstance(message, dict) and message.get("role") == "user"
+        )
+        if config.reply_words:
+            words = [f"word{n}" for n in range(config.reply_words)]
+        else:
+            words = f"Stub reply: {prompt}".split(" ")
+        usage = {"prompt_tokens": max(1, len(prompt) // 4), "completion_tokens": len(words)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = new_ulid("chatcmpl")
+        if body.get("stream"):
+            self._stream(completion_id, model, words, usage, config)
+            return
+        self._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(
+        self,
+        completion_id: str,
+        model: str,
+        words: list[str],
+        usage: dict[str, int],
+        config: StubConfig,
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload: object) -> None:
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for index, word in enumerate(words):
+                if index and config.chunk_delay_ms:
+                    time.sleep(config.chunk_delay_ms / 1000.0)
+                delta = word if index == 0 else f" {word}"
+                send(
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                    }
+                )
+            final = {"id": completion_id, "object": "chat.completion.chunk", "model": model, "choices": []}
+            send({**final, "usage": usage})
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up mid-stream (a cancelled call); stop generating.
+            self.close_connection = True
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: StubConfig) -> None:
+        super().__init__(address, _StubHandler)
+        self.config = config
+        self.stats = StubStats()
+        self.stats_lock = threading.Lock()
+
+
+class StubServer:
+    """OpenAI-compatible chat completions server for latency and throughput tests.
+
+    Serves ``POST /v1/chat/completions`` (plain and ``stream: true``) over HTTP/1.1
+    keep-alive with configurable latency, and counts the connections it accepts so
+    tests can check that clients reuse them. Port 0 picks a free port.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: StubConfig | None = None) -> None:
+        self._server = _StubHTTPServer((host, port), config or StubConfig())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def config(self) -> StubConfig:
+        return self._server.config
+
+    @property
+    def stats(self) -> StubStats:
+        return self._server.stats
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="writer-llm-stub",
+        description="Serve an OpenAI-compatible stub for exercising LLM providers without network access.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before every response.")
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0, help="Delay between streamed chunks.")
+    parser.add_argument("--reply-words", type=int, default=0, help="Words per reply (default: echo the prompt).")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N chat requests with 503.")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        chunk_delay_ms=args.chunk_delay_ms,
+        reply_words=args.reply_words,
+        fail_first=args.fail_first,
+    )
+    server = StubServer(args.host, args.port, config)
+    logger.info("LLM stub listening on %s", server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
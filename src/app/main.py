@@ -1,15 +1,58 @@
 from __future__ import annotations
 
+import asyncio
 import json
-import hashlib
+import os
 import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
-from typing import Generator
-
-from fastapi import Depends, FastAPI, HTTPException, Query
-
-from app.db import get_connection, init_db
+from typing import AsyncIterator, Literal, Mapping
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from app.blobs import text_hash
+from app.budget import (
+    BudgetLimits,
+    charge_usage,
+    check_before_call,
+    initial_run_remaining,
+    initial_step_remaining,
+    release_reservation,
+    reserve_call,
+)
+from app.cancellation import CallCancelled, CancellationToken, call_with_deadline, current_token, get_cancellations
+from app.db import PoolExhausted, close_pools, close_writers, init_db, on_commit, run_write
+from app.executor import ExecutorSaturated, db_read, db_write, read_metrics, shutdown_executors, write_metrics
+from app.export import EXPORT_SECTIONS, ProjectExport, batch_size, parse_include, stream_project_export
+from app.hedging import get_hedging, hedged_call, reset_hedging
+from app.idempotency import IdempotencyMiddleware
+from app.leases import (
+    WORKER_ID,
+    claim_run,
+    get_heartbeat,
+    holds_lease,
+    lease_seconds,
+    release_run,
+    stop_heartbeat,
+)
+from app.llm import (
+    DEFAULT_MODEL_ID,
+    DEFAULT_PROVIDER_ID,
+    ChunkCallback,
+    LlmGenerate,
+    LlmOutcome,
+    LlmRequest,
+    build_request,
+    call_llm,
+    default_llm_generate,
+    estimated_usage,
+    record_llm_call,
+    usage_tokens,
+)
+from app.llm_cache import cache_key, get_response_cache, reset_response_cache
 from app.schemas import (
     ChapterCreate,
     ChapterListResponse,
@@ -22,40 +65,104 @@ from app.schemas import (
     ChapterTextVersionListResponse,
     ChapterTextVersionOut,
     ChapterUpdate,
+    DbMetricsOut,
+    ExecutorLaneMetrics,
+    LlmModelCreate,
+    LlmModelListResponse,
+    LlmModelOut,
+    LlmProviderCreate,
+    LlmProviderListResponse,
+    LlmProviderOut,
     ProjectCreate,
     ProjectListResponse,
     ProjectOut,
     ProjectSettingsOut,
     ProjectSettingsUpdate,
     ProjectUpdate,
+    RunEventListResponse,
+    RunEventOut,
+    RunListResponse,
     RunOut,
     RunStepListResponse,
     RunStepOut,
+    RunStepApprove,
     RunStepOverride,
+    SearchHit,
+    SearchResponse,
+    RunBatchOut,
+    RunBatchStatusOut,
+    SwarmRunBatchCreate,
     SwarmRunCreate,
 )
+from app.providers import (
+    MODEL_COLUMNS,
+    PROVIDER_COLUMNS,
+    ProviderSettings,
+    get_provider_registry,
+    reset_provider_registry,
+)
+from app.rate_limit import RateLimitTimeout, get_rate_limiters, reset_rate_limiters
+from app.run_events import (
+    TERMINAL_RUN_STATUSES,
+    RunEvent,
+    Subscription,
+    event_seq,
+    get_run_event_bus,
+    list_run_events,
+    record_created_events,
+    record_run_event,
+)
+from app.run_executor import get_run_executor, get_step_executor, shutdown_run_executor, shutdown_step_executor
+from app.scheduler import (
+    QueueSnapshot,
+    current_queue_snapshot,
+    get_run_dispatcher,
+    queued_among,
+    start_run_dispatcher,
+    stop_run_dispatcher,
+)
+from app.search import decode_cursor, encode_cursor, index_chapter_version, index_segment, retitle_chapter, search
+from app.selection import DraftCandidate, issue_count, parse_review_report, rank_candidates, weighted_score
+from app.serialization import RawJSONResponse, RowEncoder, encode_page
+from app.single_flight import SingleFlight
+from app.streams import StreamCheckpointer, checkpoint_seconds, get_stream_hub
+from app.timestamps import utc_now_iso
 from app.ulid import new_ulid
+from app.versions import VERSION_COLUMNS, insert_text_version, load_version_texts
 
 
 @asynccontextmanager
 async def app_lifespan(_: FastAPI):
     init_db()
+    reset_response_cache()
+    reset_rate_limiters()
+    reset_hedging()
+    reset_provider_registry()
+    get_run_event_bus().start(db_read)
+    if _dispatch_locally():
+        # The dispatcher also picks up runs whose driver died (no lease, or one that
+        # stopped heartbeating) as soon as it starts.
+        start_run_dispatcher(get_run_executor(), _drive_run, WORKER_ID, lease_seconds())
     yield
+    await get_run_event_bus().stop()
+    stop_run_dispatcher()
+    shutdown_run_executor()
+    shutdown_step_executor()
+    reset_provider_registry()
+    stop_heartbeat()
+    shutdown_executors()
+    close_writers()
+    close_pools()
 
 
 app = FastAPI(title="Writer API", version="0.1.0-m0a", lifespan=app_lifespan)
+app.add_middleware(IdempotencyMiddleware)
 
 
-def utc_now_iso() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-
-
-def db_session() -> Generator[sqlite3.Connection, None, None]:
-    conn = get_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
+@app.exception_handler(ExecutorSaturated)
+@app.exception_handler(PoolExhausted)
+async def executor_saturated_handler(_: Request, exc: ExecutorSaturated | PoolExhausted) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 
 def _project_from_row(row: sqlite3.Row) -> ProjectOut:
@@ -69,6 +176,44 @@ def _project_from_row(row: sqlite3.Row) -> ProjectOut:
     )
 
 
+_PROJECT_ENCODER = RowEncoder(ProjectOut)
+_CHAPTER_ENCODER = RowEncoder(ChapterOut)
+_CHAPTER_SEGMENT_ENCODER = RowEncoder(ChapterSegmentOut)
+_CHAPTER_REVIEW_ENCODER = RowEncoder(ChapterReviewOut)
+_CHAPTER_TEXT_VERSION_ENCODER = RowEncoder(ChapterTextVersionOut)
+
+ListView = Literal["full", "summary"]
+
+
+def _list_fields(model: type[BaseModel], fields: str | None, view: str, heavy: tuple[str, ...]) -> tuple[str, ...]:
+    """The item fields a list request asked for, in schema order; ``id`` is always included.
+
+    ``fields=a,b`` names them; ``view=summary`` is every field but the ``heavy`` ones.
+    """
+    if fields is None:
+        return tuple(name for name in model.model_fields if view == "full" or name not in heavy)
+    if view != "full":
+        raise HTTPException(status_code=422, detail="Use either fields or view, not both.")
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(requested - model.model_fields.keys())
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}.")
+    return tuple(name for name in model.model_fields if name in requested or name == "id")
+
+
+def _list_columns(selected: tuple[str, ...], sources: Mapping[str, str] | None = None) -> str:
+    """The SELECT list for ``selected`` fields, so unrequested (heavy) columns are never read.
+
+    ``sources`` gives the columns of fields that are not a column of the same name.
+    """
+    columns = ["id"]
+    for name in selected:
+        for column in (sources or {}).get(name, name).split(", "):
+            if column not in columns:
+                columns.append(column)
+    return ", ".join(columns)
+
+
 def _project_exists(conn: sqlite3.Connection, project_id: str) -> bool:
     row = conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone()
     return row is not None
@@ -92,7 +237,6 @@ def _ensure_settings(
         "VALUES (?, ?, ?, ?, ?)",
         (settings_id, project_id, "{}", timestamp, timestamp),
     )
-    conn.commit()
     return conn.execute(
         "SELECT id, project_id, settings_json, created_at, updated_at "
         "FROM project_settings WHERE project_id = ?",
@@ -100,6 +244,16 @@ def _ensure_settings(
     ).fetchone()
 
 
+def _project_settings_from_row(row: sqlite3.Row) -> ProjectSettingsOut:
+    return ProjectSettingsOut(
+        id=row["id"],
+        project_id=row["project_id"],
+        settings_json=json.loads(row["settings_json"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
 def _loads_optional_json(raw: str | None) -> dict[str, object] | None:
     if raw is None:
         return None
@@ -146,110 +300,112 @@ def _chapter_segment_from_row(row: sqlite3.Row) -> ChapterSegmentOut:
         pov_node_id=row["pov_node_id"],
         segment_type=row["segment_type"],
         content_text=row["content_text"],
+        char_count=row["char_count"],
+        content_hash=row["content_hash"],
         attrs_json=_loads_optional_json(row["attrs_json"]),
         created_at=row["created_at"],
         updated_at=row["updated_at"],
     )
 
 
-def _chapter_review_from_row(row: sqlite3.Row) -> ChapterReviewOut:
-    return ChapterReviewOut(
-        id=row["id"],
-        chapter_id=row["chapter_id"],
-        version_id=row["version_id"],
-        review_type=row["review_type"],
-        report_json=json.loads(row["report_json"]),
-        source_run_id=row["source_run_id"],
-        source_step_id=row["source_step_id"],
-        created_at=row["created_at"],
-    )
-
-
-def _chapter_text_version_from_row(row: sqlite3.Row) -> ChapterTextVersionOut:
-    return ChapterTextVersionOut(
-        id=row["id"],
-        chapter_id=row["chapter_id"],
-        version_no=row["version_no"],
-        stage=row["stage"],
-        content_text=row["content_text"],
-        source_run_id=row["source_run_id"],
-        source_step_id=row["source_step_id"],
-        created_at=row["created_at"],
-    )
-
-
 @app.post("/projects", response_model=ProjectOut)
-def create_project(payload: ProjectCreate, conn: sqlite3.Connection = Depends(db_session)) -> ProjectOut:
-    now = utc_now_iso()
-    project_id = new_ulid("proj")
-    conn.execute(
-        "INSERT INTO projects (id, name, genre, premise, created_at, updated_at) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (project_id, payload.name, payload.genre, payload.premise, now, now),
-    )
-    conn.execute(
-        "INSERT INTO project_settings (id, project_id, settings_json, created_at, updated_at) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (new_ulid("pset"), project_id, "{}", now, now),
-    )
-    conn.commit()
-    row = conn.execute(
-        "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
-        (project_id,),
-    ).fetchone()
-    return _project_from_row(row)
+async def create_project(payload: ProjectCreate) -> ProjectOut:
+    def write(conn: sqlite3.Connection) -> ProjectOut:
+        now = utc_now_iso()
+        project_id = new_ulid("proj")
+        conn.execute(
+            "INSERT INTO projects (id, name, genre, premise, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (project_id, payload.name, payload.genre, payload.premise, now, now),
+        )
+        conn.execute(
+            "INSERT INTO project_settings (id, project_id, settings_json, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (new_ulid("pset"), project_id, "{}", now, now),
+        )
+        row = conn.execute(
+            "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
+            (project_id,),
+        ).fetchone()
+        return _project_from_row(row)
+
+    return await db_write(write)
 
 
 @app.get("/projects/{project_id}", response_model=ProjectOut)
-def get_project(project_id: str, conn: sqlite3.Connection = Depends(db_session)) -> ProjectOut:
-    row = conn.execute(
-        "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
-        (project_id,),
-    ).fetchone()
-    if row is None:
-        raise HTTPException(status_code=404, detail="Project not found.")
-    return _project_from_row(row)
+async def get_project(project_id: str) -> ProjectOut:
+    def read(conn: sqlite3.Connection) -> ProjectOut:
+        row = conn.execute(
+            "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
+            (project_id,),
+        ).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Project not found.")
+        return _project_from_row(row)
+
+    return await db_read(read)
 
 
 @app.get("/projects", response_model=ProjectListResponse)
-def list_projects(
+async def list_projects(
     limit: int = Query(default=20, ge=1, le=100),
     after: str | None = Query(default=None),
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ProjectListResponse:
-    if after:
-        rows = conn.execute(
-            "SELECT id, name, genre, premise, created_at, updated_at "
-            "FROM projects WHERE id > ? ORDER BY id LIMIT ?",
-            (after, limit + 1),
-        ).fetchall()
-    else:
-        rows = conn.execute(
-            "SELECT id, name, genre, premise, created_at, updated_at "
-            "FROM projects ORDER BY id LIMIT ?",
-            (limit + 1,),
-        ).fetchall()
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(ProjectOut, fields, view, heavy=("premise",))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        if after:
+            rows = conn.execute(
+                f"SELECT {columns} FROM projects WHERE id > ? ORDER BY id LIMIT ?",
+                (after, limit + 1),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {columns} FROM projects ORDER BY id LIMIT ?",
+                (limit + 1,),
+            ).fetchall()
 
-    has_more = len(rows) > limit
-    page_rows = rows[:limit]
-    items = [_project_from_row(row) for row in page_rows]
-    next_after = page_rows[-1]["id"] if has_more and page_rows else None
-    return ProjectListResponse(items=items, next_after=next_after)
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        next_after = page_rows[-1]["id"] if has_more and page_rows else None
+        return encode_page(_PROJECT_ENCODER.select(selected), page_rows, next_after=next_after)
 
+    return RawJSONResponse(await db_read(read))
 
-@app.put("/projects/{project_id}", response_model=ProjectOut)
-def update_project(
+
+@app.get("/projects/{project_id}/export.ndjson")
+async def export_project_ndjson(
     project_id: str,
-    payload: ProjectUpdate,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ProjectOut:
-    row = conn.execute(
-        "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
-        (project_id,),
-    ).fetchone()
-    if row is None:
+    include: str = Query(default=",".join(EXPORT_SECTIONS)),
+    gzip: bool = Query(default=False),
+) -> StreamingResponse:
+    """Stream the project as NDJSON: a project line, then every chapter, segment and version.
+
+    Rows are read in keyset batches, each one a short read on the bounded read lane,
+    and written as they come, so memory does not grow with the project and a slow
+    client holds no connection or snapshot; ``gzip=true`` compresses on the fly.
+    """
+    try:
+        sections = parse_include(include)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    export = ProjectExport(project_id, sections, batch_size())
+    first = await db_read(export.project_line)
+    if first is None:
         raise HTTPException(status_code=404, detail="Project not found.")
 
+    chunks = stream_project_export(export, first, gzip)
+    headers = {"Content-Disposition": f'attachment; filename="{project_id}.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
+@app.put("/projects/{project_id}", response_model=ProjectOut)
+async def update_project(project_id: str, payload: ProjectUpdate) -> ProjectOut:
     fields: list[str] = []
     values: list[object] = []
     if payload.name is not None:
@@ -262,322 +418,381 @@ def update_project(
         fields.append("premise = ?")
         values.append(payload.premise)
 
-    values.extend([utc_now_iso(), project_id])
-    sql = f"UPDATE projects SET {', '.join(fields)}, updated_at = ? WHERE id = ?"
-    conn.execute(sql, values)
-    conn.commit()
+    def write(conn: sqlite3.Connection) -> ProjectOut:
+        if not _project_exists(conn, project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
 
-    updated = conn.execute(
-        "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
-        (project_id,),
-    ).fetchone()
-    return _project_from_row(updated)
+        sql = f"UPDATE projects SET {', '.join(fields)}, updated_at = ? WHERE id = ?"
+        conn.execute(sql, [*values, utc_now_iso(), project_id])
+        updated = conn.execute(
+            "SELECT id, name, genre, premise, created_at, updated_at FROM projects WHERE id = ?",
+            (project_id,),
+        ).fetchone()
+        return _project_from_row(updated)
 
+    return await db_write(write)
 
-@app.get("/projects/{project_id}/settings", response_model=ProjectSettingsOut)
-def get_project_settings(
-    project_id: str, conn: sqlite3.Connection = Depends(db_session)
-) -> ProjectSettingsOut:
-    if not _project_exists(conn, project_id):
-        raise HTTPException(status_code=404, detail="Project not found.")
 
-    row = _ensure_settings(conn, project_id)
-    return ProjectSettingsOut(
-        id=row["id"],
-        project_id=row["project_id"],
-        settings_json=json.loads(row["settings_json"]),
-        created_at=row["created_at"],
-        updated_at=row["updated_at"],
-    )
+@app.get("/projects/{project_id}/settings", response_model=ProjectSettingsOut)
+async def get_project_settings(project_id: str) -> ProjectSettingsOut:
+    def read(conn: sqlite3.Connection) -> sqlite3.Row | None:
+        if not _project_exists(conn, project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        return conn.execute(
+            "SELECT id, project_id, settings_json, created_at, updated_at "
+            "FROM project_settings WHERE project_id = ?",
+            (project_id,),
+        ).fetchone()
+
+    row = await db_read(read)
+    if row is None:
+        row = await db_write(lambda conn: _ensure_settings(conn, project_id))
+    return _project_settings_from_row(row)
 
 
 @app.put("/projects/{project_id}/settings", response_model=ProjectSettingsOut)
-def put_project_settings(
+async def put_project_settings(project_id: str, payload: ProjectSettingsUpdate) -> ProjectSettingsOut:
+    settings_text = json.dumps(payload.settings_json, ensure_ascii=True, sort_keys=True)
+
+    def write(conn: sqlite3.Connection) -> sqlite3.Row:
+        if not _project_exists(conn, project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        now = utc_now_iso()
+        conn.execute(
+            "INSERT INTO project_settings (id, project_id, settings_json, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(project_id) DO UPDATE SET "
+            "settings_json = excluded.settings_json, "
+            "updated_at = excluded.updated_at",
+            (new_ulid("pset"), project_id, settings_text, now, now),
+        )
+        return conn.execute(
+            "SELECT id, project_id, settings_json, created_at, updated_at "
+            "FROM project_settings WHERE project_id = ?",
+            (project_id,),
+        ).fetchone()
+
+    return _project_settings_from_row(await db_write(write))
+
+
+@app.get("/projects/{project_id}/search", response_model=SearchResponse)
+async def search_project(
     project_id: str,
-    payload: ProjectSettingsUpdate,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ProjectSettingsOut:
-    if not _project_exists(conn, project_id):
-        raise HTTPException(status_code=404, detail="Project not found.")
+    q: str = Query(min_length=1, max_length=200),
+    kind: str | None = Query(default=None, pattern="^(version|segment)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    after: str | None = Query(default=None),
+) -> SearchResponse:
+    try:
+        cursor = decode_cursor(after) if after is not None else None
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="after is not a valid search cursor.") from exc
+
+    def read(conn: sqlite3.Connection) -> SearchResponse:
+        if not _project_exists(conn, project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+        rows = search(conn, project_id, q, limit, after=cursor, source_kind=kind)
+
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        items = [
+            SearchHit(
+                source_kind=row.source_kind,
+                source_id=row.source_id,
+                chapter_id=row.chapter_id,
+                title=row.title or None,
+                snippet=row.snippet,
+                score=row.score,
+            )
+            for row in page_rows
+        ]
+        next_after = encode_cursor(page_rows[-1]) if has_more and page_rows else None
+        return SearchResponse(items=items, next_after=next_after)
 
-    now = utc_now_iso()
-    conn.execute(
-        "INSERT INTO project_settings (id, project_id, settings_json, created_at, updated_at) "
-        "VALUES (?, ?, ?, ?, ?) "
-        "ON CONFLICT(project_id) DO UPDATE SET "
-        "settings_json = excluded.settings_json, "
-        "updated_at = excluded.updated_at",
-        (
-            new_ulid("pset"),
-            project_id,
-            json.dumps(payload.settings_json, ensure_ascii=True, sort_keys=True),
-            now,
-            now,
-        ),
-    )
-    conn.commit()
-    row = conn.execute(
-        "SELECT id, project_id, settings_json, created_at, updated_at "
-        "FROM project_settings WHERE project_id = ?",
-        (project_id,),
-    ).fetchone()
-    return ProjectSettingsOut(
-        id=row["id"],
-        project_id=row["project_id"],
-        settings_json=json.loads(row["settings_json"]),
-        created_at=row["created_at"],
-        updated_at=row["updated_at"],
-    )
+    return await db_read(read)
 
 
 @app.post("/chapters", response_model=ChapterOut)
-def create_chapter(payload: ChapterCreate, conn: sqlite3.Connection = Depends(db_session)) -> ChapterOut:
-    if not _project_exists(conn, payload.project_id):
-        raise HTTPException(status_code=404, detail="Project not found.")
+async def create_chapter(payload: ChapterCreate) -> ChapterOut:
+    def write(conn: sqlite3.Connection) -> ChapterOut:
+        if not _project_exists(conn, payload.project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
 
-    now = utc_now_iso()
-    chapter_id = new_ulid("ch")
-    try:
-        conn.execute(
-            "INSERT INTO chapters ("
-            "id, project_id, volume_no, chapter_no, title, status, needs_review, review_reason, "
-            "plan_json, traversal_profile_id, style_guide_id, lock_version, created_at, updated_at"
-            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                chapter_id,
-                payload.project_id,
-                payload.volume_no,
-                payload.chapter_no,
-                payload.title,
-                "planned",
-                0,
-                None,
+        now = utc_now_iso()
+        chapter_id = new_ulid("ch")
+        try:
+            conn.execute(
+                "INSERT INTO chapters ("
+                "id, project_id, volume_no, chapter_no, title, status, needs_review, review_reason, "
+                "plan_json, traversal_profile_id, style_guide_id, lock_version, created_at, updated_at"
+                ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                 (
-                    json.dumps(payload.plan_json, ensure_ascii=True, sort_keys=True)
-                    if payload.plan_json is not None
-                    else None
+                    chapter_id,
+                    payload.project_id,
+                    payload.volume_no,
+                    payload.chapter_no,
+                    payload.title,
+                    "planned",
+                    0,
+                    None,
+                    (
+                        json.dumps(payload.plan_json, ensure_ascii=True, sort_keys=True)
+                        if payload.plan_json is not None
+                        else None
+                    ),
+                    payload.traversal_profile_id,
+                    payload.style_guide_id,
+                    0,
+                    now,
+                    now,
                 ),
-                payload.traversal_profile_id,
-                payload.style_guide_id,
-                0,
-                now,
-                now,
-            ),
-        )
-    except sqlite3.IntegrityError as exc:
-        message = str(exc).lower()
-        if "unique" in message and "chapters.project_id, chapters.volume_no, chapters.chapter_no" in message:
-            raise HTTPException(
-                status_code=409,
-                detail="Chapter number already exists in this project volume.",
-            ) from exc
-        raise
-
-    conn.commit()
-    row = conn.execute(
-        "SELECT id, project_id, volume_no, chapter_no, title, status, needs_review, review_reason, "
-        "plan_json, traversal_profile_id, style_guide_id, lock_version, created_at, updated_at "
-        "FROM chapters WHERE id = ?",
-        (chapter_id,),
-    ).fetchone()
-    return _chapter_from_row(row)
+            )
+        except sqlite3.IntegrityError as exc:
+            message = str(exc).lower()
+            if "unique" in message and "chapters.project_id, chapters.volume_no, chapters.chapter_no" in message:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Chapter number already exists in this project volume.",
+                ) from exc
+            raise
+
+        row = conn.execute(
+            "SELECT id, project_id, volume_no, chapter_no, title, status, needs_review, review_reason, "
+            "plan_json, traversal_profile_id, style_guide_id, lock_version, created_at, updated_at "
+            "FROM chapters WHERE id = ?",
+            (chapter_id,),
+        ).fetchone()
+        return _chapter_from_row(row)
+
+    return await db_write(write)
 
 
 @app.get("/chapters/{chapter_id}", response_model=ChapterOut)
-def get_chapter(chapter_id: str, conn: sqlite3.Connection = Depends(db_session)) -> ChapterOut:
-    row = _chapter_row_or_404(conn, chapter_id)
-    return _chapter_from_row(row)
+async def get_chapter(chapter_id: str) -> ChapterOut:
+    def read(conn: sqlite3.Connection) -> ChapterOut:
+        row = _chapter_row_or_404(conn, chapter_id)
+        return _chapter_from_row(row)
+
+    return await db_read(read)
 
 
 @app.get("/chapters", response_model=ChapterListResponse)
-def list_chapters(
+async def list_chapters(
     project_id: str | None = Query(default=None),
     limit: int = Query(default=20, ge=1, le=100),
     after: str | None = Query(default=None),
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ChapterListResponse:
-    filters: list[str] = []
-    values: list[object] = []
-    if project_id is not None:
-        filters.append("project_id = ?")
-        values.append(project_id)
-    if after is not None:
-        filters.append("id > ?")
-        values.append(after)
-
-    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-    query = (
-        "SELECT id, project_id, volume_no, chapter_no, title, status, needs_review, review_reason, "
-        "plan_json, traversal_profile_id, style_guide_id, lock_version, created_at, updated_at "
-        f"FROM chapters {where_clause} ORDER BY id LIMIT ?"
-    )
-    rows = conn.execute(query, (*values, limit + 1)).fetchall()
-
-    has_more = len(rows) > limit
-    page_rows = rows[:limit]
-    items = [_chapter_from_row(row) for row in page_rows]
-    next_after = page_rows[-1]["id"] if has_more and page_rows else None
-    return ChapterListResponse(items=items, next_after=next_after)
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(ChapterOut, fields, view, heavy=("plan_json",))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        filters: list[str] = []
+        values: list[object] = []
+        if project_id is not None:
+            filters.append("project_id = ?")
+            values.append(project_id)
+        if after is not None:
+            filters.append("id > ?")
+            values.append(after)
+
+        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
+        query = f"SELECT {columns} FROM chapters {where_clause} ORDER BY id LIMIT ?"
+        rows = conn.execute(query, (*values, limit + 1)).fetchall()
+
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        next_after = page_rows[-1]["id"] if has_more and page_rows else None
+        return encode_page(_CHAPTER_ENCODER.select(selected), page_rows, next_after=next_after)
+
+    return RawJSONResponse(await db_read(read))
 
 
 @app.put("/chapters/{chapter_id}", response_model=ChapterOut)
-def update_chapter(
-    chapter_id: str,
-    payload: ChapterUpdate,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ChapterOut:
-    _chapter_row_or_404(conn, chapter_id)
-
-    fields: list[str] = []
-    values: list[object] = []
-    if payload.title is not None:
-        fields.append("title = ?")
-        values.append(payload.title)
-    if payload.plan_json is not None:
-        fields.append("plan_json = ?")
-        values.append(json.dumps(payload.plan_json, ensure_ascii=True, sort_keys=True))
-    if payload.traversal_profile_id is not None:
-        fields.append("traversal_profile_id = ?")
-        values.append(payload.traversal_profile_id)
-    if payload.style_guide_id is not None:
-        fields.append("style_guide_id = ?")
-        values.append(payload.style_guide_id)
-
-    values.extend([utc_now_iso(), chapter_id])
-    query = f"UPDATE chapters SET {', '.join(fields)}, updated_at = ? WHERE id = ?"
-    conn.execute(query, values)
-    conn.commit()
-
-    updated = _chapter_row_or_404(conn, chapter_id)
-    return _chapter_from_row(updated)
+async def update_chapter(chapter_id: str, payload: ChapterUpdate) -> ChapterOut:
+    def write(conn: sqlite3.Connection) -> ChapterOut:
+        _chapter_row_or_404(conn, chapter_id)
+
+        fields: list[str] = []
+        values: list[object] = []
+        if payload.title is not None:
+            fields.append("title = ?")
+            values.append(payload.title)
+        if payload.plan_json is not None:
+            fields.append("plan_json = ?")
+            values.append(json.dumps(payload.plan_json, ensure_ascii=True, sort_keys=True))
+        if payload.traversal_profile_id is not None:
+            fields.append("traversal_profile_id = ?")
+            values.append(payload.traversal_profile_id)
+        if payload.style_guide_id is not None:
+            fields.append("style_guide_id = ?")
+            values.append(payload.style_guide_id)
+
+        values.extend([utc_now_iso(), chapter_id])
+        query = f"UPDATE chapters SET {', '.join(fields)}, updated_at = ? WHERE id = ?"
+        conn.execute(query, values)
+        if payload.title is not None:
+            retitle_chapter(conn, chapter_id, payload.title)
+
+        updated = _chapter_row_or_404(conn, chapter_id)
+        return _chapter_from_row(updated)
+
+    return await db_write(write)
 
 
 @app.post("/chapters/{chapter_id}/segments", response_model=ChapterSegmentOut)
-def upsert_chapter_segment(
-    chapter_id: str,
-    payload: ChapterSegmentUpsert,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ChapterSegmentOut:
-    _chapter_row_or_404(conn, chapter_id)
+async def upsert_chapter_segment(chapter_id: str, payload: ChapterSegmentUpsert) -> ChapterSegmentOut:
+    def write(conn: sqlite3.Connection) -> ChapterSegmentOut:
+        chapter_row = _chapter_row_or_404(conn, chapter_id)
 
-    now = utc_now_iso()
-    conn.execute(
-        "INSERT INTO chapter_segments ("
-        "id, chapter_id, segment_no, title, pov_node_id, segment_type, content_text, attrs_json, "
-        "is_deleted, deleted_at, deleted_reason, created_at, updated_at"
-        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, NULL, NULL, ?, ?) "
-        "ON CONFLICT(chapter_id, segment_no) DO UPDATE SET "
-        "title = excluded.title, "
-        "pov_node_id = excluded.pov_node_id, "
-        "segment_type = excluded.segment_type, "
-        "content_text = excluded.content_text, "
-        "attrs_json = excluded.attrs_json, "
-        "is_deleted = 0, "
-        "deleted_at = NULL, "
-        "deleted_reason = NULL, "
-        "updated_at = excluded.updated_at",
-        (
-            new_ulid("chseg"),
-            chapter_id,
-            payload.segment_no,
-            payload.title,
-            payload.pov_node_id,
-            payload.segment_type,
-            payload.content_text,
+        now = utc_now_iso()
+        conn.execute(
+            "INSERT INTO chapter_segments ("
+            "id, chapter_id, segment_no, title, pov_node_id, segment_type, content_text, char_count, content_hash, "
+            "attrs_json, is_deleted, deleted_at, deleted_reason, created_at, updated_at"
+            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, NULL, NULL, ?, ?) "
+            "ON CONFLICT(chapter_id, segment_no) DO UPDATE SET "
+            "title = excluded.title, "
+            "pov_node_id = excluded.pov_node_id, "
+            "segment_type = excluded.segment_type, "
+            "content_text = excluded.content_text, "
+            "char_count = excluded.char_count, "
+            "content_hash = excluded.content_hash, "
+            "attrs_json = excluded.attrs_json, "
+            "is_deleted = 0, "
+            "deleted_at = NULL, "
+            "deleted_reason = NULL, "
+            "updated_at = excluded.updated_at",
             (
-                json.dumps(payload.attrs_json, ensure_ascii=True, sort_keys=True)
-                if payload.attrs_json is not None
-                else None
+                new_ulid("chseg"),
+                chapter_id,
+                payload.segment_no,
+                payload.title,
+                payload.pov_node_id,
+                payload.segment_type,
+                payload.content_text,
+                len(payload.content_text) if payload.content_text is not None else None,
+                text_hash(payload.content_text) if payload.content_text is not None else None,
+                (
+                    json.dumps(payload.attrs_json, ensure_ascii=True, sort_keys=True)
+                    if payload.attrs_json is not None
+                    else None
+                ),
+                now,
+                now,
             ),
-            now,
-            now,
-        ),
-    )
-    conn.commit()
-    row = conn.execute(
-        "SELECT id, chapter_id, segment_no, title, pov_node_id, segment_type, content_text, attrs_json, "
-        "created_at, updated_at "
-        "FROM chapter_segments WHERE chapter_id = ? AND segment_no = ? AND is_deleted = 0",
-        (chapter_id, payload.segment_no),
-    ).fetchone()
-    return _chapter_segment_from_row(row)
+        )
+        row = conn.execute(
+            f"SELECT {_CHAPTER_SEGMENT_ENCODER.select_list} FROM chapter_segments "
+            "WHERE chapter_id = ? AND segment_no = ? AND is_deleted = 0",
+            (chapter_id, payload.segment_no),
+        ).fetchone()
+        index_segment(conn, chapter_row["project_id"], chapter_id, row["id"], row["title"], row["content_text"])
+        return _chapter_segment_from_row(row)
+
+    return await db_write(write)
 
 
 @app.get("/chapters/{chapter_id}/segments", response_model=ChapterSegmentListResponse)
-def list_chapter_segments(
-    chapter_id: str, conn: sqlite3.Connection = Depends(db_session)
-) -> ChapterSegmentListResponse:
-    _chapter_row_or_404(conn, chapter_id)
-    rows = conn.execute(
-        "SELECT id, chapter_id, segment_no, title, pov_node_id, segment_type, content_text, attrs_json, "
-        "created_at, updated_at "
-        "FROM chapter_segments WHERE chapter_id = ? AND is_deleted = 0 ORDER BY segment_no",
-        (chapter_id,),
-    ).fetchall()
-    return ChapterSegmentListResponse(items=[_chapter_segment_from_row(row) for row in rows])
+async def list_chapter_segments(
+    chapter_id: str,
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(ChapterSegmentOut, fields, view, heavy=("content_text", "attrs_json"))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        _chapter_row_or_404(conn, chapter_id)
+        rows = conn.execute(
+            f"SELECT {columns} FROM chapter_segments WHERE chapter_id = ? AND is_deleted = 0 ORDER BY segment_no",
+            (chapter_id,),
+        ).fetchall()
+        return encode_page(_CHAPTER_SEGMENT_ENCODER.select(selected), rows)
+
+    return RawJSONResponse(await db_read(read))
 
 
 @app.get("/chapters/{chapter_id}/reviews", response_model=ChapterReviewListResponse)
-def list_chapter_reviews(
+async def list_chapter_reviews(
     chapter_id: str,
     limit: int = Query(default=50, ge=1, le=100),
     after: str | None = Query(default=None),
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ChapterReviewListResponse:
-    _chapter_row_or_404(conn, chapter_id)
-    if after:
-        rows = conn.execute(
-            "SELECT id, chapter_id, version_id, review_type, report_json, source_run_id, source_step_id, created_at "
-            "FROM chapter_reviews WHERE chapter_id = ? AND id > ? ORDER BY id LIMIT ?",
-            (chapter_id, after, limit + 1),
-        ).fetchall()
-    else:
-        rows = conn.execute(
-            "SELECT id, chapter_id, version_id, review_type, report_json, source_run_id, source_step_id, created_at "
-            "FROM chapter_reviews WHERE chapter_id = ? ORDER BY id LIMIT ?",
-            (chapter_id, limit + 1),
-        ).fetchall()
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(ChapterReviewOut, fields, view, heavy=("report_json",))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        _chapter_row_or_404(conn, chapter_id)
+        if after:
+            rows = conn.execute(
+                f"SELECT {columns} FROM chapter_reviews WHERE chapter_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (chapter_id, after, limit + 1),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {columns} FROM chapter_reviews WHERE chapter_id = ? ORDER BY id LIMIT ?",
+                (chapter_id, limit + 1),
+            ).fetchall()
 
-    has_more = len(rows) > limit
-    page_rows = rows[:limit]
-    items = [_chapter_review_from_row(row) for row in page_rows]
-    next_after = page_rows[-1]["id"] if has_more and page_rows else None
-    return ChapterReviewListResponse(items=items, next_after=next_after)
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        next_after = page_rows[-1]["id"] if has_more and page_rows else None
+        return encode_page(_CHAPTER_REVIEW_ENCODER.select(selected), page_rows, next_after=next_after)
+
+    return RawJSONResponse(await db_read(read))
 
 
 @app.get("/chapters/{chapter_id}/text-versions", response_model=ChapterTextVersionListResponse)
-def list_chapter_text_versions(
+async def list_chapter_text_versions(
     chapter_id: str,
     limit: int = Query(default=50, ge=1, le=100),
     after: str | None = Query(default=None),
-    conn: sqlite3.Connection = Depends(db_session),
-) -> ChapterTextVersionListResponse:
-    _chapter_row_or_404(conn, chapter_id)
-    if after:
-        rows = conn.execute(
-            "SELECT id, chapter_id, version_no, stage, content_text, source_run_id, source_step_id, created_at "
-            "FROM chapter_text_versions WHERE chapter_id = ? AND id > ? ORDER BY id LIMIT ?",
-            (chapter_id, after, limit + 1),
-        ).fetchall()
-    else:
-        rows = conn.execute(
-            "SELECT id, chapter_id, version_no, stage, content_text, source_run_id, source_step_id, created_at "
-            "FROM chapter_text_versions WHERE chapter_id = ? ORDER BY id LIMIT ?",
-            (chapter_id, limit + 1),
-        ).fetchall()
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(ChapterTextVersionOut, fields, view, heavy=("content_text",))
+    # Texts live in blobs (or delta chains); only pages that return them read the storage columns.
+    with_text = "content_text" in selected
+    columns = _list_columns(selected, {"content_text": VERSION_COLUMNS})
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        _chapter_row_or_404(conn, chapter_id)
+        if after:
+            rows = conn.execute(
+                f"SELECT {columns} FROM chapter_text_versions WHERE chapter_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (chapter_id, after, limit + 1),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {columns} FROM chapter_text_versions WHERE chapter_id = ? ORDER BY id LIMIT ?",
+                (chapter_id, limit + 1),
+            ).fetchall()
+
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        computed = [{"content_text": text} for text in load_version_texts(conn, page_rows)] if with_text else None
+        next_after = page_rows[-1]["id"] if has_more and page_rows else None
+        return encode_page(
+            _CHAPTER_TEXT_VERSION_ENCODER.select(selected),
+            page_rows,
+            computed,
+            next_after=next_after,
+        )
 
-    has_more = len(rows) > limit
-    page_rows = rows[:limit]
-    items = [_chapter_text_version_from_row(row) for row in page_rows]
-    next_after = page_rows[-1]["id"] if has_more and page_rows else None
-    return ChapterTextVersionListResponse(items=items, next_after=next_after)
+    return RawJSONResponse(await db_read(read))
 
 
 def _run_row_or_404(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row:
     row = conn.execute(
         "SELECT id, project_id, swarm_profile_id, run_type, target_chapter_id, status, "
-        "input_json, output_json, budget_json, started_at, finished_at "
-        "FROM runs WHERE id = ?",
+        "input_json, output_json, budget_json, budget_remaining_tokens, budget_remaining_cost, llm_cache, "
+        "batch_id, priority, started_at, finished_at FROM runs WHERE id = ?",
         (run_id,),
     ).fetchone()
     if row is None:
@@ -585,11 +800,16 @@ def _run_row_or_404(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row:
     return row
 
 
+_RUN_STEP_COLUMNS = (
+    "id, run_id, step_no, step_type, role, status, depends_on_json, requires_approval, approval_status, "
+    "override_payload_json, input_json, output_json, budget_json, budget_remaining_tokens, "
+    "budget_remaining_cost, started_at, finished_at, error_text"
+)
+
+
 def _run_step_row_or_404(conn: sqlite3.Connection, run_id: str, step_id: str) -> sqlite3.Row:
     row = conn.execute(
-        "SELECT id, run_id, step_no, step_type, role, status, requires_approval, approval_status, "
-        "override_payload_json, input_json, output_json, budget_json, started_at, finished_at, error_text "
-        "FROM run_steps WHERE run_id = ? AND id = ?",
+        f"SELECT {_RUN_STEP_COLUMNS} FROM run_steps WHERE run_id = ? AND id = ?",
         (run_id, step_id),
     ).fetchone()
     if row is None:
@@ -597,16 +817,22 @@ def _run_step_row_or_404(conn: sqlite3.Connection, run_id: str, step_id: str) ->
     return row
 
 
-def _first_run_step(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row | None:
+def _run_steps(conn: sqlite3.Connection, run_id: str, columns: str = _RUN_STEP_COLUMNS) -> list[sqlite3.Row]:
     return conn.execute(
-        "SELECT id, run_id, step_no, step_type, role, status, requires_approval, approval_status, "
-        "override_payload_json, input_json, output_json, budget_json, started_at, finished_at, error_text "
-        "FROM run_steps WHERE run_id = ? ORDER BY step_no LIMIT 1",
+        f"SELECT {columns} FROM run_steps WHERE run_id = ? ORDER BY step_no",
         (run_id,),
-    ).fetchone()
+    ).fetchall()
+
 
+def _step_depends_on(row: sqlite3.Row) -> list[str]:
+    return json.loads(row["depends_on_json"]) if row["depends_on_json"] else []
 
-def _run_from_row(row: sqlite3.Row) -> RunOut:
+
+_RUN_ENCODER = RowEncoder(RunOut)
+_RUN_STEP_ENCODER = RowEncoder(RunStepOut, columns={"depends_on": "depends_on_json"})
+
+
+def _run_from_row(row: sqlite3.Row, queue: QueueSnapshot | None = None) -> RunOut:
     return RunOut(
         id=row["id"],
         project_id=row["project_id"],
@@ -617,6 +843,13 @@ def _run_from_row(row: sqlite3.Row) -> RunOut:
         input_json=_loads_optional_json(row["input_json"]),
         output_json=_loads_optional_json(row["output_json"]),
         budget_json=_loads_optional_json(row["budget_json"]),
+        budget_remaining_tokens=row["budget_remaining_tokens"],
+        budget_remaining_cost=row["budget_remaining_cost"],
+        llm_cache=bool(row["llm_cache"]),
+        batch_id=row["batch_id"],
+        priority=row["priority"],
+        queue_position=queue.positions.get(row["id"]) if queue is not None else None,
+        estimated_start_at=queue.estimated_start_at(row["id"]) if queue is not None else None,
         started_at=row["started_at"],
         finished_at=row["finished_at"],
     )
@@ -630,45 +863,35 @@ def _run_step_from_row(row: sqlite3.Row) -> RunStepOut:
         step_type=row["step_type"],
         role=row["role"],
         status=row["status"],
+        depends_on=_step_depends_on(row),
         requires_approval=bool(row["requires_approval"]),
         approval_status=row["approval_status"],
         override_payload_json=_loads_optional_json(row["override_payload_json"]),
         input_json=_loads_optional_json(row["input_json"]),
         output_json=_loads_optional_json(row["output_json"]),
         budget_json=_loads_optional_json(row["budget_json"]),
+        budget_remaining_tokens=row["budget_remaining_tokens"],
+        budget_remaining_cost=row["budget_remaining_cost"],
         started_at=row["started_at"],
         finished_at=row["finished_at"],
         error_text=row["error_text"],
     )
 
 
-def _default_llm_generate(request_payload: dict[str, object]) -> dict[str, object]:
-    chapter_title = request_payload.get("chapter_title")
-    if not isinstance(chapter_title, str) or not chapter_title.strip():
-        chapter_title = f"Chapter {request_payload.get('chapter_no', 'X')}"
-
-    input_json = request_payload.get("input_json")
-    prompt_text = ""
-    if isinstance(input_json, dict):
-        raw_prompt = input_json.get("prompt")
-        if isinstance(raw_prompt, str):
-            prompt_text = raw_prompt.strip()
+def _llm_generator(request: LlmRequest) -> LlmGenerate:
+    generator = getattr(app.state, "llm_generate", None)
+    if callable(generator):
+        return generator
+    registered = get_provider_registry().generator_for(request.provider_id, request.model_id)
+    return registered if registered is not None else default_llm_generate
 
-    base_text = prompt_text or "M0a draft generated by the built-in mock runner."
-    content_text = f"{chapter_title}\n\n{base_text}"
-    return {
-        "content_text": content_text,
-        "provider_id": "mock",
-        "model_id": "mock-writer-v1",
-    }
 
-
-def _invoke_llm_for_step(
-    conn: sqlite3.Connection,
+def _build_step_llm_request(
     run_row: sqlite3.Row,
     step_row: sqlite3.Row,
     chapter_row: sqlite3.Row,
-) -> str:
+    review_of: dict[str, object] | None = None,
+) -> LlmRequest:
     run_input = _loads_optional_json(run_row["input_json"]) or {}
     request_payload: dict[str, object] = {
         "project_id": run_row["project_id"],
@@ -680,92 +903,55 @@ def _invoke_llm_for_step(
         "step_id": step_row["id"],
         "input_json": run_input,
     }
-    request_text = json.dumps(request_payload, ensure_ascii=True, sort_keys=True)
-    request_hash = hashlib.sha256(request_text.encode("utf-8")).hexdigest()
-    call_id = new_ulid("llm")
+    # Fan-out steps differ only in their step input (draft_no, review_no), which
+    # keeps parallel drafts from sharing one cached or coalesced call.
+    step_input = _loads_optional_json(step_row["input_json"])
+    if step_input is not None:
+        request_payload["step_input"] = step_input
+    if review_of is not None:
+        request_payload["review_of"] = review_of
+    budget = _loads_optional_json(step_row["budget_json"]) or {}
+    model_id = run_input.get("model_id") if isinstance(run_input.get("model_id"), str) else DEFAULT_MODEL_ID
+    provider_id = run_input.get("provider_id") if isinstance(run_input.get("provider_id"), str) else None
+    bucket = budget.get("rate_limit_bucket") if isinstance(budget.get("rate_limit_bucket"), str) else None
+    return build_request(
+        run_row["id"],
+        step_row["id"],
+        step_row["step_type"],
+        request_payload,
+        model_id=model_id,
+        use_cache=bool(run_row["llm_cache"]),
+        provider_id=provider_id or DEFAULT_PROVIDER_ID,
+        rate_limit_bucket=bucket,
+        timeout_seconds=BudgetLimits.from_json(budget).step_timeout,
+    )
+
+
+def _fail_run(conn: sqlite3.Connection, run_id: str, step_id: str, chapter_id: str, error: str) -> None:
     now = utc_now_iso()
+    conn.execute(
+        "UPDATE run_steps SET status = ?, error_text = ?, finished_at = ? WHERE id = ?",
+        ("failed", error, now, step_id),
+    )
+    record_run_event(conn, run_id, "step.status", "failed", now, step_id=step_id, payload={"error": error})
+    record_run_event(conn, run_id, "run.status", "failed", now, payload={"error": error})
+    conn.execute(
+        "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
+        (
+            "failed",
+            json.dumps({"error": error}, ensure_ascii=True, sort_keys=True),
+            now,
+            run_id,
+        ),
+    )
+    conn.execute(
+        "UPDATE chapters SET needs_review = 1, review_reason = ?, updated_at = ? WHERE id = ?",
+        (error, now, chapter_id),
+    )
 
-    provider_id = "mock"
-    model_id = "mock-writer-v1"
-    usage_payload: dict[str, object] = {}
-    try:
-        generator = getattr(app.state, "llm_generate", None)
-        if callable(generator):
-            generated = generator(request_payload)
-        else:
-            generated = _default_llm_generate(request_payload)
-
-        if isinstance(generated, str):
-            content_text = generated
-        elif isinstance(generated, dict):
-            raw_content = generated.get("content_text")
-            if not isinstance(raw_content, str):
-                raise ValueError("LLM mock must return content_text as string.")
-            content_text = raw_content
-            if isinstance(generated.get("provider_id"), str):
-                provider_id = generated["provider_id"]
-            if isinstance(generated.get("model_id"), str):
-                model_id = generated["model_id"]
-            raw_usage = generated.get("usage_json")
-            if isinstance(raw_usage, dict):
-                usage_payload = raw_usage
-        else:
-            raise ValueError("LLM mock must return either a string or a dict.")
 
-        if not content_text.strip():
-            raise ValueError("LLM mock returned empty content.")
-
-        if not usage_payload:
-            usage_payload = {
-                "prompt_tokens": max(1, len(request_text) // 4),
-                "completion_tokens": max(1, len(content_text) // 4),
-            }
-        response_text = json.dumps({"content_text": content_text}, ensure_ascii=True, sort_keys=True)
-        response_hash = hashlib.sha256(response_text.encode("utf-8")).hexdigest()
-
-        conn.execute(
-            "INSERT INTO llm_calls ("
-            "id, run_id, step_id, provider_id, model_id, purpose, request_hash, response_hash, usage_json, "
-            "status, error_text, created_at"
-            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                call_id,
-                run_row["id"],
-                step_row["id"],
-                provider_id,
-                model_id,
-                step_row["step_type"],
-                request_hash,
-                response_hash,
-                json.dumps(usage_payload, ensure_ascii=True, sort_keys=True),
-                "succeeded",
-                None,
-                now,
-            ),
-        )
-        return content_text
-    except Exception as exc:
-        conn.execute(
-            "INSERT INTO llm_calls ("
-            "id, run_id, step_id, provider_id, model_id, purpose, request_hash, response_hash, usage_json, "
-            "status, error_text, created_at"
-            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                call_id,
-                run_row["id"],
-                step_row["id"],
-                provider_id,
-                model_id,
-                step_row["step_type"],
-                request_hash,
-                None,
-                None,
-                "failed",
-                str(exc),
-                now,
-            ),
-        )
-        raise
+# Stream checkpoints written while the step's LLM call is in flight.
+_PARTIAL_OUTPUT_KEYS = ("partial_content_text", "partial_checkpoint_at")
 
 
 def _complete_run_with_content(
@@ -777,32 +963,24 @@ def _complete_run_with_content(
     approval_status: str,
 ) -> None:
     now = utc_now_iso()
-    version_no = (
-        conn.execute(
-            "SELECT COALESCE(MAX(version_no), 0) + 1 FROM chapter_text_versions WHERE chapter_id = ?",
-            (chapter_row["id"],),
-        ).fetchone()[0]
+    version_id, version_no = insert_text_version(
+        conn,
+        chapter_id=chapter_row["id"],
+        stage="final",
+        content_text=content_text,
+        source_run_id=run_row["id"],
+        source_step_id=step_row["id"],
+        created_at=now,
     )
-    version_id = new_ulid("chv")
-    conn.execute(
-        "INSERT INTO chapter_text_versions ("
-        "id, chapter_id, version_no, stage, content_text, source_run_id, source_step_id, created_at"
-        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (
-            version_id,
-            chapter_row["id"],
-            version_no,
-            "final",
-            content_text,
-            run_row["id"],
-            step_row["id"],
-            now,
-        ),
+    index_chapter_version(
+        conn, chapter_row["project_id"], chapter_row["id"], version_id, chapter_row["title"], content_text
     )
 
     step_output = _loads_optional_json(step_row["output_json"]) or {}
     if not isinstance(step_output, dict):
         step_output = {}
+    for key in _PARTIAL_OUTPUT_KEYS:
+        step_output.pop(key, None)
     step_output["content_text"] = content_text
     step_output["chapter_version_id"] = version_id
     step_output["version_no"] = version_no
@@ -817,6 +995,15 @@ def _complete_run_with_content(
             step_row["id"],
         ),
     )
+    record_run_event(
+        conn,
+        run_row["id"],
+        "step.status",
+        "completed",
+        now,
+        step_id=step_row["id"],
+        payload={"chapter_version_id": version_id},
+    )
 
     run_output = {
         "chapter_id": chapter_row["id"],
@@ -832,6 +1019,7 @@ def _complete_run_with_content(
             run_row["id"],
         ),
     )
+    record_run_event(conn, run_row["id"], "run.status", "completed", now, payload=run_output)
     conn.execute(
         "UPDATE chapters SET status = ?, needs_review = 0, review_reason = NULL, updated_at = ? WHERE id = ?",
         ("finalized", now, chapter_row["id"]),
@@ -855,58 +1043,41 @@ def _execute_run_until_stable(conn: sqlite3.Connection, run_id: str) -> sqlite3.
     if run_row["status"] == "created":
         now = utc_now_iso()
         conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
+        record_run_event(conn, run_id, "run.status", "running", now)
         conn.execute(
             "UPDATE chapters SET status = ?, needs_review = 0, review_reason = NULL, updated_at = ? WHERE id = ?",
             ("drafting", now, chapter_row["id"]),
         )
         run_row = _run_row_or_404(conn, run_id)
 
-    step_row = _first_run_step(conn, run_id)
-    if step_row is None:
+    steps = _run_steps(conn, run_id)
+    if not steps:
         now = utc_now_iso()
         conn.execute(
             "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
             ("completed", "{}", now, run_id),
         )
+        record_run_event(conn, run_id, "run.status", "completed", now)
         return _run_row_or_404(conn, run_id)
 
-    if step_row["status"] == "pending":
-        conn.execute("UPDATE run_steps SET status = ? WHERE id = ?", ("running", step_row["id"]))
-        step_row = _run_step_row_or_404(conn, run_id, step_row["id"])
-
-    if step_row["status"] == "pending_approval":
-        pause_output = {"waiting_for_approval_step_id": step_row["id"]}
+    waiting = next((row for row in steps if row["status"] == "pending_approval"), None)
+    if waiting is not None:
+        pause_output = {"waiting_for_approval_step_id": waiting["id"]}
         conn.execute(
             "UPDATE runs SET status = ?, output_json = ? WHERE id = ?",
             ("paused", json.dumps(pause_output, ensure_ascii=True, sort_keys=True), run_id),
         )
+        record_run_event(conn, run_id, "run.status", "paused", utc_now_iso(), payload=pause_output)
         return _run_row_or_404(conn, run_id)
 
-    if step_row["status"] == "approved":
+    step_row = next((row for row in steps if row["status"] == "approved"), None)
+    if step_row is not None:
         step_output = _loads_optional_json(step_row["output_json"]) or {}
         if not isinstance(step_output, dict):
             step_output = {}
         content_text = step_output.get("content_text") or step_output.get("generated_content_text")
         if not isinstance(content_text, str) or not content_text.strip():
-            now = utc_now_iso()
-            error = "Approved step has no content."
-            conn.execute(
-                "UPDATE run_steps SET status = ?, error_text = ?, finished_at = ? WHERE id = ?",
-                ("failed", error, now, step_row["id"]),
-            )
-            conn.execute(
-                "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
-                (
-                    "failed",
-                    json.dumps({"error": error}, ensure_ascii=True, sort_keys=True),
-                    now,
-                    run_id,
-                ),
-            )
-            conn.execute(
-                "UPDATE chapters SET needs_review = 1, review_reason = ?, updated_at = ? WHERE id = ?",
-                (error, now, chapter_row["id"]),
-            )
+            _fail_run(conn, run_id, step_row["id"], chapter_row["id"], "Approved step has no content.")
             return _run_row_or_404(conn, run_id)
 
         _complete_run_with_content(
@@ -919,41 +1090,186 @@ def _execute_run_until_stable(conn: sqlite3.Connection, run_id: str) -> sqlite3.
         )
         return _run_row_or_404(conn, run_id)
 
-    if step_row["status"] != "running":
-        return _run_row_or_404(conn, run_id)
+    # Start every pending step whose dependencies have completed. Select steps make
+    # no LLM call and are decided here; a running draft or review step waits for a
+    # background worker to make its LLM call (see _drive_run).
+    completed = {row["id"] for row in steps if row["status"] == "completed"}
+    for step_row in steps:
+        if step_row["status"] != "pending" or not completed.issuperset(_step_depends_on(step_row)):
+            continue
+        conn.execute("UPDATE run_steps SET status = ? WHERE id = ?", ("running", step_row["id"]))
+        record_run_event(conn, run_id, "step.status", "running", utc_now_iso(), step_id=step_row["id"])
+        if step_row["step_type"] == "select":
+            _run_select_step(conn, run_row, _run_step_row_or_404(conn, run_id, step_row["id"]), chapter_row)
+            return _execute_run_until_stable(conn, run_id)
 
-    try:
-        content_text = _invoke_llm_for_step(
+    return _run_row_or_404(conn, run_id)
+
+
+def _draft_candidates(conn: sqlite3.Connection, run_id: str, steps: list[sqlite3.Row]) -> list[DraftCandidate]:
+    candidates: dict[str, DraftCandidate] = {}
+    reviewed_drafts: dict[str, str] = {}
+    for row in steps:
+        if row["step_type"] == "draft" and row["status"] == "completed":
+            output = _loads_optional_json(row["output_json"]) or {}
+            candidates[row["id"]] = DraftCandidate(
+                step_id=row["id"],
+                draft_no=(_loads_optional_json(row["input_json"]) or {}).get("draft_no", row["step_no"]),
+                chapter_version_id=output["chapter_version_id"],
+                content_text=output["content_text"],
+            )
+        elif row["step_type"] == "review":
+            reviewed_drafts[row["id"]] = _step_depends_on(row)[0]
+    for review in conn.execute(
+        "SELECT source_step_id, report_json FROM chapter_reviews WHERE source_run_id = ? ORDER BY id", (run_id,)
+    ):
+        candidate = candidates.get(reviewed_drafts.get(review["source_step_id"], ""))
+        if candidate is not None:
+            candidate.reports.append(json.loads(review["report_json"]))
+    return list(candidates.values())
+
+
+def _run_select_step(
+    conn: sqlite3.Connection,
+    run_row: sqlite3.Row,
+    step_row: sqlite3.Row,
+    chapter_row: sqlite3.Row,
+) -> None:
+    """Rank the run's drafts by the step's ``select_strategy`` and finalize (or offer) the winner.
+
+    ``human_only`` and approval-gated steps stop at ``pending_approval`` with the
+    ranked candidates; approving one (``selected_step_id``) finalizes it.
+    """
+    strategy = (_loads_optional_json(step_row["input_json"]) or {}).get("select_strategy", "min_issues")
+    ranked = rank_candidates(_draft_candidates(conn, run_row["id"], _run_steps(conn, run_row["id"])), strategy)
+    winner = ranked[0] if ranked and strategy != "human_only" else None
+    step_output: dict[str, object] = {
+        "select_strategy": strategy,
+        "candidates": [candidate.summary() for candidate in ranked],
+        "selected_step_id": winner.step_id if winner is not None else None,
+    }
+    if not step_row["requires_approval"] and winner is not None:
+        conn.execute(
+            "UPDATE run_steps SET output_json = ? WHERE id = ?",
+            (json.dumps(step_output, ensure_ascii=True, sort_keys=True), step_row["id"]),
+        )
+        _complete_run_with_content(
             conn=conn,
             run_row=run_row,
-            step_row=step_row,
+            step_row=_run_step_row_or_404(conn, run_row["id"], step_row["id"]),
             chapter_row=chapter_row,
+            content_text=winner.content_text,
+            approval_status="n/a",
         )
-    except Exception as exc:
-        now = utc_now_iso()
-        error = str(exc)
-        conn.execute(
-            "UPDATE run_steps SET status = ?, error_text = ?, finished_at = ? WHERE id = ?",
-            ("failed", error, now, step_row["id"]),
-        )
-        conn.execute(
-            "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
-            (
-                "failed",
-                json.dumps({"error": error}, ensure_ascii=True, sort_keys=True),
-                now,
-                run_id,
-            ),
-        )
+        return
+    if winner is not None:
+        step_output["generated_content_text"] = winner.content_text
+    now = utc_now_iso()
+    conn.execute(
+        "UPDATE run_steps SET status = ?, approval_status = ?, output_json = ?, finished_at = ? WHERE id = ?",
+        (
+            "pending_approval",
+            "pending",
+            json.dumps(step_output, ensure_ascii=True, sort_keys=True),
+            now,
+            step_row["id"],
+        ),
+    )
+    record_run_event(
+        conn,
+        run_row["id"],
+        "step.status",
+        "pending_approval",
+        now,
+        step_id=step_row["id"],
+        payload={"selected_step_id": step_output["selected_step_id"]},
+    )
+
+
+def _review_target(conn: sqlite3.Connection, step_row: sqlite3.Row) -> dict[str, object]:
+    """What a review step reviews: its draft step's chapter version and text."""
+    (draft_step_id,) = _step_depends_on(step_row)
+    draft_output = _loads_optional_json(_run_step_row_or_404(conn, step_row["run_id"], draft_step_id)["output_json"])
+    return {
+        "step_id": draft_step_id,
+        "chapter_version_id": draft_output["chapter_version_id"],
+        "content_text": draft_output["content_text"],
+    }
+
+
+def _next_llm_requests(conn: sqlite3.Connection, run_id: str, inflight: set[str]) -> list[LlmRequest]:
+    """Requests for the run's running LLM steps that have no call in ``inflight`` yet."""
+    run_row = _execute_run_until_stable(conn, run_id)
+    if run_row["status"] != "running":
+        return []
+    chapter_row = _chapter_row_or_404(conn, run_row["target_chapter_id"])
+    requests = []
+    for step_row in _run_steps(conn, run_id):
+        if step_row["status"] != "running" or step_row["step_type"] == "select" or step_row["id"] in inflight:
+            continue
+        review_of = _review_target(conn, step_row) if step_row["step_type"] == "review" else None
+        request = _build_step_llm_request(run_row, step_row, chapter_row, review_of)
+        # Refuse calls the remaining budget cannot cover before any tokens are spent, and
+        # reserve each admitted call's estimate so the steps admitted after it see less.
+        budget = _loads_optional_json(step_row["budget_json"])
+        exceeded = check_before_call(conn, request, budget)
+        if exceeded is not None:
+            for admitted in requests:
+                release_reservation(conn, admitted)
+            _fail_run(conn, run_id, step_row["id"], chapter_row["id"], exceeded)
+            return []
+        requests.append(reserve_call(conn, request, budget))
+    return requests
+
+
+def _apply_llm_outcome(
+    conn: sqlite3.Connection,
+    request: LlmRequest,
+    outcome: LlmOutcome,
+    started_at: str,
+    owner: str,
+) -> bool:
+    for attempt in (outcome, *outcome.hedge_attempts):
+        record_llm_call(conn, request, attempt, started_at)
+    charge_usage(conn, request, outcome)
+    get_response_cache().remember(conn, request, outcome)
+
+    # The run may have been paused or cancelled, or its lease taken over, while the
+    # call was in flight; the call is still recorded but its output is discarded. A
+    # paused run regenerates on resume.
+    if not holds_lease(conn, request.run_id, owner):
+        return False
+    run_row = _run_row_or_404(conn, request.run_id)
+    step_row = _run_step_row_or_404(conn, request.run_id, request.step_id)
+    if run_row["status"] != "running" or step_row["status"] != "running":
+        return False
+    chapter_row = _chapter_row_or_404(conn, run_row["target_chapter_id"])
+    if outcome.cancel_reason == "timeout":
+        _retry_or_fail_step(conn, run_row, step_row, chapter_row, outcome.error)
+        return True
+    if outcome.cancel_reason is not None:
+        # Paused (or cancelled) mid-call and already running again: regenerate.
+        return True
+    if outcome.rate_limit is not None and not outcome.coalesced:
+        step_budget = _loads_optional_json(step_row["budget_json"]) or {}
+        step_budget["rate_limit"] = outcome.rate_limit
         conn.execute(
-            "UPDATE chapters SET needs_review = 1, review_reason = ?, updated_at = ? WHERE id = ?",
-            (error, now, chapter_row["id"]),
+            "UPDATE run_steps SET budget_json = ? WHERE id = ?",
+            (json.dumps(step_budget, ensure_ascii=True, sort_keys=True), step_row["id"]),
         )
-        return _run_row_or_404(conn, run_id)
+
+    if not outcome.succeeded:
+        _fail_run(conn, run_row["id"], step_row["id"], chapter_row["id"], outcome.error)
+        return True
+
+    if any(request.step_id in _step_depends_on(row) for row in _run_steps(conn, run_row["id"])):
+        _complete_intermediate_step(conn, run_row, step_row, chapter_row, outcome.content_text)
+        _execute_run_until_stable(conn, run_row["id"])
+        return True
 
     if step_row["requires_approval"]:
         now = utc_now_iso()
-        step_output = {"generated_content_text": content_text}
+        step_output = {"generated_content_text": outcome.content_text}
         conn.execute(
             "UPDATE run_steps SET status = ?, approval_status = ?, output_json = ?, finished_at = ? WHERE id = ?",
             (
@@ -964,237 +1280,1053 @@ def _execute_run_until_stable(conn: sqlite3.Connection, run_id: str) -> sqlite3.
                 step_row["id"],
             ),
         )
+        record_run_event(conn, run_row["id"], "step.status", "pending_approval", now, step_id=step_row["id"])
         pause_output = {"waiting_for_approval_step_id": step_row["id"]}
         conn.execute(
             "UPDATE runs SET status = ?, output_json = ? WHERE id = ?",
-            ("paused", json.dumps(pause_output, ensure_ascii=True, sort_keys=True), run_id),
+            ("paused", json.dumps(pause_output, ensure_ascii=True, sort_keys=True), run_row["id"]),
         )
-        return _run_row_or_404(conn, run_id)
+        record_run_event(conn, run_row["id"], "run.status", "paused", now, payload=pause_output)
+        return True
 
     _complete_run_with_content(
         conn=conn,
         run_row=run_row,
         step_row=step_row,
         chapter_row=chapter_row,
-        content_text=content_text,
+        content_text=outcome.content_text,
         approval_status="n/a",
     )
-    return _run_row_or_404(conn, run_id)
+    return True
 
 
-@app.post("/swarm/run", response_model=RunOut)
-def create_swarm_run(
-    payload: SwarmRunCreate,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> RunOut:
-    if not _project_exists(conn, payload.project_id):
-        raise HTTPException(status_code=404, detail="Project not found.")
+def _complete_intermediate_step(
+    conn: sqlite3.Connection,
+    run_row: sqlite3.Row,
+    step_row: sqlite3.Row,
+    chapter_row: sqlite3.Row,
+    content_text: str,
+) -> None:
+    """Store a draft as a ``draft``-stage chapter version, or a review as a ``chapter_reviews`` row."""
+    now = utc_now_iso()
+    step_output = _loads_optional_json(step_row["output_json"]) or {}
+    for key in _PARTIAL_OUTPUT_KEYS:
+        step_output.pop(key, None)
+    step_output["content_text"] = content_text
+    if step_row["step_type"] == "review":
+        target = _review_target(conn, step_row)
+        report = parse_review_report(content_text)
+        review_id = new_ulid("chrev")
+        review_type = report.get("review_type") if isinstance(report.get("review_type"), str) else "logic"
+        conn.execute(
+            "INSERT INTO chapter_reviews ("
+            "id, chapter_id, version_id, review_type, report_json, source_run_id, source_step_id, created_at"
+            ") VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                review_id,
+                chapter_row["id"],
+                target["chapter_version_id"],
+                review_type,
+                json.dumps(report, ensure_ascii=True, sort_keys=True),
+                run_row["id"],
+                step_row["id"],
+                now,
+            ),
+        )
+        step_output.update(
+            review_id=review_id,
+            chapter_version_id=target["chapter_version_id"],
+            issue_count=issue_count(report),
+            score=weighted_score(report),
+        )
+        event_payload = {"review_id": review_id}
+    else:
+        version_id, version_no = insert_text_version(
+            conn,
+            chapter_id=chapter_row["id"],
+            stage="draft",
+            content_text=content_text,
+            source_run_id=run_row["id"],
+            source_step_id=step_row["id"],
+            created_at=now,
+        )
+        step_output.update(chapter_version_id=version_id, version_no=version_no)
+        event_payload = {"chapter_version_id": version_id}
+    conn.execute(
+        "UPDATE run_steps SET status = ?, output_json = ?, finished_at = ?, error_text = NULL WHERE id = ?",
+        ("completed", json.dumps(step_output, ensure_ascii=True, sort_keys=True), now, step_row["id"]),
+    )
+    record_run_event(
+        conn, run_row["id"], "step.status", "completed", now, step_id=step_row["id"], payload=event_payload
+    )
 
-    chapter_row = _chapter_row_or_404(conn, payload.chapter_id)
-    if chapter_row["project_id"] != payload.project_id:
-        raise HTTPException(status_code=403, detail="Chapter does not belong to this project.")
 
-    now = utc_now_iso()
-    run_id = new_ulid("run")
-    step_id = new_ulid("step")
+def _retry_or_fail_step(
+    conn: sqlite3.Connection,
+    run_row: sqlite3.Row,
+    step_row: sqlite3.Row,
+    chapter_row: sqlite3.Row,
+    error: str,
+) -> None:
+    """Give a timed-out step another attempt while its ``retry_budget`` lasts, else fail the run."""
+    step_budget = _loads_optional_json(step_row["budget_json"]) or {}
+    retries_used = step_budget.get("retries_used", 0)
+    if not isinstance(retries_used, int):
+        retries_used = 0
+    if retries_used >= BudgetLimits.from_json(step_budget).retry_budget:
+        _fail_run(conn, run_row["id"], step_row["id"], chapter_row["id"], error)
+        return
+    step_budget["retries_used"] = retries_used + 1
+    step_output = _loads_optional_json(step_row["output_json"]) or {}
+    for key in _PARTIAL_OUTPUT_KEYS:
+        step_output.pop(key, None)
     conn.execute(
-        "INSERT INTO runs ("
-        "id, project_id, swarm_profile_id, run_type, target_chapter_id, status, input_json, output_json, "
-        "budget_json, started_at, finished_at"
-        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "UPDATE run_steps SET budget_json = ?, output_json = ?, error_text = ? WHERE id = ?",
         (
-            run_id,
-            payload.project_id,
-            payload.swarm_profile_id,
-            payload.run_type,
-            payload.chapter_id,
-            "created",
-            (
-                json.dumps(payload.input_json, ensure_ascii=True, sort_keys=True)
-                if payload.input_json is not None
-                else None
-            ),
-            None,
-            (
-                json.dumps(payload.budget_json, ensure_ascii=True, sort_keys=True)
-                if payload.budget_json is not None
-                else None
-            ),
-            now,
-            None,
+            json.dumps(step_budget, ensure_ascii=True, sort_keys=True),
+            json.dumps(step_output, ensure_ascii=True, sort_keys=True) if step_output else None,
+            error,
+            step_row["id"],
         ),
     )
+    record_run_event(
+        conn,
+        run_row["id"],
+        "step.status",
+        "retrying",
+        utc_now_iso(),
+        step_id=step_row["id"],
+        payload={"error": error, "attempt": retries_used + 2},
+    )
+
+
+def _checkpoint_partial_output(conn: sqlite3.Connection, request: LlmRequest, text: str, owner: str) -> None:
+    if not holds_lease(conn, request.run_id, owner):
+        return
+    step_row = _run_step_row_or_404(conn, request.run_id, request.step_id)
+    if step_row["status"] != "running":
+        return
+    step_output = _loads_optional_json(step_row["output_json"]) or {}
+    step_output["partial_content_text"] = text
+    step_output["partial_checkpoint_at"] = utc_now_iso()
     conn.execute(
+        "UPDATE run_steps SET output_json = ? WHERE id = ?",
+        (json.dumps(step_output, ensure_ascii=True, sort_keys=True), step_row["id"]),
+    )
+
+
+_llm_single_flight: SingleFlight[LlmOutcome] = SingleFlight()
+
+
+def _call_with_rate_limit(request: LlmRequest, on_chunk: ChunkCallback | None = None) -> LlmOutcome:
+    limiter = get_rate_limiters().get(request.bucket)
+    if limiter is None:
+        return call_llm(_llm_generator(request), request, on_chunk)
+    reserved = request.estimated_prompt_tokens + limiter.limits.completion_reserve_tokens
+    started = time.monotonic()
+    try:
+        admission = limiter.acquire(reserved)
+    except RateLimitTimeout as exc:
+        return LlmOutcome(
+            provider_id=request.provider_id,
+            model_id=request.model_id,
+            error=str(exc),
+            rate_limit={"bucket": request.bucket, "wait_ms": round((time.monotonic() - started) * 1000.0, 3)},
+        )
+    outcome = None
+    try:
+        outcome = call_llm(_llm_generator(request), request, on_chunk)
+    finally:
+        limiter.release(admission, usage_tokens(outcome.usage) if outcome is not None and outcome.succeeded else None)
+    outcome.rate_limit = {"bucket": request.bucket, "wait_ms": round(admission.waited_seconds * 1000.0, 3)}
+    return outcome
+
+
+def _admit_hedge(request: LlmRequest) -> LlmRequest | None:
+    """The hedge's duplicate with its estimate reserved, or None if the step's budget cannot cover it.
+
+    Checked and reserved in one write, like the calls ``_next_llm_requests`` admits,
+    so steps admitted while the hedge runs see its cost; ``charge_usage`` settles it.
+    """
+
+    def admit(conn: sqlite3.Connection) -> LlmRequest | None:
+        row = conn.execute("SELECT budget_json FROM run_steps WHERE id = ?", (request.step_id,)).fetchone()
+        budget = _loads_optional_json(row["budget_json"]) if row is not None else None
+        if check_before_call(conn, request, budget) is not None:
+            return None
+        return reserve_call(conn, request, budget)
+
+    return run_write(admit)
+
+
+def _call_provider(request: LlmRequest, on_chunk: ChunkCallback | None = None) -> LlmOutcome:
+    plan = get_hedging().plan(request)
+    if plan is None:
+        return _call_with_rate_limit(request, on_chunk)
+    return hedged_call(_call_with_rate_limit, request, plan, on_chunk, _admit_hedge)
+
+
+def _generate(request: LlmRequest, on_chunk: ChunkCallback | None = None) -> LlmOutcome:
+    cached = get_response_cache().lookup(request)
+    if cached is not None:
+        return cached
+    if not request.use_cache:
+        return _call_provider(request, on_chunk)
+    # Identical requests already in flight in this process share the leader's call;
+    # followers only see the finished text, not the leader's stream.
+    token = current_token()
+    while True:
+        try:
+            outcome, leader = _llm_single_flight.do(
+                cache_key(request.request_hash, request.model_id),
+                lambda: _call_provider(request, on_chunk),
+                token,
+            )
+        except CallCancelled:
+            if token is None or token.cancelled:
+                raise
+            continue  # Only the leader's call was abandoned; make the call ourselves.
+        return outcome if leader else outcome.for_follower()
+
+
+def _run_step_call(request: LlmRequest, token: CancellationToken, owner: str) -> bool:
+    """Make one step's LLM call under ``token`` and apply it; False once the run no longer wants it."""
+    started_at = utc_now_iso()
+    stream = get_stream_hub().open(request.run_id, request.step_id)
+    checkpointer = StreamCheckpointer(
+        stream,
+        lambda text: run_write(lambda conn: _checkpoint_partial_output(conn, request, text, owner)),
+        checkpoint_seconds(),
+    )
+    try:
+        try:
+            outcome = call_with_deadline(lambda: _generate(request, checkpointer), token, request.timeout_seconds)
+        except CallCancelled as exc:
+            # Charged at an estimate, so a retry is checked against what the cut-off call spent.
+            outcome = LlmOutcome(
+                provider_id=request.provider_id,
+                model_id=request.model_id,
+                usage=estimated_usage(request, len(stream.text())),
+                error=str(exc),
+                cancel_reason=exc.reason,
+            )
+        return run_write(lambda conn: _apply_llm_outcome(conn, request, outcome, started_at, owner))
+    finally:
+        get_stream_hub().close(stream)
+
+
+def _drive_run(run_id: str, owner: str = WORKER_ID) -> None:
+    """Advance ``run_id`` until it no longer needs the LLM, under a lease held by ``owner``.
+
+    Each state transition is its own short write; the model calls themselves run with
+    no transaction open. Steps that are ready together (parallel drafts, then their
+    reviews) are fanned out to the step pool, and each finished call immediately
+    starts whatever it unblocks, so a chapter takes about as long as its slowest
+    chain of calls. The lease (kept alive by the heartbeat thread) stops two
+    processes from driving the same run; if it is lost mid-call the result is dropped
+    and the new owner regenerates. Each call runs under its step's timeout and a child
+    of the run's cancellation token, which pause/cancel fire, so this worker stops
+    waiting at once.
+    """
+    if not run_write(lambda conn: claim_run(conn, run_id, owner, lease_seconds())):
+        return
+    heartbeat = get_heartbeat()
+    heartbeat.track(run_id)
+    token: CancellationToken | None = None
+    inflight: dict[Future[bool], str] = {}
+    try:
+        while True:
+            # Opened before the requests are read, so a pause or cancel committed after
+            # that read always finds the token.
+            if token is None or token.cancelled:
+                token = get_cancellations().open(run_id)
+            running = set(inflight.values())
+            for request in run_write(lambda conn: _next_llm_requests(conn, run_id, running)):
+                future = get_step_executor().submit(_run_step_call, request, token.child(), owner)
+                inflight[future] = request.step_id
+            if not inflight:
+                return
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            applied = [future.result() for future in done]
+            for future in done:
+                del inflight[future]
+            if not all(applied):
+                return
+    finally:
+        if inflight:
+            # The run stopped (or this driver failed): nothing waits for the siblings' output.
+            token.cancel("stopped")
+            wait(inflight)
+        if token is not None:
+            get_cancellations().close(run_id, token)
+        heartbeat.untrack(run_id)
+        run_write(lambda conn: release_run(conn, run_id, owner))
+
+
+def _dispatch_locally() -> bool:
+    # "external" leaves running runs for `writer-worker` processes to claim.
+    return os.getenv("WRITER_RUN_DISPATCH", "local").strip().lower() != "external"
+
+
+def _schedule_run(run: RunOut) -> RunOut:
+    if run.status == "running" and _dispatch_locally():
+        executor = get_run_executor()
+        dispatcher = get_run_dispatcher()
+        if dispatcher is None or executor.is_inflight(run.id):
+            # A driver already holding this run picks the transition up on its next pass.
+            executor.submit(run.id, _drive_run)
+        else:
+            dispatcher.kick()
+    return run
+
+
+def _plan_steps(payload: SwarmRunCreate | SwarmRunBatchCreate) -> list[tuple[str, str, bool, dict | None, list[int]]]:
+    """The step DAG of one run as ``(step_type, role, requires_approval, input_json, depends_on)``.
+
+    ``depends_on`` holds indexes into the list. One draft and no reviews is the plain
+    single-step run; otherwise ``draft_n`` drafts each get ``review_n`` reviews and a
+    final select step waits for all of them.
+    """
+    if payload.draft_n == 1 and payload.review_n == 0:
+        return [("draft", "writer", payload.requires_approval, None, [])]
+    steps: list[tuple[str, str, bool, dict | None, list[int]]] = [
+        ("draft", "writer", False, {"draft_no": draft_no}, []) for draft_no in range(1, payload.draft_n + 1)
+    ]
+    for draft_index in range(payload.draft_n):
+        for review_no in range(1, payload.review_n + 1):
+            review_input = {"draft_no": draft_index + 1, "review_no": review_no}
+            steps.append(("review", "critic", False, review_input, [draft_index]))
+    requires_approval = payload.requires_approval or payload.select_strategy == "human_only"
+    select_input = {"select_strategy": payload.select_strategy}
+    steps.append(("select", "editor", requires_approval, select_input, list(range(len(steps)))))
+    return steps
+
+
+def _insert_runs(
+    conn: sqlite3.Connection,
+    payload: SwarmRunCreate | SwarmRunBatchCreate,
+    chapter_ids: list[str],
+    now: str,
+    batch_id: str | None = None,
+) -> list[tuple[str, str]]:
+    """Insert one created run (and its step DAG) per chapter; returns ``(run_id, first_step_id)`` pairs."""
+    plan = _plan_steps(payload)
+    ids = [(new_ulid("run"), [new_ulid("step") for _ in plan]) for _ in chapter_ids]
+    limits = BudgetLimits.from_json(payload.budget_json)
+    run_remaining_tokens, run_remaining_cost = initial_run_remaining(limits)
+    step_remaining_tokens, step_remaining_cost = initial_step_remaining(limits)
+    input_json = (
+        json.dumps(payload.input_json, ensure_ascii=True, sort_keys=True) if payload.input_json is not None else None
+    )
+    budget_json = (
+        json.dumps(payload.budget_json, ensure_ascii=True, sort_keys=True) if payload.budget_json is not None else None
+    )
+    conn.executemany(
+        "INSERT INTO runs ("
+        "id, project_id, swarm_profile_id, run_type, target_chapter_id, status, input_json, output_json, "
+        "budget_json, budget_remaining_tokens, budget_remaining_cost, llm_cache, batch_id, priority, "
+        "started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                run_id,
+                payload.project_id,
+                payload.swarm_profile_id,
+                payload.run_type,
+                chapter_id,
+                "created",
+                input_json,
+                None,
+                budget_json,
+                run_remaining_tokens,
+                run_remaining_cost,
+                1 if payload.llm_cache else 0,
+                batch_id,
+                payload.priority,
+                now,
+                None,
+            )
+            for (run_id, _), chapter_id in zip(ids, chapter_ids)
+        ],
+    )
+    conn.executemany(
         "INSERT INTO run_steps ("
-        "id, run_id, step_no, step_type, role, status, requires_approval, approval_status, "
-        "override_payload_json, input_json, output_json, budget_json, started_at, finished_at, error_text"
-        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (
-            step_id,
-            run_id,
-            1,
-            "draft",
-            "writer",
-            "pending",
-            1 if payload.requires_approval else 0,
-            "n/a",
-            None,
-            None,
-            None,
+        "id, run_id, step_no, step_type, role, status, depends_on_json, requires_approval, approval_status, "
+        "override_payload_json, input_json, output_json, budget_json, budget_remaining_tokens, "
+        "budget_remaining_cost, started_at, finished_at, error_text"
+        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
             (
-                json.dumps(payload.budget_json, ensure_ascii=True, sort_keys=True)
-                if payload.budget_json is not None
-                else None
-            ),
-            now,
-            None,
-            None,
-        ),
+                step_ids[step_index],
+                run_id,
+                step_index + 1,
+                step_type,
+                role,
+                "pending",
+                json.dumps([step_ids[index] for index in depends_on]) if depends_on else None,
+                1 if requires_approval else 0,
+                "n/a",
+                None,
+                json.dumps(step_input, ensure_ascii=True, sort_keys=True) if step_input is not None else None,
+                None,
+                budget_json,
+                step_remaining_tokens,
+                step_remaining_cost,
+                now,
+                None,
+                None,
+            )
+            for run_id, step_ids in ids
+            for step_index, (step_type, role, requires_approval, step_input, depends_on) in enumerate(plan)
+        ],
     )
+    record_created_events(conn, [run_id for run_id, _ in ids], now)
+    return [(run_id, step_ids[0]) for run_id, step_ids in ids]
 
-    run_row = _run_row_or_404(conn, run_id)
-    if payload.auto_start:
-        run_row = _execute_run_until_stable(conn, run_id)
 
-    conn.commit()
-    return _run_from_row(run_row)
+@app.post("/swarm/run", response_model=RunOut)
+async def create_swarm_run(payload: SwarmRunCreate) -> RunOut:
+    def write(conn: sqlite3.Connection) -> RunOut:
+        if not _project_exists(conn, payload.project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        chapter_row = _chapter_row_or_404(conn, payload.chapter_id)
+        if chapter_row["project_id"] != payload.project_id:
+            raise HTTPException(status_code=403, detail="Chapter does not belong to this project.")
+
+        now = utc_now_iso()
+        ((run_id, _),) = _insert_runs(conn, payload, [payload.chapter_id], now)
+        run_row = _run_row_or_404(conn, run_id)
+        if payload.auto_start:
+            run_row = _execute_run_until_stable(conn, run_id)
+
+        return _run_from_row(run_row)
+
+    return _schedule_run(await db_write(write))
+
+
+@app.post("/swarm/runs:batch", response_model=RunBatchOut)
+async def create_swarm_run_batch(payload: SwarmRunBatchCreate) -> RunBatchOut:
+    """Create one run per chapter in a single transaction.
+
+    Rows are bulk-inserted; auto-started runs then take their first transition
+    through the same state machine as ``POST /swarm/run``.
+    """
+    chapter_ids = list(dict.fromkeys(payload.chapter_ids))
+    if len(chapter_ids) != len(payload.chapter_ids):
+        raise HTTPException(status_code=422, detail="chapter_ids must be unique.")
+
+    def write(conn: sqlite3.Connection) -> tuple[RunBatchOut, list[RunOut]]:
+        if not _project_exists(conn, payload.project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        placeholders = ", ".join("?" for _ in chapter_ids)
+        owners = dict(
+            conn.execute(f"SELECT id, project_id FROM chapters WHERE id IN ({placeholders})", chapter_ids).fetchall()
+        )
+        missing = [chapter_id for chapter_id in chapter_ids if chapter_id not in owners]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Chapter not found: {', '.join(missing)}.")
+        foreign = [chapter_id for chapter_id in chapter_ids if owners[chapter_id] != payload.project_id]
+        if foreign:
+            raise HTTPException(
+                status_code=403, detail=f"Chapters do not belong to this project: {', '.join(foreign)}."
+            )
+
+        now = utc_now_iso()
+        batch_id = new_ulid("batch")
+        conn.execute(
+            "INSERT INTO run_batches (id, project_id, run_count, created_at) VALUES (?, ?, ?, ?)",
+            (batch_id, payload.project_id, len(chapter_ids), now),
+        )
+        run_ids = [run_id for run_id, _ in _insert_runs(conn, payload, chapter_ids, now, batch_id=batch_id)]
+        started: list[RunOut] = []
+        if payload.auto_start:
+            started = [_run_from_row(_execute_run_until_stable(conn, run_id)) for run_id in run_ids]
+        return RunBatchOut(id=batch_id, project_id=payload.project_id, run_ids=run_ids, created_at=now), started
+
+    batch, started = await db_write(write)
+    for run in started:
+        _schedule_run(run)
+    return batch
+
+
+@app.get("/swarm/batches/{batch_id}", response_model=RunBatchStatusOut)
+async def get_swarm_run_batch(batch_id: str) -> RunBatchStatusOut:
+    def read(conn: sqlite3.Connection) -> RunBatchStatusOut:
+        batch = conn.execute(
+            "SELECT id, project_id, run_count, created_at FROM run_batches WHERE id = ?",
+            (batch_id,),
+        ).fetchone()
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Run batch not found.")
+        counts = dict(
+            conn.execute(
+                "SELECT status, COUNT(*) FROM runs WHERE batch_id = ? GROUP BY status",
+                (batch_id,),
+            ).fetchall()
+        )
+        finished = sum(counts.get(status, 0) for status in TERMINAL_RUN_STATUSES)
+        total = batch["run_count"]
+        return RunBatchStatusOut(
+            id=batch["id"],
+            project_id=batch["project_id"],
+            total=total,
+            status_counts=counts,
+            finished=finished,
+            progress=finished / total if total else 1.0,
+            done=finished >= total,
+            created_at=batch["created_at"],
+        )
+
+    return await db_read(read)
 
 
 @app.get("/runs/{run_id}", response_model=RunOut)
-def get_run(run_id: str, conn: sqlite3.Connection = Depends(db_session)) -> RunOut:
-    row = _run_row_or_404(conn, run_id)
-    return _run_from_row(row)
+async def get_run(run_id: str) -> RunOut:
+    def read(conn: sqlite3.Connection) -> RunOut:
+        row = _run_row_or_404(conn, run_id)
+        # Only a run still waiting for a worker has a position; a driven one skips the snapshot.
+        queued = row["status"] == "running" and queued_among(conn, [run_id])
+        queue = current_queue_snapshot(conn) if queued else None
+        return _run_from_row(row, queue)
+
+    return await db_read(read)
+
+
+@app.get("/projects/{project_id}/runs", response_model=RunListResponse)
+async def list_project_runs(
+    project_id: str,
+    status: str | None = Query(default=None),
+    max_remaining_tokens: int | None = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    after: str | None = Query(default=None),
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(RunOut, fields, view, heavy=("input_json", "output_json", "budget_json"))
+    # The queue fields are worked out from the run status, and only when asked for.
+    with_queue = "queue_position" in selected or "estimated_start_at" in selected
+    columns = _list_columns(selected, {"queue_position": "status", "estimated_start_at": "status"})
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        if not _project_exists(conn, project_id):
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        clauses = ["project_id = ?"]
+        params: list[object] = [project_id]
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if max_remaining_tokens is not None:
+            # Served by idx_runs_budget_tokens; runs without a token limit are never "close".
+            clauses.append("budget_remaining_tokens <= ?")
+            params.append(max_remaining_tokens)
+        if after:
+            clauses.append("id > ?")
+            params.append(after)
+        rows = conn.execute(
+            f"SELECT {columns} FROM runs WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        page_rows = rows[:limit]
+        running = [row["id"] for row in page_rows if row["status"] == "running"] if with_queue else []
+        queue = current_queue_snapshot(conn) if queued_among(conn, running) else None
+        computed = [
+            {
+                "queue_position": queue.positions.get(row["id"]) if queue is not None else None,
+                "estimated_start_at": queue.estimated_start_at(row["id"]) if queue is not None else None,
+            }
+            for row in page_rows
+        ]
+        next_after = page_rows[-1]["id"] if has_more and page_rows else None
+        return encode_page(_RUN_ENCODER.select(selected), page_rows, computed, next_after=next_after)
+
+    return RawJSONResponse(await db_read(read))
 
 
 @app.get("/runs/{run_id}/steps", response_model=RunStepListResponse)
-def list_run_steps(run_id: str, conn: sqlite3.Connection = Depends(db_session)) -> RunStepListResponse:
-    _run_row_or_404(conn, run_id)
-    rows = conn.execute(
-        "SELECT id, run_id, step_no, step_type, role, status, requires_approval, approval_status, "
-        "override_payload_json, input_json, output_json, budget_json, started_at, finished_at, error_text "
-        "FROM run_steps WHERE run_id = ? ORDER BY step_no",
-        (run_id,),
-    ).fetchall()
-    return RunStepListResponse(items=[_run_step_from_row(row) for row in rows])
+async def list_run_steps(
+    run_id: str,
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    heavy = ("override_payload_json", "input_json", "output_json", "budget_json")
+    selected = _list_fields(RunStepOut, fields, view, heavy)
+    columns = _list_columns(selected, {"depends_on": "depends_on_json"})
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        _run_row_or_404(conn, run_id)
+        return encode_page(_RUN_STEP_ENCODER.select(selected), _run_steps(conn, run_id, columns))
+
+    return RawJSONResponse(await db_read(read))
 
 
 @app.get("/runs/{run_id}/steps/{step_id}", response_model=RunStepOut)
-def get_run_step(
-    run_id: str, step_id: str, conn: sqlite3.Connection = Depends(db_session)
-) -> RunStepOut:
-    _run_row_or_404(conn, run_id)
-    row = _run_step_row_or_404(conn, run_id, step_id)
-    return _run_step_from_row(row)
+async def get_run_step(run_id: str, step_id: str) -> RunStepOut:
+    def read(conn: sqlite3.Connection) -> RunStepOut:
+        _run_row_or_404(conn, run_id)
+        row = _run_step_row_or_404(conn, run_id, step_id)
+        return _run_step_from_row(row)
+
+    return await db_read(read)
+
+
+def _sse(event: str, data: dict[str, object], event_id: int | None = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=True, sort_keys=True)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _streamed_step(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row | None:
+    """The step a run's stream shows: the final step once it has text, else the first (draft) step."""
+    steps = _run_steps(conn, run_id)
+    if not steps:
+        return None
+    return steps[-1] if _step_text_so_far(steps[-1]) else steps[0]
+
+
+def _step_text_so_far(step_row: sqlite3.Row | None) -> str:
+    output = _loads_optional_json(step_row["output_json"]) if step_row is not None else None
+    if not isinstance(output, dict):
+        return ""
+    for key in ("content_text", "generated_content_text", "partial_content_text"):
+        if isinstance(output.get(key), str):
+            return output[key]
+    return ""
+
+
+async def _run_stream_events(run_id: str, offset: int) -> AsyncIterator[str]:
+    """Poll the live in-process stream (cheap) or, failing that, the step checkpoint.
+
+    Token events carry ``id`` = character offset after the delta, so a client that
+    reconnects with ``Last-Event-ID`` resumes where it left off. When the text no
+    longer extends what was sent (the step was regenerated) a ``reset`` event tells
+    the client to discard it and the text is resent from the start.
+    """
+    hub = get_stream_hub()
+    sent: str | None = None
+    source: object = None
+    last_sent_at = time.monotonic()
+
+    def read(conn: sqlite3.Connection) -> tuple[str, sqlite3.Row | None]:
+        return _run_row_or_404(conn, run_id)["status"], _streamed_step(conn, run_id)
+
+    while True:
+        stream = hub.get(run_id)
+        if stream is not None and not stream.finished:
+            text, step_id, status = stream.text(), stream.step_id, None
+        else:
+            status, step_row = await db_read(read)
+            text, step_id = _step_text_so_far(step_row), step_row["id"] if step_row is not None else None
+
+        if sent is None:
+            sent = text[:offset]
+        if (stream is None or stream is not source) and not text.startswith(sent):
+            yield _sse("reset", {"step_id": step_id})
+            sent = ""
+        source = stream
+        if len(text) > len(sent):
+            yield _sse("token", {"step_id": step_id, "offset": len(sent), "text": text[len(sent):]}, len(text))
+            sent = text
+            last_sent_at = time.monotonic()
+
+        if status is not None and status not in {"created", "running"}:
+            yield _sse("done", {"status": status, "step_id": step_id, "chars": len(sent)})
+            return
+        if time.monotonic() - last_sent_at >= 15.0:
+            yield ": keep-alive\n\n"
+            last_sent_at = time.monotonic()
+        await asyncio.sleep(0.05 if stream is not None else max(0.05, checkpoint_seconds()))
+
+
+@app.get("/runs/{run_id}/stream")
+async def stream_run(run_id: str, request: Request) -> StreamingResponse:
+    await db_read(lambda conn: _run_row_or_404(conn, run_id))
+    last_event_id = request.headers.get("last-event-id", "")
+    offset = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        _run_stream_events(run_id, offset),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_RUN_EVENT_ENCODER = RowEncoder(RunEventOut, columns={"payload_json": "payload"})
+
+
+def _run_event_out(event: RunEvent) -> RunEventOut:
+    return RunEventOut(
+        id=event.id,
+        run_id=event.run_id,
+        step_id=event.step_id,
+        event_type=event.event_type,
+        status=event.status,
+        payload_json=event.payload,
+        created_at=event.created_at,
+    )
+
+
+async def _run_event_cursor(run_id: str, since: str | None) -> int:
+    def read(conn: sqlite3.Connection) -> int:
+        _run_row_or_404(conn, run_id)
+        if not since:
+            return 0
+        seq = event_seq(conn, run_id, since)
+        if seq is None:
+            raise HTTPException(status_code=422, detail="Unknown event id for this run.")
+        return seq
+
+    return await db_read(read)
+
+
+async def _subscribe_and_catch_up(run_id: str, after_seq: int, limit: int) -> tuple[Subscription, list[RunEvent]]:
+    # Subscribe before reading so events committed in between reach the subscription.
+    subscription = await get_run_event_bus().subscribe(run_id, db_read)
+    try:
+        events = await db_read(lambda conn: list_run_events(conn, run_id, after_seq, limit))
+    except BaseException:
+        subscription.close()
+        raise
+    return subscription, events
+
+
+@app.get("/runs/{run_id}/events", response_model=RunEventListResponse)
+async def list_run_events_feed(
+    run_id: str,
+    since: str | None = Query(default=None),
+    wait: float = Query(default=0.0, ge=0.0, le=30.0),
+    limit: int = Query(default=100, ge=1, le=500),
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    """Events after ``since``; with ``wait`` > 0, hold the request until one arrives (long-poll).
+
+    Events are shared with the live bus already parsed, so ``fields``/``view`` trim the
+    output rather than the query.
+    """
+    selected = _list_fields(RunEventOut, fields, view, heavy=("payload_json",))
+    after_seq = await _run_event_cursor(run_id, since)
+    events = await db_read(lambda conn: list_run_events(conn, run_id, after_seq, limit))
+    if not events and wait > 0:
+        subscription, events = await _subscribe_and_catch_up(run_id, after_seq, limit)
+        try:
+            if not events:
+                events = (await subscription.next(after_seq, wait))[:limit]
+        finally:
+            subscription.close()
+    next_since = events[-1].id if events else since
+    encoder = _RUN_EVENT_ENCODER.select(selected)
+    return RawJSONResponse(encode_page(encoder, [vars(event) for event in events], next_since=next_since))
+
+
+async def _run_event_stream(run_id: str, after_seq: int) -> AsyncIterator[str]:
+    page = 500
+    subscription, events = await _subscribe_and_catch_up(run_id, after_seq, page)
+    try:
+        while True:
+            for event in events:
+                if event.seq <= after_seq:
+                    continue
+                after_seq = event.seq
+                yield (
+                    f"event: {event.event_type}\nid: {event.id}\n"
+                    f"data: {_run_event_out(event).model_dump_json()}\n\n"
+                )
+                if event.ends_run:
+                    return
+            if len(events) >= page:
+                # Still catching up on a long history.
+                events = await db_read(lambda conn: list_run_events(conn, run_id, after_seq, page))
+                continue
+            events = await subscription.next(after_seq, 15.0)
+            if not events:
+                yield ": keep-alive\n\n"
+    finally:
+        subscription.close()
+
+
+@app.get("/runs/{run_id}/events/stream")
+async def stream_run_events(
+    run_id: str,
+    request: Request,
+    since: str | None = Query(default=None),
+) -> StreamingResponse:
+    """SSE feed of run events; ends after the run reaches a terminal status."""
+    after_seq = await _run_event_cursor(run_id, request.headers.get("last-event-id") or since)
+    return StreamingResponse(
+        _run_event_stream(run_id, after_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/runs/{run_id}/pause", response_model=RunOut)
-def pause_run(run_id: str, conn: sqlite3.Connection = Depends(db_session)) -> RunOut:
-    run_row = _run_row_or_404(conn, run_id)
-    if run_row["status"] != "running":
-        raise HTTPException(status_code=409, detail="Run is not in running state.")
+async def pause_run(run_id: str) -> RunOut:
+    def write(conn: sqlite3.Connection) -> RunOut:
+        run_row = _run_row_or_404(conn, run_id)
+        if run_row["status"] != "running":
+            raise HTTPException(status_code=409, detail="Run is not in running state.")
+
+        conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("paused", run_id))
+        record_run_event(conn, run_id, "run.status", "paused", utc_now_iso())
+        on_commit(conn, lambda: get_cancellations().cancel(run_id, "paused"))
+        return _run_from_row(_run_row_or_404(conn, run_id))
 
-    conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("paused", run_id))
-    conn.commit()
-    return _run_from_row(_run_row_or_404(conn, run_id))
+    return await db_write(write)
 
 
 @app.post("/runs/{run_id}/resume", response_model=RunOut)
-def resume_run(run_id: str, conn: sqlite3.Connection = Depends(db_session)) -> RunOut:
-    run_row = _run_row_or_404(conn, run_id)
-    if run_row["status"] not in {"paused", "created"}:
-        raise HTTPException(status_code=409, detail="Run is not resumable in current state.")
+async def resume_run(run_id: str) -> RunOut:
+    def write(conn: sqlite3.Connection) -> RunOut:
+        run_row = _run_row_or_404(conn, run_id)
+        if run_row["status"] not in {"paused", "created"}:
+            raise HTTPException(status_code=409, detail="Run is not resumable in current state.")
+
+        if any(row["status"] == "pending_approval" for row in _run_steps(conn, run_id)):
+            raise HTTPException(status_code=409, detail="Run is waiting for step approval.")
 
-    step_row = _first_run_step(conn, run_id)
-    if step_row is not None and step_row["status"] == "pending_approval":
-        raise HTTPException(status_code=409, detail="Run is waiting for step approval.")
+        conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
+        record_run_event(conn, run_id, "run.status", "running", utc_now_iso())
+        updated_run = _execute_run_until_stable(conn, run_id)
+        return _run_from_row(updated_run)
 
-    conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
-    updated_run = _execute_run_until_stable(conn, run_id)
-    conn.commit()
-    return _run_from_row(updated_run)
+    return _schedule_run(await db_write(write))
 
 
 @app.post("/runs/{run_id}/cancel", response_model=RunOut)
-def cancel_run(run_id: str, conn: sqlite3.Connection = Depends(db_session)) -> RunOut:
-    run_row = _run_row_or_404(conn, run_id)
-    if run_row["status"] in {"completed", "failed", "cancelled"}:
-        raise HTTPException(status_code=409, detail="Run is already finalized.")
+async def cancel_run(run_id: str) -> RunOut:
+    def write(conn: sqlite3.Connection) -> RunOut:
+        run_row = _run_row_or_404(conn, run_id)
+        if run_row["status"] in {"completed", "failed", "cancelled"}:
+            raise HTTPException(status_code=409, detail="Run is already finalized.")
 
-    now = utc_now_iso()
-    conn.execute(
-        "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
-        (
-            "cancelled",
-            json.dumps({"cancelled": True}, ensure_ascii=True, sort_keys=True),
-            now,
-            run_id,
-        ),
-    )
-    if run_row["target_chapter_id"] is not None:
+        now = utc_now_iso()
         conn.execute(
-            "UPDATE chapters SET needs_review = 1, review_reason = ?, updated_at = ? WHERE id = ?",
-            ("run_cancelled", now, run_row["target_chapter_id"]),
+            "UPDATE runs SET status = ?, output_json = ?, finished_at = ? WHERE id = ?",
+            (
+                "cancelled",
+                json.dumps({"cancelled": True}, ensure_ascii=True, sort_keys=True),
+                now,
+                run_id,
+            ),
         )
-    conn.commit()
-    return _run_from_row(_run_row_or_404(conn, run_id))
+        record_run_event(conn, run_id, "run.status", "cancelled", now)
+        on_commit(conn, lambda: get_cancellations().cancel(run_id, "cancelled"))
+        if run_row["target_chapter_id"] is not None:
+            conn.execute(
+                "UPDATE chapters SET needs_review = 1, review_reason = ?, updated_at = ? WHERE id = ?",
+                ("run_cancelled", now, run_row["target_chapter_id"]),
+            )
+        return _run_from_row(_run_row_or_404(conn, run_id))
+
+    return await db_write(write)
 
 
 @app.post("/runs/{run_id}/steps/{step_id}/approve", response_model=RunStepOut)
-def approve_run_step(
-    run_id: str,
-    step_id: str,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> RunStepOut:
-    run_row = _run_row_or_404(conn, run_id)
-    if run_row["status"] not in {"paused", "running"}:
-        raise HTTPException(status_code=409, detail="Run cannot accept step approval in current state.")
+async def approve_run_step(run_id: str, step_id: str, payload: RunStepApprove | None = None) -> RunStepOut:
+    def write(conn: sqlite3.Connection) -> RunStepOut:
+        run_row = _run_row_or_404(conn, run_id)
+        if run_row["status"] not in {"paused", "running"}:
+            raise HTTPException(status_code=409, detail="Run cannot accept step approval in current state.")
 
-    step_row = _run_step_row_or_404(conn, run_id, step_id)
-    if step_row["status"] != "pending_approval":
-        raise HTTPException(status_code=409, detail="Step is not waiting for approval.")
+        step_row = _run_step_row_or_404(conn, run_id, step_id)
+        if step_row["status"] != "pending_approval":
+            raise HTTPException(status_code=409, detail="Step is not waiting for approval.")
 
-    conn.execute(
-        "UPDATE run_steps SET status = ?, approval_status = ? WHERE id = ?",
-        ("approved", "approved", step_id),
-    )
-    conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
-    _execute_run_until_stable(conn, run_id)
-    conn.commit()
-    return _run_step_from_row(_run_step_row_or_404(conn, run_id, step_id))
+        step_output = _loads_optional_json(step_row["output_json"]) or {}
+        selected_step_id = payload.selected_step_id if payload is not None else None
+        if step_row["step_type"] == "select":
+            selected_step_id = selected_step_id or step_output.get("selected_step_id")
+            if selected_step_id is None:
+                raise HTTPException(status_code=422, detail="selected_step_id is required to approve this step.")
+            if selected_step_id not in {candidate["step_id"] for candidate in step_output.get("candidates", [])}:
+                raise HTTPException(status_code=422, detail="Selected step is not a draft candidate of this step.")
+            draft_output = _loads_optional_json(_run_step_row_or_404(conn, run_id, selected_step_id)["output_json"])
+            step_output["selected_step_id"] = selected_step_id
+            step_output["content_text"] = draft_output["content_text"]
+        elif selected_step_id is not None:
+            raise HTTPException(status_code=422, detail="Only select steps take selected_step_id.")
+
+        conn.execute(
+            "UPDATE run_steps SET status = ?, approval_status = ?, output_json = ? WHERE id = ?",
+            ("approved", "approved", json.dumps(step_output, ensure_ascii=True, sort_keys=True), step_id),
+        )
+        conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
+        now = utc_now_iso()
+        record_run_event(conn, run_id, "step.status", "approved", now, step_id=step_id)
+        record_run_event(conn, run_id, "run.status", "running", now)
+        _execute_run_until_stable(conn, run_id)
+        return _run_step_from_row(_run_step_row_or_404(conn, run_id, step_id))
+
+    return await db_write(write)
 
 
 @app.post("/runs/{run_id}/steps/{step_id}/override", response_model=RunStepOut)
-def override_run_step(
-    run_id: str,
-    step_id: str,
-    payload: RunStepOverride,
-    conn: sqlite3.Connection = Depends(db_session),
-) -> RunStepOut:
-    run_row = _run_row_or_404(conn, run_id)
-    if run_row["status"] not in {"paused", "running"}:
-        raise HTTPException(status_code=409, detail="Run cannot accept step override in current state.")
+async def override_run_step(run_id: str, step_id: str, payload: RunStepOverride) -> RunStepOut:
+    def write(conn: sqlite3.Connection) -> RunStepOut:
+        run_row = _run_row_or_404(conn, run_id)
+        if run_row["status"] not in {"paused", "running"}:
+            raise HTTPException(status_code=409, detail="Run cannot accept step override in current state.")
 
-    step_row = _run_step_row_or_404(conn, run_id, step_id)
-    if step_row["status"] != "pending_approval":
-        raise HTTPException(status_code=409, detail="Step is not waiting for override.")
+        step_row = _run_step_row_or_404(conn, run_id, step_id)
+        if step_row["status"] != "pending_approval":
+            raise HTTPException(status_code=409, detail="Step is not waiting for override.")
 
-    step_output = _loads_optional_json(step_row["output_json"]) or {}
-    if not isinstance(step_output, dict):
-        step_output = {}
-    step_output["content_text"] = payload.content_text
-    step_output["overridden"] = True
-    conn.execute(
-        "UPDATE run_steps SET status = ?, approval_status = ?, override_payload_json = ?, output_json = ? "
-        "WHERE id = ?",
-        (
-            "approved",
-            "approved",
-            json.dumps({"content_text": payload.content_text}, ensure_ascii=True, sort_keys=True),
-            json.dumps(step_output, ensure_ascii=True, sort_keys=True),
-            step_id,
-        ),
+        step_output = _loads_optional_json(step_row["output_json"]) or {}
+        if not isinstance(step_output, dict):
+            step_output = {}
+        step_output["content_text"] = payload.content_text
+        step_output["overridden"] = True
+        conn.execute(
+            "UPDATE run_steps SET status = ?, approval_status = ?, override_payload_json = ?, output_json = ? "
+            "WHERE id = ?",
+            (
+                "approved",
+                "approved",
+                json.dumps({"content_text": payload.content_text}, ensure_ascii=True, sort_keys=True),
+                json.dumps(step_output, ensure_ascii=True, sort_keys=True),
+                step_id,
+            ),
+        )
+        conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
+        now = utc_now_iso()
+        record_run_event(conn, run_id, "step.status", "approved", now, step_id=step_id, payload={"overridden": True})
+        record_run_event(conn, run_id, "run.status", "running", now)
+        _execute_run_until_stable(conn, run_id)
+        return _run_step_from_row(_run_step_row_or_404(conn, run_id, step_id))
+
+    return await db_write(write)
+
+
+_LLM_PROVIDER_ENCODER = RowEncoder(LlmProviderOut)
+_LLM_MODEL_ENCODER = RowEncoder(LlmModelOut)
+
+
+def _llm_provider_from_row(row: sqlite3.Row) -> LlmProviderOut:
+    return LlmProviderOut(
+        id=row["id"],
+        name=row["name"],
+        base_url=row["base_url"],
+        config_json=_loads_optional_json(row["config_json"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+def _llm_model_from_row(row: sqlite3.Row) -> LlmModelOut:
+    return LlmModelOut(
+        id=row["id"],
+        provider_id=row["provider_id"],
+        model_name=row["model_name"],
+        capabilities_json=_loads_optional_json(row["capabilities_json"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+@app.post("/llm/providers", response_model=LlmProviderOut)
+async def create_llm_provider(payload: LlmProviderCreate) -> LlmProviderOut:
+    try:
+        ProviderSettings.from_json(payload.config_json)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+    def write(conn: sqlite3.Connection) -> LlmProviderOut:
+        now = utc_now_iso()
+        provider_id = payload.id or new_ulid("llmp")
+        row = conn.execute(
+            "INSERT INTO llm_providers (id, name, base_url, config_json, created_at, updated_at) "
+            f"VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO NOTHING RETURNING {PROVIDER_COLUMNS}",
+            (
+                provider_id,
+                payload.name,
+                payload.base_url,
+                json.dumps(payload.config_json, ensure_ascii=True, sort_keys=True)
+                if payload.config_json is not None
+                else None,
+                now,
+                now,
+            ),
+        ).fetchone()
+        if row is None:
+            raise HTTPException(status_code=409, detail="LLM provider already exists.")
+        on_commit(conn, get_provider_registry().invalidate)
+        return _llm_provider_from_row(row)
+
+    return await db_write(write)
+
+
+@app.get("/llm/providers", response_model=LlmProviderListResponse)
+async def list_llm_providers(
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(LlmProviderOut, fields, view, heavy=("config_json",))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        rows = conn.execute(f"SELECT {columns} FROM llm_providers ORDER BY id").fetchall()
+        return encode_page(_LLM_PROVIDER_ENCODER.select(selected), rows)
+
+    return RawJSONResponse(await db_read(read))
+
+
+@app.post("/llm/providers/{provider_id}/models", response_model=LlmModelOut)
+async def create_llm_model(provider_id: str, payload: LlmModelCreate) -> LlmModelOut:
+    def write(conn: sqlite3.Connection) -> LlmModelOut:
+        if conn.execute("SELECT 1 FROM llm_providers WHERE id = ?", (provider_id,)).fetchone() is None:
+            raise HTTPException(status_code=404, detail="LLM provider not found.")
+        now = utc_now_iso()
+        row = conn.execute(
+            "INSERT INTO llm_models (id, provider_id, model_name, capabilities_json, created_at, updated_at) "
+            f"VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(provider_id, model_name) DO NOTHING RETURNING {MODEL_COLUMNS}",
+            (
+                new_ulid("llmm"),
+                provider_id,
+                payload.model_name,
+                json.dumps(payload.capabilities_json, ensure_ascii=True, sort_keys=True)
+                if payload.capabilities_json is not None
+                else None,
+                now,
+                now,
+            ),
+        ).fetchone()
+        if row is None:
+            raise HTTPException(status_code=409, detail="LLM model already registered for this provider.")
+        on_commit(conn, get_provider_registry().invalidate)
+        return _llm_model_from_row(row)
+
+    return await db_write(write)
+
+
+@app.get("/llm/providers/{provider_id}/models", response_model=LlmModelListResponse)
+async def list_llm_models(
+    provider_id: str,
+    fields: str | None = Query(default=None),
+    view: ListView = Query(default="full"),
+) -> RawJSONResponse:
+    selected = _list_fields(LlmModelOut, fields, view, heavy=("capabilities_json",))
+    columns = _list_columns(selected)
+
+    def read(conn: sqlite3.Connection) -> bytes:
+        if conn.execute("SELECT 1 FROM llm_providers WHERE id = ?", (provider_id,)).fetchone() is None:
+            raise HTTPException(status_code=404, detail="LLM provider not found.")
+        rows = conn.execute(
+            f"SELECT {columns} FROM llm_models WHERE provider_id = ? ORDER BY model_name",
+            (provider_id,),
+        ).fetchall()
+        return encode_page(_LLM_MODEL_ENCODER.select(selected), rows)
+
+    return RawJSONResponse(await db_read(read))
+
+
+@app.get("/metrics/db", response_model=DbMetricsOut)
+async def get_db_metrics() -> DbMetricsOut:
+    return DbMetricsOut(
+        read=ExecutorLaneMetrics(**read_metrics()),
+        write=ExecutorLaneMetrics(**write_metrics()),
     )
-    conn.execute("UPDATE runs SET status = ? WHERE id = ?", ("running", run_id))
-    _execute_run_until_stable(conn, run_id)
-    conn.commit()
-    return _run_step_from_row(_run_step_row_or_404(conn, run_id, step_id))
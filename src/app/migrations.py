@@ -0,0 +1,793 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import lzma
+import os
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Iterator
+
+# A step receives the migration connection inside an open transaction.
+MigrationStep = Callable[[sqlite3.Connection], None]
+# A backfill processes at most ``batch_size`` rows and returns how many it touched;
+# it is re-run in fresh transactions until it touches fewer than ``batch_size``.
+Backfill = Callable[[sqlite3.Connection, int], int]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: tuple[str | MigrationStep, ...] = ()
+    backfills: tuple[Backfill, ...] = ()
+    indexes: tuple[str, ...] = ()
+
+
+def add_column(table: str, column: str, definition: str) -> MigrationStep:
+    def step(conn: sqlite3.Connection) -> None:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return step
+
+
+_BASELINE_TABLES = (
+    """
+CREATE TABLE IF NOT EXISTS projects (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  genre TEXT,
+  premise TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS project_settings (
+  id TEXT PRIMARY KEY,
+  project_id TEXT NOT NULL,
+  settings_json TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  FOREIGN KEY(project_id) REFERENCES projects(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS chapters (
+  id TEXT PRIMARY KEY,
+  project_id TEXT NOT NULL,
+  volume_no INTEGER NOT NULL DEFAULT 1,
+  chapter_no INTEGER NOT NULL,
+  title TEXT,
+  status TEXT NOT NULL DEFAULT 'planned',
+  needs_review INTEGER NOT NULL DEFAULT 0,
+  review_reason TEXT,
+  plan_json TEXT,
+  traversal_profile_id TEXT,
+  style_guide_id TEXT,
+  lock_version INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  UNIQUE(project_id, volume_no, chapter_no),
+  FOREIGN KEY(project_id) REFERENCES projects(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS chapter_text_versions (
+  id TEXT PRIMARY KEY,
+  chapter_id TEXT NOT NULL,
+  version_no INTEGER NOT NULL,
+  stage TEXT NOT NULL,
+  content_text TEXT NOT NULL,
+  source_run_id TEXT,
+  source_step_id TEXT,
+  created_at TEXT NOT NULL,
+  UNIQUE(chapter_id, version_no),
+  FOREIGN KEY(chapter_id) REFERENCES chapters(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS chapter_segments (
+  id TEXT PRIMARY KEY,
+  chapter_id TEXT NOT NULL,
+  segment_no INTEGER NOT NULL,
+  title TEXT,
+  pov_node_id TEXT,
+  segment_type TEXT,
+  content_text TEXT,
+  attrs_json TEXT,
+  is_deleted INTEGER NOT NULL DEFAULT 0,
+  deleted_at TEXT,
+  deleted_reason TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  UNIQUE(chapter_id, segment_no),
+  FOREIGN KEY(chapter_id) REFERENCES chapters(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS chapter_reviews (
+  id TEXT PRIMARY KEY,
+  chapter_id TEXT NOT NULL,
+  version_id TEXT NOT NULL,
+  review_type TEXT NOT NULL DEFAULT 'logic',
+  report_json TEXT NOT NULL,
+  source_run_id TEXT,
+  source_step_id TEXT,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(chapter_id) REFERENCES chapters(id),
+  FOREIGN KEY(version_id) REFERENCES chapter_text_versions(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS runs (
+  id TEXT PRIMARY KEY,
+  project_id TEXT NOT NULL,
+  swarm_profile_id TEXT,
+  run_type TEXT NOT NULL,
+  target_chapter_id TEXT,
+  status TEXT NOT NULL,
+  input_json TEXT,
+  output_json TEXT,
+  budget_json TEXT,
+  started_at TEXT NOT NULL,
+  finished_at TEXT,
+  FOREIGN KEY(project_id) REFERENCES projects(id),
+  FOREIGN KEY(target_chapter_id) REFERENCES chapters(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS run_steps (
+  id TEXT PRIMARY KEY,
+  run_id TEXT NOT NULL,
+  step_no INTEGER NOT NULL,
+  step_type TEXT NOT NULL,
+  role TEXT,
+  status TEXT NOT NULL,
+  requires_approval INTEGER NOT NULL DEFAULT 0,
+  approval_status TEXT NOT NULL DEFAULT 'n/a',
+  override_payload_json TEXT,
+  input_json TEXT,
+  output_json TEXT,
+  budget_json TEXT,
+  started_at TEXT NOT NULL,
+  finished_at TEXT,
+  error_text TEXT,
+  UNIQUE(run_id, step_no),
+  FOREIGN KEY(run_id) REFERENCES runs(id)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS llm_calls (
+  id TEXT PRIMARY KEY,
+  run_id TEXT,
+  step_id TEXT,
+  provider_id TEXT,
+  model_id TEXT,
+  purpose TEXT,
+  request_hash TEXT NOT NULL,
+  response_hash TEXT,
+  usage_json TEXT,
+  status TEXT NOT NULL,
+  error_text TEXT,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(run_id) REFERENCES runs(id),
+  FOREIGN KEY(step_id) REFERENCES run_steps(id)
+)
+""",
+)
+
+_BASELINE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_project_settings_project_id ON project_settings(project_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chapters_project_id ON chapters(project_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_chapter_segments_chapter_id ON chapter_segments(chapter_id, segment_no)",
+    "CREATE INDEX IF NOT EXISTS idx_chapter_text_versions_chapter_id ON chapter_text_versions(chapter_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_chapter_reviews_chapter_id ON chapter_reviews(chapter_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_project_id ON runs(project_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_run_steps_run_id ON run_steps(run_id, step_no)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_calls_run_id ON llm_calls(run_id, created_at)",
+)
+
+
+# Everything a migration runs is defined below, frozen as of the version that
+# introduced it. Migrations never import application code: a later change to the
+# app must not change what an old upgrade step does.
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# v2: text bodies move into content-addressed, compressed ``text_blobs``.
+
+
+def _v2_put_text(conn: sqlite3.Connection, text: str) -> str:
+    digest = _text_hash(text)
+    raw = text.encode("utf-8")
+    packed = zlib.compress(raw, 6)
+    codec, data = ("zlib", packed) if len(packed) < len(raw) else ("none", raw)
+    conn.execute(
+        "INSERT OR IGNORE INTO text_blobs (hash, codec, raw_size, data, created_at) VALUES (?, ?, ?, ?, ?)",
+        (digest, codec, len(raw), data, _utc_now_iso()),
+    )
+    return digest
+
+
+def _v2_get_text(conn: sqlite3.Connection, digest: str) -> str:
+    codec, data = conn.execute("SELECT codec, data FROM text_blobs WHERE hash = ?", (digest,)).fetchone()
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "lzma":
+        data = lzma.decompress(data)
+    elif codec != "none":
+        raise ValueError(f"Unknown blob codec: {codec}")
+    return bytes(data).decode("utf-8")
+
+
+def _v2_move_version_text_to_blobs(conn: sqlite3.Connection, batch_size: int) -> int:
+    rows = conn.execute(
+        "SELECT id, content_text FROM chapter_text_versions WHERE content_hash IS NULL LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for row in rows:
+        digest = _v2_put_text(conn, row[1])
+        conn.execute(
+            "UPDATE chapter_text_versions SET content_hash = ?, content_text = '' WHERE id = ?",
+            (digest, row[0]),
+        )
+    return len(rows)
+
+
+# v3: versions may be stored as line edit scripts against their predecessor.
+# Later backfills read only these columns, so a column added by a later migration
+# cannot break the upgrade of a database that predates it.
+_V3_VERSION_COLUMNS = "id, content_text, content_hash, storage_kind, base_version_id, delta_hash"
+
+
+def _v3_apply_delta(base: str, ops: list[list[object]]) -> str:
+    base_lines = base.splitlines(keepends=True)
+    parts: list[str] = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1] : op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+def _v3_version_text(conn: sqlite3.Connection, row: sqlite3.Row) -> str:
+    """The text of a v3 version row: walk back to its keyframe, then replay the deltas forward."""
+    chain: list[sqlite3.Row] = []
+    while row["storage_kind"] == "delta":
+        chain.append(row)
+        row = conn.execute(
+            f"SELECT {_V3_VERSION_COLUMNS} FROM chapter_text_versions WHERE id = ?",
+            (row["base_version_id"],),
+        ).fetchone()
+    text = row["content_text"] if row["content_hash"] is None else _v2_get_text(conn, row["content_hash"])
+    for delta_row in reversed(chain):
+        text = _v3_apply_delta(text, json.loads(_v2_get_text(conn, delta_row["delta_hash"])))
+    return text
+
+
+# v4: full-text search over each chapter's latest version and its live segments.
+
+
+def _v4_create_search_index(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS search_documents ("
+        "id INTEGER PRIMARY KEY, "
+        "source_kind TEXT NOT NULL, "
+        "source_id TEXT NOT NULL UNIQUE, "
+        "project_id TEXT NOT NULL, "
+        "chapter_id TEXT NOT NULL)"
+    )
+    # Created up front (the table starts empty) so the backfills' NOT EXISTS probes
+    # stay indexed on a large database.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_documents_project ON search_documents(project_id, source_kind)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_documents_chapter ON search_documents(chapter_id, source_kind)"
+    )
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    ).fetchone()
+    if exists is not None:
+        return
+    # Trigram handles CJK text; SQLite builds without it fall back to unicode61.
+    try:
+        conn.execute("CREATE VIRTUAL TABLE search_index USING fts5(title, body, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        conn.execute(
+            "CREATE VIRTUAL TABLE search_index USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def _v4_add_document(
+    conn: sqlite3.Connection,
+    source_kind: str,
+    source_id: str,
+    project_id: str,
+    chapter_id: str,
+    title: str | None,
+    body: str | None,
+) -> None:
+    doc_id = conn.execute(
+        "INSERT INTO search_documents (source_kind, source_id, project_id, chapter_id) VALUES (?, ?, ?, ?)",
+        (source_kind, source_id, project_id, chapter_id),
+    ).lastrowid
+    conn.execute("INSERT INTO search_index (rowid, title, body) VALUES (?, ?, ?)", (doc_id, title or "", body or ""))
+
+
+def _v4_backfill_version_documents(conn: sqlite3.Connection, batch_size: int) -> int:
+    chapters = conn.execute(
+        "SELECT c.id, c.project_id, c.title FROM chapters c "
+        "WHERE EXISTS (SELECT 1 FROM chapter_text_versions v WHERE v.chapter_id = c.id) "
+        "AND NOT EXISTS (SELECT 1 FROM search_documents d WHERE d.chapter_id = c.id AND d.source_kind = 'version') "
+        "LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for chapter in chapters:
+        latest = conn.execute(
+            f"SELECT {_V3_VERSION_COLUMNS} FROM chapter_text_versions WHERE chapter_id = ? "
+            "ORDER BY version_no DESC LIMIT 1",
+            (chapter[0],),
+        ).fetchone()
+        text = _v3_version_text(conn, latest)
+        _v4_add_document(conn, "version", latest["id"], chapter[1], chapter[0], chapter[2], text)
+    return len(chapters)
+
+
+def _v4_backfill_segment_documents(conn: sqlite3.Connection, batch_size: int) -> int:
+    segments = conn.execute(
+        "SELECT s.id, c.project_id, s.chapter_id, s.title, s.content_text "
+        "FROM chapter_segments s JOIN chapters c ON c.id = s.chapter_id "
+        "WHERE s.is_deleted = 0 "
+        "AND NOT EXISTS (SELECT 1 FROM search_documents d WHERE d.source_id = s.id) "
+        "LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for segment in segments:
+        _v4_add_document(conn, "segment", segment[0], segment[1], segment[2], segment[3], segment[4])
+    return len(segments)
+
+
+# v9: remaining budget projections, seeded from the usage already recorded in llm_calls.
+
+
+def _v9_number(raw: dict[str, object], key: str) -> float | None:
+    value = raw.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def _v9_call_cost(model_id: str, usage: dict[str, object]) -> float:
+    reported = _v9_number(usage, "cost")
+    if reported is not None:
+        return reported
+    raw = os.getenv("WRITER_LLM_PRICING", "").strip()
+    pricing = json.loads(raw) if raw else {}
+    if not isinstance(pricing, dict):
+        raise ValueError("WRITER_LLM_PRICING must be a JSON object.")
+    prices = pricing.get(model_id) or pricing.get("*")
+    if not isinstance(prices, dict):
+        return 0.0
+    prompt_tokens = usage.get("prompt_tokens") if isinstance(usage.get("prompt_tokens"), int) else 0
+    completion_tokens = usage.get("completion_tokens") if isinstance(usage.get("completion_tokens"), int) else 0
+    return (
+        prompt_tokens * float(prices.get("prompt_per_1k", 0.0))
+        + completion_tokens * float(prices.get("completion_per_1k", 0.0))
+    ) / 1000.0
+
+
+def _v9_spent(conn: sqlite3.Connection, column: str, owner_id: str) -> tuple[int, float]:
+    tokens = 0
+    cost = 0.0
+    for model_id, usage_json in conn.execute(
+        f"SELECT model_id, usage_json FROM llm_calls WHERE {column} = ? AND status = 'succeeded'",
+        (owner_id,),
+    ):
+        usage = json.loads(usage_json) if usage_json else {}
+        tokens += sum(
+            value for key in ("prompt_tokens", "completion_tokens") if isinstance(value := usage.get(key), int)
+        )
+        cost += _v9_call_cost(model_id or "", usage)
+    return tokens, cost
+
+
+def _v9_backfill_remaining(
+    conn: sqlite3.Connection,
+    batch_size: int,
+    table: str,
+    call_column: str,
+    token_key: str,
+    cost_key: str,
+) -> int:
+    rows = conn.execute(
+        f"SELECT id, budget_json FROM {table} WHERE "
+        f"(budget_remaining_tokens IS NULL AND json_type(budget_json, '$.{token_key}') IN ('integer', 'real')) "
+        f"OR (budget_remaining_cost IS NULL AND json_type(budget_json, '$.{cost_key}') IN ('integer', 'real')) "
+        "LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for row_id, budget_json in rows:
+        budget = json.loads(budget_json)
+        tokens, cost = _v9_spent(conn, call_column, row_id)
+        max_tokens, max_cost = _v9_number(budget, token_key), _v9_number(budget, cost_key)
+        conn.execute(
+            f"UPDATE {table} SET budget_remaining_tokens = ?, budget_remaining_cost = ? WHERE id = ?",
+            (
+                int(max_tokens) - tokens if max_tokens is not None else None,
+                max_cost - cost if max_cost is not None else None,
+                row_id,
+            ),
+        )
+    return len(rows)
+
+
+def _v9_backfill_run_budgets(conn: sqlite3.Connection, batch_size: int) -> int:
+    return _v9_backfill_remaining(conn, batch_size, "runs", "run_id", "max_tokens_total", "max_cost_total")
+
+
+def _v9_backfill_step_budgets(conn: sqlite3.Connection, batch_size: int) -> int:
+    return _v9_backfill_remaining(conn, batch_size, "run_steps", "step_id", "max_tokens_step", "max_cost_step")
+
+
+# v17: character counts (and segment hashes) served by summary views in place of text.
+
+
+def _v17_backfill_version_char_counts(conn: sqlite3.Connection, batch_size: int) -> int:
+    rows = conn.execute(
+        f"SELECT {_V3_VERSION_COLUMNS} FROM chapter_text_versions WHERE char_count IS NULL LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for row in rows:
+        text = _v3_version_text(conn, row)
+        conn.execute("UPDATE chapter_text_versions SET char_count = ? WHERE id = ?", (len(text), row["id"]))
+    return len(rows)
+
+
+def _v17_backfill_segment_summaries(conn: sqlite3.Connection, batch_size: int) -> int:
+    rows = conn.execute(
+        "SELECT id, content_text FROM chapter_segments WHERE content_text IS NOT NULL AND content_hash IS NULL LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    for row in rows:
+        conn.execute(
+            "UPDATE chapter_segments SET char_count = ?, content_hash = ? WHERE id = ?",
+            (len(row[1]), _text_hash(row[1]), row[0]),
+        )
+    return len(rows)
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(version=1, name="baseline", statements=_BASELINE_TABLES, indexes=_BASELINE_INDEXES),
+    Migration(
+        version=2,
+        name="content_addressed_text_blobs",
+        statements=(
+            """
+CREATE TABLE IF NOT EXISTS text_blobs (
+  hash TEXT PRIMARY KEY,
+  codec TEXT NOT NULL,
+  raw_size INTEGER NOT NULL,
+  data BLOB NOT NULL,
+  created_at TEXT NOT NULL
+)
+""",
+            add_column("chapter_text_versions", "content_hash", "TEXT"),
+        ),
+        backfills=(_v2_move_version_text_to_blobs,),
+        indexes=(
+            "CREATE INDEX IF NOT EXISTS idx_chapter_text_versions_content_hash "
+            "ON chapter_text_versions(content_hash)",
+        ),
+    ),
+    Migration(
+        version=3,
+        name="delta_version_storage",
+        statements=(
+            add_column("chapter_text_versions", "storage_kind", "TEXT NOT NULL DEFAULT 'full'"),
+            add_column("chapter_text_versions", "base_version_id", "TEXT"),
+            add_column("chapter_text_versions", "delta_hash", "TEXT"),
+            add_column("chapter_text_versions", "delta_depth", "INTEGER NOT NULL DEFAULT 0"),
+        ),
+    ),
+    Migration(
+        version=4,
+        name="full_text_search",
+        statements=(_v4_create_search_index,),
+        backfills=(_v4_backfill_version_documents, _v4_backfill_segment_documents),
+    ),
+    Migration(
+        version=5,
+        name="run_status_index",
+        indexes=("CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, id)",),
+    ),
+    Migration(
+        version=6,
+        name="run_leases",
+        statements=(
+            add_column("runs", "lease_owner", "TEXT"),
+            add_column("runs", "lease_expires_at", "TEXT"),
+        ),
+        indexes=("CREATE INDEX IF NOT EXISTS idx_runs_lease ON runs(status, lease_expires_at)",),
+    ),
+    Migration(
+        version=7,
+        name="llm_response_cache",
+        statements=(
+            """
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+  cache_key TEXT PRIMARY KEY,
+  provider_id TEXT NOT NULL,
+  response_model_id TEXT NOT NULL,
+  content_hash TEXT NOT NULL,
+  usage_json TEXT NOT NULL,
+  response_hash TEXT NOT NULL,
+  created_epoch REAL NOT NULL,
+  last_used_epoch REAL NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0
+)
+""",
+            "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_used ON llm_response_cache(last_used_epoch)",
+            "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache(created_epoch)",
+            add_column("runs", "llm_cache", "INTEGER NOT NULL DEFAULT 1"),
+        ),
+        indexes=("CREATE INDEX IF NOT EXISTS idx_llm_calls_request_hash ON llm_calls(request_hash, model_id)",),
+    ),
+    Migration(
+        version=8,
+        name="llm_call_leaders",
+        statements=(add_column("llm_calls", "leader_call_id", "TEXT"),),
+    ),
+    Migration(
+        version=9,
+        name="budget_remaining",
+        statements=(
+            add_column("runs", "budget_remaining_tokens", "INTEGER"),
+            add_column("runs", "budget_remaining_cost", "REAL"),
+            add_column("run_steps", "budget_remaining_tokens", "INTEGER"),
+            add_column("run_steps", "budget_remaining_cost", "REAL"),
+        ),
+        backfills=(_v9_backfill_run_budgets, _v9_backfill_step_budgets),
+        indexes=(
+            "CREATE INDEX IF NOT EXISTS idx_runs_budget_tokens ON runs(project_id, budget_remaining_tokens)",
+            "CREATE INDEX IF NOT EXISTS idx_run_steps_budget_tokens ON run_steps(run_id, budget_remaining_tokens)",
+        ),
+    ),
+    Migration(
+        version=10,
+        name="run_events",
+        statements=(
+            # seq gives a commit-ordered cursor; ids are client-facing ULIDs whose
+            # random suffix does not order events written in the same millisecond.
+            """
+CREATE TABLE IF NOT EXISTS run_events (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  id TEXT NOT NULL UNIQUE,
+  run_id TEXT NOT NULL,
+  step_id TEXT,
+  event_type TEXT NOT NULL,
+  status TEXT NOT NULL,
+  payload_json TEXT,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(run_id) REFERENCES runs(id),
+  FOREIGN KEY(step_id) REFERENCES run_steps(id)
+)
+""",
+        ),
+        indexes=("CREATE INDEX IF NOT EXISTS idx_run_events_run ON run_events(run_id, seq)",),
+    ),
+    Migration(
+        version=11,
+        name="run_batches",
+        statements=(
+            """
+CREATE TABLE IF NOT EXISTS run_batches (
+  id TEXT PRIMARY KEY,
+  project_id TEXT NOT NULL,
+  run_count INTEGER NOT NULL,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(project_id) REFERENCES projects(id)
+)
+""",
+            add_column("runs", "batch_id", "TEXT REFERENCES run_batches(id)"),
+        ),
+        # Covers the batch progress aggregate, which never touches the run rows.
+        indexes=("CREATE INDEX IF NOT EXISTS idx_runs_batch ON runs(batch_id, status)",),
+    ),
+    Migration(
+        version=12,
+        name="run_scheduling",
+        statements=(
+            add_column("runs", "priority", "TEXT NOT NULL DEFAULT 'interactive'"),
+            add_column("runs", "dispatched_at", "TEXT"),
+        ),
+        # The scheduler reads each (project, priority) queue head by id.
+        indexes=("CREATE INDEX IF NOT EXISTS idx_runs_queue ON runs(status, project_id, priority, id)",),
+    ),
+    Migration(
+        version=13,
+        name="llm_providers",
+        statements=(
+            """
+CREATE TABLE IF NOT EXISTS llm_providers (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  base_url TEXT,
+  config_json TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+)
+""",
+            """
+CREATE TABLE IF NOT EXISTS llm_models (
+  id TEXT PRIMARY KEY,
+  provider_id TEXT NOT NULL,
+  model_name TEXT NOT NULL,
+  capabilities_json TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  FOREIGN KEY(provider_id) REFERENCES llm_providers(id)
+)
+""",
+        ),
+        indexes=(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_llm_models_provider_name ON llm_models(provider_id, model_name)",
+        ),
+    ),
+    Migration(
+        version=14,
+        name="llm_call_latency",
+        statements=(add_column("llm_calls", "latency_ms", "REAL"),),
+        # Hedging reads the newest successful latencies per model; the partial index skips the rest.
+        indexes=(
+            "CREATE INDEX IF NOT EXISTS idx_llm_calls_latency "
+            "ON llm_calls(provider_id, model_id, created_at, latency_ms) "
+            "WHERE status = 'succeeded' AND latency_ms IS NOT NULL",
+        ),
+    ),
+    Migration(
+        version=15,
+        name="run_step_dag",
+        # JSON list of the step ids a step waits for; NULL for the single-step runs created before it.
+        statements=(add_column("run_steps", "depends_on_json", "TEXT"),),
+    ),
+    Migration(
+        version=16,
+        name="idempotency_keys",
+        # The spec's table, except that project_id is "" for requests outside any project
+        # (POST /projects, /llm/providers), so it has no foreign key to projects.
+        statements=(
+            """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  id TEXT PRIMARY KEY,
+  project_id TEXT NOT NULL,
+  endpoint TEXT NOT NULL,
+  idempotency_key TEXT NOT NULL,
+  request_hash TEXT NOT NULL,
+  status TEXT NOT NULL,
+  lease_owner TEXT,
+  lease_until TEXT,
+  http_status INTEGER,
+  response_json TEXT,
+  response_hash TEXT,
+  error_text TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  UNIQUE(project_id, endpoint, idempotency_key)
+)
+""",
+        ),
+        # Lookups use the UNIQUE constraint's index; purges walk created_at.
+        indexes=(
+            "CREATE INDEX IF NOT EXISTS idx_idem_lease ON idempotency_keys(status, lease_until)",
+            "CREATE INDEX IF NOT EXISTS idx_idem_created ON idempotency_keys(created_at)",
+        ),
+    ),
+    Migration(
+        version=17,
+        name="content_summaries",
+        # Served by view=summary list pages in place of the text; NULL for segments without text.
+        statements=(
+            add_column("chapter_text_versions", "char_count", "INTEGER"),
+            add_column("chapter_segments", "char_count", "INTEGER"),
+            add_column("chapter_segments", "content_hash", "TEXT"),
+        ),
+        backfills=(_v17_backfill_version_char_counts, _v17_backfill_segment_summaries),
+    ),
+    Migration(
+        version=18,
+        name="run_durations",
+        # Queue ETAs average the newest completed runs; without it that sorts every completed run.
+        indexes=("CREATE INDEX IF NOT EXISTS idx_runs_finished ON runs(status, finished_at)",),
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _backfill_batch_size() -> int:
+    raw = os.getenv("WRITER_DB_MIGRATION_BATCH_SIZE")
+    if raw is None or not raw.strip():
+        return 5000
+    return int(raw)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _apply(conn: sqlite3.Connection, migration: Migration, batch_size: int) -> None:
+    with _transaction(conn):
+        for statement in migration.statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(statement)
+
+    # Backfills and index builds each commit in short transactions so other
+    # connections (workers, the writer thread) can interleave on a large database.
+    # Indexes come last so they are built once over the backfilled data.
+    for backfill in migration.backfills:
+        while True:
+            with _transaction(conn):
+                processed = backfill(conn, batch_size)
+            if processed < batch_size:
+                break
+
+    for index_sql in migration.indexes:
+        with _transaction(conn):
+            conn.execute(index_sql)
+
+    with _transaction(conn):
+        conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+
+def migrate(conn: sqlite3.Connection, batch_size: int | None = None) -> list[int]:
+    """Apply pending migrations and return the versions applied.
+
+    When ``PRAGMA user_version`` already equals ``LATEST_VERSION`` this is a single
+    header read and no DDL runs. Every step is idempotent, so a migration interrupted
+    before its version bump is simply re-applied on the next start.
+    """
+    current = schema_version(conn)
+    if current >= LATEST_VERSION:
+        return []
+
+    size = batch_size or _backfill_batch_size()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        applied: list[int] = []
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+            _apply(conn, migration, size)
+            applied.append(migration.version)
+        return applied
+    finally:
+        conn.isolation_level = isolation_level
@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from app.cancellation import current_token
+from app.db import env_float, pooled_connection
+from app.llm import LlmGenerate
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - exercised only without the "providers" extra
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_COLUMNS = "id, name, base_url, config_json, created_at, updated_at"
+MODEL_COLUMNS = "id, provider_id, model_name, capabilities_json, created_at, updated_at"
+# Worth another attempt: throttling and transient upstream failures.
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class ProviderError(RuntimeError):
+    pass
+
+
+def _positive(raw: dict[str, object], key: str, default: float) -> float:
+    value = raw.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"config_json.{key} must be a non-negative number.")
+    return float(value)
+
+
+@dataclass(frozen=True)
+class ProviderSettings:
+    """Per-provider client settings from ``llm_providers.config_json``.
+
+    Secrets never live in the database: ``api_key_env`` names the environment
+    variable holding the key.
+    """
+
+    timeout_seconds: float = 120.0
+    connect_timeout_seconds: float = 10.0
+    max_retries: int = 2
+    backoff_base_seconds: float = 0.5
+    backoff_max_seconds: float = 8.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry_seconds: float = 60.0
+    http2: bool = True
+    stream: bool = True
+    api_key_env: str | None = None
+    system_prompt: str | None = None
+
+    @classmethod
+    def from_json(cls, raw: object) -> "ProviderSettings":
+        if raw is None:
+            return cls()
+        if not isinstance(raw, dict):
+            raise ValueError("config_json must be an object.")
+        for key in ("http2", "stream"):
+            if not isinstance(raw.get(key, True), bool):
+                raise ValueError(f"config_json.{key} must be a boolean.")
+        for key in ("api_key_env", "system_prompt"):
+            if raw.get(key) is not None and not isinstance(raw[key], str):
+                raise ValueError(f"config_json.{key} must be a string.")
+        return cls(
+            timeout_seconds=_positive(raw, "timeout_seconds", cls.timeout_seconds),
+            connect_timeout_seconds=_positive(raw, "connect_timeout_seconds", cls.connect_timeout_seconds),
+            max_retries=int(_positive(raw, "max_retries", cls.max_retries)),
+            backoff_base_seconds=_positive(raw, "backoff_base_seconds", cls.backoff_base_seconds),
+            backoff_max_seconds=_positive(raw, "backoff_max_seconds", cls.backoff_max_seconds),
+            max_connections=max(1, int(_positive(raw, "max_connections", cls.max_connections))),
+            max_keepalive_connections=int(_positive(raw, "max_keepalive_connections", cls.max_keepalive_connections)),
+            keepalive_expiry_seconds=_positive(raw, "keepalive_expiry_seconds", cls.keepalive_expiry_seconds),
+            http2=raw.get("http2", True),
+            stream=raw.get("stream", True),
+            api_key_env=raw.get("api_key_env"),
+            system_prompt=raw.get("system_prompt"),
+        )
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry ``attempt`` (0-based): capped exponential with equal jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2**attempt))
+        return random.uniform(ceiling / 2.0, ceiling)
+
+
+@dataclass(frozen=True)
+class ProviderEntry:
+    id: str
+    name: str
+    base_url: str
+    settings: ProviderSettings
+    # Registered model ids and names, both mapped to the name sent upstream.
+    models: dict[str, str]
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _retry_after(response: "httpx.Response") -> float | None:
+    raw = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(raw)) if raw is not None else None
+    except ValueError:
+        return None
+
+
+def _sleep(seconds: float) -> None:
+    """Back off for ``seconds``, waking early (and raising) if the call is cancelled."""
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+        return
+    woken = threading.Event()
+    token.add_callback(woken.set)
+    woken.wait(seconds)
+    token.raise_if_cancelled()
+
+
+def _messages(payload: dict[str, object], system_prompt: str | None) -> list[dict[str, str]]:
+    input_json = payload.get("input_json") if isinstance(payload.get("input_json"), dict) else {}
+    prompt = input_json.get("prompt") if isinstance(input_json.get("prompt"), str) else ""
+    title = payload.get("chapter_title") or f"Chapter {payload.get('chapter_no', 'X')}"
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    messages.append({"role": "user", "content": f"{title}\n\n{prompt}".strip()})
+    return messages
+
+
+class OpenAICompatibleProvider:
+    """``/chat/completions`` client over one shared, pooled keep-alive connection set."""
+
+    def __init__(self, entry: ProviderEntry, client: "httpx.Client") -> None:
+        self.entry = entry
+        self.client = client
+
+    def _headers(self) -> dict[str, str]:
+        key_env = self.entry.settings.api_key_env
+        key = os.getenv(key_env) if key_env else None
+        return {"Authorization": f"Bearer {key}"} if key else {}
+
+    def generate(self, payload: dict[str, object], model_name: str) -> object:
+        settings = self.entry.settings
+        body: dict[str, object] = {"model": model_name, "messages": _messages(payload, settings.system_prompt)}
+        if settings.stream:
+            body["stream"] = True
+            body["stream_options"] = {"include_usage": True}
+            return self._stream(body)
+        return self._complete(body)
+
+    def _retry(self, attempt: int, reason: str, retry_after: float | None = None) -> bool:
+        settings = self.entry.settings
+        if attempt >= settings.max_retries:
+            return False
+        delay = settings.backoff(attempt, retry_after)
+        logger.info("Provider %s: %s; retry %d in %.2fs.", self.entry.id, reason, attempt + 1, delay)
+        _sleep(delay)
+        return True
+
+    def _complete(self, body: dict[str, object]) -> dict[str, object]:
+        attempt = 0
+        while True:
+            try:
+                response = self.client.post("/chat/completions", json=body, headers=self._headers())
+            except httpx.TransportError as exc:
+                if self._retry(attempt, f"{type(exc).__name__}: {exc}"):
+                    attempt += 1
+                    continue
+                raise ProviderError(f"Provider {self.entry.id} unreachable: {exc}") from exc
+            if response.status_code in RETRYABLE_STATUS and self._retry(
+                attempt, f"HTTP {response.status_code}", _retry_after(response)
+            ):
+                attempt += 1
+                continue
+            if response.status_code >= 400:
+                raise ProviderError(
+                    f"Provider {self.entry.id} returned HTTP {response.status_code}: {response.text[:200]}"
+                )
+            data = response.json()
+            choices = data.get("choices") or []
+            message = choices[0].get("message") if choices else None
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str):
+                raise ProviderError(f"Provider {self.entry.id} returned no message content.")
+            result: dict[str, object] = {
+                "content_text": content,
+                "provider_id": self.entry.id,
+                "model_id": body["model"],
+            }
+            if isinstance(data.get("usage"), dict):
+                result["usage_json"] = data["usage"]
+            return result
+
+    def _stream(self, body: dict[str, object]) -> Iterator[dict[str, object]]:
+        """Yield deltas as they arrive; closing the iterator drops the connection mid-response.
+
+        Failures are retried only until the first delta has been yielded.
+        """
+        attempt = 0
+        started = False
+        while True:
+            retry_after: float | None = None
+            try:
+                with self.client.stream("POST", "/chat/completions", json=body, headers=self._headers()) as response:
+                    status = response.status_code
+                    if status in RETRYABLE_STATUS and attempt < self.entry.settings.max_retries:
+                        retry_after = _retry_after(response)
+                    else:
+                        if status >= 400:
+                            response.read()
+                            raise ProviderError(
+                                f"Provider {self.entry.id} returned HTTP {status}: {response.text[:200]}"
+                            )
+                        started = True
+                        yield {"delta": "", "provider_id": self.entry.id, "model_id": body["model"]}
+                        yield from self._sse_chunks(response)
+                        return
+            except httpx.TransportError as exc:
+                if started or not self._retry(attempt, f"{type(exc).__name__}: {exc}"):
+                    raise ProviderError(f"Provider {self.entry.id} stream failed: {exc}") from exc
+                attempt += 1
+                continue
+            self._retry(attempt, f"HTTP {status}", retry_after)
+            attempt += 1
+
+    @staticmethod
+    def _sse_chunks(response: "httpx.Response") -> Iterator[dict[str, object]]:
+        # Read through to the end of the body even after [DONE], so the connection
+        # goes back to the pool instead of being closed.
+        for line in response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                continue
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            out: dict[str, object] = {"delta": delta if isinstance(delta, str) else ""}
+            if isinstance(chunk.get("usage"), dict):
+                out["usage_json"] = chunk["usage"]
+            yield out
+
+
+def _failing(message: str) -> LlmGenerate:
+    """Generator that fails the step with ``message`` instead of calling out."""
+
+    def generate(_: dict[str, object]) -> object:
+        raise ValueError(message)
+
+    return generate
+
+
+class ProviderRegistry:
+    """Providers and models from ``llm_providers`` / ``llm_models``, with one pooled client each.
+
+    Clients are built on first use and kept for the life of the process, so calls
+    to a provider share keep-alive (and, with ``h2`` installed, HTTP/2) connections
+    instead of paying a handshake per call. The tables are re-read after local
+    writes (``invalidate``) and every ``refresh_seconds`` to pick up other processes'.
+    """
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._entries: dict[str, ProviderEntry] | None = None
+        self._loaded_at = 0.0
+        self._clients: dict[str, tuple[ProviderEntry, "httpx.Client"]] = {}
+        self._retired: list["httpx.Client"] = []
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = None
+
+    @staticmethod
+    def load(conn: sqlite3.Connection) -> dict[str, ProviderEntry]:
+        models: dict[str, dict[str, str]] = {}
+        for model_id, provider_id, model_name in conn.execute(
+            "SELECT id, provider_id, model_name FROM llm_models"
+        ).fetchall():
+            models.setdefault(provider_id, {}).update({model_id: model_name, model_name: model_name})
+        entries = {}
+        for row in conn.execute(f"SELECT {PROVIDER_COLUMNS} FROM llm_providers").fetchall():
+            if not row["base_url"]:
+                continue
+            config = json.loads(row["config_json"]) if row["config_json"] is not None else None
+            try:
+                settings = ProviderSettings.from_json(config)
+            except ValueError:
+                logger.warning("Provider %s has invalid config_json; skipping it.", row["id"])
+                continue
+            entries[row["id"]] = ProviderEntry(
+                id=row["id"],
+                name=row["name"],
+                base_url=row["base_url"].rstrip("/"),
+                settings=settings,
+                models=models.get(row["id"], {}),
+            )
+        return entries
+
+    def _current(self) -> dict[str, ProviderEntry]:
+        with self._lock:
+            if self._entries is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return self._entries
+        with pooled_connection() as conn:
+            entries = self.load(conn)
+        with self._lock:
+            self._entries, self._loaded_at = entries, time.monotonic()
+        return entries
+
+    def _client(self, entry: ProviderEntry) -> "httpx.Client":
+        with self._lock:
+            cached = self._clients.get(entry.id)
+            if cached is not None and cached[0].base_url == entry.base_url and cached[0].settings == entry.settings:
+                return cached[1]
+            settings = entry.settings
+            client = httpx.Client(
+                base_url=entry.base_url,
+                http2=settings.http2 and _http2_available(),
+                timeout=httpx.Timeout(settings.timeout_seconds, connect=settings.connect_timeout_seconds),
+                limits=httpx.Limits(
+                    max_connections=settings.max_connections,
+                    max_keepalive_connections=settings.max_keepalive_connections,
+                    keepalive_expiry=settings.keepalive_expiry_seconds,
+                ),
+            )
+            if cached is not None:
+                # Calls may still be streaming on the old client; close it with the registry.
+                self._retired.append(cached[1])
+            self._clients[entry.id] = (entry, client)
+            return client
+
+    def generator_for(self, provider_id: str, model_id: str) -> LlmGenerate | None:
+        """Generator for a registered provider, or None when ``provider_id`` is not one."""
+        entry = self._current().get(provider_id)
+        if entry is None:
+            return None
+        if httpx is None:
+            return _failing("LLM providers need httpx; install the 'providers' extra.")
+        model_name = entry.models.get(model_id)
+        if model_name is None:
+            return _failing(f"Model {model_id} is not registered for provider {provider_id}.")
+        provider = OpenAICompatibleProvider(entry, self._client(entry))
+        return lambda payload: provider.generate(payload, model_name)
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def close(self) -> None:
+        with self._lock:
+            clients = [client for _, client in self._clients.values()] + self._retired
+            self._clients, self._retired = {}, []
+        for client in clients:
+            client.close()
+
+
+_registry: ProviderRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProviderRegistry(env_float("WRITER_LLM_PROVIDERS_REFRESH_SECONDS", 30.0))
+        return _registry
+
+
+def reset_provider_registry() -> None:
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        registry.close()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+class RateLimitTimeout(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class BucketLimits:
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_inflight_calls: int | None = None
+    queue_timeout_seconds: float = 60.0
+    # Completion tokens reserved up front; reconciled against actual usage afterwards.
+    completion_reserve_tokens: int = 1024
+
+    @classmethod
+    def from_json(cls, raw: dict[str, object]) -> "BucketLimits":
+        return cls(
+            requests_per_minute=raw.get("rpm"),
+            tokens_per_minute=raw.get("tpm"),
+            max_inflight_calls=raw.get("max_inflight_calls"),
+            queue_timeout_seconds=float(raw.get("queue_timeout_seconds", cls.queue_timeout_seconds)),
+            completion_reserve_tokens=int(raw.get("completion_reserve_tokens", cls.completion_reserve_tokens)),
+        )
+
+
+@dataclass
+class Admission:
+    bucket: str
+    waited_seconds: float
+    reserved_tokens: int
+    settled: bool = False
+
+
+class _Refill:
+    """A continuously refilling bucket; the level may go negative after reconciliation."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class TokenBucketLimiter:
+    """RPM, TPM and concurrency admission for one provider/model bucket.
+
+    Waiters are admitted strictly in arrival order: a large request at the head of
+    the queue is not overtaken by smaller ones behind it, so no caller starves.
+    """
+
+    def __init__(self, name: str, limits: BucketLimits) -> None:
+        self.name = name
+        self.limits = limits
+        self._cond = threading.Condition()
+        self._queue: deque[object] = deque()
+        self._requests = _Refill(limits.requests_per_minute) if limits.requests_per_minute else None
+        self._tokens = _Refill(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        self.inflight = 0
+        self.admitted = 0
+        self.timed_out = 0
+
+    def _clamp(self, tokens: int) -> int:
+        if self._tokens is None:
+            return tokens
+        return min(tokens, int(self._tokens.capacity))
+
+    def _blocked_for(self, tokens: int, now: float) -> float | None:
+        """Seconds until the head request fits, or None if only a release can unblock it."""
+        if self.limits.max_inflight_calls is not None and self.inflight >= self.limits.max_inflight_calls:
+            return None
+        wait = 0.0
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.seconds_until(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.seconds_until(tokens))
+        return wait
+
+    def acquire(self, tokens: int, timeout: float | None = None) -> Admission:
+        timeout = self.limits.queue_timeout_seconds if timeout is None else timeout
+        tokens = self._clamp(tokens)
+        ticket = object()
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] is ticket:
+                        blocked = self._blocked_for(tokens, now)
+                        if blocked == 0.0:
+                            break
+                    else:
+                        blocked = None
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise RateLimitTimeout(
+                            f"Rate limit bucket {self.name} did not admit the call within {timeout:g}s."
+                        )
+                    self._cond.wait(remaining if blocked is None else min(remaining, blocked))
+            except BaseException:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._queue.popleft()
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+            self.inflight += 1
+            self.admitted += 1
+            self._cond.notify_all()
+        return Admission(bucket=self.name, waited_seconds=time.monotonic() - started, reserved_tokens=tokens)
+
+    def release(self, admission: Admission, actual_tokens: int | None = None) -> None:
+        with self._cond:
+            if admission.settled:
+                return
+            admission.settled = True
+            self.inflight -= 1
+            if self._tokens is not None and actual_tokens is not None:
+                self._tokens.refill(time.monotonic())
+                self._tokens.level -= actual_tokens - admission.reserved_tokens
+            self._cond.notify_all()
+
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+
+class RateLimiterRegistry:
+    """Limiters keyed on ``provider_id:model_id`` (or an explicit bucket name).
+
+    Limits come from ``WRITER_LLM_RATE_LIMITS``, a JSON object mapping bucket names
+    to ``{"rpm", "tpm", "max_inflight_calls", "queue_timeout_seconds",
+    "completion_reserve_tokens"}``; ``"*"`` applies to buckets without an entry.
+    Buckets with no configured limits are not throttled.
+    """
+
+    def __init__(self, config: dict[str, BucketLimits]) -> None:
+        self.config = config
+        self._lock = threading.Lock()
+        self._limiters: dict[str, TokenBucketLimiter | None] = {}
+
+    def get(self, bucket: str) -> TokenBucketLimiter | None:
+        with self._lock:
+            if bucket not in self._limiters:
+                limits = self.config.get(bucket) or self.config.get("*")
+                self._limiters[bucket] = TokenBucketLimiter(bucket, limits) if limits is not None else None
+            return self._limiters[bucket]
+
+
+def _configured_limits() -> dict[str, BucketLimits]:
+    raw = os.getenv("WRITER_LLM_RATE_LIMITS", "").strip()
+    if not raw:
+        return {}
+    parsed = json.loads(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("WRITER_LLM_RATE_LIMITS must be a JSON object.")
+    return {bucket: BucketLimits.from_json(limits) for bucket, limits in parsed.items()}
+
+
+_registry: RateLimiterRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiters() -> RateLimiterRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = RateLimiterRegistry(_configured_limits())
+        return _registry
+
+
+def reset_rate_limiters() -> None:
+    global _registry
+    with _registry_lock:
+        _registry = None
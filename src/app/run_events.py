@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from app.db import env_float, on_commit
+from app.ulid import new_ulid
+
+RUN_EVENT_COLUMNS = "seq, id, run_id, step_id, event_type, status, payload_json, created_at"
+TERMINAL_RUN_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# Runs a read closure off the event loop (``app.executor.db_read``).
+DbRead = Callable[[Callable[[sqlite3.Connection], object]], Awaitable[object]]
+
+
+@dataclass(frozen=True)
+class RunEvent:
+    seq: int
+    id: str
+    run_id: str
+    step_id: str | None
+    event_type: str
+    status: str
+    payload: dict[str, object] | None
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "RunEvent":
+        return cls(
+            seq=row["seq"],
+            id=row["id"],
+            run_id=row["run_id"],
+            step_id=row["step_id"],
+            event_type=row["event_type"],
+            status=row["status"],
+            payload=json.loads(row["payload_json"]) if row["payload_json"] is not None else None,
+            created_at=row["created_at"],
+        )
+
+    @property
+    def ends_run(self) -> bool:
+        return self.event_type == "run.status" and self.status in TERMINAL_RUN_STATUSES
+
+
+def record_run_event(
+    conn: sqlite3.Connection,
+    run_id: str,
+    event_type: str,
+    status: str,
+    created_at: str,
+    step_id: str | None = None,
+    payload: dict[str, object] | None = None,
+) -> str:
+    """Append a transition to ``run_events`` inside the caller's transaction.
+
+    Listeners in this process are woken once the transaction commits.
+    """
+    event_id = new_ulid("rev")
+    conn.execute(
+        "INSERT INTO run_events (id, run_id, step_id, event_type, status, payload_json, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            event_id,
+            run_id,
+            step_id,
+            event_type,
+            status,
+            json.dumps(payload, ensure_ascii=True, sort_keys=True) if payload is not None else None,
+            created_at,
+        ),
+    )
+    on_commit(conn, get_run_event_bus().notify)
+    return event_id
+
+
+def record_created_events(conn: sqlite3.Connection, run_ids: list[str], created_at: str) -> None:
+    """Bulk form of ``record_run_event`` for freshly inserted runs."""
+    conn.executemany(
+        "INSERT INTO run_events (id, run_id, step_id, event_type, status, payload_json, created_at) "
+        "VALUES (?, ?, NULL, 'run.status', 'created', NULL, ?)",
+        [(new_ulid("rev"), run_id, created_at) for run_id in run_ids],
+    )
+    on_commit(conn, get_run_event_bus().notify)
+
+
+def event_seq(conn: sqlite3.Connection, run_id: str, event_id: str) -> int | None:
+    row = conn.execute("SELECT seq FROM run_events WHERE id = ? AND run_id = ?", (event_id, run_id)).fetchone()
+    return row[0] if row is not None else None
+
+
+def list_run_events(conn: sqlite3.Connection, run_id: str, after_seq: int, limit: int) -> list[RunEvent]:
+    rows = conn.execute(
+        f"SELECT {RUN_EVENT_COLUMNS} FROM run_events WHERE run_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+        (run_id, after_seq, limit),
+    ).fetchall()
+    return [RunEvent.from_row(row) for row in rows]
+
+
+class Subscription:
+    def __init__(self, bus: "RunEventBus", run_id: str) -> None:
+        self.bus = bus
+        self.run_id = run_id
+        self.queue: asyncio.Queue[RunEvent] = asyncio.Queue()
+
+    async def next(self, after_seq: int, timeout: float) -> list[RunEvent]:
+        """Wait up to ``timeout`` seconds for events past ``after_seq``; returns all that are ready."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return []
+            try:
+                event = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return []
+            events = [event]
+            while not self.queue.empty():
+                events.append(self.queue.get_nowait())
+            fresh = [event for event in events if event.seq > after_seq]
+            if fresh:
+                return fresh
+
+    def close(self) -> None:
+        self.bus._unsubscribe(self)
+
+
+class RunEventBus:
+    """Tails ``run_events`` once for every listener in this process.
+
+    A single task reads new rows by ``seq`` and hands each one to the subscriptions
+    for its run, so N clients watching runs cost one query per wake-up rather than
+    N polls. Commits on this process's writer wake the task at once; events written
+    by other processes (``writer-worker``) are picked up every ``poll_interval``.
+    Subscribers catch up from the table themselves after subscribing and drop
+    duplicates by ``seq``.
+    """
+
+    def __init__(self, poll_interval: float) -> None:
+        self.poll_interval = poll_interval
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._last_seq: int | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.queries = 0
+
+    def start(self, db_read: DbRead) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run(db_read))
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+
+    def notify(self) -> None:
+        """Thread-safe wake-up; called after a commit that appended events."""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or not self._subscriptions:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # Loop already closed during shutdown.
+
+    async def subscribe(self, run_id: str, db_read: DbRead) -> Subscription:
+        if self._last_seq is None:
+            # Start tailing from before the subscriber's own catch-up read, so nothing
+            # committed in between can be missed.
+            latest = await db_read(
+                lambda conn: conn.execute("SELECT COALESCE(MAX(seq), 0) FROM run_events").fetchone()[0]
+            )
+            if self._last_seq is None:
+                self._last_seq = latest
+        subscription = Subscription(self, run_id)
+        self._subscriptions.setdefault(run_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.run_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.run_id]
+        if not self._subscriptions:
+            self._last_seq = None
+
+    async def _run(self, db_read: DbRead) -> None:
+        assert self._wake is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._subscriptions and self._last_seq is not None:
+                after = self._last_seq
+                rows = await db_read(
+                    lambda conn: conn.execute(
+                        f"SELECT {RUN_EVENT_COLUMNS} FROM run_events WHERE seq > ? ORDER BY seq LIMIT 500",
+                        (after,),
+                    ).fetchall()
+                )
+                self.queries += 1
+                if self._last_seq is None:
+                    break
+                for row in rows:
+                    event = RunEvent.from_row(row)
+                    for subscription in self._subscriptions.get(event.run_id, ()):
+                        subscription.queue.put_nowait(event)
+                if rows:
+                    self._last_seq = max(self._last_seq, rows[-1]["seq"])
+                if len(rows) < 500:
+                    break
+
+
+_bus: RunEventBus | None = None
+
+
+def get_run_event_bus() -> RunEventBus:
+    global _bus
+    if _bus is None:
+        _bus = RunEventBus(env_float("WRITER_RUN_EVENTS_POLL_SECONDS", 1.0))
+    return _bus
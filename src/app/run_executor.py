@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app.db import env_int
+
+logger = logging.getLogger(__name__)
+
+
+class RunExecutor:
+    """Background thread pool that drives runs outside the request cycle.
+
+    Jobs are keyed by run id. Submitting a run that is already queued or executing
+    does not start a second driver; it marks the run dirty so the current driver
+    makes one more pass once it finishes, which picks up any transition (approval,
+    resume) committed while it was busy.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run-worker")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight: set[str] = set()
+        self._dirty: set[str] = set()
+        # Called (outside the lock) each time a driver finishes and frees a worker slot.
+        self.on_slot_free: Callable[[], None] | None = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, run_id: str, drive: Callable[[str], None]) -> bool:
+        """Schedule ``drive(run_id)``; returns False when it was coalesced into a pending job."""
+        with self._lock:
+            if run_id in self._inflight:
+                self._dirty.add(run_id)
+                return False
+            self._inflight.add(run_id)
+            self.submitted += 1
+        try:
+            self._executor.submit(self._run, run_id, drive)
+        except RuntimeError:
+            with self._lock:
+                self._inflight.discard(run_id)
+                self._idle.notify_all()
+            raise
+        return True
+
+    def _run(self, run_id: str, drive: Callable[[str], None]) -> None:
+        try:
+            while True:
+                try:
+                    drive(run_id)
+                except Exception:
+                    logger.exception("Background driver for run %s failed.", run_id)
+                    with self._lock:
+                        self.failed += 1
+                with self._lock:
+                    finished = run_id not in self._dirty
+                    if finished:
+                        self._inflight.discard(run_id)
+                        self.completed += 1
+                        self._idle.notify_all()
+                    else:
+                        self._dirty.discard(run_id)
+                if finished:
+                    if self.on_slot_free is not None:
+                        self.on_slot_free()
+                    return
+        except BaseException:
+            with self._lock:
+                self._inflight.discard(run_id)
+                self._idle.notify_all()
+            raise
+
+    def is_inflight(self, run_id: str) -> bool:
+        with self._lock:
+            return run_id in self._inflight
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._inflight, timeout=timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_run_executor: RunExecutor | None = None
+_run_executor_lock = threading.Lock()
+
+
+def get_run_executor() -> RunExecutor:
+    global _run_executor
+    with _run_executor_lock:
+        if _run_executor is None:
+            _run_executor = RunExecutor(max_workers=env_int("WRITER_RUN_WORKERS", 4))
+        return _run_executor
+
+
+def shutdown_run_executor() -> None:
+    global _run_executor
+    with _run_executor_lock:
+        executor, _run_executor = _run_executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+_step_executor: ThreadPoolExecutor | None = None
+
+
+def get_step_executor() -> ThreadPoolExecutor:
+    """Pool for the independent steps of a run (parallel drafts and reviews) that one driver fans out."""
+    global _step_executor
+    with _run_executor_lock:
+        if _step_executor is None:
+            _step_executor = ThreadPoolExecutor(
+                max_workers=env_int("WRITER_STEP_WORKERS", 8), thread_name_prefix="run-step"
+            )
+        return _step_executor
+
+
+def shutdown_step_executor() -> None:
+    """Call after the run drivers have stopped; they wait on the steps they fanned out."""
+    global _step_executor
+    with _run_executor_lock:
+        executor, _step_executor = _step_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
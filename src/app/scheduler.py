@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from app.db import env_float, env_int, run_write
+from app.run_executor import RunExecutor
+from app.timestamps import iso, utc_now
+
+logger = logging.getLogger(__name__)
+
+# Strict precedence: a queued interactive run is always dispatched before a batch one.
+PRIORITY_CLASSES = ("interactive", "batch")
+
+
+@dataclass(frozen=True)
+class ProjectPolicy:
+    weight: float = 1.0
+    max_concurrent_runs: int | None = None
+
+
+@dataclass(frozen=True)
+class QueuedRun:
+    id: str
+    project_id: str
+    priority: str
+
+
+def _default_policy() -> ProjectPolicy:
+    cap = env_int("WRITER_SCHEDULER_MAX_RUNS_PER_PROJECT", 0)
+    return ProjectPolicy(max_concurrent_runs=cap if cap > 0 else None)
+
+
+def project_policies(conn: sqlite3.Connection, project_ids: set[str]) -> dict[str, ProjectPolicy]:
+    """Per-project ``weight`` / ``max_concurrent_runs`` from ``settings_json["scheduler"]``."""
+    default = _default_policy()
+    policies = {project_id: default for project_id in project_ids}
+    if not project_ids:
+        return policies
+    placeholders = ", ".join("?" for _ in project_ids)
+    rows = conn.execute(
+        f"SELECT project_id, settings_json FROM project_settings WHERE project_id IN ({placeholders})",
+        sorted(project_ids),
+    ).fetchall()
+    for project_id, settings_json in rows:
+        scheduler = json.loads(settings_json).get("scheduler")
+        if not isinstance(scheduler, dict):
+            continue
+        weight = scheduler.get("weight", default.weight)
+        cap = scheduler.get("max_concurrent_runs", default.max_concurrent_runs)
+        policies[project_id] = ProjectPolicy(
+            weight=float(weight) if isinstance(weight, (int, float)) and weight > 0 else default.weight,
+            max_concurrent_runs=int(cap) if isinstance(cap, int) and cap > 0 else default.max_concurrent_runs,
+        )
+    return policies
+
+
+def active_runs_by_project(conn: sqlite3.Connection, now_iso: str) -> dict[str, int]:
+    rows = conn.execute(
+        "SELECT project_id, COUNT(*) FROM runs WHERE status = 'running' "
+        "AND lease_owner IS NOT NULL AND lease_expires_at >= ? GROUP BY project_id",
+        (now_iso,),
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def queued_runs(conn: sqlite3.Connection, now_iso: str, per_queue: int | None = None) -> list[QueuedRun]:
+    """Runnable runs nobody holds a live lease on, oldest first.
+
+    With ``per_queue`` only that many heads of each (project, priority) queue are
+    read, which is all a claim of at most ``per_queue`` runs can need.
+    """
+    rows = conn.execute(
+        "SELECT id, project_id, priority FROM ("
+        "SELECT id, project_id, priority, "
+        "ROW_NUMBER() OVER (PARTITION BY project_id, priority ORDER BY id) AS queue_rank "
+        "FROM runs WHERE status = 'running' AND (lease_owner IS NULL OR lease_expires_at < ?)"
+        ") WHERE ? IS NULL OR queue_rank <= ? ORDER BY id",
+        (now_iso, per_queue, per_queue),
+    ).fetchall()
+    return [QueuedRun(id=row[0], project_id=row[1], priority=row[2]) for row in rows]
+
+
+def queued_among(conn: sqlite3.Connection, run_ids: list[str]) -> set[str]:
+    """Those of ``run_ids`` still waiting for a worker, the only runs with a queue position."""
+    if not run_ids:
+        return set()
+    placeholders = ", ".join("?" for _ in run_ids)
+    rows = conn.execute(
+        f"SELECT id FROM runs WHERE id IN ({placeholders}) AND status = 'running' "
+        "AND (lease_owner IS NULL OR lease_expires_at < ?)",
+        (*run_ids, iso(utc_now())),
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def fair_order(
+    queued: list[QueuedRun],
+    active: dict[str, int],
+    policies: dict[str, ProjectPolicy],
+    limit: int | None = None,
+    respect_caps: bool = True,
+) -> list[QueuedRun]:
+    """Order in which the scheduler hands out ``queued`` runs.
+
+    Within the highest priority class that has an eligible run, the next slot goes
+    to the project with the smallest weighted share of running runs (active plus
+    already picked, divided by weight); ties go to the oldest run. Projects at their
+    concurrency cap are skipped when ``respect_caps`` is set.
+    """
+    queues: dict[tuple[int, str], list[QueuedRun]] = {}
+    for run in queued:
+        rank = PRIORITY_CLASSES.index(run.priority) if run.priority in PRIORITY_CLASSES else len(PRIORITY_CLASSES)
+        queues.setdefault((rank, run.project_id), []).append(run)
+    heads = {key: 0 for key in queues}
+    running = dict(active)
+    default = ProjectPolicy()
+    order: list[QueuedRun] = []
+    while limit is None or len(order) < limit:
+        best: tuple[float, str, tuple[int, str]] | None = None
+        best_rank: int | None = None
+        for key in sorted(queues):
+            rank, project_id = key
+            if best_rank is not None and rank > best_rank:
+                break
+            if heads[key] >= len(queues[key]):
+                continue
+            policy = policies.get(project_id, default)
+            count = running.get(project_id, 0)
+            if respect_caps and policy.max_concurrent_runs is not None and count >= policy.max_concurrent_runs:
+                continue
+            candidate = (count / policy.weight, queues[key][heads[key]].id, key)
+            if best is None or candidate < best:
+                best, best_rank = candidate, rank
+        if best is None:
+            break
+        key = best[2]
+        order.append(queues[key][heads[key]])
+        heads[key] += 1
+        running[key[1]] = running.get(key[1], 0) + 1
+    return order
+
+
+def claim_scheduled_runs(conn: sqlite3.Connection, owner: str, limit: int, seconds: float) -> list[str]:
+    """Lease up to ``limit`` runs in fair-scheduling order; returns them in that order."""
+    now = utc_now()
+    now_iso = iso(now)
+    queued = queued_runs(conn, now_iso, per_queue=limit)
+    if not queued:
+        return []
+    active = active_runs_by_project(conn, now_iso)
+    policies = project_policies(conn, {run.project_id for run in queued})
+    picked = [run.id for run in fair_order(queued, active, policies, limit=limit)]
+    if not picked:
+        return []
+    placeholders = ", ".join("?" for _ in picked)
+    rows = conn.execute(
+        "UPDATE runs SET lease_owner = ?, lease_expires_at = ?, dispatched_at = COALESCE(dispatched_at, ?) "
+        f"WHERE id IN ({placeholders}) AND status = 'running' "
+        "AND (lease_owner IS NULL OR lease_expires_at < ?) RETURNING id",
+        (owner, iso(now + timedelta(seconds=seconds)), now_iso, *picked, now_iso),
+    ).fetchall()
+    claimed = {row[0] for row in rows}
+    return [run_id for run_id in picked if run_id in claimed]
+
+
+@dataclass(frozen=True)
+class QueueSnapshot:
+    positions: dict[str, int]
+    active: int
+    slots: int
+    average_run_seconds: float
+
+    def estimated_start_at(self, run_id: str) -> str | None:
+        position = self.positions.get(run_id)
+        if position is None:
+            return None
+        waves = (self.active + position) // max(1, self.slots)
+        moment = utc_now() + timedelta(seconds=waves * self.average_run_seconds)
+        return iso(moment)
+
+
+def queue_snapshot(conn: sqlite3.Connection) -> QueueSnapshot:
+    """Queue positions (0 = next to start) for every waiting run, plus what ETAs need.
+
+    Positions follow :func:`fair_order` with caps ignored, so a capped project's runs
+    still get a position; the estimate assumes ``WRITER_SCHEDULER_SLOTS`` worker
+    slots and the mean duration of recent completed runs.
+    """
+    now_iso = iso(utc_now())
+    queued = queued_runs(conn, now_iso)
+    active = active_runs_by_project(conn, now_iso)
+    policies = project_policies(conn, {run.project_id for run in queued})
+    order = fair_order(queued, active, policies, respect_caps=False)
+    average = conn.execute(
+        "SELECT AVG((julianday(finished_at) - julianday(dispatched_at)) * 86400.0) FROM ("
+        "SELECT finished_at, dispatched_at FROM runs WHERE status = 'completed' AND dispatched_at IS NOT NULL "
+        "ORDER BY finished_at DESC LIMIT 50)"
+    ).fetchone()[0]
+    return QueueSnapshot(
+        positions={run.id: position for position, run in enumerate(order)},
+        active=sum(active.values()),
+        slots=env_int("WRITER_SCHEDULER_SLOTS", env_int("WRITER_RUN_WORKERS", 4)),
+        average_run_seconds=(
+            float(average) if average is not None else env_float("WRITER_SCHEDULER_DEFAULT_RUN_SECONDS", 60.0)
+        ),
+    )
+
+
+class RunDispatcher:
+    """Feeds a :class:`RunExecutor` from the scheduler whenever it has free slots.
+
+    Wakes when kicked (a run became runnable, or a driver finished and freed a slot)
+    and otherwise every ``poll_interval`` seconds, to pick up runs whose leases lapsed.
+    """
+
+    def __init__(
+        self,
+        executor: RunExecutor,
+        drive: Callable[[str], None],
+        owner: str,
+        lease_seconds: float,
+        poll_interval: float,
+        snapshot_seconds: float = 1.0,
+    ) -> None:
+        self.executor = executor
+        self.drive = drive
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.snapshot_seconds = snapshot_seconds
+        self._dispatch_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._snapshot_lock = threading.Lock()
+        # (generation, taken at, snapshot); a kick or a claim bumps the generation.
+        self._snapshot: tuple[int, float, QueueSnapshot] | None = None
+        self._generation = 0
+        self.dispatched = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="run-dispatcher", daemon=True)
+        self._thread.start()
+
+    def kick(self) -> None:
+        self._invalidate_snapshot()
+        self._wake.set()
+
+    def queue_snapshot(self, conn: sqlite3.Connection) -> QueueSnapshot:
+        """:func:`queue_snapshot`, reused for ``snapshot_seconds`` so polling clients share one.
+
+        Dropped whenever the queue changes here (a kick or a claim); claims by other
+        processes show up within ``snapshot_seconds``.
+        """
+        with self._snapshot_lock:
+            generation, cached = self._generation, self._snapshot
+        if cached is not None and cached[0] == generation and time.monotonic() - cached[1] < self.snapshot_seconds:
+            return cached[2]
+        taken_at = time.monotonic()
+        snapshot = queue_snapshot(conn)
+        with self._snapshot_lock:
+            if self._generation == generation:
+                self._snapshot = (generation, taken_at, snapshot)
+        return snapshot
+
+    def _invalidate_snapshot(self) -> None:
+        with self._snapshot_lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def dispatch_once(self) -> int:
+        with self._dispatch_lock:
+            free = self.executor.max_workers - self.executor.pending()
+            if free <= 0:
+                return 0
+            claimed = run_write(lambda conn: claim_scheduled_runs(conn, self.owner, free, self.lease_seconds))
+            if claimed:
+                self._invalidate_snapshot()
+            for run_id in claimed:
+                self.executor.submit(run_id, self.drive)
+            self.dispatched += len(claimed)
+            return len(claimed)
+
+    def drain(self, timeout: float) -> bool:
+        """Dispatch until nothing is runnable and the executor is idle (used by tests and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            claimed = self.dispatch_once()
+            if not claimed and self.executor.wait_idle(timeout=0):
+                if not self.dispatch_once():
+                    return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.executor.wait_idle(timeout=min(remaining, 0.05))
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.dispatch_once()
+            except Exception:
+                logger.exception("Run dispatch failed.")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_dispatcher: RunDispatcher | None = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_run_dispatcher(
+    executor: RunExecutor,
+    drive: Callable[[str], None],
+    owner: str,
+    lease: float,
+) -> RunDispatcher:
+    global _dispatcher
+    dispatcher = RunDispatcher(
+        executor,
+        drive,
+        owner,
+        lease,
+        env_float("WRITER_RUN_DISPATCH_POLL_SECONDS", 1.0),
+        env_float("WRITER_SCHEDULER_SNAPSHOT_SECONDS", 1.0),
+    )
+    executor.on_slot_free = dispatcher.kick
+    with _dispatcher_lock:
+        previous, _dispatcher = _dispatcher, dispatcher
+    if previous is not None:
+        previous.stop()
+    dispatcher.start()
+    dispatcher.kick()
+    return dispatcher
+
+
+def get_run_dispatcher() -> RunDispatcher | None:
+    with _dispatcher_lock:
+        return _dispatcher
+
+
+def current_queue_snapshot(conn: sqlite3.Connection) -> QueueSnapshot:
+    """The local dispatcher's cached snapshot, or a fresh one when runs are dispatched externally."""
+    dispatcher = get_run_dispatcher()
+    return dispatcher.queue_snapshot(conn) if dispatcher is not None else queue_snapshot(conn)
+
+
+def stop_run_dispatcher() -> None:
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.stop()
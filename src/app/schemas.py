@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
@@ -156,6 +156,9 @@ class ChapterSegmentOut(BaseModel):
     pov_node_id: str | None = None
     segment_type: str | None = None
     content_text: str | None = None
+    # Characters and sha256 of content_text; what view=summary returns instead of the text.
+    char_count: int | None = None
+    content_hash: str | None = None
     attrs_json: dict[str, Any] | None = None
     created_at: str
     updated_at: str
@@ -187,6 +190,8 @@ class ChapterTextVersionOut(BaseModel):
     version_no: int
     stage: str
     content_text: str
+    char_count: int | None = None
+    content_hash: str | None = None
     source_run_id: str | None = None
     source_step_id: str | None = None
     created_at: str
@@ -197,6 +202,20 @@ class ChapterTextVersionListResponse(BaseModel):
     next_after: str | None = None
 
 
+class SearchHit(BaseModel):
+    source_kind: str
+    source_id: str
+    chapter_id: str
+    title: str | None = None
+    snippet: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    items: list[SearchHit]
+    next_after: str | None = None
+
+
 class SwarmRunCreate(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
@@ -208,6 +227,48 @@ class SwarmRunCreate(BaseModel):
     budget_json: dict[str, Any] | None = None
     requires_approval: bool = False
     auto_start: bool = True
+    llm_cache: bool = True
+    priority: Literal["interactive", "batch"] = "interactive"
+    # Parallel drafts, reviews per draft, and how the winning draft is picked (runtime B6).
+    draft_n: int = Field(default=1, ge=1, le=3)
+    review_n: int = Field(default=0, ge=0, le=2)
+    select_strategy: Literal["min_issues", "weighted_score", "human_only"] = "min_issues"
+
+
+class SwarmRunBatchCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    project_id: str = Field(min_length=1)
+    chapter_ids: list[str] = Field(min_length=1, max_length=500)
+    run_type: str = Field(default="chapter_write", min_length=1, max_length=64)
+    swarm_profile_id: str | None = None
+    input_json: dict[str, Any] | None = None
+    budget_json: dict[str, Any] | None = None
+    requires_approval: bool = False
+    auto_start: bool = True
+    llm_cache: bool = True
+    priority: Literal["interactive", "batch"] = "batch"
+    draft_n: int = Field(default=1, ge=1, le=3)
+    review_n: int = Field(default=0, ge=0, le=2)
+    select_strategy: Literal["min_issues", "weighted_score", "human_only"] = "min_issues"
+
+
+class RunBatchOut(BaseModel):
+    id: str
+    project_id: str
+    run_ids: list[str]
+    created_at: str
+
+
+class RunBatchStatusOut(BaseModel):
+    id: str
+    project_id: str
+    total: int
+    status_counts: dict[str, int]
+    finished: int
+    progress: float
+    done: bool
+    created_at: str
 
 
 class RunOut(BaseModel):
@@ -220,10 +281,23 @@ class RunOut(BaseModel):
     input_json: dict[str, Any] | None = None
     output_json: dict[str, Any] | None = None
     budget_json: dict[str, Any] | None = None
+    budget_remaining_tokens: int | None = None
+    budget_remaining_cost: float | None = None
+    llm_cache: bool = True
+    batch_id: str | None = None
+    priority: str = "interactive"
+    # Set while the run waits for a worker slot; position 0 is dispatched next.
+    queue_position: int | None = None
+    estimated_start_at: str | None = None
     started_at: str
     finished_at: str | None = None
 
 
+class RunListResponse(BaseModel):
+    items: list[RunOut]
+    next_after: str | None = None
+
+
 class RunStepOut(BaseModel):
     id: str
     run_id: str
@@ -231,12 +305,15 @@ class RunStepOut(BaseModel):
     step_type: str
     role: str | None = None
     status: str
+    depends_on: list[str] = Field(default_factory=list)
     requires_approval: bool
     approval_status: str
     override_payload_json: dict[str, Any] | None = None
     input_json: dict[str, Any] | None = None
     output_json: dict[str, Any] | None = None
     budget_json: dict[str, Any] | None = None
+    budget_remaining_tokens: int | None = None
+    budget_remaining_cost: float | None = None
     started_at: str
     finished_at: str | None = None
     error_text: str | None = None
@@ -246,7 +323,88 @@ class RunStepListResponse(BaseModel):
     items: list[RunStepOut]
 
 
+class RunEventOut(BaseModel):
+    id: str
+    run_id: str
+    step_id: str | None = None
+    event_type: str
+    status: str
+    payload_json: dict[str, Any] | None = None
+    created_at: str
+
+
+class RunEventListResponse(BaseModel):
+    items: list[RunEventOut]
+    next_since: str | None = None
+
+
+class RunStepApprove(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # Select steps only: the draft step to finalize instead of the automatic pick.
+    selected_step_id: str | None = Field(default=None, min_length=1)
+
+
 class RunStepOverride(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     content_text: str = Field(min_length=1)
+
+
+class LlmProviderCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # Runs select the provider by this id (``input_json.provider_id``); generated when omitted.
+    id: str | None = Field(default=None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_.:-]+$")
+    name: str = Field(min_length=1, max_length=200)
+    base_url: str = Field(min_length=1, max_length=2000)
+    config_json: dict[str, Any] | None = None
+
+
+class LlmProviderOut(BaseModel):
+    id: str
+    name: str
+    base_url: str | None = None
+    config_json: dict[str, Any] | None = None
+    created_at: str
+    updated_at: str
+
+
+class LlmProviderListResponse(BaseModel):
+    items: list[LlmProviderOut]
+
+
+class LlmModelCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    model_name: str = Field(min_length=1, max_length=200)
+    capabilities_json: dict[str, Any] | None = None
+
+
+class LlmModelOut(BaseModel):
+    id: str
+    provider_id: str
+    model_name: str
+    capabilities_json: dict[str, Any] | None = None
+    created_at: str
+    updated_at: str
+
+
+class LlmModelListResponse(BaseModel):
+    items: list[LlmModelOut]
+
+
+class ExecutorLaneMetrics(BaseModel):
+    max_workers: int
+    max_queue: int
+    queued: int
+    active: int
+    completed: int
+    rejected: int
+    peak_queued: int
+    avg_wait_ms: float
+
+
+class DbMetricsOut(BaseModel):
+    read: ExecutorLaneMetrics
+    write: ExecutorLaneMetrics
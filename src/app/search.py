@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+
+# Trigram handles CJK text, which has no word boundaries for unicode61 to split on.
+# It only matches terms of three or more characters; shorter terms fall back to a
+# substring scan over the project's documents.
+_TRIGRAM_MIN_CHARS = 3
+_SNIPPET_TOKENS = 24
+_SNIPPET_CONTEXT_CHARS = 32
+MARK_OPEN = "<mark>"
+MARK_CLOSE = "</mark>"
+
+
+def uses_trigram(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'search_index'").fetchone()
+    return row is not None and "trigram" in row[0]
+
+
+def _upsert_document(
+    conn: sqlite3.Connection,
+    source_kind: str,
+    source_id: str,
+    project_id: str,
+    chapter_id: str,
+    title: str | None,
+    body: str | None,
+) -> None:
+    row = conn.execute("SELECT id FROM search_documents WHERE source_id = ?", (source_id,)).fetchone()
+    if row is None:
+        doc_id = conn.execute(
+            "INSERT INTO search_documents (source_kind, source_id, project_id, chapter_id) VALUES (?, ?, ?, ?)",
+            (source_kind, source_id, project_id, chapter_id),
+        ).lastrowid
+    else:
+        doc_id = row[0]
+        conn.execute("DELETE FROM search_index WHERE rowid = ?", (doc_id,))
+    conn.execute(
+        "INSERT INTO search_index (rowid, title, body) VALUES (?, ?, ?)",
+        (doc_id, title or "", body or ""),
+    )
+
+
+def remove_document(conn: sqlite3.Connection, source_id: str) -> None:
+    row = conn.execute("SELECT id FROM search_documents WHERE source_id = ?", (source_id,)).fetchone()
+    if row is None:
+        return
+    conn.execute("DELETE FROM search_index WHERE rowid = ?", (row[0],))
+    conn.execute("DELETE FROM search_documents WHERE id = ?", (row[0],))
+
+
+def index_chapter_version(
+    conn: sqlite3.Connection,
+    project_id: str,
+    chapter_id: str,
+    version_id: str,
+    title: str | None,
+    content_text: str,
+) -> None:
+    """Make ``version_id`` the only indexed version of its chapter."""
+    stale = conn.execute(
+        "SELECT source_id FROM search_documents "
+        "WHERE chapter_id = ? AND source_kind = 'version' AND source_id != ?",
+        (chapter_id, version_id),
+    ).fetchall()
+    for row in stale:
+        remove_document(conn, row[0])
+    _upsert_document(conn, "version", version_id, project_id, chapter_id, title, content_text)
+
+
+def index_segment(
+    conn: sqlite3.Connection,
+    project_id: str,
+    chapter_id: str,
+    segment_id: str,
+    title: str | None,
+    content_text: str | None,
+    is_deleted: bool = False,
+) -> None:
+    if is_deleted:
+        remove_document(conn, segment_id)
+        return
+    _upsert_document(conn, "segment", segment_id, project_id, chapter_id, title, content_text)
+
+
+def retitle_chapter(conn: sqlite3.Connection, chapter_id: str, title: str | None) -> None:
+    conn.execute(
+        "UPDATE search_index SET title = ? WHERE rowid IN ("
+        "SELECT id FROM search_documents WHERE chapter_id = ? AND source_kind = 'version')",
+        (title or "", chapter_id),
+    )
+
+
+@dataclass(frozen=True)
+class SearchRow:
+    doc_id: int
+    score: float
+    source_kind: str
+    source_id: str
+    chapter_id: str
+    title: str
+    snippet: str
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _substring_snippet(body: str, terms: list[str]) -> str:
+    lowered = body.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    hits = [(pos, term) for pos, term in zip(positions, terms) if pos >= 0]
+    if not hits:
+        return body[: _SNIPPET_CONTEXT_CHARS * 2]
+    pos, term = min(hits)
+    start = max(0, pos - _SNIPPET_CONTEXT_CHARS)
+    end = min(len(body), pos + len(term) + _SNIPPET_CONTEXT_CHARS)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(body) else ""
+    return (
+        prefix
+        + body[start:pos]
+        + MARK_OPEN
+        + body[pos : pos + len(term)]
+        + MARK_CLOSE
+        + body[pos + len(term) : end]
+        + suffix
+    )
+
+
+def encode_cursor(row: SearchRow) -> str:
+    return f"{row.score!r}:{row.doc_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[float, int]:
+    score_text, _, doc_text = cursor.rpartition(":")
+    return float(score_text), int(doc_text)
+
+
+def search(
+    conn: sqlite3.Connection,
+    project_id: str,
+    query: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+    source_kind: str | None = None,
+) -> list[SearchRow]:
+    """BM25-ranked hits ordered by ``(score, doc_id)`` for keyset pagination.
+
+    Returns up to ``limit + 1`` rows so callers can tell whether another page exists.
+    """
+    terms = [term for term in query.split() if term]
+    if not terms:
+        return []
+    trigram = uses_trigram(conn)
+    match_terms = [term for term in terms if not trigram or len(term) >= _TRIGRAM_MIN_CHARS]
+    scan_terms = [term for term in terms if term not in match_terms]
+
+    filters = ["d.project_id = ?"]
+    values: list[object] = [project_id]
+    if source_kind is not None:
+        filters.append("d.source_kind = ?")
+        values.append(source_kind)
+    for term in scan_terms:
+        filters.append("(instr(lower(f.title), lower(?)) > 0 OR instr(lower(f.body), lower(?)) > 0)")
+        values.extend([term, term])
+
+    if match_terms:
+        inner = (
+            "SELECT f.rowid AS doc_id, bm25(search_index, 2.0, 1.0) AS score, "
+            f"snippet(search_index, 1, '{MARK_OPEN}', '{MARK_CLOSE}', '…', {_SNIPPET_TOKENS}) AS snippet, "
+            "f.title AS title, f.body AS body, d.source_kind, d.source_id, d.chapter_id "
+            "FROM search_index f JOIN search_documents d ON d.id = f.rowid "
+            f"WHERE search_index MATCH ? AND {' AND '.join(filters)}"
+        )
+        values.insert(0, " AND ".join(_fts_phrase(term) for term in match_terms))
+    else:
+        inner = (
+            "SELECT f.rowid AS doc_id, 0.0 AS score, NULL AS snippet, "
+            "f.title AS title, f.body AS body, d.source_kind, d.source_id, d.chapter_id "
+            "FROM search_index f JOIN search_documents d ON d.id = f.rowid "
+            f"WHERE {' AND '.join(filters)}"
+        )
+
+    outer_where = ""
+    if after is not None:
+        outer_where = "WHERE score > ? OR (score = ? AND doc_id > ?) "
+        values.extend([after[0], after[0], after[1]])
+    rows = conn.execute(
+        f"SELECT * FROM ({inner}) {outer_where}ORDER BY score, doc_id LIMIT ?",
+        (*values, limit + 1),
+    ).fetchall()
+
+    results = []
+    for row in rows:
+        snippet = row["snippet"]
+        if scan_terms and (not snippet or MARK_OPEN not in snippet):
+            snippet = _substring_snippet(row["body"], scan_terms)
+        results.append(
+            SearchRow(
+                doc_id=row["doc_id"],
+                score=row["score"],
+                source_kind=row["source_kind"],
+                source_id=row["source_id"],
+                chapter_id=row["chapter_id"],
+                title=row["title"],
+                snippet=snippet or "",
+            )
+        )
+    return results
+
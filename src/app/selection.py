@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+
+SELECT_STRATEGIES = ("min_issues", "weighted_score", "human_only")
+
+# Review score dimensions and their weights for ``weighted_score`` (runtime B6 / review notes 3.5).
+DEFAULT_SCORE_WEIGHTS = {"consistency": 0.4, "style": 0.3, "progress": 0.3}
+
+
+def parse_review_report(text: str) -> dict[str, object]:
+    """A review step's reply as a report; replies that are not a JSON object become a plain summary."""
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        return {"summary": text.strip(), "issues": []}
+    return parsed
+
+
+def issue_count(report: dict[str, object]) -> int:
+    issues = report.get("issues")
+    return len(issues) if isinstance(issues, list) else 0
+
+
+def weighted_score(report: dict[str, object], weights: dict[str, float] = DEFAULT_SCORE_WEIGHTS) -> float | None:
+    """Weighted mean of the report's numeric ``scores``; a bare numeric ``score`` is used as is."""
+    scores = report.get("scores")
+    if isinstance(scores, dict):
+        rated = [
+            (weight, float(value))
+            for name, weight in weights.items()
+            if isinstance(value := scores.get(name), (int, float)) and not isinstance(value, bool)
+        ]
+        if rated:
+            return sum(weight * value for weight, value in rated) / sum(weight for weight, _ in rated)
+    score = report.get("score")
+    if isinstance(score, (int, float)) and not isinstance(score, bool):
+        return float(score)
+    return None
+
+
+@dataclass
+class DraftCandidate:
+    step_id: str
+    draft_no: int
+    chapter_version_id: str
+    content_text: str
+    reports: list[dict[str, object]] = field(default_factory=list)
+
+    @property
+    def issues(self) -> float:
+        """Mean issues per review, so drafts are compared on the same scale whatever ``review_n`` is."""
+        if not self.reports:
+            return 0.0
+        return sum(issue_count(report) for report in self.reports) / len(self.reports)
+
+    @property
+    def score(self) -> float | None:
+        scores = [score for report in self.reports if (score := weighted_score(report)) is not None]
+        return sum(scores) / len(scores) if scores else None
+
+    def summary(self) -> dict[str, object]:
+        return {
+            "step_id": self.step_id,
+            "draft_no": self.draft_no,
+            "chapter_version_id": self.chapter_version_id,
+            "review_count": len(self.reports),
+            "issues": self.issues,
+            "score": self.score,
+        }
+
+
+def _negated_score(candidate: DraftCandidate) -> float:
+    return -candidate.score if candidate.score is not None else float("inf")
+
+
+def rank_candidates(candidates: list[DraftCandidate], strategy: str) -> list[DraftCandidate]:
+    """Best draft first. Unscored drafts rank last on score; ties fall back to draft order.
+
+    ``human_only`` keeps draft order: nothing is chosen automatically.
+    """
+    if strategy == "min_issues":
+        return sorted(candidates, key=lambda c: (c.issues, _negated_score(c), c.draft_no))
+    if strategy == "weighted_score":
+        return sorted(candidates, key=lambda c: (_negated_score(c), c.issues, c.draft_no))
+    if strategy == "human_only":
+        return sorted(candidates, key=lambda c: c.draft_no)
+    raise ValueError(f"Unknown select strategy {strategy}.")
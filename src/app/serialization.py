@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import types
+import typing
+from typing import Any, Iterable, Mapping, Sequence
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+
+def _field_kind(annotation: Any) -> str:
+    """How a field is written: "bool" and "float" coerce SQLite values, "json" copies stored JSON text."""
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        (annotation,) = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    base = typing.get_origin(annotation) or annotation
+    if base is bool:
+        return "bool"
+    if base is float:
+        return "float"
+    if base in (dict, list):
+        return "json"
+    return "value"
+
+
+class RowEncoder:
+    """Writes database rows as JSON objects of one output schema, without building models.
+
+    List endpoints used to parse every JSON column, build a pydantic model per row and
+    have FastAPI validate and serialize it all again through ``response_model``. Rows
+    we wrote ourselves need none of that: the encoder is compiled once from the
+    schema's fields, copies JSON columns (stored by ``json.dumps``) into the output
+    as they are, turns SQLite's 0/1 into booleans, and writes everything else with
+    pydantic-core's ``to_json``, so values come out exactly as FastAPI wrote them.
+    ``columns`` maps fields whose column is named differently; fields that are not
+    columns at all are passed to ``encode`` as keyword values (``computed`` in
+    ``encode_page``). A NULL JSON column is written as the field default. ``fields``
+    limits the output to those fields (see ``select``).
+    """
+
+    # Distinct field selections compiled per encoder; ``fields=`` combinations beyond it are compiled per request.
+    MAX_SELECTIONS = 64
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        columns: Mapping[str, str] | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> None:
+        self.model = model
+        self._columns = dict(columns or {})
+        self._selections: dict[tuple[str, ...], RowEncoder] = {}
+        selected = set(model.model_fields if fields is None else fields)
+        # Per field: its key with the separator in front, name, column, kind and NULL JSON text.
+        self._fields: list[tuple[bytes, str, str, str, bytes]] = []
+        for name, info in model.model_fields.items():
+            if name not in selected:
+                continue
+            position = len(self._fields)
+            key = (b"{" if position == 0 else b",") + to_json(name) + b":"
+            missing = b"null" if info.is_required() else to_json(info.get_default(call_default_factory=True))
+            self._fields.append((key, name, self._columns.get(name, name), _field_kind(info.annotation), missing))
+
+    @property
+    def select_list(self) -> str:
+        """The SELECT list of the columns this encoder reads, in schema order."""
+        return ", ".join(column for _, _, column, _, _ in self._fields)
+
+    def select(self, fields: tuple[str, ...]) -> RowEncoder:
+        """An encoder writing only ``fields``; rows then only need those fields' columns."""
+        encoder = self._selections.get(fields)
+        if encoder is None:
+            encoder = RowEncoder(self.model, self._columns, fields)
+            if len(self._selections) < self.MAX_SELECTIONS:
+                self._selections[fields] = encoder
+        return encoder
+
+    def encode(self, row: Mapping[str, Any], **values: Any) -> bytes:
+        out: list[bytes] = []
+        self._write(out, row, values)
+        return b"".join(out)
+
+    def _write(self, out: list[bytes], row: Mapping[str, Any], values: Mapping[str, Any]) -> None:
+        if not self._fields:
+            out.append(b"{")
+        for key, name, column, kind, missing in self._fields:
+            value = values[name] if name in values else row[column]
+            out.append(key)
+            if value is None:
+                out.append(missing if kind == "json" else b"null")
+            elif kind == "json":
+                out.append(value.encode("utf-8") if isinstance(value, str) else to_json(value))
+            elif kind == "bool":
+                out.append(b"true" if value else b"false")
+            elif kind == "float":
+                out.append(to_json(float(value)))
+            else:
+                out.append(to_json(value))
+        out.append(b"}")
+
+
+def encode_page(
+    encoder: RowEncoder,
+    rows: Sequence[Mapping[str, Any]],
+    computed: Sequence[Mapping[str, Any]] | None = None,
+    **fields: Any,
+) -> bytes:
+    """A list response body: ``rows`` as ``items`` plus top-level fields such as ``next_after``.
+
+    ``computed`` holds each row's non-column field values. The whole page is joined
+    once, so long texts are copied a single time.
+    """
+    out = [b'{"items":[']
+    for index, row in enumerate(rows):
+        if index:
+            out.append(b",")
+        encoder._write(out, row, computed[index] if computed is not None else {})
+    out.append(b"]")
+    for name, value in fields.items():
+        out.append(b"," + to_json(name) + b":" + to_json(value))
+    out.append(b"}")
+    return b"".join(out)
+
+
+class RawJSONResponse(Response):
+    """A body that is already JSON text; FastAPI sends it without validating or re-encoding it."""
+
+    media_type = "application/json"
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Generic, TypeVar
+
+from app.cancellation import CallCancelled, CancellationToken
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving while it is
+    in flight block on the leader's future and receive the same result or exception.
+    Nothing is remembered once the leader finishes, so this only deduplicates work
+    that overlaps in time; the response cache covers repeats after the fact.
+
+    A leader whose ``token`` is cancelled gives up the key at once: its followers get
+    :class:`CallCancelled` and the next caller leads a fresh execution, even while the
+    abandoned one is still winding down.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future[T]] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], T], token: CancellationToken | None = None) -> tuple[T, bool]:
+        """Return ``(result, is_leader)``."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                self.leaders += 1
+                leader = True
+            else:
+                self.followers += 1
+                leader = False
+
+        if not leader:
+            return future.result(), False
+
+        if token is not None:
+            token.add_callback(lambda: self._abandon(key, future, CallCancelled(token.reason or "cancelled")))
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._settle(future, exc)
+            raise
+        else:
+            self._settle(future, result)
+            return result, True
+        finally:
+            self._release(key, future)
+
+    def _release(self, key: str, future: Future[T]) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _abandon(self, key: str, future: Future[T], exc: BaseException) -> None:
+        self._release(key, future)
+        self._settle(future, exc)
+
+    @staticmethod
+    def _settle(future: Future[T], result: object) -> None:
+        try:
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass  # Already abandoned, or finished just before the abandon landed.
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+from app.db import env_float
+
+
+def checkpoint_seconds() -> float:
+    return env_float("WRITER_STREAM_CHECKPOINT_SECONDS", 2.0)
+
+
+class TextStream:
+    """Text streamed so far for one LLM call of a run step."""
+
+    def __init__(self, run_id: str, step_id: str) -> None:
+        self.run_id = run_id
+        self.step_id = step_id
+        self._lock = threading.Lock()
+        self._parts: list[str] = []
+        self._joined = ""
+        self._dirty = False
+        self.finished = False
+
+    def append(self, delta: str) -> None:
+        with self._lock:
+            self._parts.append(delta)
+            self._dirty = True
+
+    def text(self) -> str:
+        with self._lock:
+            if self._dirty:
+                self._joined = "".join(self._parts)
+                self._parts = [self._joined]
+                self._dirty = False
+            return self._joined
+
+    def finish(self) -> None:
+        self.finished = True
+
+
+class StreamHub:
+    """In-process registry of live text streams, keyed by run id.
+
+    Only the process driving a run sees its stream; other processes (and clients
+    that connect after the call ends) read the checkpoints in ``run_steps.output_json``.
+    A run streams one step at a time: steps opened while another is live get a
+    stream that is checkpointed but not registered.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._streams: dict[str, TextStream] = {}
+
+    def open(self, run_id: str, step_id: str) -> TextStream:
+        stream = TextStream(run_id, step_id)
+        with self._lock:
+            live = self._streams.get(run_id)
+            if live is None or live.finished:
+                self._streams[run_id] = stream
+        return stream
+
+    def get(self, run_id: str) -> TextStream | None:
+        with self._lock:
+            return self._streams.get(run_id)
+
+    def close(self, stream: TextStream) -> None:
+        stream.finish()
+        with self._lock:
+            if self._streams.get(stream.run_id) is stream:
+                del self._streams[stream.run_id]
+
+
+_hub = StreamHub()
+
+
+def get_stream_hub() -> StreamHub:
+    return _hub
+
+
+class StreamCheckpointer:
+    """Chunk callback that feeds a :class:`TextStream` and flushes it in batches.
+
+    ``flush`` receives the full text so far at most once per ``interval`` seconds,
+    so a crash mid-stream loses at most that much output.
+    """
+
+    def __init__(self, stream: TextStream, flush: Callable[[str], None], interval: float) -> None:
+        self.stream = stream
+        self.flush = flush
+        self.interval = interval
+        self.flushes = 0
+        self._last_flush = time.monotonic()
+
+    def __call__(self, delta: str) -> None:
+        self.stream.append(delta)
+        now = time.monotonic()
+        if now - self._last_flush >= self.interval:
+            self._last_flush = now
+            self.flushes += 1
+            self.flush(self.stream.text())
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+# Every stored timestamp is UTC in this one format, so they also compare correctly as text.
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def iso(moment: datetime) -> str:
+    return moment.strftime(ISO_FORMAT)
+
+
+def utc_now_iso() -> str:
+    return iso(utc_now())
+
+
+def parse_iso(value: str) -> datetime:
+    return datetime.strptime(value, ISO_FORMAT).replace(tzinfo=timezone.utc)
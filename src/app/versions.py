@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import difflib
+import json
+import os
+import sqlite3
+
+from app.blobs import get_text, get_texts, put_text, text_cache, text_hash
+from app.ulid import new_ulid
+
+STORAGE_MODES = ("full", "delta")
+
+VERSION_COLUMNS = (
+    "id, chapter_id, version_no, stage, content_text, content_hash, char_count, storage_kind, base_version_id, "
+    "delta_hash, delta_depth, source_run_id, source_step_id, created_at"
+)
+
+
+def _storage_mode() -> str:
+    mode = os.getenv("WRITER_VERSION_STORAGE", "full").strip().lower()
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"WRITER_VERSION_STORAGE must be one of {', '.join(STORAGE_MODES)}.")
+    return mode
+
+
+def _keyframe_interval() -> int:
+    return max(1, int(os.getenv("WRITER_VERSION_KEYFRAME_INTERVAL", "10")))
+
+
+def make_delta(base: str, target: str) -> list[list[object]]:
+    """Line-level edit script turning ``base`` into ``target``.
+
+    ``["c", i1, i2]`` copies base lines ``i1:i2``; ``["i", text]`` inserts literal text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(a=base_lines, b=target_lines, autojunk=False)
+    ops: list[list[object]] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["i", "".join(target_lines[j1:j2])])
+    return ops
+
+
+def apply_delta(base: str, ops: list[list[object]]) -> str:
+    base_lines = base.splitlines(keepends=True)
+    parts: list[str] = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1] : op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+def _latest_version(conn: sqlite3.Connection, chapter_id: str) -> sqlite3.Row | None:
+    return conn.execute(
+        f"SELECT {VERSION_COLUMNS} FROM chapter_text_versions WHERE chapter_id = ? "
+        "ORDER BY version_no DESC LIMIT 1",
+        (chapter_id,),
+    ).fetchone()
+
+
+def insert_text_version(
+    conn: sqlite3.Connection,
+    chapter_id: str,
+    stage: str,
+    content_text: str,
+    source_run_id: str | None,
+    source_step_id: str | None,
+    created_at: str,
+) -> tuple[str, int]:
+    """Append a version of ``content_text`` and return ``(version_id, version_no)``.
+
+    In ``delta`` mode a version is stored as an edit script against its predecessor
+    unless the body already exists as a blob, the chain has reached the keyframe
+    interval, or the script would not be meaningfully smaller than the text.
+    """
+    latest = _latest_version(conn, chapter_id)
+    version_no = 1 if latest is None else latest["version_no"] + 1
+    digest = text_hash(content_text)
+
+    storage_kind = "full"
+    base_version_id = None
+    delta_hash = None
+    delta_depth = 0
+    if (
+        _storage_mode() == "delta"
+        and latest is not None
+        and latest["delta_depth"] + 1 < _keyframe_interval()
+        and conn.execute("SELECT 1 FROM text_blobs WHERE hash = ?", (digest,)).fetchone() is None
+    ):
+        base_text = load_version_texts(conn, [latest])[0]
+        delta_text = json.dumps(make_delta(base_text, content_text), ensure_ascii=False, separators=(",", ":"))
+        if len(delta_text) * 2 < len(content_text):
+            storage_kind = "delta"
+            base_version_id = latest["id"]
+            delta_hash = put_text(conn, delta_text)
+            delta_depth = latest["delta_depth"] + 1
+            text_cache.put(digest, content_text)
+
+    if storage_kind == "full":
+        put_text(conn, content_text)
+
+    version_id = new_ulid("chv")
+    conn.execute(
+        "INSERT INTO chapter_text_versions ("
+        "id, chapter_id, version_no, stage, content_text, content_hash, char_count, storage_kind, base_version_id, "
+        "delta_hash, delta_depth, source_run_id, source_step_id, created_at"
+        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            version_id,
+            chapter_id,
+            version_no,
+            stage,
+            "",
+            digest,
+            len(content_text),
+            storage_kind,
+            base_version_id,
+            delta_hash,
+            delta_depth,
+            source_run_id,
+            source_step_id,
+            created_at,
+        ),
+    )
+    return version_id, version_no
+
+
+def load_version_texts(conn: sqlite3.Connection, rows: list[sqlite3.Row]) -> list[str]:
+    """Return the full text of each version row, rebuilding delta chains as needed.
+
+    Rows must carry ``VERSION_COLUMNS``. Bodies resolved once are cached by content
+    hash, so a chain is only replayed on the first read after a cold start.
+    """
+    blobs = get_texts(conn, [row["content_hash"] for row in rows if row["content_hash"]])
+    resolved: dict[str, str] = {}
+    return [_resolve(conn, row, blobs, resolved) for row in rows]
+
+
+def _known_text(row: sqlite3.Row, blobs: dict[str, str], resolved: dict[str, str]) -> str | None:
+    if row["id"] in resolved:
+        return resolved[row["id"]]
+    digest = row["content_hash"]
+    if digest is None:
+        return row["content_text"]
+    if digest in blobs:
+        return blobs[digest]
+    return text_cache.get(digest)
+
+
+def _resolve(
+    conn: sqlite3.Connection,
+    row: sqlite3.Row,
+    blobs: dict[str, str],
+    resolved: dict[str, str],
+) -> str:
+    # Walk back to the nearest body we already have (or a keyframe), then replay the
+    # deltas forward; a loop, so chain length is not bounded by the recursion limit.
+    chain: list[sqlite3.Row] = []
+    text = _known_text(row, blobs, resolved)
+    while text is None and row["storage_kind"] == "delta":
+        chain.append(row)
+        row = conn.execute(
+            f"SELECT {VERSION_COLUMNS} FROM chapter_text_versions WHERE id = ?",
+            (row["base_version_id"],),
+        ).fetchone()
+        text = _known_text(row, blobs, resolved)
+    if text is None:
+        text = get_text(conn, row["content_hash"])
+    resolved[row["id"]] = text
+    for delta_row in reversed(chain):
+        text = apply_delta(text, json.loads(get_text(conn, delta_row["delta_hash"])))
+        if text_hash(text) != delta_row["content_hash"]:
+            raise ValueError(f"Delta reconstruction of version {delta_row['id']} does not match its hash.")
+        text_cache.put(delta_row["content_hash"], text)
+        resolved[delta_row["id"]] = text
+    return text
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import threading
+
+from app.db import close_pools, close_writers, env_float, env_int, init_db, run_write
+from app.hedging import reset_hedging
+from app.leases import WORKER_ID, lease_seconds, reclaim_expired_leases, stop_heartbeat
+from app.llm_cache import reset_response_cache
+from app.main import _drive_run
+from app.providers import reset_provider_registry
+from app.rate_limit import reset_rate_limiters
+from app.run_executor import RunExecutor, shutdown_step_executor
+from app.scheduler import claim_scheduled_runs
+
+logger = logging.getLogger("app.worker")
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="writer-worker",
+        description="Claim running runs from the database under a lease and drive them to a stable state.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=env_int("WRITER_RUN_WORKERS", 4),
+        help="Runs driven at once by this process (default: WRITER_RUN_WORKERS or 4).",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=env_float("WRITER_WORKER_POLL_SECONDS", 1.0),
+        help="Seconds to sleep when no run is claimable (default: 1.0).",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Exit once no claimable run is left instead of polling forever.",
+    )
+    return parser.parse_args(argv)
+
+
+def run_worker(concurrency: int, poll_interval: float, once: bool = False, stop: threading.Event | None = None) -> int:
+    """Claim and drive runs until ``stop`` is set (or, with ``once``, until idle).
+
+    Returns the number of runs this worker claimed.
+    """
+    stop = stop or threading.Event()
+    init_db()
+    reset_response_cache()
+    reset_rate_limiters()
+    reset_hedging()
+    reclaimed = run_write(reclaim_expired_leases)
+    if reclaimed:
+        logger.info("Reclaimed %d expired run lease(s): %s", len(reclaimed), ", ".join(reclaimed))
+
+    executor = RunExecutor(max_workers=concurrency)
+    claimed_total = 0
+    try:
+        while not stop.is_set():
+            free = concurrency - executor.pending()
+            claimed: list[str] = []
+            if free > 0:
+                claimed = run_write(lambda conn: claim_scheduled_runs(conn, WORKER_ID, free, lease_seconds()))
+            for run_id in claimed:
+                executor.submit(run_id, _drive_run)
+            claimed_total += len(claimed)
+            if claimed:
+                continue
+            if once and executor.wait_idle(timeout=0):
+                break
+            stop.wait(poll_interval)
+    finally:
+        executor.shutdown()
+        shutdown_step_executor()
+        reset_provider_registry()
+        stop_heartbeat()
+    return claimed_total
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    logger.info("Worker %s starting with concurrency %d.", WORKER_ID, args.concurrency)
+    try:
+        claimed = run_worker(args.concurrency, args.poll_interval, once=args.once, stop=stop)
+    finally:
+        close_writers()
+        close_pools()
+    logger.info("Worker %s stopped after claiming %d run(s).", WORKER_ID, claimed)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from typing import Callable
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.run_executor import get_run_executor
+from app.scheduler import get_run_dispatcher
+
+
+@pytest.fixture
+def wait_for_run() -> Callable[[TestClient, str], dict]:
+    """Block until nothing is left to dispatch and run workers are idle, then return the run."""
+
+    def wait(client: TestClient, run_id: str, timeout: float = 5.0) -> dict:
+        dispatcher = get_run_dispatcher()
+        assert dispatcher.drain(timeout) if dispatcher is not None else get_run_executor().wait_idle(timeout)
+        resp = client.get(f"/runs/{run_id}")
+        assert resp.status_code == 200
+        return resp.json()
+
+    return wait
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app.blobs import TextCache, get_text, text_cache, text_hash
+from app.db import get_connection, init_db
+from app.main import app
+from app.migrations import migrate
+from app.versions import VERSION_COLUMNS, apply_delta, insert_text_version, load_version_texts, make_delta
+
+
+def _revision(version_no: int) -> str:
+    paragraphs = [f"第{idx}段：山门外的风雪没有停。" * 4 + "\n" for idx in range(40)]
+    paragraphs[version_no % 40] = f"第{version_no}次修订的段落。\n"
+    return "".join(paragraphs)
+
+
+def test_text_cache_evicts_least_recently_used_by_size() -> None:
+    cache = TextCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+
+
+def test_text_cache_bounds_cjk_text_by_bytes_not_characters() -> None:
+    # Three 4-character CJK bodies are 12 characters but 36 bytes of UTF-8.
+    cache = TextCache(max_bytes=30)
+    cache.put("a", "雪夜无声")
+    cache.put("b", "风起云涌")
+    assert cache.get("a") == "雪夜无声"
+    cache.put("c", "长篇小说")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "雪夜无声"
+    assert cache.get("c") == "长篇小说"
+    # A body larger than the whole bound in bytes is never cached, however few characters it has.
+    cache.put("d", "雪" * 11)
+    assert cache.get("d") is None
+
+
+def test_migration_moves_inline_version_text_into_blobs(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+
+    conn = get_connection()
+    try:
+        conn.execute(
+            "INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_1', 'P', 'now', 'now')"
+        )
+        conn.execute(
+            "INSERT INTO chapters (id, project_id, chapter_no, created_at, updated_at) "
+            "VALUES ('ch_1', 'proj_1', 1, 'now', 'now')"
+        )
+        for version_no in range(1, 6):
+            body = "repeated body" if version_no % 2 else f"unique body {version_no}"
+            conn.execute(
+                "INSERT INTO chapter_text_versions (id, chapter_id, version_no, stage, content_text, created_at) "
+                "VALUES (?, 'ch_1', ?, 'final', ?, 'now')",
+                (f"chv_{version_no}", version_no, body),
+            )
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+
+        migrate(conn, batch_size=2)
+
+        rows = conn.execute(
+            "SELECT content_text, content_hash FROM chapter_text_versions ORDER BY version_no"
+        ).fetchall()
+        assert all(row["content_text"] == "" for row in rows)
+        assert rows[0]["content_hash"] == text_hash("repeated body")
+        assert get_text(conn, rows[3]["content_hash"]) == "unique body 4"
+        assert conn.execute("SELECT COUNT(*) FROM text_blobs").fetchone()[0] == 3
+    finally:
+        conn.close()
+
+
+def test_delta_roundtrip_preserves_text_exactly() -> None:
+    base = "line one\nline two\nline three"
+    target = "line zero\nline one\nline 2\nline three\n"
+    assert apply_delta(base, make_delta(base, target)) == target
+    assert apply_delta("", make_delta("", target)) == target
+    assert apply_delta(base, make_delta(base, "")) == ""
+
+
+def test_delta_storage_keeps_keyframes_and_reconstructs(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_VERSION_STORAGE", "delta")
+    monkeypatch.setenv("WRITER_VERSION_KEYFRAME_INTERVAL", "4")
+    counter = {"n": 0}
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        counter["n"] += 1
+        return {"content_text": _revision(counter["n"])}
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Delta Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            for _ in range(9):
+                run = client.post(
+                    "/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id, "llm_cache": False}
+                )
+                assert run.status_code == 200
+                wait_for_run(client, run.json()["id"])
+
+            with get_connection() as conn:
+                kinds = [
+                    (row["storage_kind"], row["delta_depth"])
+                    for row in conn.execute(
+                        "SELECT storage_kind, delta_depth FROM chapter_text_versions ORDER BY version_no"
+                    )
+                ]
+            assert kinds == [
+                ("full", 0), ("delta", 1), ("delta", 2), ("delta", 3),
+                ("full", 0), ("delta", 1), ("delta", 2), ("delta", 3),
+                ("full", 0),
+            ]
+
+            text_cache.clear()
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert [version["content_text"] for version in versions] == [_revision(n) for n in range(1, 10)]
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_long_delta_chain_is_rebuilt_without_recursion(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_VERSION_STORAGE", "delta")
+    monkeypatch.setenv("WRITER_VERSION_KEYFRAME_INTERVAL", "5000")
+    init_db()
+
+    conn = get_connection()
+    try:
+        conn.execute("INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_1', 'P', 'now', 'now')")
+        conn.execute(
+            "INSERT INTO chapters (id, project_id, chapter_no, created_at, updated_at) "
+            "VALUES ('ch_1', 'proj_1', 1, 'now', 'now')"
+        )
+        versions = 1200
+        for version_no in range(1, versions + 1):
+            insert_text_version(conn, "ch_1", "final", _revision(version_no), None, None, "now")
+        conn.commit()
+        rows = conn.execute(
+            f"SELECT {VERSION_COLUMNS} FROM chapter_text_versions ORDER BY version_no DESC LIMIT 1"
+        ).fetchall()
+        assert rows[0]["delta_depth"] == versions - 1
+
+        text_cache.clear()
+        assert load_version_texts(conn, rows) == [_revision(versions)]
+    finally:
+        conn.close()
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.budget import call_cost
+from app.db import get_connection, init_db
+from app.main import app
+from app.migrations import migrate
+
+
+def _project_and_chapter(client: TestClient) -> tuple[str, str]:
+    project_id = client.post("/projects", json={"name": "Budget Book"}).json()["id"]
+    chapter_id = client.post(
+        "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+    ).json()["id"]
+    return project_id, chapter_id
+
+
+def test_call_cost_prefers_reported_cost_then_pricing(monkeypatch) -> None:
+    usage = {"prompt_tokens": 1000, "completion_tokens": 500}
+    assert call_cost("m", usage) == 0.0
+    monkeypatch.setenv("WRITER_LLM_PRICING", '{"m": {"prompt_per_1k": 0.5, "completion_per_1k": 2.0}}')
+    assert call_cost("m", usage) == pytest.approx(1.5)
+    assert call_cost("m", {**usage, "cost": 0.1}) == pytest.approx(0.1)
+    assert call_cost("other", usage) == 0.0
+
+
+def test_usage_is_charged_and_projected_into_remaining_columns(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    app.state.llm_generate = lambda request: {
+        "content_text": "Draft",
+        "usage_json": {"prompt_tokens": 100, "completion_tokens": 200, "cost": 0.25},
+    }
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _project_and_chapter(client)
+            budget = {"max_tokens_total": 1000, "max_tokens_step": 500, "max_cost_total": 1.0}
+            run = client.post(
+                "/swarm/run",
+                json={"project_id": project_id, "chapter_id": chapter_id, "budget_json": budget, "llm_cache": False},
+            ).json()
+            assert (run["budget_remaining_tokens"], run["budget_remaining_cost"]) == (1000, 1.0)
+
+            done = wait_for_run(client, run["id"])
+            assert done["status"] == "completed"
+            assert done["budget_remaining_tokens"] == 700
+            assert done["budget_remaining_cost"] == pytest.approx(0.75)
+            step = client.get(f"/runs/{run['id']}/steps").json()["items"][0]
+            assert (step["budget_remaining_tokens"], step["budget_remaining_cost"]) == (200, None)
+
+            unlimited = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+            assert wait_for_run(client, unlimited["id"])["budget_remaining_tokens"] is None
+
+            listed = client.get(f"/projects/{project_id}/runs").json()["items"]
+            assert [item["id"] for item in listed] == [run["id"], unlimited["id"]]
+            low = client.get(f"/projects/{project_id}/runs", params={"max_remaining_tokens": 800}).json()
+            assert [item["id"] for item in low["items"]] == [run["id"]]
+            assert client.get(f"/projects/{project_id}/runs", params={"max_remaining_tokens": 500}).json() == {
+                "items": [],
+                "next_after": None,
+            }
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_call_over_budget_is_refused_before_reaching_the_provider(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    calls = {"n": 0}
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        calls["n"] += 1
+        return {"content_text": "Draft", "usage_json": {"prompt_tokens": 100, "completion_tokens": 200}}
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _project_and_chapter(client)
+            body = {"project_id": project_id, "chapter_id": chapter_id, "llm_cache": False}
+
+            step_capped = client.post("/swarm/run", json={**body, "budget_json": {"max_tokens_step": 5}}).json()
+            failed = wait_for_run(client, step_capped["id"])
+            assert failed["status"] == "failed"
+            assert "Token budget exceeded" in failed["output_json"]["error"]
+            assert "max_tokens_step" in failed["output_json"]["error"]
+
+            spent = client.post("/swarm/run", json={**body, "budget_json": {"max_cost_total": 0}}).json()
+            assert "Cost budget exceeded" in wait_for_run(client, spent["id"])["output_json"]["error"]
+        assert calls["n"] == 0
+
+        with get_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM llm_calls").fetchone()[0] == 0
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_migration_backfills_remaining_budget_from_recorded_usage(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+
+    conn = get_connection()
+    try:
+        conn.execute("INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_1', 'P', 'now', 'now')")
+        for run_id, budget_json in (
+            ("run_1", '{"max_tokens_total": 100, "max_cost_total": 2}'),
+            ("run_2", '{"max_tokens_total": "lots"}'),
+            ("run_3", None),
+        ):
+            conn.execute(
+                "INSERT INTO runs (id, project_id, run_type, status, budget_json, started_at) "
+                "VALUES (?, 'proj_1', 'chapter_write', 'completed', ?, 'now')",
+                (run_id, budget_json),
+            )
+        conn.execute(
+            "INSERT INTO run_steps (id, run_id, step_no, step_type, status, budget_json, started_at) "
+            "VALUES ('step_1', 'run_1', 1, 'draft', 'completed', '{\"max_tokens_step\": 50}', 'now')"
+        )
+        for call_id, status in (("llm_1", "succeeded"), ("llm_2", "cache_hit")):
+            conn.execute(
+                "INSERT INTO llm_calls (id, run_id, step_id, model_id, request_hash, usage_json, status, created_at) "
+                "VALUES (?, 'run_1', 'step_1', 'm', 'h', '{\"prompt_tokens\": 10, \"completion_tokens\": 20, "
+                "\"cost\": 0.5}', ?, 'now')",
+                (call_id, status),
+            )
+        conn.execute("UPDATE runs SET budget_remaining_tokens = NULL, budget_remaining_cost = NULL")
+        conn.execute("UPDATE run_steps SET budget_remaining_tokens = NULL, budget_remaining_cost = NULL")
+        conn.execute("PRAGMA user_version = 8")
+        conn.commit()
+
+        migrate(conn, batch_size=1)
+
+        runs = conn.execute("SELECT id, budget_remaining_tokens, budget_remaining_cost FROM runs ORDER BY id")
+        assert [tuple(row) for row in runs] == [("run_1", 70, 1.5), ("run_2", None, None), ("run_3", None, None)]
+        step = conn.execute("SELECT budget_remaining_tokens, budget_remaining_cost FROM run_steps").fetchone()
+        assert tuple(step) == (20, None)
+    finally:
+        conn.close()
+
+
+def test_steps_admitted_together_reserve_their_estimates(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    calls = {"n": 0}
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        calls["n"] += 1
+        return {"content_text": "Draft", "usage_json": {"prompt_tokens": 100, "completion_tokens": 200}}
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _project_and_chapter(client)
+            body = {"project_id": project_id, "chapter_id": chapter_id, "llm_cache": False, "review_n": 0}
+
+            # Each draft reserves at least 400 tokens, so the third of three no longer fits.
+            budget = {"max_tokens_total": 1000, "completion_reserve_tokens": 400}
+            run = client.post("/swarm/run", json={**body, "draft_n": 3, "budget_json": budget}).json()
+            failed = wait_for_run(client, run["id"])
+            assert failed["status"] == "failed"
+            assert "Token budget exceeded" in failed["output_json"]["error"]
+            # Refusing the third gives back what the first two had reserved.
+            assert failed["budget_remaining_tokens"] == 1000
+            assert calls["n"] == 0
+
+            # Admitted calls settle their reservation against actual usage.
+            run = client.post("/swarm/run", json={**body, "draft_n": 2, "budget_json": budget}).json()
+            assert wait_for_run(client, run["id"])["budget_remaining_tokens"] == 1000 - 2 * 300
+            assert calls["n"] == 2
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
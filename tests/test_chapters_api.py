@@ -4,9 +4,12 @@ from datetime import datetime, timezone
 
 from fastapi.testclient import TestClient
 
+from app.blobs import text_cache, text_hash
 from app.db import get_connection
 from app.main import app
+from app.migrations import LATEST_VERSION, migrate
 from app.ulid import new_ulid
+from app.versions import insert_text_version
 
 
 def _utc_now_iso() -> str:
@@ -174,3 +177,75 @@ def test_chapter_text_versions_and_reviews_list(monkeypatch, tmp_path) -> None:
         assert reviews.status_code == 200
         assert len(reviews.json()["items"]) == 1
         assert reviews.json()["items"][0]["review_type"] == "logic"
+
+
+def test_summary_views_and_field_selection_skip_text_bodies(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    with TestClient(app) as client:
+        project_id = _create_project(client, "Summary Book")
+        chapter_id = client.post(
+            "/chapters",
+            json={"project_id": project_id, "chapter_no": 1, "title": "C1", "plan_json": {"beats": ["a"]}},
+        ).json()["id"]
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 1, "content_text": "雪落无声"})
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 2, "title": "Empty"})
+        texts = ["第一稿。", "第二稿，更长一些。"]
+        with get_connection() as conn:
+            for text in texts:
+                insert_text_version(conn, chapter_id, "final", text, None, None, _utc_now_iso())
+            # Summaries never read the text: they still work once the bodies are gone.
+            conn.execute("DELETE FROM text_blobs")
+            conn.commit()
+        text_cache.clear()
+
+        versions = client.get(f"/chapters/{chapter_id}/text-versions?view=summary").json()["items"]
+        # Ids minted in the same millisecond are not ordered; version_no is.
+        versions.sort(key=lambda version: version["version_no"])
+        assert [(v["char_count"], v["content_hash"]) for v in versions] == [(len(t), text_hash(t)) for t in texts]
+        assert all("content_text" not in version for version in versions)
+        segments = client.get(f"/chapters/{chapter_id}/segments?view=summary").json()["items"]
+        assert [(s["segment_no"], s["char_count"], s["content_hash"]) for s in segments] == [
+            (1, 4, text_hash("雪落无声")),
+            (2, None, None),
+        ]
+        assert "content_text" not in segments[0] and "attrs_json" not in segments[0]
+        full_segment = client.get(f"/chapters/{chapter_id}/segments").json()["items"][0]
+        assert full_segment["content_text"] == "雪落无声" and full_segment["char_count"] == 4
+
+        chapters = client.get(f"/chapters?project_id={project_id}&fields=title,status").json()["items"]
+        assert chapters == [{"id": chapter_id, "title": "C1", "status": "planned"}]
+        assert "plan_json" not in client.get("/chapters?view=summary").json()["items"][0]
+        assert client.get("/projects?fields=name").json()["items"] == [{"id": project_id, "name": "Summary Book"}]
+
+        assert client.get("/chapters?fields=title,bogus").status_code == 422
+        assert client.get("/chapters?fields=title&view=summary").status_code == 422
+        assert client.get("/chapters?view=tiny").status_code == 422
+
+
+def test_content_summaries_are_backfilled(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    with TestClient(app) as client:
+        project_id = _create_project(client, "Legacy Book")
+        chapter_id = client.post("/chapters", json={"project_id": project_id, "chapter_no": 1}).json()["id"]
+        now = _utc_now_iso()
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT INTO chapter_text_versions (id, chapter_id, version_no, stage, content_text, created_at) "
+                "VALUES ('chv_old', ?, 1, 'final', 'legacy text', ?)",
+                (chapter_id, now),
+            )
+            conn.execute(
+                "INSERT INTO chapter_segments (id, chapter_id, segment_no, content_text, created_at, updated_at) "
+                "VALUES ('chseg_old', ?, 1, '旧段落', ?, ?)",
+                (chapter_id, now, now),
+            )
+            conn.execute("PRAGMA user_version = 16")
+            conn.commit()
+            assert migrate(conn) == list(range(17, LATEST_VERSION + 1))
+
+        version = client.get(f"/chapters/{chapter_id}/text-versions?fields=char_count").json()["items"][0]
+        assert version == {"id": "chv_old", "char_count": len("legacy text")}
+        segment = client.get(f"/chapters/{chapter_id}/segments?view=summary").json()["items"][0]
+        assert (segment["char_count"], segment["content_hash"]) == (3, text_hash("旧段落"))
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.blobs import get_text, text_hash
+from app.db import (
+    PoolExhausted,
+    close_pools,
+    close_writers,
+    get_connection,
+    get_pool,
+    get_writer,
+    init_db,
+    pooled_connection,
+    run_write,
+)
+from app.executor import ExecutorSaturated, ReadExecutor
+from app.main import app
+from app.migrations import LATEST_VERSION, MIGRATIONS, migrate, schema_version
+
+
+def test_pooled_connection_is_configured_and_reused(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_DB_BUSY_TIMEOUT_MS", "1234")
+    monkeypatch.setenv("WRITER_DB_CACHE_SIZE", "-4096")
+
+    try:
+        with pooled_connection() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+            assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+            assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+            first_id = id(conn)
+
+        with pooled_connection() as conn:
+            assert id(conn) == first_id
+
+        pool = get_pool()
+        assert pool.opened == 1
+        assert pool.idle_count() == 1
+    finally:
+        close_pools()
+
+
+def test_pool_recycles_expired_and_broken_connections(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_DB_HEALTH_CHECK_SECONDS", "0")
+
+    try:
+        pool = get_pool()
+        conn = pool.acquire()
+        pool.release(conn)
+
+        conn.close()
+        replacement = pool.acquire()
+        assert replacement is not conn
+        assert replacement.execute("SELECT 1").fetchone()[0] == 1
+        pool.release(replacement)
+        assert pool.recycled == 1
+
+        replacement.opened_at -= pool.settings.max_lifetime_seconds + 1
+        fresh = pool.acquire()
+        assert fresh is not replacement
+        pool.release(fresh)
+        assert pool.opened == 3
+    finally:
+        close_pools()
+
+
+def test_pool_keeps_at_most_pool_size_idle(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_DB_POOL_SIZE", "2")
+
+    try:
+        pool = get_pool()
+        conns = [pool.acquire() for _ in range(4)]
+        for conn in conns:
+            pool.release(conn)
+        assert pool.idle_count() == 2
+    finally:
+        close_pools()
+
+
+def test_pool_caps_open_connections_and_waits_for_a_release(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_DB_POOL_MAX_OPEN", "2")
+    monkeypatch.setenv("WRITER_DB_POOL_ACQUIRE_TIMEOUT_SECONDS", "0.2")
+
+    try:
+        pool = get_pool()
+        held = [pool.acquire(), pool.acquire()]
+        with pytest.raises(PoolExhausted):
+            pool.acquire()
+        assert pool.timeouts == 1 and pool.opened == 2
+
+        monkeypatch.setattr(pool, "settings", dataclasses.replace(pool.settings, acquire_timeout_seconds=5.0))
+        threading.Timer(0.05, pool.release, args=(held[0],)).start()
+        assert pool.acquire() is held[0]
+        assert pool.opened == 2
+    finally:
+        close_pools()
+
+
+def test_pooled_read_connections_are_query_only(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    try:
+        with pooled_connection() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("CREATE TABLE scratch (id INTEGER)")
+    finally:
+        close_pools()
+
+
+def test_write_queue_group_commits_and_isolates_failures(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_DB_WRITE_BATCH_WINDOW_MS", "50")
+
+    try:
+        run_write(lambda conn: conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, label TEXT)"))
+        writer = get_writer()
+        batches_before = writer.batches
+
+        gate = threading.Event()
+        blocker = writer.submit(lambda conn: gate.wait(5))
+
+        def insert(label: str):
+            def write(conn: sqlite3.Connection) -> int:
+                cursor = conn.execute("INSERT INTO items (label) VALUES (?)", (label,))
+                if label == "bad":
+                    raise ValueError("rejected")
+                return cursor.lastrowid
+
+            return write
+
+        futures = [writer.submit(insert(label)) for label in ("a", "bad", "b", "c")]
+        gate.set()
+
+        assert blocker.result(timeout=5) is True
+        assert futures[0].result(timeout=5) >= 1
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5) >= 1
+        assert futures[3].result(timeout=5) >= 1
+        assert writer.batches - batches_before <= 2
+
+        with pooled_connection() as conn:
+            labels = [row["label"] for row in conn.execute("SELECT label FROM items ORDER BY id")]
+        assert labels == ["a", "b", "c"]
+    finally:
+        close_writers()
+        close_pools()
+
+
+def test_migrate_applies_once_then_takes_fast_path(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    assert init_db() == list(range(1, LATEST_VERSION + 1))
+
+    conn = get_connection()
+    try:
+        assert schema_version(conn) == LATEST_VERSION
+        statements: list[str] = []
+        conn.set_trace_callback(statements.append)
+        assert migrate(conn) == []
+        assert statements == ["PRAGMA user_version"]
+    finally:
+        conn.close()
+
+
+def test_migrate_adopts_unversioned_database(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+
+    conn = get_connection()
+    try:
+        conn.execute(
+            "INSERT INTO projects (id, name, genre, premise, created_at, updated_at) "
+            "VALUES ('proj_1', 'Kept', NULL, NULL, 'now', 'now')"
+        )
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+
+        assert migrate(conn, batch_size=2) == list(range(1, LATEST_VERSION + 1))
+        assert conn.execute("SELECT name FROM projects WHERE id = 'proj_1'").fetchone()[0] == "Kept"
+        assert schema_version(conn) == LATEST_VERSION
+    finally:
+        conn.close()
+
+
+def test_migrate_upgrades_a_populated_baseline_database(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    conn = get_connection()
+    try:
+        # The database as the first release left it: the v1 schema, with data in every table.
+        baseline = MIGRATIONS[0]
+        for statement in (*baseline.statements, *baseline.indexes):
+            conn.execute(statement)
+        conn.executescript(
+            """
+            INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_1', 'P', 'now', 'now');
+            INSERT INTO chapters (id, project_id, chapter_no, title, created_at, updated_at)
+              VALUES ('ch_1', 'proj_1', 1, 'Snow', 'now', 'now');
+            INSERT INTO chapter_text_versions (id, chapter_id, version_no, stage, content_text, created_at)
+              VALUES ('chv_1', 'ch_1', 1, 'final', 'first draft', 'now'),
+                     ('chv_2', 'ch_1', 2, 'final', 'second draft, longer', 'now');
+            INSERT INTO chapter_segments (id, chapter_id, segment_no, content_text, created_at, updated_at)
+              VALUES ('chseg_1', 'ch_1', 1, 'falling snow', 'now', 'now');
+            INSERT INTO runs (id, project_id, run_type, status, budget_json, started_at)
+              VALUES ('run_1', 'proj_1', 'chapter_write', 'completed', '{"max_tokens_total": 100}', 'now');
+            INSERT INTO run_steps (id, run_id, step_no, step_type, status, budget_json, started_at)
+              VALUES ('step_1', 'run_1', 1, 'draft', 'completed', '{"max_tokens_step": 50}', 'now');
+            INSERT INTO llm_calls (id, run_id, step_id, model_id, request_hash, usage_json, status, created_at)
+              VALUES ('call_1', 'run_1', 'step_1', 'm', 'h',
+                      '{"prompt_tokens": 10, "completion_tokens": 5}', 'succeeded', 'now');
+            PRAGMA user_version = 1;
+            """
+        )
+
+        assert migrate(conn, batch_size=1) == list(range(2, LATEST_VERSION + 1))
+
+        versions = conn.execute(
+            "SELECT content_text, content_hash, char_count FROM chapter_text_versions ORDER BY version_no"
+        ).fetchall()
+        assert [(row["content_text"], row["char_count"]) for row in versions] == [("", 11), ("", 20)]
+        assert get_text(conn, versions[1]["content_hash"]) == "second draft, longer"
+        documents = conn.execute("SELECT source_id FROM search_documents ORDER BY source_id").fetchall()
+        assert [row[0] for row in documents] == ["chseg_1", "chv_2"]
+        segment = conn.execute("SELECT char_count, content_hash FROM chapter_segments").fetchone()
+        assert tuple(segment) == (12, text_hash("falling snow"))
+        assert conn.execute("SELECT budget_remaining_tokens FROM runs").fetchone()[0] == 85
+        assert conn.execute("SELECT budget_remaining_tokens FROM run_steps").fetchone()[0] == 35
+    finally:
+        conn.close()
+
+
+def test_read_executor_rejects_when_saturated(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    executor = ReadExecutor(max_workers=1, max_queue=0)
+    gate = threading.Event()
+
+    async def scenario() -> None:
+        blocked = asyncio.ensure_future(executor.submit(lambda conn: gate.wait(5)))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await executor.submit(lambda conn: conn.execute("SELECT 1").fetchone()[0])
+        gate.set()
+        assert await blocked is True
+
+    try:
+        asyncio.run(scenario())
+        metrics = executor.metrics()
+        assert metrics["rejected"] == 1
+        assert metrics["completed"] == 1
+        assert metrics["peak_queued"] == 1
+    finally:
+        executor.shutdown()
+        close_pools()
+
+
+def test_db_metrics_endpoint_reports_both_lanes(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "Metrics"}).json()["id"]
+        assert client.get(f"/projects/{project_id}").status_code == 200
+
+        metrics = client.get("/metrics/db")
+        assert metrics.status_code == 200
+        body = metrics.json()
+        assert body["read"]["completed"] >= 1
+        assert body["write"]["completed"] >= 1
+        assert body["write"]["max_workers"] == 1
+        assert body["read"]["queued"] == 0
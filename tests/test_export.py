@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import gzip
+import json
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.export import export_project
+from app.main import app
+from app.versions import insert_text_version
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _records(body: bytes) -> list[tuple[str, dict]]:
+    assert body.endswith(b"\n")
+    return [(record["type"], record["data"]) for record in map(json.loads, body.splitlines())]
+
+
+def _seed(client: TestClient) -> tuple[str, list[str], list[str]]:
+    project_id = client.post("/projects", json={"name": "长篇", "premise": "雪夜"}).json()["id"]
+    chapter_ids = [
+        client.post(
+            "/chapters",
+            json={"project_id": project_id, "chapter_no": no, "title": f"第{no}章", "plan_json": {"beats": [no]}},
+        ).json()["id"]
+        for no in (2, 1, 3)
+    ]
+    for chapter_id in chapter_ids:
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 1, "content_text": "开头"})
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 2, "attrs_json": {"mood": "冷"}})
+    texts = ["第一稿，雪落无声。", "第一稿，雪落无声，风起。", "第二章正文。"]
+    with get_connection() as conn:
+        insert_text_version(conn, chapter_ids[0], "final", texts[0], None, None, _utc_now_iso())
+        insert_text_version(conn, chapter_ids[0], "final", texts[1], None, None, _utc_now_iso())
+        insert_text_version(conn, chapter_ids[1], "final", texts[2], None, None, _utc_now_iso())
+        conn.commit()
+    # Another project's rows never leak into the export.
+    other_id = client.post("/projects", json={"name": "Other"}).json()["id"]
+    client.post("/chapters", json={"project_id": other_id, "chapter_no": 1, "title": "Other"})
+    return project_id, chapter_ids, texts
+
+
+def test_export_streams_project_rows_as_ndjson(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_VERSION_STORAGE", "delta")
+    monkeypatch.setenv("WRITER_EXPORT_BATCH_SIZE", "2")
+    with TestClient(app) as client:
+        project_id, chapter_ids, texts = _seed(client)
+
+        resp = client.get(f"/projects/{project_id}/export.ndjson")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        assert resp.headers["content-disposition"] == f'attachment; filename="{project_id}.ndjson"'
+        records = _records(resp.content)
+        assert [kind for kind, _ in records] == ["project"] + ["chapter"] * 3 + ["segment"] * 6 + ["version"] * 3
+        assert records[0][1]["premise"] == "雪夜"
+
+        # Each line is exactly the item the list endpoint returns.
+        chapters = [data for kind, data in records if kind == "chapter"]
+        assert [data["chapter_no"] for data in chapters] == [1, 2, 3]
+        listed = client.get(f"/chapters?project_id={project_id}").json()["items"]
+        assert sorted(chapters, key=lambda data: data["id"]) == listed
+        segments = [data for kind, data in records if kind == "segment"]
+        assert {data["chapter_id"] for data in segments} == set(chapter_ids)
+        assert segments[:2] == client.get(f"/chapters/{segments[0]['chapter_id']}/segments").json()["items"]
+        versions = [data for kind, data in records if kind == "version"]
+        by_chapter = {chapter_ids[0]: texts[:2], chapter_ids[1]: texts[2:]}
+        assert sorted(data["content_text"] for data in versions) == sorted(texts)
+        for data in versions:
+            assert data["content_text"] == by_chapter[data["chapter_id"]][data["version_no"] - 1]
+
+        only_chapters = _records(client.get(f"/projects/{project_id}/export.ndjson?include=chapters").content)
+        assert [kind for kind, _ in only_chapters] == ["project"] + ["chapter"] * 3
+        versions_first = client.get(f"/projects/{project_id}/export.ndjson?include=versions, segments").content
+        assert [kind for kind, _ in _records(versions_first)][1:] == ["segment"] * 6 + ["version"] * 3
+
+        with client.stream("GET", f"/projects/{project_id}/export.ndjson?gzip=true") as zipped:
+            assert zipped.headers["content-encoding"] == "gzip"
+            assert _records(gzip.decompress(b"".join(zipped.iter_raw()))) == records
+
+        assert client.get("/projects/missing/export.ndjson").status_code == 404
+        unknown = client.get(f"/projects/{project_id}/export.ndjson?include=chapters,notes")
+        assert unknown.status_code == 422 and "notes" in unknown.json()["detail"]
+
+
+def test_export_yields_one_chunk_per_batch(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        project_id, _, _ = _seed(client)
+
+    with get_connection() as conn:
+        chunks = list(export_project(conn, project_id, ("chapters", "segments", "versions"), 2))
+    # Project line, then 3 chapters, 6 segments and 3 versions in batches of two.
+    assert [len(chunk.splitlines()) for chunk in chunks] == [1, 2, 1, 2, 2, 2, 2, 1]
+    assert _records(b"".join(chunks))[1][1]["chapter_no"] == 1
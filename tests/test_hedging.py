@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.hedging import latency_percentile
+from app.llm import usage_tokens
+from app.llm_stub import StubConfig, StubServer
+from app.main import app
+
+
+@pytest.fixture
+def stubs():
+    slow = StubServer(config=StubConfig(latency_ms=1500.0)).start()
+    fast = StubServer(config=StubConfig()).start()
+    try:
+        yield slow, fast
+    finally:
+        slow.stop()
+        fast.stop()
+
+
+def _seed_latencies(provider_id: str, model_id: str, latencies: list[float]) -> None:
+    with get_connection() as conn:
+        for n, latency in enumerate(latencies):
+            conn.execute(
+                "INSERT INTO llm_calls (id, provider_id, model_id, request_hash, status, latency_ms, created_at) "
+                "VALUES (?, ?, ?, 'seed', 'succeeded', ?, ?)",
+                (f"llm_seed_{provider_id}_{n:03d}", provider_id, model_id, latency, f"2026-01-01T00:00:{n:02d}Z"),
+            )
+        conn.commit()
+
+
+def test_slow_call_is_hedged_to_the_fallback_and_both_attempts_are_logged(
+    monkeypatch, tmp_path, stubs, wait_for_run
+) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    policy = {"percentile": 0.9, "min_samples": 5, "fallback_provider_id": "fast", "fallback_model_id": "m"}
+    monkeypatch.setenv("WRITER_LLM_HEDGE", json.dumps({"slow:m": policy}))
+    slow, fast = stubs
+    with TestClient(app) as client:
+        for provider_id, stub in (("slow", slow), ("fast", fast)):
+            client.post("/llm/providers", json={"id": provider_id, "name": provider_id, "base_url": stub.url})
+            client.post(f"/llm/providers/{provider_id}/models", json={"model_name": "m"})
+        _seed_latencies("slow", "m", [40.0, 50.0, 60.0, 70.0, 80.0])
+        project_id = client.post("/projects", json={"name": "Hedge Book"}).json()["id"]
+        chapter_id = client.post(
+            "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+        ).json()["id"]
+
+        started = time.monotonic()
+        run = client.post(
+            "/swarm/run",
+            json={
+                "project_id": project_id,
+                "chapter_id": chapter_id,
+                "input_json": {"provider_id": "slow", "model_id": "m", "prompt": "race"},
+            },
+        ).json()
+        assert wait_for_run(client, run["id"])["status"] == "completed"
+        # The fallback answered long before the slow provider's first byte.
+        assert time.monotonic() - started < 1.4
+        assert (slow.stats.requests, fast.stats.requests) == (1, 1)
+
+        with get_connection() as conn:
+            calls = conn.execute(
+                "SELECT provider_id, status, error_text, usage_json, latency_ms FROM llm_calls "
+                "WHERE run_id = ? ORDER BY status DESC",
+                (run["id"],),
+            ).fetchall()
+        assert [(row["provider_id"], row["status"]) for row in calls] == [("fast", "succeeded"), ("slow", "hedge_lost")]
+        assert calls[1]["error_text"] == "LLM call cancelled: hedged."
+        # The loser never reported usage; its prompt is estimated and still billed.
+        assert json.loads(calls[1]["usage_json"])["estimated"] is True
+        assert calls[1]["latency_ms"] >= 80.0 and calls[0]["latency_ms"] is not None
+        versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+        assert [version["content_text"] for version in versions] == ["Stub reply: C1\n\nrace"]
+
+
+def test_latency_percentile_needs_enough_recent_samples(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app):
+        _seed_latencies("p", "m", [float(n) for n in range(1, 21)])
+        with get_connection() as conn:
+            assert latency_percentile(conn, "p", "m", 0.95, 200, 20) == 19.0
+            assert latency_percentile(conn, "p", "m", 0.5, 200, 20) == 10.0
+            # Only the newest ten (11..20) count.
+            assert latency_percentile(conn, "p", "m", 0.5, 10, 5) == 15.0
+            assert latency_percentile(conn, "p", "m", 0.5, 10, 11) is None
+            assert latency_percentile(conn, "other", "m", 0.5, 200, 1) is None
+
+
+def test_hedge_checks_the_budget_and_caches_under_the_model_that_answered(
+    monkeypatch, tmp_path, stubs, wait_for_run
+) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    policy = {"percentile": 0.9, "min_samples": 5, "fallback_provider_id": "fast", "fallback_model_id": "m2"}
+    monkeypatch.setenv("WRITER_LLM_HEDGE", json.dumps({"slow:m": policy}))
+    slow, fast = stubs
+    with TestClient(app) as client:
+        for provider_id, stub, model in (("slow", slow, "m"), ("fast", fast, "m2")):
+            client.post("/llm/providers", json={"id": provider_id, "name": provider_id, "base_url": stub.url})
+            client.post(f"/llm/providers/{provider_id}/models", json={"model_name": model})
+        _seed_latencies("slow", "m", [40.0, 50.0, 60.0, 70.0, 80.0])
+        project_id = client.post("/projects", json={"name": "Hedge Book"}).json()["id"]
+        chapter_ids = [
+            client.post("/chapters", json={"project_id": project_id, "chapter_no": no, "title": f"C{no}"}).json()["id"]
+            for no in (1, 2)
+        ]
+
+        def start(chapter_id: str, prompt: str, budget: dict | None = None) -> dict:
+            input_json = {"provider_id": "slow", "model_id": "m", "prompt": prompt}
+            body = {"project_id": project_id, "chapter_id": chapter_id, "input_json": input_json}
+            return client.post("/swarm/run", json={**body, "budget_json": budget}).json()
+
+        # The primary's reservation leaves too little for a duplicate, so no hedge is sent.
+        tight = start(chapter_ids[0], "tight", {"max_tokens_total": 1500, "completion_reserve_tokens": 1000})
+        assert wait_for_run(client, tight["id"])["status"] == "completed"
+        assert (slow.stats.requests, fast.stats.requests) == (1, 0)
+
+        hedged = start(chapter_ids[1], "race", {"max_tokens_total": 100000})
+        done = wait_for_run(client, hedged["id"])
+        assert done["status"] == "completed"
+        assert fast.stats.requests == 1
+        with get_connection() as conn:
+            keys = [row[0] for row in conn.execute("SELECT cache_key FROM llm_response_cache ORDER BY cache_key")]
+            usages = [
+                json.loads(row[0])
+                for row in conn.execute("SELECT usage_json FROM llm_calls WHERE run_id = ?", (hedged["id"],))
+            ]
+        # The hedge reserved its own estimate when it fired; both reservations settle to actual usage.
+        assert len(usages) == 2
+        assert done["budget_remaining_tokens"] == 100000 - sum(usage_tokens(usage) for usage in usages)
+        # The fallback's text is cached for the fallback model, never for the primary's.
+        assert sorted(key.split(":")[0] for key in keys) == ["m", "m2"]
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.idempotency import purge_expired_keys, request_hash
+from app.main import app
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _hash(body: dict) -> str:
+    return request_hash(b"", json.dumps(body).encode("utf-8"))
+
+
+def _key_rows() -> list[tuple[str, str, str]]:
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT project_id, endpoint, status FROM idempotency_keys ORDER BY created_at, id"
+        ).fetchall()
+    return [(row["project_id"], row["endpoint"], row["status"]) for row in rows]
+
+
+def test_retried_swarm_run_replays_the_first_response(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "Retry Book"}).json()["id"]
+        chapter_id = client.post(
+            "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+        ).json()["id"]
+        body = {"project_id": project_id, "chapter_id": chapter_id, "input_json": {"prompt": "once"}}
+
+        first = client.post("/swarm/run", json=body, headers={"Idempotency-Key": "run-1"})
+        assert first.status_code == 200 and "idempotent-replayed" not in first.headers
+        # Same request, keys in another order: replayed, no second run.
+        reordered = {"input_json": {"prompt": "once"}, "chapter_id": chapter_id, "project_id": project_id}
+        second = client.post("/swarm/run", json=reordered, headers={"Idempotency-Key": "run-1"})
+        assert second.status_code == 200 and second.headers["idempotent-replayed"] == "true"
+        assert second.json() == first.json()
+        wait_for_run(client, first.json()["id"])
+        assert [run["id"] for run in client.get(f"/projects/{project_id}/runs").json()["items"]] == [first.json()["id"]]
+
+        conflict = client.post(
+            "/swarm/run", json={**body, "input_json": {"prompt": "twice"}}, headers={"Idempotency-Key": "run-1"}
+        )
+        assert conflict.status_code == 409
+        assert conflict.json()["error_code"] == "E101_IDEMPOTENCY_CONFLICT"
+
+        # Errors below 500 are final and replayed too; requests without a key are untouched.
+        missing = {"project_id": project_id, "chapter_id": "missing"}
+        assert client.post("/swarm/run", json=missing, headers={"Idempotency-Key": "bad"}).status_code == 404
+        assert client.post("/swarm/run", json=missing, headers={"Idempotency-Key": "bad"}).headers[
+            "idempotent-replayed"
+        ] == "true"
+        assert client.post("/projects", json={"name": "No key"}).status_code == 200
+        assert client.post("/projects", json={"name": "Keyed"}, headers={"Idempotency-Key": "p"}).status_code == 200
+        assert _key_rows() == [
+            (project_id, "POST /swarm/run", "succeeded"),
+            (project_id, "POST /swarm/run", "succeeded"),
+            ("", "POST /projects", "succeeded"),
+        ]
+        assert client.post("/projects", json={"name": "Keyed"}, headers={"Idempotency-Key": ""}).status_code == 422
+
+
+def test_in_flight_keys_answer_202_until_their_lease_lapses(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        with get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO idempotency_keys (id, project_id, endpoint, idempotency_key, request_hash, status, "
+                "lease_owner, lease_until, created_at, updated_at) "
+                "VALUES (?, '', 'POST /projects', ?, ?, 'processing', 'other', ?, ?, ?)",
+                [
+                    ("idem_live", "live", _hash({"name": "Live"}), "2999-01-01T00:00:00.000000Z", _now(), _now()),
+                    ("idem_lapsed", "lapsed", _hash({"name": "Lapsed"}), "2000-01-01T00:00:00.000000Z", _now(), _now()),
+                ],
+            )
+            conn.commit()
+
+        waiting = client.post("/projects", json={"name": "Live"}, headers={"Idempotency-Key": "live"})
+        assert waiting.status_code == 202
+        assert waiting.json()["error_code"] == "E104_PROCESSING" and int(waiting.headers["retry-after"]) >= 1
+        # The owner died mid-request: the retry takes the key over and runs.
+        taken = client.post("/projects", json={"name": "Lapsed"}, headers={"Idempotency-Key": "lapsed"})
+        assert taken.status_code == 200 and taken.json()["name"] == "Lapsed"
+        assert _key_rows()[-1] == ("", "POST /projects", "succeeded")
+
+
+def test_expired_keys_are_purged_in_batches(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        for n in range(5):
+            client.post("/projects", json={"name": f"P{n}"}, headers={"Idempotency-Key": f"k{n}"})
+        with get_connection() as conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET created_at = '2000-01-01T00:00:00.000000Z' WHERE idempotency_key != 'k4'"
+            )
+            conn.commit()
+            assert [purge_expired_keys(conn, 3600.0, 3) for _ in range(3)] == [3, 1, 0]
+            conn.commit()
+        assert [row[1] for row in _key_rows()] == ["POST /projects"]
+
+        # An expired key is as good as unused: it runs again instead of replaying.
+        with get_connection() as conn:
+            conn.execute("UPDATE idempotency_keys SET created_at = '2000-01-01T00:00:00.000000Z'")
+            conn.commit()
+        again = client.post("/projects", json={"name": "P4"}, headers={"Idempotency-Key": "k4"})
+        assert "idempotent-replayed" not in again.headers
+        assert len(client.get("/projects").json()["items"]) == 6
+
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection, init_db
+from app.llm import build_request
+from app.llm_cache import CachedResponse, MemoryCacheTier, SqliteCacheTier
+from app.main import _llm_single_flight, app
+from app.single_flight import SingleFlight
+
+
+def _entry(text: str, stored_at: float) -> CachedResponse:
+    return CachedResponse(
+        provider_id="p",
+        model_id="m",
+        content_text=text,
+        usage={"prompt_tokens": 1},
+        response_hash="h",
+        stored_at=stored_at,
+    )
+
+
+def test_memory_tier_evicts_by_count_size_and_ttl() -> None:
+    tier = MemoryCacheTier(max_entries=2, max_bytes=10, ttl_seconds=60)
+    tier.put(None, "a", _entry("aaaa", 0))
+    tier.put(None, "b", _entry("bbbb", 0))
+    assert tier.get(None, "a", 1) is not None
+    tier.put(None, "c", _entry("cc", 0))
+    assert tier.get(None, "b", 1) is None
+    tier.put(None, "d", _entry("dddddddd", 0))
+    assert tier.get(None, "a", 1) is None
+    assert tier.get(None, "d", 1) is not None
+    assert tier.get(None, "d", 61) is None
+
+
+def test_sqlite_tier_prunes_expired_and_least_recently_used(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+    tier = SqliteCacheTier(max_entries=2, ttl_seconds=100)
+    conn = get_connection()
+    try:
+        tier.put(conn, "old", _entry("old body", 0))
+        tier.put(conn, "a", _entry("body a", 150))
+        assert tier.get(conn, "old", 150) is None
+        tier.put(conn, "b", _entry("body b", 151))
+        tier.touch(conn, "a", 152)
+        tier.put(conn, "c", _entry("body c", 153))
+
+        keys = [row[0] for row in conn.execute("SELECT cache_key FROM llm_response_cache ORDER BY cache_key")]
+        assert keys == ["a", "c"]
+        assert tier.get(conn, "a", 160).content_text == "body a"
+    finally:
+        conn.close()
+
+
+def test_request_hash_ignores_run_and_step_ids() -> None:
+    first = build_request("run_1", "step_1", "draft", {"run_id": "run_1", "step_id": "step_1", "prompt": "x"})
+    second = build_request("run_2", "step_2", "draft", {"run_id": "run_2", "step_id": "step_2", "prompt": "x"})
+    assert first.request_hash == second.request_hash
+    assert build_request("run_1", "step_1", "review", first.payload).request_hash != first.request_hash
+
+
+def test_repeated_runs_hit_cache_and_record_cache_hit(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    calls = {"n": 0}
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        calls["n"] += 1
+        return {"content_text": f"Draft {calls['n']}", "usage_json": {"prompt_tokens": 5, "completion_tokens": 7}}
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Cache Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            body = {"project_id": project_id, "chapter_id": chapter_id, "input_json": {"prompt": "same"}}
+
+            first = client.post("/swarm/run", json=body).json()
+            wait_for_run(client, first["id"])
+            second = client.post("/swarm/run", json=body).json()
+            wait_for_run(client, second["id"])
+            assert calls["n"] == 1
+
+            opted_out = client.post("/swarm/run", json={**body, "llm_cache": False}).json()
+            assert opted_out["llm_cache"] is False
+            wait_for_run(client, opted_out["id"])
+            assert calls["n"] == 2
+
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert [version["content_text"] for version in versions] == ["Draft 1", "Draft 1", "Draft 2"]
+
+        # A fresh process starts with an empty memory tier but still hits SQLite.
+        with TestClient(app) as client:
+            third = client.post("/swarm/run", json=body).json()
+            wait_for_run(client, third["id"])
+        assert calls["n"] == 2
+
+        with get_connection() as conn:
+            rows = conn.execute(
+                "SELECT run_id, status, usage_json FROM llm_calls ORDER BY created_at, id"
+            ).fetchall()
+            hits = conn.execute("SELECT hits FROM llm_response_cache").fetchall()
+        statuses = {row["run_id"]: row["status"] for row in rows}
+        assert statuses == {
+            first["id"]: "succeeded",
+            second["id"]: "cache_hit",
+            opted_out["id"]: "succeeded",
+            third["id"]: "cache_hit",
+        }
+        assert [row["hits"] for row in hits] == [2]
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_concurrent_identical_requests_share_one_call(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    started = threading.Event()
+    release = threading.Event()
+    calls = {"n": 0}
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        calls["n"] += 1
+        started.set()
+        assert release.wait(5.0)
+        return {"content_text": "Shared draft"}
+
+    app.state.llm_generate = generate
+    followers_before = _llm_single_flight.followers
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Storm Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            body = {"project_id": project_id, "chapter_id": chapter_id}
+
+            leader_run = client.post("/swarm/run", json=body).json()
+            assert started.wait(5.0)
+            follower_run = client.post("/swarm/run", json=body).json()
+            deadline = time.monotonic() + 5.0
+            while _llm_single_flight.followers == followers_before and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+
+            assert wait_for_run(client, leader_run["id"])["status"] == "completed"
+            assert wait_for_run(client, follower_run["id"])["status"] == "completed"
+        assert calls["n"] == 1
+
+        with get_connection() as conn:
+            rows = {
+                row["run_id"]: row
+                for row in conn.execute("SELECT id, run_id, status, leader_call_id, response_hash FROM llm_calls")
+            }
+        leader, follower = rows[leader_run["id"]], rows[follower_run["id"]]
+        assert (leader["status"], leader["leader_call_id"]) == ("succeeded", None)
+        assert (follower["status"], follower["leader_call_id"]) == ("coalesced", leader["id"])
+        assert follower["response_hash"] == leader["response_hash"]
+    finally:
+        release.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_single_flight_shares_failures_with_followers() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+    results: list[object] = []
+
+    def fail() -> str:
+        entered.set()
+        release.wait(5.0)
+        raise RuntimeError("provider down")
+
+    def follow() -> None:
+        try:
+            flight.do("k", lambda: "unused")
+        except RuntimeError as exc:
+            results.append(str(exc))
+
+    leader = threading.Thread(target=_swallow, args=(flight, fail))
+    leader.start()
+    assert entered.wait(5.0)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    while flight.followers == 0:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5.0)
+    follower.join(5.0)
+
+    assert results == ["provider down"]
+    assert flight.inflight() == 0
+    assert flight.do("k", lambda: "fresh") == ("fresh", True)
+
+
+def _swallow(flight: SingleFlight[str], fn: Callable[[], str]) -> None:
+    try:
+        flight.do("k", fn)
+    except RuntimeError:
+        pass
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.llm_stub import StubConfig, StubServer
+from app.main import app
+from app.providers import ProviderSettings
+
+
+@pytest.fixture
+def stub():
+    server = StubServer(config=StubConfig()).start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def _run(client: TestClient, project_id: str, chapter_no: int, input_json: dict) -> str:
+    chapter_id = client.post(
+        "/chapters", json={"project_id": project_id, "chapter_no": chapter_no, "title": f"C{chapter_no}"}
+    ).json()["id"]
+    return client.post(
+        "/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id, "input_json": input_json}
+    ).json()["id"]
+
+
+def test_registered_provider_streams_over_one_pooled_connection(monkeypatch, tmp_path, stub, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        provider = client.post("/llm/providers", json={"id": "stub", "name": "Local stub", "base_url": stub.url}).json()
+        model = client.post("/llm/providers/stub/models", json={"model_name": "stub-writer"}).json()
+        assert (provider["id"], model["provider_id"]) == ("stub", "stub")
+        project_id = client.post("/projects", json={"name": "Provider Book"}).json()["id"]
+
+        run_ids = []
+        for chapter_no in range(1, 4):
+            # By model name or by registered model id.
+            model_id = "stub-writer" if chapter_no < 3 else model["id"]
+            input_json = {"provider_id": "stub", "model_id": model_id, "prompt": f"scene {chapter_no}"}
+            run_ids.append(_run(client, project_id, chapter_no, input_json))
+            assert wait_for_run(client, run_ids[-1])["status"] == "completed"
+
+        with get_connection() as conn:
+            calls = conn.execute(
+                "SELECT provider_id, model_id, usage_json FROM llm_calls WHERE run_id = ?", (run_ids[0],)
+            ).fetchall()
+        assert [(row["provider_id"], row["model_id"]) for row in calls] == [("stub", "stub-writer")]
+        assert '"completion_tokens": 4' in calls[0]["usage_json"]
+        chapter_id = client.get(f"/runs/{run_ids[0]}").json()["target_chapter_id"]
+        versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+        assert [version["content_text"] for version in versions] == ["Stub reply: C1\n\nscene 1"]
+        # Keep-alive: three calls, one TCP connection.
+        assert (stub.stats.requests, stub.stats.connections) == (3, 1)
+
+        unknown = _run(client, project_id, 4, {"provider_id": "stub", "model_id": "missing"})
+        assert wait_for_run(client, unknown)["output_json"] == {
+            "error": "Model missing is not registered for provider stub."
+        }
+
+
+def test_retryable_failures_back_off_and_retry(monkeypatch, tmp_path, stub, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    stub.config.fail_first = 2
+    config = {"stream": False, "max_retries": 2, "backoff_base_seconds": 0.01}
+    with TestClient(app) as client:
+        provider = {"id": "flaky", "name": "Flaky", "base_url": stub.url, "config_json": config}
+        client.post("/llm/providers", json=provider)
+        client.post("/llm/providers/flaky/models", json={"model_name": "m"})
+        project_id = client.post("/projects", json={"name": "Retry Book"}).json()["id"]
+
+        recovered = _run(client, project_id, 1, {"provider_id": "flaky", "model_id": "m"})
+        assert wait_for_run(client, recovered)["status"] == "completed"
+        assert stub.stats.requests == 3
+
+        stub.config.fail_first = 10
+        exhausted = _run(client, project_id, 2, {"provider_id": "flaky", "model_id": "m"})
+        failed = wait_for_run(client, exhausted)
+        assert failed["status"] == "failed"
+        assert failed["output_json"]["error"].startswith("Provider flaky returned HTTP 503")
+        assert stub.stats.requests == 6
+
+
+def test_provider_registry_api_validation(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        created = client.post("/llm/providers", json={"name": "Generated id", "base_url": "http://localhost:1/v1"})
+        assert created.json()["id"].startswith("llmp_")
+        body = {"id": "dup", "name": "Dup", "base_url": "http://localhost:1/v1"}
+        assert client.post("/llm/providers", json=body).status_code == 200
+        assert client.post("/llm/providers", json=body).status_code == 409
+        bad = client.post("/llm/providers", json={**body, "id": "bad", "config_json": {"timeout_seconds": "slow"}})
+        assert bad.status_code == 422
+        assert client.post("/llm/providers/dup/models", json={"model_name": "m"}).status_code == 200
+        assert client.post("/llm/providers/dup/models", json={"model_name": "m"}).status_code == 409
+        assert client.post("/llm/providers/missing/models", json={"model_name": "m"}).status_code == 404
+        assert [item["id"] for item in client.get("/llm/providers").json()["items"]] == ["dup", created.json()["id"]]
+        assert [item["model_name"] for item in client.get("/llm/providers/dup/models").json()["items"]] == ["m"]
+
+    settings = ProviderSettings(backoff_base_seconds=1.0, backoff_max_seconds=3.0)
+    assert all(1.5 <= settings.backoff(5) <= 3.0 for _ in range(20))
+    assert settings.backoff(0, retry_after=10.0) == 3.0
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.rate_limit import BucketLimits, RateLimitTimeout, TokenBucketLimiter
+
+
+def test_concurrency_cap_admits_waiters_in_arrival_order() -> None:
+    limiter = TokenBucketLimiter("p:m", BucketLimits(max_inflight_calls=1))
+    holder = limiter.acquire(1)
+    order: list[int] = []
+
+    def wait_turn(index: int) -> None:
+        admission = limiter.acquire(1, timeout=5.0)
+        order.append(index)
+        limiter.release(admission)
+
+    threads = []
+    for index in range(4):
+        thread = threading.Thread(target=wait_turn, args=(index,))
+        thread.start()
+        threads.append(thread)
+        while limiter.queued() < index + 1:
+            time.sleep(0.001)
+
+    limiter.release(holder)
+    for thread in threads:
+        thread.join(5.0)
+    assert order == [0, 1, 2, 3]
+    assert limiter.inflight == 0
+
+
+def test_token_bucket_waits_for_refill_and_reconciles_usage() -> None:
+    limiter = TokenBucketLimiter("p:m", BucketLimits(tokens_per_minute=600))
+    first = limiter.acquire(500)
+    assert first.waited_seconds < 0.05
+    # The call actually used 595 tokens, leaving 5 in the bucket.
+    limiter.release(first, actual_tokens=595)
+
+    second = limiter.acquire(10, timeout=5.0)
+    assert 0.3 < second.waited_seconds < 2.0
+    limiter.release(second)
+
+
+def test_queue_timeout_removes_the_waiter() -> None:
+    limiter = TokenBucketLimiter("p:m", BucketLimits(max_inflight_calls=1))
+    holder = limiter.acquire(1)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1, timeout=0.05)
+    assert limiter.queued() == 0
+    assert limiter.timed_out == 1
+    limiter.release(holder)
+    limiter.release(limiter.acquire(1, timeout=0.05))
+
+
+def test_rate_limited_runs_record_wait_and_fail_on_timeout(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv(
+        "WRITER_LLM_RATE_LIMITS",
+        json.dumps({"mock:mock-writer-v1": {"tpm": 60, "queue_timeout_seconds": 0.05, "completion_reserve_tokens": 0}}),
+    )
+    app.state.llm_generate = lambda request: {
+        "content_text": "Expensive draft",
+        "usage_json": {"prompt_tokens": 400, "completion_tokens": 600},
+    }
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Limited Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            body = {"project_id": project_id, "chapter_id": chapter_id, "llm_cache": False}
+
+            first = client.post("/swarm/run", json=body).json()
+            assert wait_for_run(client, first["id"])["status"] == "completed"
+            step = client.get(f"/runs/{first['id']}/steps").json()["items"][0]
+            assert step["budget_json"]["rate_limit"]["bucket"] == "mock:mock-writer-v1"
+            assert step["budget_json"]["rate_limit"]["wait_ms"] >= 0
+
+            # The first call overspent its reservation, so the bucket is in debt.
+            second = client.post("/swarm/run", json=body).json()
+            failed = wait_for_run(client, second["id"])
+            assert failed["status"] == "failed"
+            assert "did not admit the call" in failed["output_json"]["error"]
+            step = client.get(f"/runs/{second['id']}/steps").json()["items"][0]
+            assert step["budget_json"]["rate_limit"]["wait_ms"] >= 50
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
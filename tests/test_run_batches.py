@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.main import app
+
+
+def _chapters(client: TestClient, project_id: str, count: int) -> list[str]:
+    return [
+        client.post("/chapters", json={"project_id": project_id, "chapter_no": no, "title": f"C{no}"}).json()["id"]
+        for no in range(1, count + 1)
+    ]
+
+
+def test_batch_creates_and_drives_runs_with_aggregate_progress(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "Volume"}).json()["id"]
+        chapter_ids = _chapters(client, project_id, 5)
+
+        resp = client.post(
+            "/swarm/runs:batch",
+            json={"project_id": project_id, "chapter_ids": chapter_ids, "input_json": {"prompt": "Night shift"}},
+        )
+        assert resp.status_code == 200
+        batch = resp.json()
+        assert len(batch["run_ids"]) == 5
+
+        for run_id, chapter_id in zip(batch["run_ids"], chapter_ids):
+            run = wait_for_run(client, run_id)
+            assert (run["status"], run["target_chapter_id"], run["batch_id"]) == ("completed", chapter_id, batch["id"])
+
+        status = client.get(f"/swarm/batches/{batch['id']}").json()
+        assert status["status_counts"] == {"completed": 5}
+        assert (status["total"], status["finished"], status["progress"], status["done"]) == (5, 5, 1.0, True)
+
+        queued = client.post(
+            "/swarm/runs:batch",
+            json={"project_id": project_id, "chapter_ids": chapter_ids[:2], "auto_start": False},
+        ).json()
+        status = client.get(f"/swarm/batches/{queued['id']}").json()
+        assert status["status_counts"] == {"created": 2}
+        assert (status["finished"], status["progress"], status["done"]) == (0, 0.0, False)
+
+        assert client.get("/swarm/batches/batch_missing").status_code == 404
+
+
+def test_batch_validation_rejects_the_whole_batch(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "Mine"}).json()["id"]
+        other_project_id = client.post("/projects", json={"name": "Theirs"}).json()["id"]
+        (mine,) = _chapters(client, project_id, 1)
+        (theirs,) = _chapters(client, other_project_id, 1)
+
+        url = "/swarm/runs:batch"
+        missing = client.post(url, json={"project_id": project_id, "chapter_ids": [mine, "ch_missing"]})
+        assert missing.status_code == 404
+        assert "ch_missing" in missing.json()["detail"]
+        foreign = client.post(url, json={"project_id": project_id, "chapter_ids": [mine, theirs]})
+        assert foreign.status_code == 403
+        assert client.post(url, json={"project_id": project_id, "chapter_ids": [mine, mine]}).status_code == 422
+        assert client.post(url, json={"project_id": project_id, "chapter_ids": []}).status_code == 422
+        assert client.post(url, json={"project_id": "proj_missing", "chapter_ids": [mine]}).status_code == 404
+
+    with get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM run_batches").fetchone()[0] == 0
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.run_events import get_run_event_bus
+
+
+def _transitions(items: list[dict]) -> list[tuple[str, str]]:
+    return [(item["event_type"], item["status"]) for item in items]
+
+
+def test_transitions_are_logged_and_long_poll_wakes_on_new_events(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    # Long enough that only the commit hook can explain a prompt wake-up.
+    monkeypatch.setenv("WRITER_RUN_EVENTS_POLL_SECONDS", "30")
+    monkeypatch.setattr("app.run_events._bus", None)
+    app.state.llm_generate = lambda request: "Draft for approval"
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Feed Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            run = client.post(
+                "/swarm/run",
+                json={"project_id": project_id, "chapter_id": chapter_id, "requires_approval": True},
+            ).json()
+            assert wait_for_run(client, run["id"])["status"] == "paused"
+
+            feed = client.get(f"/runs/{run['id']}/events").json()
+            assert _transitions(feed["items"]) == [
+                ("run.status", "created"),
+                ("run.status", "running"),
+                ("step.status", "running"),
+                ("step.status", "pending_approval"),
+                ("run.status", "paused"),
+            ]
+            since = feed["next_since"]
+            assert since == feed["items"][-1]["id"]
+            step_id = feed["items"][-1]["payload_json"]["waiting_for_approval_step_id"]
+
+            # Nothing new: an immediate poll returns empty and keeps the cursor.
+            assert client.get(f"/runs/{run['id']}/events", params={"since": since}).json() == {
+                "items": [],
+                "next_since": since,
+            }
+
+            def approve_later() -> None:
+                time.sleep(0.2)
+                client.post(f"/runs/{run['id']}/steps/{step_id}/approve")
+
+            approver = threading.Thread(target=approve_later)
+            approver.start()
+            started = time.monotonic()
+            woken = client.get(f"/runs/{run['id']}/events", params={"since": since, "wait": 10}).json()
+            elapsed = time.monotonic() - started
+            approver.join(5.0)
+            assert 0.1 < elapsed < 5.0
+            assert woken["items"][0]["event_type"] == "step.status"
+            assert woken["items"][0]["status"] == "approved"
+
+            with client.stream("GET", f"/runs/{run['id']}/events/stream", params={"since": since}) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                data = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data: ")]
+            assert _transitions(data) == [
+                ("step.status", "approved"),
+                ("run.status", "running"),
+                ("step.status", "completed"),
+                ("run.status", "completed"),
+            ]
+
+            assert client.get(f"/runs/{run['id']}/events", params={"since": "rev_missing"}).status_code == 422
+            assert client.get("/runs/run_missing/events").status_code == 404
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_listeners_share_one_tail_query(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_RUN_EVENTS_POLL_SECONDS", "30")
+    monkeypatch.setattr("app.run_events._bus", None)
+    release = threading.Event()
+
+    def generate(request: dict[str, object]) -> str:
+        assert release.wait(5.0)
+        return "Draft"
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Fan-out Book"}).json()["id"]
+            chapter_id = client.post(
+                "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+            ).json()["id"]
+            run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+            since = client.get(f"/runs/{run['id']}/events").json()["next_since"]
+
+            results: list[list[str]] = []
+
+            def listen() -> None:
+                feed = client.get(f"/runs/{run['id']}/events", params={"since": since, "wait": 10}).json()
+                results.append([item["status"] for item in feed["items"]])
+
+            listeners = [threading.Thread(target=listen) for _ in range(5)]
+            for listener in listeners:
+                listener.start()
+            bus = get_run_event_bus()
+            deadline = time.monotonic() + 5.0
+            while sum(len(subs) for subs in bus._subscriptions.values()) < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            queries_before = bus.queries
+            release.set()
+            for listener in listeners:
+                listener.join(5.0)
+            wait_for_run(client, run["id"])
+
+            assert results == [["completed", "completed"]] * 5
+            # The commit woke the tail once; every listener was fed from that read.
+            assert bus.queries - queries_before <= 2
+    finally:
+        release.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app import scheduler
+from app.db import get_connection, init_db
+from app.main import app
+from app.scheduler import ProjectPolicy, QueuedRun, RunDispatcher, claim_scheduled_runs, fair_order
+
+
+def _queue(project_id: str, count: int, priority: str = "interactive", start: int = 0) -> list[QueuedRun]:
+    return [QueuedRun(id=f"run_{start + n:03d}", project_id=project_id, priority=priority) for n in range(count)]
+
+
+def test_fair_order_weights_projects_ranks_classes_and_respects_caps() -> None:
+    # The busy project queued everything first; fair queuing still interleaves.
+    busy = _queue("proj_busy", 4)
+    quiet = _queue("proj_quiet", 2, start=10)
+    order = [run.project_id for run in fair_order(busy + quiet, {}, {})]
+    assert order == ["proj_busy", "proj_quiet", "proj_busy", "proj_quiet", "proj_busy", "proj_busy"]
+
+    weighted = fair_order(busy + quiet, {}, {"proj_busy": ProjectPolicy(weight=2.0)})
+    assert [run.project_id for run in weighted] == [
+        "proj_busy",
+        "proj_quiet",
+        "proj_busy",
+        "proj_busy",
+        "proj_quiet",
+        "proj_busy",
+    ]
+
+    # Runs already executing count against their project's share.
+    order = fair_order(busy + quiet, {"proj_busy": 2}, {}, limit=2)
+    assert [run.project_id for run in order] == ["proj_quiet", "proj_quiet"]
+
+    # Interactive work always goes first, even when the batch run is older.
+    mixed = _queue("proj_busy", 1, priority="batch") + _queue("proj_quiet", 1, start=10)
+    assert [run.priority for run in fair_order(mixed, {}, {})] == ["interactive", "batch"]
+
+    capped = {"proj_busy": ProjectPolicy(max_concurrent_runs=1)}
+    assert [run.id for run in fair_order(busy + quiet, {}, capped)] == ["run_000", "run_010", "run_011"]
+    assert [run.id for run in fair_order(busy, {"proj_busy": 1}, capped)] == []
+    assert len(fair_order(busy, {"proj_busy": 1}, capped, respect_caps=False)) == 4
+
+
+def test_queued_runs_expose_position_and_claims_follow_the_schedule(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_RUN_DISPATCH", "external")
+    monkeypatch.setenv("WRITER_SCHEDULER_SLOTS", "2")
+    with TestClient(app) as client:
+        big = client.post("/projects", json={"name": "Big"}).json()["id"]
+        small = client.post("/projects", json={"name": "Small"}).json()["id"]
+        client.put(f"/projects/{big}/settings", json={"settings_json": {"scheduler": {"max_concurrent_runs": 2}}})
+        big_chapters = [
+            client.post("/chapters", json={"project_id": big, "chapter_no": no, "title": f"B{no}"}).json()["id"]
+            for no in range(1, 4)
+        ]
+        batch = client.post("/swarm/runs:batch", json={"project_id": big, "chapter_ids": big_chapters}).json()
+        batch_ids = sorted(batch["run_ids"])
+        small_chapter = client.post("/chapters", json={"project_id": small, "chapter_no": 1, "title": "S1"}).json()
+        interactive = client.post("/swarm/run", json={"project_id": small, "chapter_id": small_chapter["id"]}).json()
+        assert interactive["priority"] == "interactive"
+
+        runs = {run["id"]: run for run in client.get(f"/projects/{big}/runs").json()["items"]}
+        assert [runs[run_id]["priority"] for run_id in batch_ids] == ["batch"] * 3
+        assert [runs[run_id]["queue_position"] for run_id in batch_ids] == [1, 2, 3]
+        queued = client.get(f"/runs/{interactive['id']}").json()
+        assert queued["queue_position"] == 0
+        assert queued["estimated_start_at"] <= runs[batch_ids[2]]["estimated_start_at"]
+
+        conn = get_connection()
+        try:
+            # The interactive run jumps the queue and the big project stops at its cap.
+            assert claim_scheduled_runs(conn, "worker-a", 5, 60) == [interactive["id"], *batch_ids[:2]]
+            assert claim_scheduled_runs(conn, "worker-b", 5, 60) == []
+            conn.commit()
+        finally:
+            conn.close()
+
+        claimed = client.get(f"/runs/{interactive['id']}").json()
+        assert (claimed["queue_position"], claimed["estimated_start_at"]) == (None, None)
+        waiting = client.get(f"/runs/{batch_ids[2]}").json()
+        assert waiting["queue_position"] == 0
+        invalid = {"project_id": small, "chapter_id": small_chapter["id"], "priority": "urgent"}
+        assert client.post("/swarm/run", json=invalid).status_code == 422
+
+
+def test_dispatcher_reuses_its_queue_snapshot_until_the_queue_changes(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+    taken: list[int] = []
+    real_snapshot = scheduler.queue_snapshot
+
+    def counting_snapshot(conn):
+        taken.append(1)
+        return real_snapshot(conn)
+
+    monkeypatch.setattr(scheduler, "queue_snapshot", counting_snapshot)
+    dispatcher = RunDispatcher(None, lambda run_id: None, "worker-a", 60.0, 1.0, snapshot_seconds=60.0)
+    with get_connection() as conn:
+        first = dispatcher.queue_snapshot(conn)
+        assert dispatcher.queue_snapshot(conn) is first and len(taken) == 1
+        # A kick means a run became runnable: the next poll takes a fresh snapshot.
+        dispatcher.kick()
+        assert dispatcher.queue_snapshot(conn) is not first and len(taken) == 2
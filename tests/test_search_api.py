@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection, init_db
+from app.main import app
+from app.migrations import migrate
+
+
+def _create_chapter(client: TestClient, project_id: str, chapter_no: int, title: str) -> str:
+    resp = client.post(
+        "/chapters",
+        json={"project_id": project_id, "volume_no": 1, "chapter_no": chapter_no, "title": title},
+    )
+    assert resp.status_code == 200
+    return resp.json()["id"]
+
+
+def test_search_matches_cjk_segments_and_run_output_with_snippets(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    app.state.llm_generate = lambda request: {
+        "content_text": "雪夜里，少年推开山门，看见师父留下的青铜剑。",
+        "provider_id": "test-provider",
+        "model_id": "test-model",
+    }
+
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Search Book"}).json()["id"]
+            other_project_id = client.post("/projects", json={"name": "Other Book"}).json()["id"]
+            chapter_id = _create_chapter(client, project_id, 1, "第一章 山门")
+            other_chapter_id = _create_chapter(client, other_project_id, 1, "Elsewhere")
+
+            client.post(
+                f"/chapters/{chapter_id}/segments",
+                json={"segment_no": 1, "title": "开场", "content_text": "青铜剑在雪中发出低鸣。"},
+            )
+            client.post(
+                f"/chapters/{other_chapter_id}/segments",
+                json={"segment_no": 1, "content_text": "青铜剑不属于这个项目。"},
+            )
+            run_resp = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id})
+            run = wait_for_run(client, run_resp.json()["id"])
+            assert run["status"] == "completed"
+
+            resp = client.get(f"/projects/{project_id}/search", params={"q": "青铜剑"})
+            assert resp.status_code == 200
+            items = resp.json()["items"]
+            assert {item["source_kind"] for item in items} == {"segment", "version"}
+            assert all(item["chapter_id"] == chapter_id for item in items)
+            assert all("<mark>" in item["snippet"] for item in items)
+            version_hit = next(item for item in items if item["source_kind"] == "version")
+            assert version_hit["source_id"] == run["output_json"]["chapter_version_id"]
+
+            short = client.get(f"/projects/{project_id}/search", params={"q": "雪", "kind": "segment"}).json()
+            assert [item["snippet"] for item in short["items"]] == ["青铜剑在<mark>雪</mark>中发出低鸣。"]
+
+            client.put(f"/chapters/{chapter_id}", json={"title": "第一章 归来"})
+            retitled = client.get(f"/projects/{project_id}/search", params={"q": "归来"}).json()
+            assert [item["source_kind"] for item in retitled["items"]] == ["version"]
+
+            missing = client.get("/projects/proj_missing/search", params={"q": "青铜剑"})
+            assert missing.status_code == 404
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_search_pages_with_keyset_cursor(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "Paged"}).json()["id"]
+        chapter_id = _create_chapter(client, project_id, 1, "Chapter")
+        for segment_no in range(1, 8):
+            client.post(
+                f"/chapters/{chapter_id}/segments",
+                json={"segment_no": segment_no, "content_text": "lantern " * segment_no + "harbor"},
+            )
+
+        seen: list[str] = []
+        after = None
+        while True:
+            params = {"q": "lantern", "limit": 3}
+            if after is not None:
+                params["after"] = after
+            page = client.get(f"/projects/{project_id}/search", params=params).json()
+            seen.extend(item["source_id"] for item in page["items"])
+            scores = [item["score"] for item in page["items"]]
+            assert scores == sorted(scores)
+            after = page["next_after"]
+            if after is None:
+                break
+
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+
+        bad = client.get(f"/projects/{project_id}/search", params={"q": "lantern", "after": "nope"})
+        assert bad.status_code == 422
+
+
+def test_migration_backfills_search_index_from_existing_rows(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    init_db()
+
+    conn = get_connection()
+    try:
+        conn.execute("INSERT INTO projects (id, name, created_at, updated_at) VALUES ('proj_1', 'P', 'now', 'now')")
+        conn.execute(
+            "INSERT INTO chapters (id, project_id, chapter_no, title, created_at, updated_at) "
+            "VALUES ('ch_1', 'proj_1', 1, 'Old Title', 'now', 'now')"
+        )
+        for version_no in (1, 2):
+            conn.execute(
+                "INSERT INTO chapter_text_versions (id, chapter_id, version_no, stage, content_text, created_at) "
+                "VALUES (?, 'ch_1', ?, 'final', ?, 'now')",
+                (f"chv_{version_no}", version_no, f"draft number {version_no} of the harbor scene"),
+            )
+        conn.execute(
+            "INSERT INTO chapter_segments (id, chapter_id, segment_no, content_text, is_deleted, created_at, updated_at) "
+            "VALUES ('chseg_1', 'ch_1', 1, 'harbor lights', 0, 'now', 'now')"
+        )
+        conn.execute("DROP TABLE search_index")
+        conn.execute("DROP TABLE search_documents")
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+
+        migrate(conn, batch_size=1)
+
+        rows = conn.execute("SELECT source_kind, source_id FROM search_documents ORDER BY source_id").fetchall()
+        assert [tuple(row) for row in rows] == [("segment", "chseg_1"), ("version", "chv_2")]
+    finally:
+        conn.close()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.schemas import (
+    ChapterListResponse,
+    ChapterReviewListResponse,
+    ChapterSegmentListResponse,
+    ChapterTextVersionListResponse,
+    LlmModelListResponse,
+    LlmProviderListResponse,
+    ProjectListResponse,
+    RunEventListResponse,
+    RunListResponse,
+    RunStepListResponse,
+    RunStepOut,
+)
+from app.serialization import RowEncoder, encode_page
+
+
+def test_list_endpoints_match_their_response_models(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    with TestClient(app) as client:
+        project_id = client.post("/projects", json={"name": "长篇", "premise": "雪夜"}).json()["id"]
+        chapter_id = client.post(
+            "/chapters",
+            json={"project_id": project_id, "chapter_no": 1, "title": "第一章", "plan_json": {"beats": ["a", 1]}},
+        ).json()["id"]
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 1, "content_text": "开头"})
+        client.post(f"/chapters/{chapter_id}/segments", json={"segment_no": 2, "attrs_json": {"mood": "冷"}})
+        run = client.post(
+            "/swarm/run",
+            json={
+                "project_id": project_id,
+                "chapter_id": chapter_id,
+                "input_json": {"prompt": "写"},
+                "budget_json": {"max_tokens": 100000, "max_cost": 5},
+                "draft_n": 2,
+                "review_n": 1,
+            },
+        ).json()
+        assert wait_for_run(client, run["id"])["status"] == "completed"
+        client.post("/llm/providers", json={"id": "p1", "name": "P", "base_url": "http://x", "config_json": {"a": 1}})
+        client.post("/llm/providers/p1/models", json={"model_name": "m"})
+
+        endpoints = {
+            "/projects": ProjectListResponse,
+            f"/chapters?project_id={project_id}": ChapterListResponse,
+            f"/chapters/{chapter_id}/segments": ChapterSegmentListResponse,
+            f"/chapters/{chapter_id}/reviews": ChapterReviewListResponse,
+            f"/chapters/{chapter_id}/text-versions?limit=2": ChapterTextVersionListResponse,
+            f"/projects/{project_id}/runs": RunListResponse,
+            f"/runs/{run['id']}/steps": RunStepListResponse,
+            f"/runs/{run['id']}/events": RunEventListResponse,
+            "/llm/providers": LlmProviderListResponse,
+            "/llm/providers/p1/models": LlmModelListResponse,
+        }
+        for path, model in endpoints.items():
+            resp = client.get(path)
+            assert resp.status_code == 200 and resp.headers["content-type"] == "application/json"
+            body = resp.json()
+            assert body["items"], path
+            # Same document, types included, as the response model would have produced.
+            assert body == model.model_validate_json(resp.content).model_dump(mode="json"), path
+            summary = client.get(path + ("&" if "?" in path else "?") + "view=summary").json()["items"]
+            assert [item["id"] for item in summary] == [item["id"] for item in body["items"]], path
+            assert not any(key.endswith("_json") or key == "content_text" for item in summary for key in item), path
+
+        assert client.get(f"/chapters/{chapter_id}/text-versions?limit=2").json()["next_after"] is not None
+        assert client.get("/runs/missing/steps").status_code == 404
+
+
+def test_row_encoder_coerces_sqlite_values_and_copies_json_columns() -> None:
+    encoder = RowEncoder(RunStepOut, columns={"depends_on": "depends_on_json"})
+    row = {name: None for name in RunStepOut.model_fields} | {
+        "id": "step_1",
+        "run_id": "run_1",
+        "step_no": 1,
+        "step_type": "draft",
+        "status": "completed",
+        "depends_on_json": None,
+        "requires_approval": 0,
+        "approval_status": "not_required",
+        "output_json": '{"text": "\\u96ea"}',
+        "budget_remaining_cost": 2,
+        "started_at": "2026-01-01T00:00:00.000000Z",
+    }
+    encoded = encoder.encode(row, error_text="失败")
+    assert b'"output_json":{"text": "\\u96ea"}' in encoded and '"error_text":"失败"'.encode() in encoded
+    parsed = json.loads(encoded)
+    assert parsed["depends_on"] == [] and parsed["requires_approval"] is False
+    assert parsed["budget_remaining_cost"] == 2.0 and isinstance(parsed["budget_remaining_cost"], float)
+    assert parsed["output_json"] == {"text": "雪"}
+    page = encode_page(encoder, [row, row], [{"error_text": "失败"}, {"error_text": None}], next_after="step_1")
+    assert json.loads(page) == {"items": [parsed, {**parsed, "error_text": None}], "next_after": "step_1"}
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.llm import usage_tokens
+from app.main import app
+
+
+def _chapters(client: TestClient, count: int) -> tuple[str, list[str]]:
+    project_id = client.post("/projects", json={"name": "Timeout Book"}).json()["id"]
+    chapter_ids = [
+        client.post("/chapters", json={"project_id": project_id, "chapter_no": no, "title": f"C{no}"}).json()["id"]
+        for no in range(1, count + 1)
+    ]
+    return project_id, chapter_ids
+
+
+def _call_statuses(run_id: str) -> list[tuple[str, str | None]]:
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT status, error_text FROM llm_calls WHERE run_id = ? ORDER BY created_at, id", (run_id,)
+        ).fetchall()
+    return [(row["status"], row["error_text"]) for row in rows]
+
+
+def test_timed_out_calls_retry_then_fail_and_free_the_worker(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_RUN_WORKERS", "1")
+    hang = threading.Event()
+    attempts: dict[str, int] = {}
+
+    def generate(request: dict[str, object]) -> str:
+        prompt = request["input_json"]["prompt"]
+        attempts[prompt] = attempts.get(prompt, 0) + 1
+        if prompt == "hang" or (prompt == "hang once" and attempts[prompt] == 1):
+            hang.wait(30.0)
+        return f"{prompt} finished"
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, (flaky, stuck, quick) = _chapters(client, 3)
+
+            def start(chapter_id: str, prompt: str, budget: dict | None = None) -> dict:
+                body = {"project_id": project_id, "chapter_id": chapter_id, "input_json": {"prompt": prompt}}
+                return client.post("/swarm/run", json={**body, "budget_json": budget}).json()
+
+            budget = {"step_timeout_seconds": 0.2, "retry_budget": 1, "max_tokens_total": 100000}
+            retried = start(flaky, "hang once", budget)
+            started = time.monotonic()
+            done = wait_for_run(client, retried["id"])
+            assert done["status"] == "completed"
+            assert time.monotonic() - started < 3.0
+            assert _call_statuses(retried["id"]) == [
+                ("cancelled", "LLM call cancelled: timeout."),
+                ("succeeded", None),
+            ]
+            # The cut-off call is charged at an estimate, so the retry sees it spent.
+            with get_connection() as conn:
+                usages = [
+                    json.loads(row[0])
+                    for row in conn.execute(
+                        "SELECT usage_json FROM llm_calls WHERE run_id = ? ORDER BY created_at, id", (retried["id"],)
+                    )
+                ]
+            assert usages[0]["estimated"] is True and usage_tokens(usages[0]) > 0
+            assert done["budget_remaining_tokens"] == 100000 - sum(usage_tokens(usage) for usage in usages)
+            events = client.get(f"/runs/{retried['id']}/events").json()["items"]
+            assert [event["payload_json"] for event in events if event["status"] == "retrying"] == [
+                {"attempt": 2, "error": "LLM call cancelled: timeout."}
+            ]
+
+            # With no retries left the step fails, and the single worker moves straight on.
+            failed = start(stuck, "hang", {"step_timeout_seconds": 0.2})
+            completed = start(quick, "quick")
+            failed = wait_for_run(client, failed["id"])
+            assert (failed["status"], failed["output_json"]) == ("failed", {"error": "LLM call cancelled: timeout."})
+            assert wait_for_run(client, completed["id"])["status"] == "completed"
+            assert not hang.is_set()
+    finally:
+        hang.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_cancel_stops_a_streaming_call_mid_flight(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    streaming = threading.Event()
+    closed = threading.Event()
+    finish = threading.Event()
+
+    def generate(request: dict[str, object]):
+        def chunks():
+            try:
+                yield "Once"
+                streaming.set()
+                while not finish.wait(0.01):
+                    yield " more"
+            finally:
+                closed.set()
+
+        return chunks()
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, (chapter_id,) = _chapters(client, 1)
+            run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+            assert streaming.wait(5.0)
+            assert client.post(f"/runs/{run['id']}/cancel").json()["status"] == "cancelled"
+            # The generator is closed at its next chunk instead of streaming on.
+            assert closed.wait(2.0)
+            assert wait_for_run(client, run["id"])["status"] == "cancelled"
+            assert _call_statuses(run["id"]) == [("cancelled", "LLM call cancelled: cancelled.")]
+            assert not finish.is_set()
+    finally:
+        finish.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Iterator
+
+from fastapi.testclient import TestClient
+
+from app.db import get_connection
+from app.llm import build_request, call_llm
+from app.main import _run_stream_events, app
+
+
+def _project_and_chapter(client: TestClient) -> tuple[str, str]:
+    project_id = client.post("/projects", json={"name": "Stream Book"}).json()["id"]
+    chapter_id = client.post(
+        "/chapters", json={"project_id": project_id, "chapter_no": 1, "title": "C1"}
+    ).json()["id"]
+    return project_id, chapter_id
+
+
+async def _collect_events(events: AsyncIterator[str], after_first: threading.Event) -> list[tuple[str, dict]]:
+    collected = []
+    async for raw in events:
+        lines = dict(line.split(": ", 1) for line in raw.strip().splitlines() if not line.startswith(":"))
+        collected.append((lines["event"], json.loads(lines["data"])))
+        after_first.set()
+    return collected
+
+
+def _read_events(response) -> Iterator[tuple[str, dict]]:
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+def test_call_llm_consumes_streaming_generators() -> None:
+    request = build_request("run_1", "step_1", "draft", {"prompt": "x"})
+    deltas: list[str] = []
+
+    def generate(payload: dict[str, object]) -> Iterator[object]:
+        yield "Once "
+        yield {"delta": "upon"}
+        yield {"delta": "", "usage_json": {"prompt_tokens": 3, "completion_tokens": 2}, "model_id": "m2"}
+
+    outcome = call_llm(generate, request, deltas.append)
+    assert deltas == ["Once ", "upon"]
+    assert (outcome.content_text, outcome.model_id) == ("Once upon", "m2")
+    assert outcome.usage == {"prompt_tokens": 3, "completion_tokens": 2}
+
+    def broken(payload: dict[str, object]) -> Iterator[object]:
+        yield "partial"
+        raise RuntimeError("connection reset")
+
+    assert call_llm(broken, request).error == "connection reset"
+
+
+def test_stream_endpoint_forwards_tokens_and_checkpoints_partial_output(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_STREAM_CHECKPOINT_SECONDS", "0")
+    halfway = threading.Event()
+    release = threading.Event()
+
+    def generate(payload: dict[str, object]) -> Iterator[str]:
+        yield "The harbor "
+        yield "was quiet. "
+        halfway.set()
+        assert release.wait(5.0)
+        yield "Then the bells rang."
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _project_and_chapter(client)
+            run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+            assert halfway.wait(5.0)
+
+            step = client.get(f"/runs/{run['id']}/steps").json()["items"][0]
+            assert step["output_json"]["partial_content_text"] == "The harbor was quiet. "
+
+            # TestClient buffers streamed bodies, so consume the event generator directly.
+            events = asyncio.run(_collect_events(_run_stream_events(run["id"], 0), release))
+            tokens = [data["text"] for event, data in events if event == "token"]
+            assert tokens[0] == "The harbor was quiet. "
+            assert "".join(tokens) == "The harbor was quiet. Then the bells rang."
+            assert events[-1] == ("done", {"chars": 42, "status": "completed", "step_id": step["id"]})
+
+            with client.stream("GET", f"/runs/{run['id']}/stream") as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                assert [event for event, _ in _read_events(response)] == ["token", "done"]
+
+            wait_for_run(client, run["id"])
+            step = client.get(f"/runs/{run['id']}/steps").json()["items"][0]
+            assert step["output_json"]["content_text"] == "The harbor was quiet. Then the bells rang."
+            assert "partial_content_text" not in step["output_json"]
+
+            # A finished run replays from the stored output, resuming at Last-Event-ID.
+            with client.stream("GET", f"/runs/{run['id']}/stream", headers={"Last-Event-ID": "11"}) as response:
+                events = list(_read_events(response))
+            assert events[0] == (
+                "token",
+                {"offset": 11, "step_id": step["id"], "text": "was quiet. Then the bells rang."},
+            )
+            assert events[-1][0] == "done"
+
+            assert client.get("/runs/run_missing/stream").status_code == 404
+    finally:
+        release.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_failed_stream_keeps_last_checkpoint(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_STREAM_CHECKPOINT_SECONDS", "0")
+
+    def generate(payload: dict[str, object]) -> Iterator[str]:
+        yield "First line. "
+        time.sleep(0.01)
+        yield "Second line. "
+        raise RuntimeError("provider dropped the stream")
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _project_and_chapter(client)
+            run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+            assert wait_for_run(client, run["id"])["status"] == "failed"
+
+        with get_connection() as conn:
+            output = conn.execute("SELECT output_json FROM run_steps WHERE run_id = ?", (run["id"],)).fetchone()[0]
+        assert json.loads(output)["partial_content_text"] == "First line. Second line. "
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
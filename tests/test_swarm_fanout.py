@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.selection import DraftCandidate, rank_candidates
+
+# Per draft: issues each review reports, and its review scores.
+REVIEWS = {
+    1: (["pacing", "voice"], {"consistency": 6, "style": 6, "progress": 6}),
+    2: ([], {"consistency": 7, "style": 5, "progress": 5}),
+    3: (["typo"], {"consistency": 9, "style": 9, "progress": 9}),
+}
+
+
+def _generate(request: dict[str, object]) -> str:
+    time.sleep(0.3)
+    step_input = request["step_input"]
+    if "review_of" in request:
+        issues, scores = REVIEWS[step_input["draft_no"]]
+        return json.dumps({"issues": issues, "scores": scores})
+    return f"Draft {step_input['draft_no']}"
+
+
+def _start(client: TestClient, project_id: str, chapter_no: int, **options) -> tuple[str, dict]:
+    chapter_id = client.post(
+        "/chapters", json={"project_id": project_id, "chapter_no": chapter_no, "title": f"C{chapter_no}"}
+    ).json()["id"]
+    run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id, **options}).json()
+    return chapter_id, run
+
+
+def test_drafts_and_reviews_fan_out_in_parallel_and_the_best_draft_wins(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    app.state.llm_generate = _generate
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Fan-out Book"}).json()["id"]
+            started = time.monotonic()
+            chapter_id, run = _start(client, project_id, 1, draft_n=3, review_n=2)
+            assert wait_for_run(client, run["id"])["status"] == "completed"
+            # Nine 0.3s calls in two waves (drafts, then reviews), not one after another.
+            assert time.monotonic() - started < 1.5
+
+            steps = client.get(f"/runs/{run['id']}/steps").json()["items"]
+            assert [step["step_type"] for step in steps] == ["draft"] * 3 + ["review"] * 6 + ["select"]
+            drafts = [step["id"] for step in steps[:3]]
+            assert [step["depends_on"] for step in steps[3:9]] == [[draft] for draft in drafts for _ in range(2)]
+            assert steps[-1]["depends_on"] == [step["id"] for step in steps[:9]]
+            assert steps[-1]["output_json"]["selected_step_id"] == drafts[1]
+
+            reviews = client.get(f"/chapters/{chapter_id}/reviews").json()["items"]
+            assert len(reviews) == 6 and {review["source_run_id"] for review in reviews} == {run["id"]}
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert [(version["stage"], version["content_text"]) for version in versions][-1] == ("final", "Draft 2")
+            assert sorted(version["content_text"] for version in versions if version["stage"] == "draft") == [
+                "Draft 1",
+                "Draft 2",
+                "Draft 3",
+            ]
+
+            _, weighted = _start(client, project_id, 2, draft_n=3, review_n=1, select_strategy="weighted_score")
+            weighted_steps = client.get(f"/runs/{weighted['id']}/steps").json()["items"]
+            assert wait_for_run(client, weighted["id"])["status"] == "completed"
+            select_output = client.get(f"/runs/{weighted['id']}/steps/{weighted_steps[-1]['id']}").json()["output_json"]
+            assert select_output["selected_step_id"] == weighted_steps[2]["id"]
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_human_only_selection_waits_for_an_approved_choice(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    app.state.llm_generate = _generate
+    try:
+        with TestClient(app) as client:
+            project_id = client.post("/projects", json={"name": "Human Book"}).json()["id"]
+            chapter_id, run = _start(client, project_id, 1, draft_n=2, select_strategy="human_only")
+            assert wait_for_run(client, run["id"])["status"] == "paused"
+            steps = client.get(f"/runs/{run['id']}/steps").json()["items"]
+            select = steps[-1]
+            assert select["status"] == "pending_approval"
+            assert [c["step_id"] for c in select["output_json"]["candidates"]] == [steps[0]["id"], steps[1]["id"]]
+            assert select["output_json"]["selected_step_id"] is None
+
+            approve = f"/runs/{run['id']}/steps/{select['id']}/approve"
+            assert client.post(approve).status_code == 422
+            assert client.post(approve, json={"selected_step_id": select["id"]}).status_code == 422
+            approved = client.post(approve, json={"selected_step_id": steps[1]["id"]}).json()
+            assert approved["status"] == "completed"
+            assert client.get(f"/runs/{run['id']}").json()["status"] == "completed"
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert versions[-1]["content_text"] == "Draft 2"
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_rank_candidates_strategies() -> None:
+    def candidate(draft_no: int, *reports: dict) -> DraftCandidate:
+        return DraftCandidate(f"step{draft_no}", draft_no, f"chv{draft_no}", f"Draft {draft_no}", list(reports))
+
+    few_issues = candidate(1, {"issues": ["a"], "score": 5})
+    high_score = candidate(2, {"issues": ["a", "b"], "scores": {"consistency": 10, "style": 10, "progress": 10}})
+    unreviewed = candidate(3)
+    assert [c.draft_no for c in rank_candidates([few_issues, high_score, unreviewed], "min_issues")] == [3, 1, 2]
+    assert [c.draft_no for c in rank_candidates([few_issues, high_score, unreviewed], "weighted_score")] == [2, 1, 3]
+    assert [c.draft_no for c in rank_candidates([unreviewed, high_score, few_issues], "human_only")] == [1, 2, 3]
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import threading
+
 from fastapi.testclient import TestClient
 
 from app.db import get_connection
 from app.main import app
+from app.run_executor import RunExecutor
 
 
 def _create_project_and_chapter(client: TestClient, name: str = "Runner Book") -> tuple[str, str]:
@@ -20,7 +23,7 @@ def _create_project_and_chapter(client: TestClient, name: str = "Runner Book") -
     return project_id, chapter_id
 
 
-def test_swarm_run_auto_start_completes_and_records_llm_call(monkeypatch, tmp_path) -> None:
+def test_swarm_run_auto_start_completes_and_records_llm_call(monkeypatch, tmp_path, wait_for_run) -> None:
     db_path = tmp_path / "core.db"
     monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
     app.state.llm_generate = lambda request: {
@@ -43,9 +46,10 @@ def test_swarm_run_auto_start_completes_and_records_llm_call(monkeypatch, tmp_pa
             )
             assert run_resp.status_code == 200
             run = run_resp.json()
-            assert run["status"] == "completed"
+            assert run["status"] == "running"
 
             run_id = run["id"]
+            assert wait_for_run(client, run_id)["status"] == "completed"
             steps_resp = client.get(f"/runs/{run_id}/steps")
             assert steps_resp.status_code == 200
             steps = steps_resp.json()["items"]
@@ -79,7 +83,7 @@ def test_swarm_run_auto_start_completes_and_records_llm_call(monkeypatch, tmp_pa
             delattr(app.state, "llm_generate")
 
 
-def test_swarm_run_pause_for_approval_then_approve(monkeypatch, tmp_path) -> None:
+def test_swarm_run_pause_for_approval_then_approve(monkeypatch, tmp_path, wait_for_run) -> None:
     db_path = tmp_path / "core.db"
     monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
     app.state.llm_generate = lambda request: {"content_text": "Needs human approval"}
@@ -92,9 +96,8 @@ def test_swarm_run_pause_for_approval_then_approve(monkeypatch, tmp_path) -> Non
                 json={"project_id": project_id, "chapter_id": chapter_id, "requires_approval": True},
             )
             assert run_resp.status_code == 200
-            run = run_resp.json()
-            assert run["status"] == "paused"
-            run_id = run["id"]
+            run_id = run_resp.json()["id"]
+            assert wait_for_run(client, run_id)["status"] == "paused"
 
             step_resp = client.get(f"/runs/{run_id}/steps")
             assert step_resp.status_code == 200
@@ -117,7 +120,7 @@ def test_swarm_run_pause_for_approval_then_approve(monkeypatch, tmp_path) -> Non
             delattr(app.state, "llm_generate")
 
 
-def test_swarm_run_override_approval_output(monkeypatch, tmp_path) -> None:
+def test_swarm_run_override_approval_output(monkeypatch, tmp_path, wait_for_run) -> None:
     db_path = tmp_path / "core.db"
     monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
     app.state.llm_generate = lambda request: {"content_text": "Original LLM output"}
@@ -130,6 +133,7 @@ def test_swarm_run_override_approval_output(monkeypatch, tmp_path) -> None:
                 json={"project_id": project_id, "chapter_id": chapter_id, "requires_approval": True},
             )
             run_id = run_resp.json()["id"]
+            wait_for_run(client, run_id)
             step_id = client.get(f"/runs/{run_id}/steps").json()["items"][0]["id"]
 
             override_resp = client.post(
@@ -148,7 +152,7 @@ def test_swarm_run_override_approval_output(monkeypatch, tmp_path) -> None:
             delattr(app.state, "llm_generate")
 
 
-def test_swarm_run_resume_from_created_and_cancel(monkeypatch, tmp_path) -> None:
+def test_swarm_run_resume_from_created_and_cancel(monkeypatch, tmp_path, wait_for_run) -> None:
     db_path = tmp_path / "core.db"
     monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
     app.state.llm_generate = lambda request: {"content_text": "Resume flow output"}
@@ -166,7 +170,8 @@ def test_swarm_run_resume_from_created_and_cancel(monkeypatch, tmp_path) -> None
 
             resumed = client.post(f"/runs/{run_id}/resume")
             assert resumed.status_code == 200
-            assert resumed.json()["status"] == "completed"
+            assert resumed.json()["status"] == "running"
+            assert wait_for_run(client, run_id)["status"] == "completed"
 
             project_id_2, chapter_id_2 = _create_project_and_chapter(client, "Cancel Book")
             created_2 = client.post(
@@ -180,3 +185,101 @@ def test_swarm_run_resume_from_created_and_cancel(monkeypatch, tmp_path) -> None
     finally:
         if hasattr(app.state, "llm_generate"):
             delattr(app.state, "llm_generate")
+
+
+def test_identical_run_outputs_share_one_compressed_blob(monkeypatch, tmp_path, wait_for_run) -> None:
+    db_path = tmp_path / "core.db"
+    monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
+    monkeypatch.setenv("WRITER_BLOB_CODEC", "lzma")
+    app.state.llm_generate = lambda request: {"content_text": "Same chapter body. " * 200}
+
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _create_project_and_chapter(client, "Dedup Book")
+            for _ in range(2):
+                run_resp = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id})
+                assert run_resp.status_code == 200
+                wait_for_run(client, run_resp.json()["id"])
+
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert [version["version_no"] for version in versions] == [1, 2]
+            assert versions[0]["content_text"] == versions[1]["content_text"] == "Same chapter body. " * 200
+
+            with get_connection() as conn:
+                hashes = conn.execute(
+                    "SELECT DISTINCT content_hash FROM chapter_text_versions WHERE chapter_id = ?",
+                    (chapter_id,),
+                ).fetchall()
+                blob = conn.execute("SELECT codec, raw_size, length(data) AS stored FROM text_blobs").fetchall()
+            assert len(hashes) == 1
+            assert len(blob) == 1
+            assert blob[0]["codec"] == "lzma"
+            assert blob[0]["stored"] < blob[0]["raw_size"]
+    finally:
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_swarm_run_llm_call_runs_in_background_without_holding_writes(monkeypatch, tmp_path, wait_for_run) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    started = threading.Event()
+    release = threading.Event()
+
+    def generate(request: dict[str, object]) -> dict[str, object]:
+        started.set()
+        assert release.wait(5.0)
+        return {"content_text": "Slow model output"}
+
+    app.state.llm_generate = generate
+    try:
+        with TestClient(app) as client:
+            project_id, chapter_id = _create_project_and_chapter(client, "Slow Book")
+            run_resp = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id})
+            assert run_resp.json()["status"] == "running"
+            run_id = run_resp.json()["id"]
+            assert started.wait(5.0)
+
+            # The writer is free while the model call is in flight.
+            assert client.post("/projects", json={"name": "Written meanwhile"}).status_code == 200
+            assert client.post(f"/runs/{run_id}/pause").json()["status"] == "paused"
+            release.set()
+
+            paused = wait_for_run(client, run_id)
+            assert paused["status"] == "paused"
+            with get_connection() as conn:
+                calls = conn.execute("SELECT status, error_text FROM llm_calls WHERE run_id = ?", (run_id,)).fetchall()
+            # Pausing abandoned the in-flight call rather than waiting for it.
+            assert [(row["status"], row["error_text"]) for row in calls] == [
+                ("cancelled", "LLM call cancelled: paused.")
+            ]
+            assert client.get(f"/chapters/{chapter_id}/text-versions").json()["items"] == []
+
+            assert client.post(f"/runs/{run_id}/resume").json()["status"] == "running"
+            completed = wait_for_run(client, run_id)
+            assert completed["status"] == "completed"
+            versions = client.get(f"/chapters/{chapter_id}/text-versions").json()["items"]
+            assert [version["content_text"] for version in versions] == ["Slow model output"]
+    finally:
+        release.set()
+        if hasattr(app.state, "llm_generate"):
+            delattr(app.state, "llm_generate")
+
+
+def test_run_executor_coalesces_resubmitted_runs() -> None:
+    executor = RunExecutor(max_workers=2)
+    gate = threading.Event()
+    calls: list[str] = []
+
+    def drive(run_id: str) -> None:
+        calls.append(run_id)
+        gate.wait(5.0)
+
+    try:
+        assert executor.submit("run_a", drive) is True
+        assert executor.submit("run_a", drive) is False
+        assert executor.submit("run_a", drive) is False
+        gate.set()
+        assert executor.wait_idle(5.0)
+        assert calls == ["run_a", "run_a"]
+    finally:
+        executor.shutdown()
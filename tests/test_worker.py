@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.db import close_writers, get_connection, init_db
+from app.leases import claim_next_runs, claim_run, reclaim_expired_leases, release_run
+from app.main import app
+from app.worker import run_worker
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+
+def _queue_runs(client: TestClient, count: int) -> list[str]:
+    project_id = client.post("/projects", json={"name": "Worker Book"}).json()["id"]
+    run_ids = []
+    for chapter_no in range(1, count + 1):
+        chapter_id = client.post(
+            "/chapters", json={"project_id": project_id, "chapter_no": chapter_no, "title": f"C{chapter_no}"}
+        ).json()["id"]
+        run = client.post("/swarm/run", json={"project_id": project_id, "chapter_id": chapter_id}).json()
+        assert run["status"] == "running"
+        run_ids.append(run["id"])
+    return run_ids
+
+
+def test_leases_are_exclusive_until_they_expire(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_RUN_DISPATCH", "external")
+    with TestClient(app) as client:
+        run_ids = _queue_runs(client, 3)
+
+    conn = get_connection()
+    try:
+        assert claim_next_runs(conn, "worker-a", 2, 60) == run_ids[:2]
+        assert claim_next_runs(conn, "worker-b", 5, 60) == run_ids[2:]
+        assert claim_run(conn, run_ids[0], "worker-b", 60) is False
+        assert claim_run(conn, run_ids[0], "worker-a", 60) is True
+
+        conn.execute("UPDATE runs SET lease_expires_at = '2000-01-01T00:00:00.000000Z' WHERE id = ?", (run_ids[1],))
+        assert reclaim_expired_leases(conn) == [run_ids[1]]
+        assert claim_next_runs(conn, "worker-b", 5, 60) == [run_ids[1]]
+
+        release_run(conn, run_ids[0], "worker-b")
+        assert conn.execute("SELECT lease_owner FROM runs WHERE id = ?", (run_ids[0],)).fetchone()[0] == "worker-a"
+        release_run(conn, run_ids[0], "worker-a")
+        assert claim_run(conn, run_ids[0], "worker-b", 60) is True
+    finally:
+        conn.close()
+
+
+def test_worker_drives_externally_dispatched_runs(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("WRITER_DB_PATH", str(tmp_path / "core.db"))
+    monkeypatch.setenv("WRITER_RUN_DISPATCH", "external")
+    with TestClient(app) as client:
+        run_ids = _queue_runs(client, 3)
+        assert all(client.get(f"/runs/{run_id}").json()["status"] == "running" for run_id in run_ids)
+
+    # A crashed worker left a stale lease on the first run.
+    conn = get_connection()
+    try:
+        conn.execute(
+            "UPDATE runs SET lease_owner = 'dead-worker', lease_expires_at = '2000-01-01T00:00:00.000000Z' "
+            "WHERE id = ?",
+            (run_ids[0],),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert run_worker(concurrency=2, poll_interval=0.01, once=True) == 3
+    close_writers()
+
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT status, lease_owner FROM runs WHERE id IN ({', '.join('?' for _ in run_ids)})", run_ids
+        ).fetchall()
+    finally:
+        conn.close()
+    assert [(row["status"], row["lease_owner"]) for row in rows] == [("completed", None)] * 3
+
+
+def test_worker_cli_runs_as_separate_processes(monkeypatch, tmp_path) -> None:
+    db_path = tmp_path / "core.db"
+    monkeypatch.setenv("WRITER_DB_PATH", str(db_path))
+    monkeypatch.setenv("WRITER_RUN_DISPATCH", "external")
+    with TestClient(app) as client:
+        run_ids = _queue_runs(client, 4)
+
+    env = {**os.environ, "WRITER_DB_PATH": str(db_path), "PYTHONPATH": str(SRC_DIR)}
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.worker", "--once", "--concurrency", "2", "--poll-interval", "0.01"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        for _ in range(2)
+    ]
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=60)
+        assert worker.returncode == 0, stderr.decode()
+
+    init_db()
+    conn = get_connection()
+    try:
+        statuses = conn.execute("SELECT DISTINCT status FROM runs").fetchall()
+        calls = conn.execute("SELECT run_id, COUNT(*) AS n FROM llm_calls GROUP BY run_id").fetchall()
+    finally:
+        conn.close()
+    assert [row["status"] for row in statuses] == ["completed"]
+    assert sorted(row["run_id"] for row in calls) == sorted(run_ids)
+    assert all(row["n"] == 1 for row in calls)